@@ -21,6 +21,7 @@ if PY2:
     zip_longest = itertools.izip_longest
     reduce = reduce
     from urllib import unquote_plus
+    import Queue as queue
     FileNotFoundError = IOError
     IsADirectoryError = IOError
 
@@ -40,6 +41,7 @@ else:
     import functools
     reduce = functools.reduce
     from urllib.parse import unquote_plus
+    import queue
     FileNotFoundError = FileNotFoundError
     IsADirectoryError = IsADirectoryError
 
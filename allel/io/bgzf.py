@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Utilities for reading files compressed in the BGZF format (blocked gzip), as produced
+by bgzip. A BGZF file is a series of independent gzip members ("blocks"), each holding
+at most 64 kB of uncompressed data, which means blocks can be decompressed in parallel.
+
+"""
+from __future__ import absolute_import, print_function, division
+import struct
+import zlib
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+
+# number of blocks to decompress within a single task when decompressing in parallel
+DEFAULT_BATCH_SIZE = 2**4
+
+
+# fixed part of the gzip member header, i.e., ID1, ID2, CM, FLG, MTIME, XFL, OS, XLEN
+_header = struct.Struct('<BBBBIBBH')
+# gzip member trailer, i.e., CRC32, ISIZE
+_trailer = struct.Struct('<II')
+# extra subfield header, i.e., SI1, SI2, SLEN
+_subfield = struct.Struct('<BBH')
+
+
+def is_bgzf(path):
+    """Determine whether the file at `path` is compressed in the BGZF format."""
+    with open(path, mode='rb') as f:
+        data = f.read(_header.size)
+        if len(data) < _header.size:
+            return False
+        id1, id2, cm, flg, _, _, _, xlen = _header.unpack(data)
+        if id1 != 31 or id2 != 139 or cm != 8 or not flg & 4:
+            return False
+        return _find_bsize(f.read(xlen)) is not None
+
+
+def _find_bsize(extra):
+    i = 0
+    while i + _subfield.size <= len(extra):
+        si1, si2, slen = _subfield.unpack_from(extra, i)
+        i += _subfield.size
+        if si1 == 66 and si2 == 67 and slen == 2:
+            return struct.unpack_from('<H', extra, i)[0]
+        i += slen
+    return None
+
+
+def read_block(fileobj):
+    """Read the next BGZF block from `fileobj`.
+
+    Returns
+    -------
+    block : tuple or None
+        A tuple of (compressed data, CRC32, uncompressed size), or None if the end of
+        the file has been reached.
+
+    """
+    data = fileobj.read(_header.size)
+    if not data:
+        return None
+    if len(data) < _header.size:
+        raise ValueError('truncated BGZF block header')
+    id1, id2, cm, flg, _, _, _, xlen = _header.unpack(data)
+    if id1 != 31 or id2 != 139 or cm != 8 or not flg & 4:
+        raise ValueError('bad BGZF block header')
+    bsize = _find_bsize(fileobj.read(xlen))
+    if bsize is None:
+        raise ValueError('missing BGZF block size')
+    # N.B., BSIZE is the total block size minus 1
+    remaining = bsize + 1 - _header.size - xlen
+    data = fileobj.read(remaining)
+    if len(data) < remaining:
+        raise ValueError('truncated BGZF block')
+    crc, isize = _trailer.unpack_from(data, remaining - _trailer.size)
+    return data[:remaining - _trailer.size], crc, isize
+
+
+def inflate_block(block):
+    """Decompress a block previously read via :func:`read_block`."""
+    cdata, crc, isize = block
+    data = zlib.decompress(cdata, -15)
+    if len(data) != isize or zlib.crc32(data) & 0xffffffff != crc:
+        raise ValueError('corrupt BGZF block')
+    return data
+
+
+def _inflate_blocks(blocks):
+    return [inflate_block(b) for b in blocks]
+
+
+def _read_blocks(fileobj, n):
+    blocks = list()
+    for _ in range(n):
+        block = read_block(fileobj)
+        if block is None:
+            break
+        blocks.append(block)
+    return blocks
+
+
+def iter_bgzf_blocks(fileobj, n_threads=None, batch_size=DEFAULT_BATCH_SIZE, close=False):
+    """Iterate over decompressed blocks of data from a BGZF file.
+
+    Parameters
+    ----------
+    fileobj : file-like
+        File-like object opened in binary mode, positioned at the start of a block.
+    n_threads : int, optional
+        If given, decompress blocks in a background pool of threads, reading ahead of
+        the consumer.
+    batch_size : int, optional
+        Number of blocks to decompress within each task submitted to the pool.
+    close : bool, optional
+        If True, close `fileobj` when iteration completes.
+
+    Returns
+    -------
+    it : iterator of bytes
+        Decompressed data, one item per non-empty block, in file order.
+
+    """
+
+    pool = None
+    try:
+
+        if n_threads is None:
+            while True:
+                block = read_block(fileobj)
+                if block is None:
+                    break
+                data = inflate_block(block)
+                if data:
+                    yield data
+
+        else:
+            pool = ThreadPool(n_threads)
+            # ring of pending decompression tasks, keep enough in flight to keep all
+            # threads busy while the consumer works through the oldest batch
+            pending = deque()
+            while True:
+                while len(pending) < 2 * n_threads:
+                    blocks = _read_blocks(fileobj, batch_size)
+                    if not blocks:
+                        break
+                    pending.append(pool.apply_async(_inflate_blocks, args=(blocks,)))
+                if not pending:
+                    break
+                for data in pending.popleft().get():
+                    if data:
+                        yield data
+
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if close:
+            fileobj.close()
+
+
+def iter_bgzf_range(fileobj, begin, end=None):
+    """Iterate over decompressed data between two virtual offsets in a BGZF file.
+
+    Parameters
+    ----------
+    fileobj : file-like
+        Seekable file-like object opened in binary mode.
+    begin : int
+        Virtual offset to start reading from.
+    end : int, optional
+        Virtual offset to stop reading at (exclusive). If not given, read to the end of
+        the file.
+
+    Returns
+    -------
+    it : iterator of bytes
+
+    """
+
+    # a virtual offset combines the position of a block within the compressed file (upper
+    # 48 bits) with a position within the uncompressed data of that block (lower 16 bits)
+    block_offset, data_offset = begin >> 16, begin & 0xffff
+    if end is not None:
+        end_block_offset, end_data_offset = end >> 16, end & 0xffff
+    fileobj.seek(block_offset)
+    while end is None or block_offset <= end_block_offset:
+        block = read_block(fileobj)
+        if block is None:
+            break
+        data = inflate_block(block)
+        if end is not None and block_offset == end_block_offset:
+            data = data[:end_data_offset]
+        if data_offset:
+            data = data[data_offset:]
+            data_offset = 0
+        if data:
+            yield data
+        block_offset = fileobj.tell()
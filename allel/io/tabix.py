@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""
+Read tabix (.tbi) and coordinate-sorted (.csi) indexes of BGZF-compressed files, so
+that data overlapping a genome region can be located without running the `tabix`
+program.
+
+"""
+from __future__ import absolute_import, print_function, division
+import gzip
+import os
+import struct
+import threading
+
+
+import numpy as np
+
+
+from allel.compat import PY2
+from allel.io.bgzf import iter_bgzf_range
+
+
+_int32 = struct.Struct('<i')
+_bin_tbi = struct.Struct('<Ii')
+_bin_csi = struct.Struct('<IQi')
+_aux = struct.Struct('<7i')
+
+
+def reg2bins(begin, end, min_shift=14, depth=5):
+    """Compute the bins that may hold data overlapping the 0-based, half-open interval
+    [`begin`, `end`), following the binning scheme of the SAM specification."""
+    bins = list()
+    end -= 1
+    shift = min_shift + depth * 3
+    offset = 0
+    for level in range(depth + 1):
+        bins.extend(range(offset + (begin >> shift), offset + (end >> shift) + 1))
+        shift -= 3
+        offset += 1 << (level * 3)
+    return bins
+
+
+def parse_region(region):
+    """Parse a region string such as 'chr1' or 'chr1:10000-20000' into a tuple of
+    (chrom, begin, end), where begin and end are 1-based and inclusive, or None if not
+    given."""
+    tokens = region.split(':')
+    chrom = tokens[0]
+    begin = end = None
+    if len(tokens) > 1:
+        range_tokens = tokens[1].split('-')
+        if len(range_tokens) != 2:
+            raise ValueError('bad region string: %r' % region)
+        begin, end = int(range_tokens[0]), int(range_tokens[1])
+    return chrom, begin, end
+
+
+def _bin_first(level):
+    return ((1 << (level * 3)) - 1) // 7
+
+
+class TabixIndex(object):
+    """Index of a BGZF-compressed, coordinate-sorted file.
+
+    Parameters
+    ----------
+    names : list of str
+        Reference sequence (chromosome) names.
+    bins : list of dict
+        For each reference sequence, a mapping from bin number to an array of chunks,
+        where each chunk is a pair of virtual offsets (begin, end).
+    min_shift : int
+        Number of bits for the minimal interval.
+    depth : int
+        Depth of the binning index.
+    linear : list of arrays, optional
+        For each reference sequence, the linear index (tabix only).
+    loffsets : list of dict, optional
+        For each reference sequence, a mapping from bin number to the virtual offset of
+        the first record overlapping the bin (CSI only).
+
+    """
+
+    def __init__(self, names, bins, min_shift=14, depth=5, linear=None, loffsets=None):
+        self.names = names
+        self.bins = bins
+        self.min_shift = min_shift
+        self.depth = depth
+        self.linear = linear
+        self.loffsets = loffsets
+        # bin holding metadata about each reference sequence
+        self.pseudo_bin = _bin_first(depth + 1) + 1
+        self.tids = dict((name, tid) for tid, name in enumerate(names))
+        self.header = None
+
+    @property
+    def data_offset(self):
+        """Virtual offset of the first record, i.e., the end of the header, or None if
+        the index holds no records."""
+        offsets = [chunks[0, 0] for ref in self.bins for chunks in ref.values()
+                   if len(chunks)]
+        if offsets:
+            return int(min(offsets))
+        return None
+
+    def n_records(self, chrom):
+        """Number of records for the given reference sequence, or None if not recorded
+        in the index."""
+        tid = self.tids.get(chrom)
+        if tid is None:
+            return 0
+        meta = self.bins[tid].get(self.pseudo_bin)
+        if meta is None or len(meta) < 2:
+            return None
+        return int(meta[1, 0])
+
+    def _min_offset(self, tid, begin):
+        if self.linear is not None:
+            linear = self.linear[tid]
+            if len(linear) == 0:
+                return 0
+            return int(linear[min(begin >> self.min_shift, len(linear) - 1)])
+        # CSI, walk up from the finest bin covering begin until an existing bin is found
+        loffsets = self.loffsets[tid]
+        b = _bin_first(self.depth) + (begin >> self.min_shift)
+        while b > 0 and b not in loffsets:
+            b = (b - 1) >> 3
+        return loffsets.get(b, 0)
+
+    def query(self, chrom, begin=None, end=None):
+        """Find chunks of the compressed file holding records that may overlap a region.
+
+        Parameters
+        ----------
+        chrom : str
+            Reference sequence name.
+        begin : int, optional
+            Start position (1-based, inclusive).
+        end : int, optional
+            Stop position (1-based, inclusive).
+
+        Returns
+        -------
+        chunks : list of (int, int) tuples
+            Sorted, non-overlapping pairs of virtual offsets (begin, end).
+
+        """
+        tid = self.tids.get(chrom)
+        if tid is None:
+            return []
+        max_end = 1 << (self.min_shift + self.depth * 3)
+        begin = max(begin - 1, 0) if begin else 0
+        end = min(end, max_end) if end else max_end
+        if begin >= end:
+            return []
+        bins = self.bins[tid]
+        min_offset = self._min_offset(tid, begin)
+        candidates = [bins[b] for b in reg2bins(begin, end, self.min_shift, self.depth)
+                      if b in bins]
+        if not candidates:
+            return []
+        candidates = np.concatenate(candidates)
+        candidates = candidates[candidates[:, 1] > min_offset]
+        candidates = candidates[np.argsort(candidates[:, 0], kind='mergesort')]
+
+        # merge overlapping or adjacent chunks
+        chunks = list()
+        for chunk_begin, chunk_end in candidates.tolist():
+            if chunks and chunk_begin <= chunks[-1][1]:
+                chunks[-1][1] = max(chunks[-1][1], chunk_end)
+            else:
+                chunks.append([chunk_begin, chunk_end])
+        return [tuple(c) for c in chunks]
+
+
+def _parse_names(data, offset, l_nm):
+    names = data[offset:offset + l_nm].split(b'\x00')
+    names = [n for n in names if n]
+    if not PY2:
+        names = [str(n, 'utf8') for n in names]
+    return names
+
+
+def _parse_chunks(data, offset, n_chunk):
+    chunks = np.frombuffer(data, dtype='<u8', count=n_chunk * 2, offset=offset)
+    return chunks.reshape(n_chunk, 2), offset + n_chunk * 16
+
+
+def read_index(path):
+    """Read a tabix (.tbi) or CSI (.csi) index file.
+
+    Parameters
+    ----------
+    path : str
+        Path to the index file.
+
+    Returns
+    -------
+    index : TabixIndex
+
+    """
+
+    with gzip.open(path, mode='rb') as f:
+        data = f.read()
+    magic = data[:4]
+
+    if magic == b'TBI\x01':
+        n_ref, = _int32.unpack_from(data, 4)
+        l_nm = _aux.unpack_from(data, 8)[-1]
+        offset = 8 + _aux.size
+        names = _parse_names(data, offset, l_nm)
+        offset += l_nm
+        bins, linear = list(), list()
+        for _ in range(n_ref):
+            ref_bins = dict()
+            n_bin, = _int32.unpack_from(data, offset)
+            offset += 4
+            for _ in range(n_bin):
+                b, n_chunk = _bin_tbi.unpack_from(data, offset)
+                ref_bins[b], offset = _parse_chunks(data, offset + _bin_tbi.size, n_chunk)
+            n_intv, = _int32.unpack_from(data, offset)
+            offset += 4
+            linear.append(np.frombuffer(data, dtype='<u8', count=n_intv, offset=offset))
+            offset += n_intv * 8
+            bins.append(ref_bins)
+        return TabixIndex(names, bins, linear=linear)
+
+    elif magic == b'CSI\x01':
+        min_shift, depth, l_aux = struct.unpack_from('<3i', data, 4)
+        offset = 16
+        if l_aux >= _aux.size:
+            l_nm = _aux.unpack_from(data, offset)[-1]
+            names = _parse_names(data, offset + _aux.size, l_nm)
+        else:
+            names = list()
+        offset += l_aux
+        n_ref, = _int32.unpack_from(data, offset)
+        offset += 4
+        bins, loffsets = list(), list()
+        for _ in range(n_ref):
+            ref_bins, ref_loffsets = dict(), dict()
+            n_bin, = _int32.unpack_from(data, offset)
+            offset += 4
+            for _ in range(n_bin):
+                b, loffset, n_chunk = _bin_csi.unpack_from(data, offset)
+                ref_bins[b], offset = _parse_chunks(data, offset + _bin_csi.size, n_chunk)
+                ref_loffsets[b] = loffset
+            bins.append(ref_bins)
+            loffsets.append(ref_loffsets)
+        return TabixIndex(names, bins, min_shift=min_shift, depth=depth,
+                          loffsets=loffsets)
+
+    else:
+        raise ValueError('not a tabix or CSI index: %r' % path)
+
+
+def find_index(path):
+    """Find the index file for the BGZF-compressed file at `path`, if any."""
+    for ext in '.tbi', '.csi':
+        if os.path.exists(path + ext):
+            return path + ext
+    return None
+
+
+def _read_header(fileobj, meta=b'#'):
+    """Read the header lines from the start of a BGZF-compressed file, stopping at the
+    first line not starting with the `meta` character."""
+    data = b''
+    start = 0
+    for block in iter_bgzf_range(fileobj, 0):
+        data += block
+        while start < len(data):
+            if data[start:start + 1] != meta:
+                return data[:start]
+            i = data.find(b'\n', start)
+            if i < 0:
+                break
+            start = i + 1
+    return data
+
+
+_cache = dict()
+_cache_lock = threading.Lock()
+
+
+def load_index(path):
+    """Load the index for the BGZF-compressed file at `path`, including the header of the
+    file, caching the result until either file is modified.
+
+    Returns
+    -------
+    index : TabixIndex or None
+        None if no index file could be found.
+
+    """
+
+    index_path = find_index(path)
+    if index_path is None:
+        return None
+    key = (os.stat(path).st_mtime, os.stat(index_path).st_mtime)
+    with _cache_lock:
+        cached = _cache.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    index = read_index(index_path)
+    with open(path, mode='rb') as f:
+        if index.data_offset is None:
+            # no records indexed, find the end of the header by scanning
+            index.header = _read_header(f)
+        else:
+            index.header = b''.join(iter_bgzf_range(f, 0, index.data_offset))
+    with _cache_lock:
+        _cache[path] = key, index
+    return index
+
+
+def iter_region(path, index, chrom, begin=None, end=None):
+    """Iterate over decompressed data from the BGZF-compressed file at `path`, comprising
+    the header followed by data from all chunks that may overlap the given region."""
+    return iter_regions(path, index, [(chrom, begin, end)])
+
+
+def iter_regions(path, index, regions):
+    """Iterate over decompressed data from the BGZF-compressed file at `path`, comprising
+    the header followed by data from all chunks that may overlap any of the given
+    regions, each a tuple of (chrom, begin, end). Chunks are read in order of their
+    position within the file, and data overlapping more than one region are read only
+    once."""
+    yield index.header
+    chunks = sorted(chunk for region in regions for chunk in index.query(*region))
+
+    # merge overlapping or adjacent chunks
+    merged = list()
+    for chunk_begin, chunk_end in chunks:
+        if merged and chunk_begin <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], chunk_end)
+        else:
+            merged.append([chunk_begin, chunk_end])
+
+    if merged:
+        with open(path, mode='rb') as f:
+            for chunk_begin, chunk_end in merged:
+                for data in iter_bgzf_range(f, chunk_begin, chunk_end):
+                    yield data
@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+"""
+Build and read a sidecar index of a VCF file, recording the offsets of records at
+regular intervals along with the boundaries of each contig, so that data overlapping a
+genome region can be located without scanning from the start of the file, and a file
+can be split into ranges of similar numbers of records to be parsed in parallel.
+
+Unlike a tabix index, the file need not be compressed with bgzip. Offsets are byte
+offsets into uncompressed files, offsets into the decompressed data of gzip files,
+and virtual offsets into BGZF files. N.B., a gzip file still has to be decompressed
+from the start to reach an offset, but data before the offset is not parsed, and so a
+gzip file is not split into ranges to be parsed in parallel.
+
+"""
+from __future__ import absolute_import, print_function, division
+from bisect import bisect_left, bisect_right
+import gzip
+import json
+import os
+import threading
+import warnings
+
+
+from allel.compat import PY2
+from allel.io.bgzf import is_bgzf, read_block, inflate_block, iter_bgzf_range
+
+
+INDEX_EXT = '.vidx'
+INDEX_FORMAT = 'vidx'
+INDEX_VERSION = 2
+DEFAULT_INDEX_INTERVAL = 2**10
+
+
+class VCFIndex(object):
+    """Sidecar index of a VCF file.
+
+    Parameters
+    ----------
+    compression : {'none', 'gzip', 'bgzf'}
+        Compression of the indexed file.
+    header_end : int
+        Offset of the first record, i.e., the end of the header.
+    contigs : list of dict
+        For each run of consecutive records on the same contig, in file order, a
+        dictionary holding the contig name ('chrom'), the offsets of the first record
+        ('start') and following the last record ('stop'), the number of records
+        ('n_records'), whether records are sorted by position ('sorted'), and the
+        position and offset of every `interval` records, starting with the first
+        ('positions', 'offsets').
+    interval : int
+        Number of records between offsets recorded.
+    size : int, optional
+        Size in bytes of the indexed file.
+    mtime : float, optional
+        Modification time of the indexed file.
+
+    """
+
+    def __init__(self, compression, header_end, contigs, interval=DEFAULT_INDEX_INTERVAL,
+                 size=None, mtime=None):
+        self.compression = compression
+        self.header_end = header_end
+        self.contigs = contigs
+        self.interval = interval
+        self.size = size
+        self.mtime = mtime
+
+    @property
+    def names(self):
+        """Names of contigs, in order of first appearance within the file."""
+        names = list()
+        for contig in self.contigs:
+            if contig['chrom'] not in names:
+                names.append(contig['chrom'])
+        return names
+
+    @property
+    def data_offset(self):
+        """Offset of the first record, i.e., the end of the header."""
+        return self.header_end
+
+    @property
+    def data_end(self):
+        """Offset following the last record."""
+        if self.contigs:
+            return self.contigs[-1]['stop']
+        return self.header_end
+
+    def n_records(self, chrom=None):
+        """Number of records for the given contig, or in total if not given."""
+        return sum(contig['n_records'] for contig in self.contigs
+                   if chrom is None or contig['chrom'] == chrom)
+
+    def query(self, chrom, begin=None, end=None):
+        """Find ranges of the file holding records that may overlap a region.
+
+        Parameters
+        ----------
+        chrom : str
+            Contig name.
+        begin : int, optional
+            Start position (1-based, inclusive).
+        end : int, optional
+            Stop position (1-based, inclusive).
+
+        Returns
+        -------
+        ranges : list of (int, int) tuples
+            Sorted pairs of offsets (start, stop).
+
+        """
+        ranges = list()
+        for contig in self.contigs:
+            if contig['chrom'] != chrom:
+                continue
+            start, stop = contig['start'], contig['stop']
+            if contig['sorted']:
+                positions, offsets = contig['positions'], contig['offsets']
+                if begin:
+                    # start from the last record recorded before the region
+                    start = offsets[max(bisect_left(positions, begin) - 1, 0)]
+                if end:
+                    # stop at the first record recorded after the region
+                    i = bisect_right(positions, end)
+                    if i < len(offsets):
+                        stop = offsets[i]
+            if start < stop:
+                ranges.append((start, stop))
+        return ranges
+
+    def query_regions(self, regions):
+        """Find ranges of the file holding records that may overlap any of the given
+        regions, each a tuple of (chrom, begin, end). Returns sorted, non-overlapping
+        pairs of offsets (start, stop)."""
+        ranges = sorted(r for region in regions for r in self.query(*region))
+
+        # merge overlapping or adjacent ranges
+        merged = list()
+        for start, stop in ranges:
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], stop)
+            else:
+                merged.append([start, stop])
+        return [tuple(r) for r in merged]
+
+    def split(self, n):
+        """Split the records into up to `n` ranges holding similar numbers of records,
+        at offsets recorded in the index.
+
+        Returns
+        -------
+        ranges : list of (int, int, int) tuples
+            Pairs of offsets (start, stop) with the number of records in each range.
+
+        """
+
+        # offsets recorded, with the number of records preceding each
+        offsets, counts = list(), list()
+        n_records = 0
+        for contig in self.contigs:
+            for i, offset in enumerate(contig['offsets']):
+                offsets.append(offset)
+                counts.append(n_records + i * self.interval)
+            n_records += contig['n_records']
+        offsets.append(self.data_end)
+        counts.append(n_records)
+
+        # choose offsets closest to an even split
+        cuts = sorted(set(bisect_left(counts, n_records * i / n) for i in range(n + 1)))
+        return [(offsets[i], offsets[j], counts[j] - counts[i])
+                for i, j in zip(cuts[:-1], cuts[1:]) if counts[j] > counts[i]]
+
+    def to_dict(self):
+        return dict(format=INDEX_FORMAT, version=INDEX_VERSION,
+                    compression=self.compression, header_end=self.header_end,
+                    interval=self.interval, size=self.size, mtime=self.mtime,
+                    contigs=self.contigs)
+
+
+def _iter_lines(fileobj):
+    """Iterate over lines, yielding the offset of the start of each line with the line."""
+    offset = 0
+    for line in fileobj:
+        yield offset, line
+        offset += len(line)
+
+
+def _iter_bgzf_lines(fileobj):
+    """Iterate over lines of a BGZF file, yielding the virtual offset of the start of
+    each line with the line."""
+    partial, partial_offset = b'', 0
+    while True:
+        block_offset = fileobj.tell()
+        block = read_block(fileobj)
+        if block is None:
+            break
+        data = inflate_block(block)
+        start = 0
+        if partial:
+            i = data.find(b'\n')
+            if i < 0:
+                partial += data
+                continue
+            yield partial_offset, partial + data[:i + 1]
+            partial, start = b'', i + 1
+        while True:
+            i = data.find(b'\n', start)
+            if i < 0:
+                break
+            yield (block_offset << 16) | start, data[start:i + 1]
+            start = i + 1
+        if start < len(data):
+            partial, partial_offset = data[start:], (block_offset << 16) | start
+    if partial:
+        yield partial_offset, partial
+
+
+def _file_compression(path):
+    if is_bgzf(path):
+        return 'bgzf'
+    with open(path, mode='rb') as f:
+        if f.read(2) == b'\x1f\x8b':
+            return 'gzip'
+    return 'none'
+
+
+def index_vcf(input, output=None, interval=DEFAULT_INDEX_INTERVAL):
+    """Build a sidecar index of a VCF file by reading through the file once, recording
+    the offset of every `interval` records along with the boundaries of each contig.
+    The index is used automatically when reading a region from the file, or when
+    splitting the file into shards to be parsed in parallel, e.g., via the
+    `n_processes` argument of :func:`allel.vcf_to_zarr`. N.B., a file compressed with
+    gzip rather than bgzip is not split into shards, as each shard would have to be
+    decompressed from the start of the file. The index is ignored if the file is
+    modified after indexing.
+
+    Parameters
+    ----------
+    input : string
+        Path to VCF file on the local file system. May be uncompressed, or compressed
+        with gzip or bgzip.
+    output : string, optional
+        Path to write the index to. Defaults to the path of the VCF file with the
+        extension '.vidx' appended, where it will be found when reading the file.
+    interval : int, optional
+        Number of records between offsets recorded. Smaller values give finer grained
+        access at the cost of a larger index.
+
+    Returns
+    -------
+    index : VCFIndex
+
+    """
+
+    if output is None:
+        output = input + INDEX_EXT
+    # N.B., recorded to check the file is not modified after indexing
+    stat = os.stat(input)
+    compression = _file_compression(input)
+    if compression == 'bgzf':
+        fileobj = open(input, mode='rb')
+        lines = _iter_bgzf_lines(fileobj)
+    else:
+        fileobj = gzip.open(input, mode='rb') if compression == 'gzip' else \
+            open(input, mode='rb')
+        lines = _iter_lines(fileobj)
+
+    contigs = list()
+    contig = None
+    chrom = None
+    header_end = None
+    prev_pos = 0
+    end = 0
+    with fileobj:
+        for offset, line in lines:
+            end = offset + len(line)
+            if offset == 0 and line.startswith(b'BCF'):
+                raise ValueError('BCF files cannot be indexed: %r' % input)
+            if header_end is None:
+                if line.startswith(b'#'):
+                    continue
+                header_end = offset
+            if not line.strip():
+                continue
+            tab = line.find(b'\t')
+            if contig is None or line[:tab] != chrom:
+                chrom = line[:tab]
+                if contig is not None:
+                    contig['stop'] = offset
+                contig = dict(chrom=chrom if PY2 else str(chrom, 'utf8'), start=offset,
+                              stop=None, n_records=0, sorted=True, positions=list(),
+                              offsets=list())
+                contigs.append(contig)
+                prev_pos = 0
+            pos = int(line[tab + 1:line.find(b'\t', tab + 1)])
+            if pos < prev_pos:
+                contig['sorted'] = False
+            prev_pos = pos
+            if contig['n_records'] % interval == 0:
+                contig['positions'].append(pos)
+                contig['offsets'].append(offset)
+            contig['n_records'] += 1
+
+    if compression == 'bgzf':
+        # N.B., a virtual offset beyond the last block reads to the end of the file
+        end = os.path.getsize(input) << 16
+    if header_end is None:
+        header_end = end
+    if contig is not None:
+        contig['stop'] = end
+
+    index = VCFIndex(compression, header_end, contigs, interval=interval,
+                     size=stat.st_size, mtime=stat.st_mtime)
+    with open(output, mode='w') as f:
+        json.dump(index.to_dict(), f)
+    return index
+
+
+def read_vcf_index(path):
+    """Read an index file written by :func:`index_vcf`.
+
+    Returns
+    -------
+    index : VCFIndex
+
+    """
+    with open(path, mode='r') as f:
+        d = json.load(f)
+    if d.get('format') != INDEX_FORMAT:
+        raise ValueError('not a VCF index: %r' % path)
+    if d.get('version') != INDEX_VERSION:
+        raise ValueError('unsupported VCF index version %r: %r' % (d.get('version'), path))
+    return VCFIndex(d['compression'], d['header_end'], d['contigs'],
+                    interval=d['interval'], size=d['size'], mtime=d['mtime'])
+
+
+_cache = dict()
+_cache_lock = threading.Lock()
+
+
+def load_vcf_index(path):
+    """Load the sidecar index for the VCF file at `path`, caching the result until
+    either file is modified.
+
+    Returns
+    -------
+    index : VCFIndex or None
+        None if no index file could be found, or the index could not be read or does
+        not match the size and modification time of the file.
+
+    """
+
+    index_path = path + INDEX_EXT
+    if not os.path.exists(index_path):
+        return None
+    stat = os.stat(path)
+    key = (stat.st_size, stat.st_mtime, os.stat(index_path).st_mtime)
+    with _cache_lock:
+        cached = _cache.get(path)
+    if cached is not None and cached[0] == key:
+        index = cached[1]
+    else:
+        try:
+            index = read_vcf_index(index_path)
+        except ValueError as e:
+            warnings.warn('%s; ignoring index' % e)
+            return None
+        with _cache_lock:
+            _cache[path] = key, index
+
+    if index.size != stat.st_size or index.mtime != stat.st_mtime:
+        warnings.warn('data file has been modified since index file %r was built; '
+                      'ignoring index' % index_path)
+        return None
+    return index
+
+
+def _iter_file_range(fileobj, start, stop, block_size=2**20):
+    fileobj.seek(start)
+    while start < stop:
+        data = fileobj.read(min(block_size, stop - start))
+        if not data:
+            break
+        start += len(data)
+        yield data
+
+
+def iter_index_ranges(path, index, ranges):
+    """Iterate over data from the VCF file at `path`, comprising the header followed by
+    data within each of the given sorted, non-overlapping ranges of offsets, as found
+    via the `index`."""
+    if index.compression == 'bgzf':
+        with open(path, mode='rb') as f:
+            for data in iter_bgzf_range(f, 0, index.header_end):
+                yield data
+            for start, stop in ranges:
+                for data in iter_bgzf_range(f, start, stop):
+                    yield data
+    else:
+        # N.B., for gzip, seeking forward decompresses without parsing
+        f = gzip.open(path, mode='rb') if index.compression == 'gzip' else \
+            open(path, mode='rb')
+        with f:
+            for data in _iter_file_range(f, 0, index.header_end):
+                yield data
+            for start, stop in ranges:
+                for data in _iter_file_range(f, start, stop):
+                    yield data
@@ -7,21 +7,38 @@ and loading into NumPy arrays, NumPy files, HDF5 files or Zarr array stores.
 
 """
 from __future__ import absolute_import, print_function, division
+import ast
 import gzip
+import io
+import json
 import os
 import re
+import struct
 from collections import namedtuple, defaultdict
 import warnings
 import time
 import subprocess
 import textwrap
+import tempfile
+import shutil
+import threading
+from multiprocessing.pool import ThreadPool
 
 
 import numpy as np
 
 
-from allel.compat import PY2, FileNotFoundError, text_type
-from allel.opt.io_vcf_read import VCFChunkIterator, FileInputStream
+from allel.compat import PY2, FileNotFoundError, text_type, queue
+from allel.opt.io_vcf_read import (VCFChunkIterator, VCFParallelChunkIterator,
+                                   BCFChunkIterator, FileInputStream, BlockInputStream,
+                                   MemoryMappedInputStream, VCFSizeScanner, OFFSETS_TYPE,
+                                   normalize_regions)
+from allel.io.bgzf import is_bgzf, iter_bgzf_blocks
+from allel.io.tabix import load_index, iter_regions
+from allel.io.vcf_index import load_vcf_index, iter_index_ranges
+# expose some names from the sidecar index module
+# noinspection PyUnresolvedReferences
+from allel.io.vcf_index import index_vcf, read_vcf_index, VCFIndex  # noqa: F401
 # expose some names from cython extension
 # noinspection PyUnresolvedReferences
 from allel.opt.io_vcf_read import (  # noqa: F401
@@ -37,6 +54,7 @@ from allel.opt.io_vcf_read import (  # noqa: F401
 DEFAULT_BUFFER_SIZE = 2**14
 DEFAULT_CHUNK_LENGTH = 2**16
 DEFAULT_CHUNK_WIDTH = 2**6
+DEFAULT_QUEUE_DEPTH = 2
 DEFAULT_ALT_NUMBER = 3
 
 
@@ -46,6 +64,12 @@ FIELD_ALTLEN = 'altlen'
 FIELD_IS_SNP = 'is_snp'
 COMPUTED_FIELDS = [FIELD_NUMALT, FIELD_ALTLEN, FIELD_IS_SNP]
 
+# names for fields computed from genotype calls, only computed if requested
+FIELD_AC = 'ac'
+FIELD_AN = 'an'
+FIELD_N_MISSING = 'n_missing'
+GENOTYPE_COMPUTED_FIELDS = [FIELD_AC, FIELD_AN, FIELD_N_MISSING]
+
 
 def _prep_fields_param(fields):
     """Prepare the `fields` parameter, and determine whether or not to store samples."""
@@ -99,13 +123,299 @@ def _chunk_iter_progress(it, log, prefix):
     log.flush()
 
 
-def _chunk_iter_transform(it, transformers):
+class VCFIngestStats(object):
+    """Throughput and timing statistics collected while reading data from a VCF file,
+    e.g., to find out which stage of processing limits the rate of ingest.
+
+    Provide an instance as the `stats` argument to :func:`iter_vcf_chunks`,
+    :func:`vcf_to_zarr` or :func:`vcf_to_hdf5`, and statistics will be accumulated as
+    data are processed. The same instance may be used for several calls.
+
+    Parameters
+    ----------
+    log : string or file-like, optional
+        If provided, statistics are also written to this file (or appended to the file
+        at this path) as JSON lines, one line after each chunk has been parsed, and
+        another line once processing is done.
+
+    Attributes
+    ----------
+    n_chunks : int
+        Number of chunks processed.
+    n_variants : int
+        Number of variants processed.
+    bytes_in : int
+        Number of bytes of input read, after any decompression.
+    bytes_out : int
+        Number of bytes of data in the arrays produced, before any compression.
+    elapsed : float
+        Time in seconds from the start of processing until done.
+    stages : dict
+        Cumulative time in seconds spent in each stage of processing: 'read' (reading
+        and decompressing input), 'parse' (parsing, excluding reading), 'transform'
+        (applying any transformers) and 'store' (compressing and storing data).
+        Stages run by background threads overlap, so times may add up to more than
+        the elapsed time.
+    fields : dict
+        Cumulative time in seconds spent parsing each column of the VCF (e.g., 'CHROM',
+        'ALT', 'INFO', 'calldata'), each INFO and FORMAT field extracted (e.g.,
+        'variants/DP', 'calldata/GT') and evaluating any filter expression
+        ('filter_expression'). Times for INFO and FORMAT fields are part of the times
+        for the 'INFO' and 'calldata' columns. When parsing with multiple threads,
+        times are summed over all threads. Not available for BCF files.
+
+    Notes
+    -----
+    Values of FORMAT fields are parsed for each sample, and take little more time to
+    parse than it takes to read the clock, so times for FORMAT fields are estimated by
+    timing the values of one in every 32 variants. Timing adds some overhead to
+    parsing, typically around 10-20%.
+
+    Examples
+    --------
+    >>> import allel
+    >>> stats = allel.VCFIngestStats()
+    >>> allel.vcf_to_zarr('example.vcf', 'example.zarr', stats=stats)  # doctest: +SKIP
+    >>> stats.variants_per_second  # doctest: +SKIP
+    >>> sorted(stats.stages.items(), key=lambda kv: -kv[1])  # doctest: +SKIP
+
+    """
+
+    def __init__(self, log=None):
+        self.log = log
+        self.n_chunks = 0
+        self.n_variants = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.elapsed = 0.
+        self.stages = defaultdict(float)
+        self.fields = defaultdict(float)
+        self._start = None
+        self._elapsed_before = 0.
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the clock, unless already running."""
+        if self._start is None:
+            self._start = time.time()
+
+    def finish(self):
+        """Stop the clock, and write statistics to the log."""
+        if self._start is not None:
+            self._elapsed_before += time.time() - self._start
+            self._start = None
+        self.elapsed = self._elapsed_before
+        self._emit('done')
+
+    def add_time(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] += seconds
+
+    def add_fields(self, fields):
+        with self._lock:
+            for k, v in fields.items():
+                self.fields[k] += v
+
+    def add_chunk(self, chunk, chunk_length):
+        with self._lock:
+            self.n_chunks += 1
+            self.n_variants += chunk_length
+            self.bytes_out += sum(a.nbytes for a in chunk.values())
+        self._emit('chunk')
+
+    def merge(self, other):
+        """Add statistics from another instance, or a dictionary as returned by
+        :func:`to_dict`, e.g., collected by a worker process."""
+        if isinstance(other, VCFIngestStats):
+            other = other.to_dict()
+        with self._lock:
+            self.n_chunks += other['n_chunks']
+            self.n_variants += other['n_variants']
+            self.bytes_in += other['bytes_in']
+            self.bytes_out += other['bytes_out']
+            for k, v in other['stages'].items():
+                self.stages[k] += v
+            for k, v in other['fields'].items():
+                self.fields[k] += v
+
+    @property
+    def variants_per_second(self):
+        elapsed = self._current_elapsed()
+        return self.n_variants / elapsed if elapsed > 0 else 0.
+
+    @property
+    def bytes_in_per_second(self):
+        elapsed = self._current_elapsed()
+        return self.bytes_in / elapsed if elapsed > 0 else 0.
+
+    def _current_elapsed(self):
+        if self._start is None:
+            return self.elapsed
+        return self._elapsed_before + time.time() - self._start
+
+    def to_dict(self):
+        """Return statistics as a dictionary of JSON-serializable values."""
+        with self._lock:
+            return dict(
+                n_chunks=self.n_chunks,
+                n_variants=self.n_variants,
+                bytes_in=self.bytes_in,
+                bytes_out=self.bytes_out,
+                elapsed=self._current_elapsed(),
+                variants_per_second=self.variants_per_second,
+                bytes_in_per_second=self.bytes_in_per_second,
+                stages=dict(self.stages),
+                fields=dict(self.fields),
+            )
+
+    def _emit(self, event):
+        if self.log is None:
+            return
+        line = json.dumps(dict(self.to_dict(), event=event, time=time.time()),
+                          sort_keys=True)
+        if isinstance(self.log, str):
+            with open(self.log, mode='a') as f:
+                print(line, file=f)
+        else:
+            print(line, file=self.log)
+            self.log.flush()
+
+    def __repr__(self):
+        return ('<%s n_variants=%s elapsed=%.2fs variants_per_second=%.1f>'
+                % (type(self).__name__, self.n_variants, self._current_elapsed(),
+                   self.variants_per_second))
+
+
+def _chunk_iter_parse_stats(chunks, stream, stats):
+    """Wrap a chunk iterator to record the time spent reading and parsing each chunk."""
+    timings = getattr(chunks, 'timings', None)
+    # N.B., include headers
+    bytes_consumed = 0
+    read_time = 0
+    fields = dict()
+    while True:
+        before = time.time()
+        item = next(chunks, None)
+        elapsed = time.time() - before
+
+        # N.B., the input stream is read while parsing
+        stats.add_time('read', stream.read_time - read_time)
+        stats.add_time('parse', elapsed - (stream.read_time - read_time))
+        with stats._lock:
+            stats.bytes_in += stream.bytes_consumed - bytes_consumed
+        bytes_consumed = stream.bytes_consumed
+        read_time = stream.read_time
+        if timings is not None:
+            fields_total = timings()
+            stats.add_fields({k: v - fields.get(k, 0) for k, v in fields_total.items()})
+            fields = fields_total
+
+        if item is None:
+            return
+        yield item
+
+
+def _chunk_iter_stats(it, stats):
+    """Wrap a chunk iterator to count the chunks and variants produced."""
+    for chunk, chunk_length, chrom, pos in it:
+        stats.add_chunk(chunk, chunk_length)
+        yield chunk, chunk_length, chrom, pos
+
+
+def _chunk_iter_finish_stats(it, stats):
+    """Wrap a chunk iterator to stop the clock once the iterator is exhausted."""
+    stats.start()
+    for item in it:
+        yield item
+    stats.finish()
+
+
+def _transform_chunk(transformers, chunk, stats=None):
+    before = time.time()
+    for transformer in transformers:
+        transformer.transform_chunk(chunk)
+    if stats is not None:
+        stats.add_time('transform', time.time() - before)
+    return chunk
+
+
+def _chunk_iter_transform(it, transformers, background=False, stats=None):
+    """Apply transformers to each chunk. If `background` is True, each chunk is
+    transformed by a background thread while the next chunk is being parsed."""
+
+    if not background:
+        for chunk, chunk_length, chrom, pos in it:
+            yield _transform_chunk(transformers, chunk, stats), chunk_length, chrom, pos
+        return
+
+    pool = ThreadPool(1)
+    try:
+        pending = None
+        for chunk, chunk_length, chrom, pos in it:
+            result = pool.apply_async(_transform_chunk, (transformers, chunk, stats))
+            if pending is not None:
+                result_prev, chunk_length_prev, chrom_prev, pos_prev = pending
+                yield result_prev.get(), chunk_length_prev, chrom_prev, pos_prev
+            pending = result, chunk_length, chrom, pos
+        if pending is not None:
+            result, chunk_length, chrom, pos = pending
+            yield result.get(), chunk_length, chrom, pos
+    finally:
+        pool.terminate()
+
+
+def _chunk_iter_decode_offsets(it):
+    """Convert any strings stored as offsets into object arrays, as for type 'object',
+    for outputs which don't support them."""
     for chunk, chunk_length, chrom, pos in it:
-        for transformer in transformers:
-            transformer.transform_chunk(chunk)
+        for k, a in chunk.items():
+            if not isinstance(a, np.ndarray):
+                chunk[k] = np.char.decode(np.asarray(a), 'utf8').astype(object)
         yield chunk, chunk_length, chrom, pos
 
 
+def _chunk_iter_store(it, store, queue_depth):
+    """Pass each chunk from the iterator to the `store` function. If `queue_depth` is
+    positive, chunks are stored by a background thread while the next chunks are being
+    parsed, holding at most `queue_depth` parsed chunks waiting to be stored."""
+
+    if not queue_depth:
+        for chunk, _, _, _ in it:
+            store(chunk)
+        return
+
+    q = queue.Queue(maxsize=queue_depth)
+    errors = list()
+
+    def writer():
+        while True:
+            chunk = q.get()
+            if chunk is None:
+                break
+            if not errors:
+                # N.B., after an error keep draining the queue so the producer never
+                # blocks
+                try:
+                    store(chunk)
+                except BaseException as e:
+                    errors.append(e)
+
+    t = threading.Thread(target=writer)
+    t.daemon = True
+    t.start()
+    try:
+        for chunk, _, _, _ in it:
+            if errors:
+                break
+            q.put(chunk)
+    finally:
+        q.put(None)
+        t.join()
+
+    if errors:
+        raise errors[0]
+
+
 def _do_rename(it, fields, rename_fields, headers):
 
     # normalise keys
@@ -135,7 +445,12 @@ def _chunk_iter_rename(it, rename_fields):
 
 _doc_param_input = \
     """Path to VCF file on the local file system. May be uncompressed or gzip-compatible
-        compressed file. May also be a file-like object (e.g., `io.BytesIO`)."""
+        compressed file. May also be a file-like object (e.g., `io.BytesIO`). A path to a
+        BCF file (binary VCF, usually compressed with BGZF) is also accepted and decoded
+        natively, BCF input is recognised by its content rather than its name. May also
+        be a list of paths, in which case variants are read from each file in turn as if
+        from a single file; headers are read from the first file, and all files must
+        hold the same samples."""
 
 _doc_param_fields = \
     """Fields to extract data for. Should be a list of strings, e.g., ``['variants/CHROM',
@@ -161,7 +476,18 @@ _doc_param_types = \
     """Overide data types. Should be a dictionary mapping field names to NumPy data types.
         E.g., providing the dictionary ``{'variants/DP': 'i8', 'calldata/GQ': 'i2'}`` will
         mean the 'variants/DP' field is stored in a 64-bit integer array, and the
-        'calldata/GQ' field is stored in a 16-bit integer array."""
+        'calldata/GQ' field is stored in a 16-bit integer array. String types may be
+        given without a size, e.g., ``{'variants/REF': 'S'}``, in which case the input
+        is scanned first to find the length of the longest value, so values are never
+        truncated. Diploid genotype calls may be stored packed, either one byte per call
+        as for :func:`allel.GenotypeArray.to_packed` with type ``'genotype_packed/u1'``,
+        or with type ``'genotype_2bit/u1'`` as four calls per byte, each call coded as
+        the number of alternate alleles (0, 1 or 2), or 3 if any allele is missing or
+        greater than 1, with the first call in the lowest two bits. The ID, REF and ALT
+        fields and string INFO fields may be given type ``'offsets'``, in which case
+        values are stored without padding in a single buffer of bytes, with an array of
+        offsets into that buffer, as an :class:`allel.OffsetStringArray`. Input with
+        such fields is always parsed in a single thread."""
 
 _doc_param_numbers = \
     """Override the expected number of values. Should be a dictionary mapping field names
@@ -174,7 +500,8 @@ _doc_param_numbers = \
 _doc_param_alt_number = \
     """Assume this number of alternate alleles and set expected number of values
         accordingly for any field declared with number 'A' or 'R' in the VCF
-        meta-information."""
+        meta-information. If 'auto', the input is scanned first to find the maximum
+        number of alternate alleles."""
 
 _doc_param_fills = \
     """Override the fill value used for empty values. Should be a dictionary mapping
@@ -189,13 +516,21 @@ _doc_param_region = \
         the default tabix behaviour, where a variant (e.g., deletion) may be included
         if its position (POS) occurs before the requested region but its reference allele
         overlaps the region - such a variant will *not* be included in the data
-        returned by this function."""
+        returned by this function. May also be a list of region strings, in which case
+        variants within any of the regions are extracted, in order of position within
+        the file; overlapping regions are merged, so each variant is extracted only
+        once."""
 
 _doc_param_tabix = \
-    """Name or path to tabix executable. Only required if `region` is given. Setting
-        `tabix` to `None` will cause a fall-back to scanning through the VCF file from
-        the beginning, which may be much slower than tabix but the only option if tabix
-        is not available on your system and/or the VCF file has not been tabix-indexed."""
+    """Name or path to tabix executable. Only required if `region` is given and the
+        index of a compressed VCF file (.tbi or .csi) cannot be found alongside it, in
+        which case the index is read directly. Setting `tabix` to `None` will cause a
+        fall-back to scanning through the VCF file from the beginning, ignoring any
+        index, which may be much slower but is the only option if tabix is not available
+        on your system and/or the VCF file has not been tabix-indexed, or if the index is
+        stale or corrupt. If there is no tabix index but a sidecar index built by
+        :func:`allel.index_vcf` is found, that is used instead, whether or not the file
+        is compressed."""
 
 _doc_param_samples = \
     """Selection of samples to extract calldata for. If provided, should be a list of
@@ -207,7 +542,8 @@ _doc_param_transformers = \
         objects, each of which must implement a "transform()" method that accepts a dict
         containing the chunk of data to be transformed. See also the
         :class:`ANNTransformer` class which implements post-processing of data from
-        SNPEFF."""
+        SNPEFF. If parsing with multiple threads, each chunk is transformed by a
+        background thread while the next chunk is being parsed."""
 
 _doc_param_buffer_size = \
     """Size in bytes of the I/O buffer used when reading data from the underlying file or
@@ -216,9 +552,55 @@ _doc_param_buffer_size = \
 _doc_param_chunk_length = \
     """Length (number of variants) of chunks in which data are processed."""
 
+_doc_param_max_memory = \
+    """Approximate number of bytes to use for the arrays holding the data parsed for
+        each chunk. If provided, `chunk_length` is ignored and instead determined from
+        the types and numbers of the fields to extract and the number of samples."""
+
+_doc_param_n_threads = \
+    """Number of threads to use for parsing. If provided, blocks of lines within each
+        chunk are parsed concurrently. Note that, when parsing in parallel, chunks may
+        hold fewer than `chunk_length` variants if some variants are skipped (e.g.,
+        because they fall outside the requested region). If the input is a file
+        compressed with bgzip (BGZF format), blocks of data are also decompressed in a
+        background pool of `n_threads` threads. BCF records are decoded serially, but
+        BGZF blocks are still decompressed in the background."""
+
+_doc_param_queue_depth = \
+    """Maximum number of parsed chunks waiting to be stored. If positive, chunks are
+        compressed and stored by a background thread while the next chunk is being
+        parsed. Set to 0 to parse and store chunks in turn."""
+
+_doc_param_filter_expression = \
+    """Expression selecting variants to extract. If provided, should be a string holding
+        a Python expression over variants fields, e.g., "(QUAL > 30) & FILTER_PASS" or
+        "is_snp and DP >= 10 and AF[0] > 0.05". Fields may be fixed fields, INFO
+        fields, FILTER fields or computed fields, and need not be among the fields
+        requested. Fields with more than one value must be indexed (e.g., "ALT[0]").
+        Supports arithmetic, comparisons and logical operators (and, or, not, &, |, ~).
+        String fields may only be compared for equality with a string, e.g.,
+        "REF == 'A'". Variants are filtered as they are parsed, and calldata are not
+        parsed at all for rejected variants."""
+
+_doc_param_subpops = \
+    """Groups of samples for which to compute allele counts while parsing, as a
+        dictionary mapping group names to sequences of sample names or of indices into
+        the samples being extracted. Allele counts for each group are stored in a field
+        named 'variants/ac_' followed by the group name, e.g., providing the dictionary
+        ``{{'A': [0, 1], 'B': [2, 3]}}`` will mean the 'variants/ac_A' and
+        'variants/ac_B' fields are stored. Counts are computed from the genotype
+        calls, as are the 'variants/ac' (allele counts), 'variants/an' (number of
+        called alleles) and 'variants/n_missing' (number of genotype calls with a
+        missing allele) fields, which may also be requested."""
+
 _doc_param_log = \
     """A file-like object (e.g., `sys.stderr`) to print progress information."""
 
+_doc_param_stats = \
+    """If provided, throughput and timing statistics are accumulated into this object as
+        data are processed, including the time spent in each stage of processing and
+        parsing each field. See :class:`VCFIngestStats`."""
+
 
 # noinspection PyShadowingBuiltins
 def read_vcf(input,
@@ -235,7 +617,12 @@ def read_vcf(input,
              transformers=None,
              buffer_size=DEFAULT_BUFFER_SIZE,
              chunk_length=DEFAULT_CHUNK_LENGTH,
-             log=None):
+             max_memory=None,
+             n_threads=None,
+             filter_expression=None,
+             subpops=None,
+             log=None,
+             by_region=False):
     """Read data from a VCF file into NumPy arrays.
 
     .. versionchanged:: 1.12.0
@@ -244,7 +631,7 @@ def read_vcf(input,
 
     Parameters
     ----------
-    input : string or file-like
+    input : string, file-like or list of strings
         {input}
     fields : list of strings, optional
         {fields}
@@ -256,11 +643,11 @@ def read_vcf(input,
         {types}
     numbers : dict, optional
         {numbers}
-    alt_number : int, optional
+    alt_number : int or 'auto', optional
         {alt_number}
     fills : dict, optional
         {fills}
-    region : string, optional
+    region : string or list of strings, optional
         {region}
     tabix : string, optional
         {tabix}
@@ -272,16 +659,32 @@ def read_vcf(input,
         {buffer_size}
     chunk_length : int, optional
         {chunk_length}
+    max_memory : int, optional
+        {max_memory}
+    n_threads : int, optional
+        {n_threads}
+    filter_expression : string, optional
+        {filter_expression}
+    subpops : dict, optional
+        {subpops}
     log : file-like, optional
         {log}
+    by_region : bool, optional
+        If True, split the data by region, returning a dictionary mapping each region
+        string given via `region` to the data for variants within that region. Requires
+        the 'variants/CHROM' and 'variants/POS' fields to be extracted.
 
     Returns
     -------
     data : dict[str, ndarray]
-        A dictionary holding arrays, or None if no variants were found.
+        A dictionary holding arrays, or None if no variants were found. If `by_region`
+        is True, a dictionary mapping regions to such dictionaries.
 
     """
 
+    if by_region and region is None:
+        raise ValueError('region must be given to split data by region')
+
     # samples requested?
     # noinspection PyTypeChecker
     store_samples, fields = _prep_fields_param(fields)
@@ -290,9 +693,13 @@ def read_vcf(input,
     fields, samples, headers, it = iter_vcf_chunks(
         input=input, fields=fields, exclude_fields=exclude_fields, types=types,
         numbers=numbers, alt_number=alt_number, buffer_size=buffer_size,
-        chunk_length=chunk_length, fills=fills, region=region, tabix=tabix,
-        samples=samples, transformers=transformers
+        chunk_length=chunk_length, max_memory=max_memory, n_threads=n_threads,
+        fills=fills, region=region, tabix=tabix, samples=samples,
+        transformers=transformers, filter_expression=filter_expression, subpops=subpops
     )
+    if by_region and ('variants/CHROM' not in fields or 'variants/POS' not in fields):
+        raise ValueError("fields 'variants/CHROM' and 'variants/POS' are required to "
+                         "split data by region")
 
     # handle field renaming
     if rename_fields:
@@ -304,27 +711,127 @@ def read_vcf(input,
     if log is not None:
         it = _chunk_iter_progress(it, log, prefix='[read_vcf]')
 
-    # read all chunks into a list
-    chunks = [d[0] for d in it]
+    # read all chunks directly into output arrays
+    capacity = None
+    if filter_expression is None:
+        capacity = _count_variants(input, region)
+    output = _chunk_iter_collect(it, capacity=capacity)
 
-    if chunks:
+    if by_region:
+        output = _split_by_region(output, region, rename_fields)
+        for data in output.values():
+            if data is not None and len(samples) > 0 and store_samples:
+                data['samples'] = samples
 
-        # setup output
-        output = dict()
+    elif output is not None and len(samples) > 0 and store_samples:
+        output['samples'] = samples
 
-        if len(samples) > 0 and store_samples:
-            output['samples'] = samples
+    return output
 
-        # find array keys
-        keys = sorted(chunks[0].keys())
-
-        # concatenate chunks
-        for k in keys:
-            output[k] = np.concatenate([chunk[k] for chunk in chunks], axis=0)
 
+def _split_by_region(output, region, rename_fields=None):
+    """Split data into a dictionary mapping each region string to the data for variants
+    within that region, or None if there are none."""
+
+    if isinstance(region, (str, text_type)):
+        region = [region]
+    if output is None:
+        return dict((r, None) for r in region)
+
+    rename_fields = rename_fields or dict()
+    chrom = np.asarray(output[rename_fields.get('variants/CHROM', 'variants/CHROM')])
+    pos = output[rename_fields.get('variants/POS', 'variants/POS')]
+
+    split = dict()
+    for r in region:
+        loc = np.zeros(pos.shape[0], dtype=bool)
+        for c, begin, end in normalize_regions(r):
+            if chrom.dtype.kind == 'S' and isinstance(c, text_type):
+                c = c.encode('utf8')
+            loc_region = chrom == c
+            if begin > 0:
+                loc_region &= pos >= begin
+            if end > 0:
+                loc_region &= pos <= end
+            loc |= loc_region
+        index, = np.nonzero(loc)
+        if index.shape[0] == 0:
+            split[r] = None
+        else:
+            split[r] = dict((k, a[index]) for k, a in output.items())
+    return split
+
+
+def _count_variants(input, region):
+    """Obtain the number of variants that will be read, if it can be determined cheaply
+    from a tabix index, otherwise None."""
+    if isinstance(input, (list, tuple)):
+        counts = [_count_variants(i, region) for i in input]
+        if None in counts:
+            return None
+        return sum(counts)
+    if not isinstance(input, str):
+        return None
+    index = load_index(input) if input.endswith('gz') else None
+    if index is None:
+        index = load_vcf_index(input)
+    if index is None:
+        return None
+    if region is None:
+        counts = [index.n_records(chrom) for chrom in index.names]
     else:
+        regions = normalize_regions(region)
+        if any(begin or end for _, begin, end in regions):
+            return None
+        counts = [index.n_records(chrom) for chrom, _, _ in regions]
+    if None in counts:
+        return None
+    return sum(counts)
+
+
+def _chunk_iter_collect(it, capacity=None):
+    """Read chunks into output arrays which are grown in place as needed, so peak memory
+    usage stays close to the size of the final arrays. Returns None if there are no
+    chunks."""
 
-        output = None
+    output = None
+    offsets_chunks = dict()
+    n_variants = 0
+
+    for chunk, chunk_length, _, _ in it:
+
+        if output is None:
+            # allocate output arrays, N.B., pages are not committed until written
+            capacity = max(capacity or 0, chunk_length)
+            output = dict((k, np.empty((capacity,) + a.shape[1:], dtype=a.dtype))
+                          for k, a in chunk.items() if isinstance(a, np.ndarray))
+            offsets_chunks = dict((k, list()) for k, a in chunk.items()
+                                  if not isinstance(a, np.ndarray))
+
+        stop = n_variants + chunk_length
+        if stop > capacity:
+            # grow geometrically, resizing in place avoids holding two copies
+            capacity = max(capacity * 2, stop)
+            for a in output.values():
+                a.resize((capacity,) + a.shape[1:], refcheck=False)
+
+        for k, a in output.items():
+            data = chunk[k]
+            if data.dtype != a.dtype:
+                # e.g., strings of differing lengths from a transformer
+                a = output[k] = a.astype(np.promote_types(a.dtype, data.dtype))
+            a[n_variants:stop] = data
+        for k, chunks in offsets_chunks.items():
+            # strings stored as offsets, concatenated once all chunks are read
+            chunks.append(chunk[k])
+        n_variants = stop
+
+    if output is not None:
+        # release any unused capacity
+        for a in output.values():
+            a.resize((n_variants,) + a.shape[1:], refcheck=False)
+        for k, chunks in offsets_chunks.items():
+            output[k] = chunks[0].concatenate(chunks[1:])
 
     return output
 
@@ -344,6 +851,10 @@ read_vcf.__doc__ = read_vcf.__doc__.format(
     transformers=_doc_param_transformers,
     buffer_size=_doc_param_buffer_size,
     chunk_length=_doc_param_chunk_length,
+    max_memory=_doc_param_max_memory,
+    n_threads=_doc_param_n_threads,
+    filter_expression=_doc_param_filter_expression,
+    subpops=_doc_param_subpops,
     log=_doc_param_log,
 )
 
@@ -372,6 +883,10 @@ def vcf_to_npz(input, output,
                transformers=None,
                buffer_size=DEFAULT_BUFFER_SIZE,
                chunk_length=DEFAULT_CHUNK_LENGTH,
+               max_memory=None,
+               n_threads=None,
+               filter_expression=None,
+               subpops=None,
                log=None):
     """Read data from a VCF file into NumPy arrays and save as a .npz file.
 
@@ -381,7 +896,7 @@ def vcf_to_npz(input, output,
 
     Parameters
     ----------
-    input : string
+    input : string or list of strings
         {input}
     output : string
         {output}
@@ -399,11 +914,11 @@ def vcf_to_npz(input, output,
         {types}
     numbers : dict, optional
         {numbers}
-    alt_number : int, optional
+    alt_number : int or 'auto', optional
         {alt_number}
     fills : dict, optional
         {fills}
-    region : string, optional
+    region : string or list of strings, optional
         {region}
     tabix : string, optional
         {tabix}
@@ -415,6 +930,14 @@ def vcf_to_npz(input, output,
         {buffer_size}
     chunk_length : int, optional
         {chunk_length}
+    max_memory : int, optional
+        {max_memory}
+    n_threads : int, optional
+        {n_threads}
+    filter_expression : string, optional
+        {filter_expression}
+    subpops : dict, optional
+        {subpops}
     log : file-like, optional
         {log}
 
@@ -429,8 +952,9 @@ def vcf_to_npz(input, output,
         input=input, fields=fields, exclude_fields=exclude_fields,
         rename_fields=rename_fields, types=types, numbers=numbers,
         alt_number=alt_number, buffer_size=buffer_size, chunk_length=chunk_length,
-        log=log, fills=fills, region=region, tabix=tabix, samples=samples,
-        transformers=transformers
+        max_memory=max_memory, n_threads=n_threads, log=log, fills=fills, region=region,
+        tabix=tabix, samples=samples, transformers=transformers,
+        filter_expression=filter_expression, subpops=subpops
     )
 
     if data is None:
@@ -464,6 +988,10 @@ vcf_to_npz.__doc__ = vcf_to_npz.__doc__.format(
     transformers=_doc_param_transformers,
     buffer_size=_doc_param_buffer_size,
     chunk_length=_doc_param_chunk_length,
+    max_memory=_doc_param_max_memory,
+    n_threads=_doc_param_n_threads,
+    filter_expression=_doc_param_filter_expression,
+    subpops=_doc_param_subpops,
     log=_doc_param_log,
 )
 
@@ -573,7 +1101,10 @@ def _hdf5_store_chunk(root, keys, chunk, vlen):
 
 
 _doc_param_chunk_width = \
-    """Width (number of samples) to use when storing chunks in output."""
+    """Width (number of samples) to use when storing chunks in output. Defaults to
+        {chunk_width}, or if `max_memory` is provided, a width such that chunks hold
+        the same number of calls as with the default `chunk_length`.""".format(
+            chunk_width=DEFAULT_CHUNK_WIDTH)
 
 
 # noinspection PyShadowingBuiltins
@@ -597,8 +1128,14 @@ def vcf_to_hdf5(input, output,
                 transformers=None,
                 buffer_size=DEFAULT_BUFFER_SIZE,
                 chunk_length=DEFAULT_CHUNK_LENGTH,
-                chunk_width=DEFAULT_CHUNK_WIDTH,
-                log=None):
+                max_memory=None,
+                n_threads=None,
+                filter_expression=None,
+                subpops=None,
+                chunk_width=None,
+                queue_depth=DEFAULT_QUEUE_DEPTH,
+                log=None,
+                stats=None):
     """Read data from a VCF file and load into an HDF5 file.
 
     .. versionchanged:: 1.12.0
@@ -607,7 +1144,7 @@ def vcf_to_hdf5(input, output,
 
     Parameters
     ----------
-    input : string
+    input : string or list of strings
         {input}
     output : string
         {output}
@@ -642,11 +1179,11 @@ def vcf_to_hdf5(input, output,
         {types}
     numbers : dict, optional
         {numbers}
-    alt_number : int, optional
+    alt_number : int or 'auto', optional
         {alt_number}
     fills : dict, optional
         {fills}
-    region : string, optional
+    region : string or list of strings, optional
         {region}
     tabix : string, optional
         {tabix}
@@ -658,10 +1195,22 @@ def vcf_to_hdf5(input, output,
         {buffer_size}
     chunk_length : int, optional
         {chunk_length}
+    max_memory : int, optional
+        {max_memory}
+    n_threads : int, optional
+        {n_threads}
+    filter_expression : string, optional
+        {filter_expression}
+    subpops : dict, optional
+        {subpops}
     chunk_width : int, optional
         {chunk_width}
+    queue_depth : int, optional
+        {queue_depth}
     log : file-like, optional
         {log}
+    stats : VCFIngestStats, optional
+        {stats}
 
     """
 
@@ -671,13 +1220,29 @@ def vcf_to_hdf5(input, output,
     # noinspection PyTypeChecker
     store_samples, fields = _prep_fields_param(fields)
 
+    # determine any sizes up front, so chunks and datasets are alike
+    types, alt_number = _resolve_auto_sizes(input, types=types, alt_number=alt_number,
+                                            region=region, tabix=tabix,
+                                            buffer_size=buffer_size, n_threads=n_threads)
+    chunk_length = _resolve_chunk_length(
+        input, chunk_length=chunk_length, max_memory=max_memory, fields=fields,
+        exclude_fields=exclude_fields, types=types, numbers=numbers,
+        alt_number=alt_number, fills=fills, samples=samples,
+        filter_expression=filter_expression, subpops=subpops
+    )
+    chunk_width = _resolve_chunk_width(chunk_width, chunk_length, max_memory)
+
     # setup chunk iterator
-    fields, samples, headers, it = iter_vcf_chunks(
+    if stats is not None:
+        stats.start()
+    fields, samples, headers, it = _iter_vcf_input(
         input, fields=fields, exclude_fields=exclude_fields, types=types,
         numbers=numbers, alt_number=alt_number, buffer_size=buffer_size,
-        chunk_length=chunk_length, fills=fills, region=region, tabix=tabix,
-        samples=samples, transformers=transformers
+        chunk_length=chunk_length, n_threads=n_threads, fills=fills, region=region,
+        tabix=tabix, samples=samples, transformers=transformers,
+        filter_expression=filter_expression, subpops=subpops, stats=stats
     )
+    it = _chunk_iter_decode_offsets(it)
 
     # handle field renaming
     if rename_fields:
@@ -694,6 +1259,8 @@ def vcf_to_hdf5(input, output,
         chunk, _, _, _ = next(it)
     except StopIteration:
         # no data, bail out
+        if stats is not None:
+            stats.finish()
         return
 
     with h5py.File(output, mode='a') as h5f:
@@ -728,13 +1295,20 @@ def vcf_to_hdf5(input, output,
             overwrite=overwrite, headers=headers, vlen=vlen
         )
 
+        def store(c):
+            before = time.time()
+            _hdf5_store_chunk(root, keys, c, vlen)
+            if stats is not None:
+                stats.add_time('store', time.time() - before)
+
         # store first chunk
-        _hdf5_store_chunk(root, keys, chunk, vlen)
+        store(chunk)
 
         # store remaining chunks
-        for chunk, _, _, _ in it:
+        _chunk_iter_store(it, store, queue_depth=queue_depth)
 
-            _hdf5_store_chunk(root, keys, chunk, vlen)
+    if stats is not None:
+        stats.finish()
 
 
 vcf_to_hdf5.__doc__ = vcf_to_hdf5.__doc__.format(
@@ -754,8 +1328,14 @@ vcf_to_hdf5.__doc__ = vcf_to_hdf5.__doc__.format(
     transformers=_doc_param_transformers,
     buffer_size=_doc_param_buffer_size,
     chunk_length=_doc_param_chunk_length,
+    max_memory=_doc_param_max_memory,
+    n_threads=_doc_param_n_threads,
+    filter_expression=_doc_param_filter_expression,
+    subpops=_doc_param_subpops,
     chunk_width=_doc_param_chunk_width,
+    queue_depth=_doc_param_queue_depth,
     log=_doc_param_log,
+    stats=_doc_param_stats,
 )
 
 
@@ -780,8 +1360,9 @@ def _zarr_setup_datasets(chunk, root, chunk_length, chunk_width, compressor, ove
     # obtain dataset keys
     keys = sorted(chunk.keys())
 
-    # deal with overwriting existing data
-    _h5like_handle_overwrite(root, keys, overwrite)
+    # deal with overwriting existing data, including bytes of strings stored as offsets
+    bytes_keys = [k + '_bytes' for k in keys if not isinstance(chunk[k], np.ndarray)]
+    _h5like_handle_overwrite(root, keys + bytes_keys, overwrite)
 
     # create datasets
     for k in keys:
@@ -789,6 +1370,20 @@ def _zarr_setup_datasets(chunk, root, chunk_length, chunk_width, compressor, ove
         # obtain initial data
         data = chunk[k]
 
+        if not isinstance(data, np.ndarray):
+            # strings stored as offsets, store the offset of the end of each value, and
+            # the bytes of all values in a separate array, with chunks of a similar size
+            # to other arrays
+            ds = root.create_dataset(k, shape=(0,) + data.shape[1:],
+                                     chunks=(chunk_length,) + data.shape[1:], dtype='i8',
+                                     compressor=compressor, overwrite=False)
+            root.create_dataset(k + '_bytes', shape=(0,),
+                                chunks=(chunk_length * chunk_width,), dtype='u1',
+                                compressor=compressor, overwrite=False)
+            _h5like_copy_metadata(k, headers, ds)
+            ds.attrs['bytes'] = k.split('/')[-1] + '_bytes'
+            continue
+
         # determine chunk shape
         if data.ndim == 1:
             chunk_shape = (chunk_length,)
@@ -813,13 +1408,318 @@ def _zarr_setup_datasets(chunk, root, chunk_length, chunk_width, compressor, ove
     return keys
 
 
-def _zarr_store_chunk(root, keys, chunk):
+def _zarr_store_chunk(root, keys, chunk, pool=None):
+
+    def store(k):
+        data = chunk[k]
+        if not isinstance(data, np.ndarray):
+            # strings stored as offsets, N.B., offsets are relative to the bytes
+            # already stored
+            start, stop = data.offsets[0], data.offsets[-1]
+            values = root[k + '_bytes']
+            ends = data.offsets[1:] - start + values.shape[0]
+            values.append(data.data[start:stop])
+            data = ends.reshape(data.shape)
+        # append data
+        root[k].append(data, axis=0)
 
     # load arrays
+    if pool is None:
+        for k in keys:
+            store(k)
+    else:
+        # arrays are independent, compress and write concurrently
+        pool.map(store, keys)
+
+
+# name of the group attribute recording progress of vcf_to_zarr
+ZARR_CHECKPOINT_KEY = 'vcf_to_zarr'
+
+
+def _zarr_read_checkpoint(output, group):
+    """Return the progress recorded in the output group by a previous call to
+    vcf_to_zarr, or None if there is none."""
+
+    import zarr
+
+    try:
+        root = zarr.open_group(output, mode='r', path=group)
+    except (ValueError, KeyError):
+        # no group
+        return None
+    return root.attrs.get(ZARR_CHECKPOINT_KEY)
+
+
+def _zarr_truncate(root, keys, n_variants):
+    """Discard anything stored beyond the first `n_variants` variants, e.g., a chunk
+    partially stored before an interruption."""
+
     for k in keys:
+        ds = root[k]
+        if ds.shape[0] < n_variants:
+            raise RuntimeError('array at path %r holds fewer variants (%s) than '
+                               'recorded (%s)' % (k, ds.shape[0], n_variants))
+        if 'bytes' in ds.attrs:
+            # strings stored as offsets, N.B., bytes are stored before the offsets
+            values = root[k + '_bytes']
+            end = int(np.max(ds[n_variants - 1])) if n_variants else 0
+            if values.shape[0] > end:
+                values.resize((end,))
+        if ds.shape[0] > n_variants:
+            ds.resize((n_variants,) + ds.shape[1:])
+
+
+def _zarr_check_datasets(chunk, root, keys, n_variants):
+    """Check arrays already in the output group can be appended to with the data in
+    `chunk`."""
+
+    for k in keys:
+        if k not in root:
+            raise ValueError('cannot append, no array at path %r' % k)
+        ds = root[k]
+        data = chunk[k]
+        if ds.shape[0] != n_variants:
+            raise ValueError('cannot append, array at path %r holds %s variants, '
+                             'expected %s' % (k, ds.shape[0], n_variants))
+        if tuple(ds.shape[1:]) != tuple(data.shape[1:]):
+            raise ValueError('cannot append, array at path %r has shape %r, found data '
+                             'with shape %r' % (k, ds.shape, data.shape))
+        if not isinstance(data, np.ndarray):
+            if 'bytes' not in ds.attrs:
+                raise ValueError('cannot append, array at path %r does not store '
+                                 'strings as offsets' % k)
+        elif not np.can_cast(data.dtype, ds.dtype):
+            raise ValueError('cannot append, array at path %r has dtype %r, found data '
+                             'with dtype %r' % (k, ds.dtype, data.dtype))
+
+
+def _chunk_iter_skip(it, n):
+    """Skip the first `n` variants."""
+    for chunk, chunk_length, chrom, pos in it:
+        if n >= chunk_length:
+            n -= chunk_length
+            continue
+        if n > 0:
+            chunk = dict((k, a[n:]) for k, a in chunk.items())
+            chunk_length -= n
+            n = 0
+        yield chunk, chunk_length, chrom, pos
+
+
+# noinspection PyShadowingBuiltins
+def _zarr_plan_shards(input, output, region, n_processes, filter_expression=None,
+                      types=None, tabix='tabix'):
+    """Plan shards for parallel processing, or return None if the input cannot be
+    sharded. Compressed input is split by chromosome via the tabix index, uncompressed
+    input is split into byte ranges."""
+
+    if region is not None:
+        warnings.warn('cannot shard when region is given; processing serially')
+        return None
+    if filter_expression is not None:
+        # N.B., number of variants per shard must be known in advance
+        warnings.warn('cannot shard when filter_expression is given; processing serially')
+        return None
+    if any(_normalize_type(t) == OFFSETS_TYPE for t in (types or dict()).values()):
+        # N.B., offsets for each shard depend on the bytes stored for previous shards
+        warnings.warn('cannot shard when strings are stored as offsets; processing '
+                      'serially')
+        return None
+    if not isinstance(output, str):
+        warnings.warn('cannot shard unless output is a path on the local file system; '
+                      'processing serially')
+        return None
+    if isinstance(input, (list, tuple)):
+        return _plan_inputs_shards(input, output, n_processes, types=types, tabix=tabix)
+    if _is_bcf(input):
+        warnings.warn('cannot shard BCF input; processing serially')
+        return None
+    vindex = load_vcf_index(input) if isinstance(input, str) else None
+    if vindex is not None and vindex.compression == 'gzip':
+        # N.B., each shard would have to be decompressed from the start of the file
+        warnings.warn('cannot shard gzip-compressed input, compress with bgzip instead; '
+                      'processing serially')
+        return None
+    if vindex is not None:
+        # split at records recorded in the sidecar index, N.B., numbers are exact
+        return _plan_index_shards(vindex, n_processes)
+    if isinstance(input, str) and not input.endswith('gz'):
+        return _plan_span_shards(input, n_processes)
+    index = None
+    if isinstance(input, str) and tabix:
+        # N.B., shards are read by region, so are scanned if tabix is None
+        index = load_index(input)
+    if index is None:
+        warnings.warn('cannot shard without a tabix index of the input; processing '
+                      'serially')
+        return None
+
+    # number of variants per chromosome, from the index metadata
+    shards = list()
+    offset = 0
+    for chrom in index.names:
+        n_variants = index.n_records(chrom)
+        if n_variants is None:
+            warnings.warn('tabix index does not record number of variants per '
+                          'chromosome; processing serially')
+            return None
+        if n_variants > 0:
+            shards.append((dict(region=chrom), offset, n_variants))
+            offset += n_variants
+
+    return shards
+
+
+def _plan_inputs_shards(inputs, output, n_processes, types=None, tabix='tabix'):
+    """Plan shards for each of several inputs in turn."""
+
+    samples = None
+    shards = list()
+    offset = 0
+    for input in inputs:
+        # N.B., shards are parsed independently, so check samples up front
+        input_samples = list(read_vcf_headers(input).samples)
+        if samples is None:
+            samples = input_samples
+        elif input_samples != samples:
+            raise ValueError('samples in input %r differ from those in input %r'
+                             % (input, inputs[0]))
+        input_shards = _zarr_plan_shards(input, output, None, n_processes, types=types,
+                                         tabix=tabix)
+        if input_shards is None:
+            return None
+        for shard, _, n_variants in input_shards:
+            shard['input'] = input
+            shards.append((shard, offset, n_variants))
+            offset += n_variants
+    return shards
+
+
+def _iter_span_streams(fileobj, n_spans):
+    """Split an uncompressed VCF file into line-aligned byte ranges of similar size,
+    yielding a memory-mapped input stream over each range."""
+
+    size = os.fstat(fileobj.fileno()).st_size
+    prev_stop = 0
+    for i in range(1, n_spans + 1):
+        try:
+            stream = MemoryMappedInputStream(fileobj, start=prev_stop,
+                                             stop=size * i // n_spans)
+        except ValueError:
+            # empty file
+            break
+        _, prev_stop = stream.span
+        yield stream
+
+
+def _plan_index_shards(index, n_shards):
+    """Split a VCF file into ranges holding similar numbers of variants, via its sidecar
+    index."""
+
+    shards = list()
+    offset = 0
+    for start, stop, n_variants in index.split(n_shards):
+        shards.append((dict(span=(start, stop)), offset, n_variants))
+        offset += n_variants
+    return shards
+
+
+def _setup_span_stream(input, span):
+    """Setup an input stream over the header and the records within a range of offsets
+    into the VCF file at `input`, as found by splitting the file into shards."""
+
+    start, stop = span
+    index = load_vcf_index(input)
+    if index is not None and index.compression != 'none':
+        return BlockInputStream(iter_index_ranges(input, index, [span]), close=True)
+    return MemoryMappedInputStream(open(input, mode='rb'), start=start, stop=stop,
+                                   close=True)
 
-        # append data
-        root[k].append(chunk[k], axis=0)
+
+def _plan_span_shards(input, n_shards):
+    """Split an uncompressed VCF file into line-aligned byte ranges of similar size."""
+
+    shards = list()
+    offset = 0
+    with open(input, mode='rb') as fileobj:
+        for stream in _iter_span_streams(fileobj, n_shards):
+            n_variants = stream.count_lines()
+            if n_variants > 0:
+                shards.append((dict(span=stream.span), offset, n_variants))
+                offset += n_variants
+    return shards
+
+
+def _zarr_iter_shards(shards, output, group, keys, kwds, rename_fields, n_processes,
+                      base=0, stats=None):
+    """Parse shards in worker processes, yielding a summary as each shard is stored.
+    Variants are stored after the first `base` variants already in the arrays. If
+    `stats` is given, statistics collected by the workers are added to it."""
+
+    import zarr
+    import multiprocessing
+
+    # make room in all arrays
+    root = zarr.open_group(output, mode='a', path=group)
+    n_variants = sum(n for _, _, n in shards)
+    for k in keys:
+        root[k].resize((base + n_variants,) + root[k].shape[1:])
+
+    # N.B., arrays are not chunked at shard boundaries, so synchronise writes
+    sync_path = tempfile.mkdtemp(suffix='.sync')
+    tasks = [(output, group, sync_path, keys, kwds, rename_fields, shard, base + offset,
+              n, stats is not None) for shard, offset, n in shards]
+    pool = multiprocessing.Pool(n_processes)
+    try:
+        for n, chrom, pos, shard_stats in pool.imap_unordered(_zarr_store_shard, tasks):
+            if stats is not None:
+                stats.merge(shard_stats)
+            yield None, n, chrom, pos
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+        shutil.rmtree(sync_path, ignore_errors=True)
+
+
+def _zarr_store_shard(task):
+    """Parse a single shard and store into the output arrays. Runs in a worker
+    process."""
+
+    import zarr
+
+    output, group, sync_path, keys, kwds, rename_fields, shard, offset, n, timing = task
+    stats = VCFIngestStats() if timing else None
+    if 'span' in shard:
+        stream = _setup_span_stream(shard.get('input', kwds['input']), shard['span'])
+        kwds = dict((k, v) for k, v in kwds.items()
+                    if k not in {'input', 'buffer_size', 'tabix'})
+        fields, _, headers, it = _iter_vcf_chunks(stream, stats=stats, **kwds)
+    else:
+        fields, _, headers, it = _iter_vcf_input(stats=stats, **dict(kwds, **shard))
+    if rename_fields:
+        _, it = _do_rename(it, fields=fields, rename_fields=rename_fields,
+                           headers=headers)
+    root = zarr.open_group(output, mode='r+', path=group,
+                           synchronizer=zarr.ProcessSynchronizer(sync_path))
+    arrays = [root[k] for k in keys]
+    start, last_chrom, last_pos = offset, b'', 0
+    for chunk, chunk_length, last_chrom, last_pos in it:
+        stop = start + chunk_length
+        if stop > offset + n:
+            break
+        before = time.time()
+        for k, a in zip(keys, arrays):
+            a[start:stop] = chunk[k]
+        if stats is not None:
+            stats.add_time('store', time.time() - before)
+        start = stop
+    else:
+        if start == offset + n:
+            return n, last_chrom, last_pos, stats.to_dict() if timing else None
+    raise RuntimeError('number of variants found for shard %r does not match the '
+                       'number expected (%s); processing serially may be required'
+                       % (shard, n))
 
 
 # noinspection PyShadowingBuiltins
@@ -827,6 +1727,8 @@ def vcf_to_zarr(input, output,
                 group='/',
                 compressor='default',
                 overwrite=False,
+                append=False,
+                resume=False,
                 fields=None,
                 exclude_fields=None,
                 rename_fields=None,
@@ -840,8 +1742,15 @@ def vcf_to_zarr(input, output,
                 transformers=None,
                 buffer_size=DEFAULT_BUFFER_SIZE,
                 chunk_length=DEFAULT_CHUNK_LENGTH,
-                chunk_width=DEFAULT_CHUNK_WIDTH,
-                log=None):
+                max_memory=None,
+                n_threads=None,
+                filter_expression=None,
+                subpops=None,
+                chunk_width=None,
+                n_processes=None,
+                queue_depth=DEFAULT_QUEUE_DEPTH,
+                log=None,
+                stats=None):
     """Read data from a VCF file and load into a Zarr on-disk store.
 
     .. versionchanged:: 1.12.0
@@ -850,7 +1759,7 @@ def vcf_to_zarr(input, output,
 
     Parameters
     ----------
-    input : string
+    input : string or list of strings
         {input}
     output : string
         {output}
@@ -860,6 +1769,18 @@ def vcf_to_zarr(input, output,
         Compression algorithm, e.g., zarr.Blosc(cname='zstd', clevel=1, shuffle=1).
     overwrite : bool
         {overwrite}
+    append : bool
+        If True, add variants to the end of the arrays already stored in the group,
+        e.g., to add further VCF files with the same samples and fields, such as files
+        for other chromosomes, without rewriting data already stored.
+    resume : bool
+        If True, and a previous call to store the same input into the group was
+        interrupted, continue from the last chunk stored by the previous call. If the
+        previous call completed, nothing is done. If the previous call was split into
+        shards via `n_processes`, the input is processed again from the start. See
+        Notes. N.B., `append` and
+        `resume` require `input` to be a path or list of paths, so that it can be
+        matched against the input recorded by a previous call.
     fields : list of strings, optional
         {fields}
     exclude_fields : list of strings, optional
@@ -870,11 +1791,11 @@ def vcf_to_zarr(input, output,
         {types}
     numbers : dict, optional
         {numbers}
-    alt_number : int, optional
+    alt_number : int or 'auto', optional
         {alt_number}
     fills : dict, optional
         {fills}
-    region : string, optional
+    region : string or list of strings, optional
         {region}
     tabix : string, optional
         {tabix}
@@ -886,39 +1807,156 @@ def vcf_to_zarr(input, output,
         {buffer_size}
     chunk_length : int, optional
         {chunk_length}
+    max_memory : int, optional
+        {max_memory}
+    n_threads : int, optional
+        {n_threads}
+    filter_expression : string, optional
+        {filter_expression}
+    subpops : dict, optional
+        {subpops}
     chunk_width : int, optional
         {chunk_width}
+    n_processes : int, optional
+        If provided, split the input into shards and parse shards concurrently in a pool
+        of `n_processes` worker processes, each writing into its own region of the
+        output arrays. A VCF file with a sidecar index built by
+        :func:`allel.index_vcf` is split into ranges holding similar numbers of
+        variants, unless compressed with gzip rather than bgzip. Otherwise, a
+        compressed VCF file requires a tabix index and is split into one shard per
+        chromosome, and an uncompressed VCF file is split into ranges of lines. Also
+        requires `output` to be a path on the local file system. The data stored are
+        the same as without this option.
+    queue_depth : int, optional
+        {queue_depth}
     log : file-like, optional
         {log}
+    stats : VCFIngestStats, optional
+        {stats}
+
+    Notes
+    -----
+    Progress is recorded in the group attribute 'vcf_to_zarr' each time a chunk has
+    been stored, including the fields stored, the total number of variants stored, and
+    the number of variants stored from each input. When resuming, anything stored
+    after the last recorded chunk is discarded, and the variants already stored are
+    skipped. If no `region` or `filter_expression` is given, the lines of variants
+    already stored are skipped without being parsed, otherwise they are parsed again
+    but not stored. All other arguments should be the same as for the interrupted
+    call.
+
+    If the input is split into shards via `n_processes`, shards are stored in any
+    order, so progress is only recorded once all shards have been stored. If such a
+    call is interrupted, resuming discards everything stored from the input and
+    processes it again from the start.
 
     """
 
     import zarr
 
+    if append and overwrite:
+        raise ValueError('cannot both append and overwrite')
+
+    if stats is not None:
+        stats.start()
+
+    # N.B., lists of inputs or regions are recorded as lists, as stored in JSON
+    entry_input = list(input) if isinstance(input, (list, tuple)) else input
+    entry_region = list(region) if isinstance(region, (list, tuple)) else region
+    if isinstance(entry_input, str) or \
+            (isinstance(entry_input, list) and all(isinstance(i, str) for i in entry_input)):
+        entry = dict(input=entry_input, region=entry_region, n_variants=0,
+                     complete=False)
+    elif append or resume:
+        # N.B., a file-like input cannot be told apart from the input recorded
+        raise ValueError('cannot append or resume unless input is a path or list of '
+                         'paths, found %r' % input)
+    else:
+        entry = dict(input=None, region=entry_region, n_variants=0, complete=False)
+
+    # determine where to start, from any progress recorded by a previous call
+    checkpoint = None
+    if append or resume:
+        checkpoint = _zarr_read_checkpoint(output, group)
+    skip = 0
+    if checkpoint is not None:
+        last = checkpoint['inputs'][-1]
+        same_input = last['input'] == entry['input'] and last['region'] == entry['region']
+        if resume and same_input and last['complete']:
+            # nothing to do
+            if stats is not None:
+                stats.finish()
+            return
+        elif resume and same_input:
+            entry = checkpoint['inputs'].pop()
+            skip = entry['n_variants']
+        elif not last['complete']:
+            raise ValueError('a previous call to store input %r into the group did not '
+                             'complete; use resume=True to continue' % last['input'])
+        elif not append:
+            raise ValueError('group holds data from input %r; use append=True to add '
+                             'data from another input' % last['input'])
+
+    # plan shards for parallel processing
+    shards = None
+    if n_processes is not None and n_processes > 1:
+        if skip:
+            warnings.warn('cannot shard when resuming; processing serially')
+        else:
+            shards = _zarr_plan_shards(input, output, region, n_processes,
+                                       filter_expression=filter_expression, types=types,
+                                       tabix=tabix)
+
     # samples requested?
     # noinspection PyTypeChecker
     store_samples, fields = _prep_fields_param(fields)
 
+    # determine any sizes up front, so all shards are parsed alike
+    types, alt_number = _resolve_auto_sizes(input, types=types, alt_number=alt_number,
+                                            region=region, tabix=tabix,
+                                            buffer_size=buffer_size, n_threads=n_threads)
+    chunk_length = _resolve_chunk_length(
+        input, chunk_length=chunk_length, max_memory=max_memory, fields=fields,
+        exclude_fields=exclude_fields, types=types, numbers=numbers,
+        alt_number=alt_number, fills=fills, samples=samples,
+        filter_expression=filter_expression, subpops=subpops
+    )
+    chunk_width = _resolve_chunk_width(chunk_width, chunk_length, max_memory)
+
     # setup chunk iterator
-    fields, samples, headers, it = iter_vcf_chunks(
-        input, fields=fields, exclude_fields=exclude_fields, types=types,
+    kwds = dict(
+        input=input, fields=fields, exclude_fields=exclude_fields, types=types,
         numbers=numbers, alt_number=alt_number, buffer_size=buffer_size,
-        chunk_length=chunk_length, fills=fills, region=region, tabix=tabix,
-        samples=samples, transformers=transformers
+        chunk_length=chunk_length, n_threads=n_threads, fills=fills, region=region,
+        tabix=tabix, samples=samples, transformers=transformers,
+        filter_expression=filter_expression, subpops=subpops
+    )
+    skip_lines = 0
+    if region is None and filter_expression is None and not _is_bcf(input) and \
+            not isinstance(input, (list, tuple)):
+        # every line is a variant, skip lines without parsing
+        skip_lines = skip
+    # N.B., if sharding, the first chunk is only used as a template
+    fields, samples, headers, it = _iter_vcf_input(
+        skip_lines=skip_lines, stats=stats if shards is None else None, **kwds
     )
+    if skip > skip_lines:
+        it = _chunk_iter_skip(it, skip - skip_lines)
 
     # handle field renaming
     if rename_fields:
-        rename_fields, it = _do_rename(it, fields=fields,
-                                       rename_fields=rename_fields,
-                                       headers=headers)
+        renamed_fields, it = _do_rename(it, fields=fields,
+                                        rename_fields=rename_fields,
+                                        headers=headers)
+    else:
+        renamed_fields = rename_fields
 
     # check for any case-insensitive duplicate fields
     # https://github.com/cggh/scikit-allel/issues/215
     ci_field_index = defaultdict(list)
     for f in fields:
-        if rename_fields:
-            f = rename_fields.get(f, f)
+        if renamed_fields:
+            f = renamed_fields.get(f, f)
         ci_field_index[f.lower()].append(f)
     for k, v in ci_field_index.items():
         if len(v) > 1:
@@ -932,45 +1970,116 @@ def vcf_to_zarr(input, output,
             raise ValueError(msg)
 
     # setup progress logging
-    if log is not None:
+    if log is not None and shards is None:
         it = _chunk_iter_progress(it, log, prefix='[vcf_to_zarr]')
 
     # read first chunk
     try:
         chunk, _, _, _ = next(it)
     except StopIteration:
+        if skip:
+            # all variants were already stored
+            root = zarr.open_group(output, mode='a', path=group)
+            _zarr_truncate(root, checkpoint['fields'], checkpoint['n_variants'])
+            entry['complete'] = True
+            checkpoint['inputs'].append(entry)
+            root.attrs[ZARR_CHECKPOINT_KEY] = checkpoint
         # no data, bail out
+        if stats is not None:
+            stats.finish()
         return
 
     # open root group
     root = zarr.open_group(output, mode='a', path=group)
+    keys = sorted(chunk.keys())
 
-    if len(samples) > 0 and store_samples:
-        # store samples
-        if samples.dtype.kind == 'O':
-            if PY2:
-                dtype = 'unicode'
-            else:
-                dtype = 'str'
+    if checkpoint is not None or (append and any(k in root for k in keys)):
+
+        # add to arrays already stored
+        if checkpoint is not None:
+            if checkpoint['fields'] != keys:
+                raise ValueError('fields do not match those stored in the group: %r'
+                                 % checkpoint['fields'])
+            base = checkpoint['n_variants']
+            _zarr_truncate(root, keys, base)
         else:
-            dtype = samples.dtype
-        root.create_dataset('samples', data=samples, compressor=None, overwrite=overwrite,
-                            dtype=dtype)
+            base = root[keys[0]].shape[0]
+            checkpoint = dict(fields=keys, n_variants=base, inputs=list())
+        _zarr_check_datasets(chunk, root, keys, base)
+        if len(samples) > 0 and store_samples and \
+                ('samples' not in root or list(root['samples'][:]) != list(samples)):
+            raise ValueError('cannot append, group holds different samples')
 
-    # setup datasets
-    # noinspection PyTypeChecker
-    keys = _zarr_setup_datasets(
-        chunk, root=root, chunk_length=chunk_length, chunk_width=chunk_width,
-        compressor=compressor, overwrite=overwrite, headers=headers
-    )
+    else:
+
+        if len(samples) > 0 and store_samples:
+            # store samples
+            if samples.dtype.kind == 'O':
+                if PY2:
+                    dtype = 'unicode'
+                else:
+                    dtype = 'str'
+            else:
+                dtype = samples.dtype
+            root.create_dataset('samples', data=samples, compressor=None,
+                                overwrite=overwrite, dtype=dtype)
+
+        # setup datasets
+        # noinspection PyTypeChecker
+        keys = _zarr_setup_datasets(
+            chunk, root=root, chunk_length=chunk_length, chunk_width=chunk_width,
+            compressor=compressor, overwrite=overwrite, headers=headers
+        )
+        checkpoint = dict(fields=keys, n_variants=0, inputs=list())
+
+    # record progress, before anything is stored
+    checkpoint['inputs'].append(entry)
+    root.attrs[ZARR_CHECKPOINT_KEY] = checkpoint
+
+    if shards is not None:
+        # first chunk only used as a template, discard and parse shards in parallel
+        it = _zarr_iter_shards(shards, output=output, group=group, keys=keys,
+                               kwds=kwds, rename_fields=rename_fields,
+                               n_processes=n_processes, base=checkpoint['n_variants'],
+                               stats=stats)
+        if log is not None:
+            it = _chunk_iter_progress(it, log, prefix='[vcf_to_zarr]')
+        # N.B., progress is not recorded until all shards are stored, as shards are
+        # stored in any order
+        for _, n, _, _ in it:
+            entry['n_variants'] += n
+            checkpoint['n_variants'] += n
+
+    else:
+
+        def store(c):
+            before = time.time()
+            _zarr_store_chunk(root, keys, c, pool)
+            if stats is not None:
+                stats.add_time('store', time.time() - before)
+            # record progress, once all arrays are stored
+            n = len(c[keys[0]])
+            entry['n_variants'] += n
+            checkpoint['n_variants'] += n
+            root.attrs[ZARR_CHECKPOINT_KEY] = checkpoint
+
+        # store first chunk
+        pool = ThreadPool(n_threads) if n_threads is not None and n_threads > 1 else None
+        try:
+            store(chunk)
 
-    # store first chunk
-    _zarr_store_chunk(root, keys, chunk)
+            # store remaining chunks
+            _chunk_iter_store(it, store, queue_depth=queue_depth)
 
-    # store remaining chunks
-    for chunk, _, _, _ in it:
+        finally:
+            if pool is not None:
+                pool.terminate()
 
-        _zarr_store_chunk(root, keys, chunk)
+    # record completion
+    entry['complete'] = True
+    root.attrs[ZARR_CHECKPOINT_KEY] = checkpoint
+    if stats is not None:
+        stats.finish()
 
 
 vcf_to_zarr.__doc__ = vcf_to_zarr.__doc__.format(
@@ -990,23 +2099,47 @@ vcf_to_zarr.__doc__ = vcf_to_zarr.__doc__.format(
     transformers=_doc_param_transformers,
     buffer_size=_doc_param_buffer_size,
     chunk_length=_doc_param_chunk_length,
+    max_memory=_doc_param_max_memory,
+    n_threads=_doc_param_n_threads,
+    filter_expression=_doc_param_filter_expression,
+    subpops=_doc_param_subpops,
     chunk_width=_doc_param_chunk_width,
+    queue_depth=_doc_param_queue_depth,
     log=_doc_param_log,
+    stats=_doc_param_stats,
 )
 
 
 # noinspection PyShadowingBuiltins
-def _setup_input_stream(input, region=None, tabix=None, buffer_size=DEFAULT_BUFFER_SIZE):
+def _setup_input_stream(input, region=None, tabix=None, buffer_size=DEFAULT_BUFFER_SIZE,
+                        n_threads=None):
 
     # obtain a file-like object
     close = False
     if isinstance(input, str) and input.endswith('gz'):
 
-        if region and tabix and os.name != 'nt':
+        # N.B., tabix=None forces scanning, e.g., if an index is stale or corrupt
+        index = load_index(input) if region and tabix else None
+        vindex = load_vcf_index(input) if region and tabix and index is None else None
+
+        if index is not None:
+            # use the index to read only the header and chunks overlapping the region
+            # N.B., still pass the region parameter through to the parser, as chunks may
+            # hold some variants outside the region
+            blocks = iter_regions(input, index, normalize_regions(region))
+            return BlockInputStream(blocks, close=True)
+
+        elif vindex is not None:
+            # use the sidecar index likewise
+            ranges = vindex.query_regions(normalize_regions(region))
+            return BlockInputStream(iter_index_ranges(input, vindex, ranges), close=True)
+
+        elif region and tabix and os.name != 'nt':
 
             try:
-                # try tabix
-                p = subprocess.Popen([tabix, '-h', input, region],
+                # try tabix, N.B., regions are merged so no variant is output twice
+                regions = [_format_region(*r) for r in normalize_regions(region)]
+                p = subprocess.Popen([tabix, '-h', input] + regions,
                                      stdout=subprocess.PIPE,
                                      stderr=subprocess.STDOUT,
                                      bufsize=0)
@@ -1038,14 +2171,34 @@ def _setup_input_stream(input, region=None, tabix=None, buffer_size=DEFAULT_BUFF
                 fileobj = gzip.open(input, mode='rb')
                 close = True
 
+        elif n_threads is not None and is_bgzf(input):
+            # decompress BGZF blocks in parallel, feeding the parser directly
+            blocks = iter_bgzf_blocks(open(input, mode='rb'), n_threads=n_threads,
+                                      close=True)
+            return BlockInputStream(blocks, close=True)
+
         else:
             fileobj = gzip.open(input, mode='rb')
             close = True
 
     elif isinstance(input, str):
         # assume no compression
+        vindex = load_vcf_index(input) if region and tabix else None
+        if vindex is not None:
+            # use the sidecar index to read only the header and ranges overlapping the
+            # region, directly from the memory-mapped file if there is a single range
+            ranges = vindex.query_regions(normalize_regions(region))
+            if len(ranges) == 1:
+                return _setup_span_stream(input, ranges[0])
+            return BlockInputStream(iter_index_ranges(input, vindex, ranges), close=True)
         fileobj = open(input, mode='rb', buffering=0)
         close = True
+        try:
+            # parse directly from memory-mapped file
+            return MemoryMappedInputStream(fileobj, close=close)
+        except (ValueError, EnvironmentError):
+            # empty file or not mappable (e.g., a pipe), read via buffer
+            pass
 
     elif hasattr(input, 'readinto'):
         fileobj = input
@@ -1056,6 +2209,44 @@ def _setup_input_stream(input, region=None, tabix=None, buffer_size=DEFAULT_BUFF
     return FileInputStream(fileobj, buffer_size=buffer_size, close=close)
 
 
+def _format_region(chrom, begin, end):
+    """Format a region as a tabix-style region string."""
+    if not begin and not end:
+        return chrom
+    return '%s:%s-%s' % (chrom, max(begin, 1), end or '')
+
+
+def _is_bcf(input):
+    """Determine whether `input` is a path to a BCF file, compressed or not."""
+    if not isinstance(input, str) or not os.path.isfile(input):
+        return False
+    with open(input, mode='rb') as f:
+        magic = f.read(2)
+    if magic == b'\x1f\x8b':
+        f = gzip.open(input, mode='rb')
+    else:
+        f = open(input, mode='rb')
+    with f:
+        try:
+            return f.read(3) == b'BCF'
+        except (IOError, EOFError):
+            return False
+
+
+def _setup_bcf_input_stream(input, buffer_size=DEFAULT_BUFFER_SIZE, n_threads=None):
+    if is_bgzf(input):
+        # decompress BGZF blocks, in the background if n_threads given
+        blocks = iter_bgzf_blocks(open(input, mode='rb'), n_threads=n_threads, close=True)
+        return BlockInputStream(blocks, close=True)
+    with open(input, mode='rb') as f:
+        magic = f.read(2)
+    if magic == b'\x1f\x8b':
+        fileobj = gzip.open(input, mode='rb')
+    else:
+        fileobj = open(input, mode='rb')
+    return FileInputStream(fileobj, buffer_size=buffer_size, close=True)
+
+
 # noinspection PyShadowingBuiltins
 def iter_vcf_chunks(input,
                     fields=None,
@@ -1069,12 +2260,17 @@ def iter_vcf_chunks(input,
                     samples=None,
                     transformers=None,
                     buffer_size=DEFAULT_BUFFER_SIZE,
-                    chunk_length=DEFAULT_CHUNK_LENGTH):
+                    chunk_length=DEFAULT_CHUNK_LENGTH,
+                    max_memory=None,
+                    n_threads=None,
+                    filter_expression=None,
+                    subpops=None,
+                    stats=None):
     """Iterate over chunks of data from a VCF file as NumPy arrays.
 
     Parameters
     ----------
-    input : string
+    input : string or list of strings
         {input}
     fields : list of strings, optional
         {fields}
@@ -1084,11 +2280,11 @@ def iter_vcf_chunks(input,
         {types}
     numbers : dict, optional
         {numbers}
-    alt_number : int, optional
+    alt_number : int or 'auto', optional
         {alt_number}
     fills : dict, optional
         {fills}
-    region : string, optional
+    region : string or list of strings, optional
         {region}
     tabix : string, optional
         {tabix}
@@ -1100,6 +2296,16 @@ def iter_vcf_chunks(input,
         {buffer_size}
     chunk_length : int, optional
         {chunk_length}
+    max_memory : int, optional
+        {max_memory}
+    n_threads : int, optional
+        {n_threads}
+    filter_expression : string, optional
+        {filter_expression}
+    subpops : dict, optional
+        {subpops}
+    stats : VCFIngestStats, optional
+        {stats}
 
     Returns
     -------
@@ -1114,17 +2320,67 @@ def iter_vcf_chunks(input,
 
     """
 
+    if stats is not None:
+        stats.start()
+    fields, samples, headers, it = _iter_vcf_input(
+        input, fields=fields, exclude_fields=exclude_fields, types=types,
+        numbers=numbers, alt_number=alt_number, fills=fills, region=region, tabix=tabix,
+        samples=samples, transformers=transformers, buffer_size=buffer_size,
+        chunk_length=chunk_length, max_memory=max_memory, n_threads=n_threads,
+        filter_expression=filter_expression, subpops=subpops, stats=stats
+    )
+    if stats is not None:
+        it = _chunk_iter_finish_stats(it, stats)
+    return fields, samples, headers, it
+
+
+def _iter_vcf_input(input, fields, exclude_fields, types, numbers, alt_number, fills,
+                    region, tabix, samples, transformers, buffer_size, chunk_length,
+                    n_threads, filter_expression, subpops, max_memory=None, skip_lines=0,
+                    stats=None):
+
+    # determine any sizes left to be found by scanning the input
+    types, alt_number = _resolve_auto_sizes(input, types=types, alt_number=alt_number,
+                                            region=region, tabix=tabix,
+                                            buffer_size=buffer_size, n_threads=n_threads)
+
     # setup commmon keyword args
     kwds = dict(fields=fields, exclude_fields=exclude_fields, types=types,
                 numbers=numbers, alt_number=alt_number, chunk_length=chunk_length,
-                fills=fills, samples=samples, region=region)
+                max_memory=max_memory, n_threads=n_threads, fills=fills, samples=samples,
+                region=region, filter_expression=filter_expression, subpops=subpops,
+                stats=stats)
+
+    if isinstance(input, (list, tuple)):
+        fields, samples, headers, it = _iter_vcf_inputs(input, tabix=tabix,
+                                                        buffer_size=buffer_size, **kwds)
+        return _iter_transformed(fields, samples, headers, it, transformers,
+                                 n_threads=n_threads, stats=stats)
 
     # setup input stream
-    stream = _setup_input_stream(input=input, region=region, tabix=tabix,
-                                 buffer_size=buffer_size)
+    if _is_bcf(input):
+        # N.B., no index is used, any region is found by scanning
+        stream = _setup_bcf_input_stream(input, buffer_size=buffer_size,
+                                         n_threads=n_threads)
+        kwds['bcf'] = True
+    else:
+        stream = _setup_input_stream(input=input, region=region, tabix=tabix,
+                                     buffer_size=buffer_size, n_threads=n_threads)
+        kwds['skip_lines'] = skip_lines
+
+    return _iter_vcf_chunks(stream, transformers=transformers, **kwds)
+
+
+def _iter_vcf_chunks(stream, transformers=None, **kwds):
 
     # setup iterator
     fields, samples, headers, it = _iter_vcf_stream(stream, **kwds)
+    return _iter_transformed(fields, samples, headers, it, transformers,
+                             n_threads=kwds.get('n_threads'), stats=kwds.get('stats'))
+
+
+def _iter_transformed(fields, samples, headers, it, transformers, n_threads=None,
+                      stats=None):
 
     # setup transformers
     if transformers is not None:
@@ -1133,7 +2389,13 @@ def iter_vcf_chunks(input,
             transformers = [transformers]
         for trans in transformers:
             fields = trans.transform_fields(fields)
-        it = _chunk_iter_transform(it, transformers)
+        # transform in the background if parsing with multiple threads
+        it = _chunk_iter_transform(it, transformers,
+                                   background=n_threads is not None and n_threads > 1,
+                                   stats=stats)
+
+    if stats is not None:
+        it = _chunk_iter_stats(it, stats)
 
     return fields, samples, headers, it
 
@@ -1152,6 +2414,11 @@ iter_vcf_chunks.__doc__ = iter_vcf_chunks.__doc__.format(
     transformers=_doc_param_transformers,
     buffer_size=_doc_param_buffer_size,
     chunk_length=_doc_param_chunk_length,
+    max_memory=_doc_param_max_memory,
+    n_threads=_doc_param_n_threads,
+    filter_expression=_doc_param_filter_expression,
+    subpops=_doc_param_subpops,
+    stats=_doc_param_stats,
     log=_doc_param_log,
 )
 
@@ -1189,7 +2456,7 @@ def _normalize_field_prefix(field, headers):
         return 'variants/' + field
 
     # try to find in computed fields
-    elif field in COMPUTED_FIELDS:
+    elif field in COMPUTED_FIELDS or field in GENOTYPE_COMPUTED_FIELDS:
         return 'variants/' + field
 
     # try to find in FORMAT
@@ -1211,7 +2478,7 @@ def _check_field(field, headers):
         if name in FIXED_VARIANTS_FIELDS:
             pass
 
-        elif name in COMPUTED_FIELDS:
+        elif name in COMPUTED_FIELDS or name in GENOTYPE_COMPUTED_FIELDS:
             # computed fields
             pass
 
@@ -1360,6 +2627,13 @@ def _normalize_type(t):
     elif isinstance(t, str) and t.startswith('genotype_ac/'):
         # custom genotype allele counts dtype
         return t
+    elif isinstance(t, str) and (t.startswith('genotype_packed/') or
+                                 t.startswith('genotype_2bit/')):
+        # custom packed genotype dtypes
+        return t
+    elif t == OFFSETS_TYPE:
+        # variable length strings
+        return t
     else:
         return np.dtype(t)
 
@@ -1411,7 +2685,7 @@ def _normalize_types(types, fields, headers):
 
         elif group == 'variants':
 
-            if name in COMPUTED_FIELDS:
+            if name in COMPUTED_FIELDS or name in GENOTYPE_COMPUTED_FIELDS:
                 # computed fields, special case
                 continue
 
@@ -1487,6 +2761,7 @@ default_numbers = {
     'variants/AF': 'A',
     'variants/MQ': 1,
     'variants/ANN': 1,
+    'variants/ac': 'R',
     'calldata/DP': 1,
     'calldata/GT': 2,
     'calldata/GQ': 1,
@@ -1536,7 +2811,7 @@ def _normalize_numbers(numbers, fields, headers, alt_number):
 
         elif group == 'variants':
 
-            if name in COMPUTED_FIELDS:
+            if name in COMPUTED_FIELDS or name in GENOTYPE_COMPUTED_FIELDS:
                 # computed fields, special case (for altlen, number depends on ALT)
                 continue
 
@@ -1618,11 +2893,242 @@ def _normalize_samples(samples, headers, types):
     return normed_samples, loc_samples
 
 
+def _is_unsized_string(t):
+    t = _normalize_type(t)
+    return isinstance(t, np.dtype) and t.kind == 'S' and t.itemsize == 0
+
+
+# noinspection PyShadowingBuiltins
+def _resolve_auto_sizes(input, types, alt_number, region=None, tabix=None,
+                        buffer_size=DEFAULT_BUFFER_SIZE, n_threads=None):
+    """Resolve `alt_number` given as 'auto' and string types given without a size, by
+    scanning the input to find the maximum number of alternate alleles and the length
+    of the longest value within each field. Returns a tuple of (types, alt_number)."""
+
+    unsized = [f for f, t in (types or dict()).items() if _is_unsized_string(t)]
+    if alt_number != 'auto' and not unsized:
+        return types, alt_number
+    if isinstance(input, (list, tuple)) and input:
+        # find sizes large enough for all inputs
+        sizes = [_resolve_auto_sizes(i, types=types, alt_number=alt_number, region=region,
+                                     tabix=tabix, buffer_size=buffer_size,
+                                     n_threads=n_threads)
+                 for i in input]
+        types = dict(types or dict())
+        for f in unsized:
+            types[f] = max((t[f] for t, _ in sizes), key=lambda t: t.itemsize)
+        if alt_number == 'auto':
+            alt_number = max(n for _, n in sizes)
+        return types, alt_number
+    if not isinstance(input, str):
+        raise ValueError("input must be a path to use alt_number='auto' or string types "
+                         "without a size, found %r" % input)
+    if _is_bcf(input):
+        raise ValueError("alt_number='auto' and string types without a size are not "
+                         "supported for BCF input")
+
+    # N.B., if a region is given, the data scanned may include variants outside the
+    # region, so sizes may be larger than strictly needed but never smaller
+    stream = _setup_input_stream(input, region=region, tabix=tabix,
+                                 buffer_size=buffer_size, n_threads=n_threads)
+    headers = _read_vcf_headers(stream)
+
+    # determine which INFO and FORMAT fields to measure
+    fields = dict((f, _normalize_field_prefix(f, headers)) for f in unsized)
+    info_keys, format_keys = set(), set()
+    for f in fields.values():
+        group, name = f.split('/')
+        if isinstance(name, text_type):
+            key = name.encode('utf8')
+        else:
+            key = name
+        if group == 'calldata':
+            format_keys.add(key)
+        elif not (name in FIXED_VARIANTS_FIELDS or name in COMPUTED_FIELDS or
+                  name.startswith('FILTER_')):
+            info_keys.add(key)
+
+    scanner = VCFSizeScanner(info_keys, format_keys)
+    if n_threads is not None and n_threads > 1 and \
+            isinstance(stream, MemoryMappedInputStream):
+        # scan line-aligned ranges of the memory-mapped file concurrently
+        with open(input, mode='rb') as fileobj:
+            scanners = [(VCFSizeScanner(info_keys, format_keys), span_stream)
+                        for span_stream in _iter_span_streams(fileobj, n_threads)]
+            pool = ThreadPool(n_threads)
+            try:
+                pool.map(lambda x: x[0].scan(x[1]), scanners)
+            finally:
+                pool.terminate()
+        for other, _ in scanners:
+            scanner.update(other)
+    else:
+        scanner.scan(stream)
+
+    lengths = scanner.lengths
+    types = dict(types or dict())
+    for f, normed in fields.items():
+        if normed not in lengths:
+            raise ValueError('string type without a size not supported for field %r' % f)
+        types[f] = np.dtype('S%s' % max(1, lengths[normed]))
+    if alt_number == 'auto':
+        alt_number = max(1, scanner.max_n_alt)
+    return types, alt_number
+
+
 def _iter_vcf_stream(stream, fields, exclude_fields, types, numbers, alt_number,
-                     chunk_length, fills, region, samples):
+                     chunk_length, fills, region, samples, n_threads=None,
+                     filter_expression=None, subpops=None, bcf=False, skip_lines=0,
+                     max_memory=None, stats=None):
 
     # read VCF headers
-    headers = _read_vcf_headers(stream)
+    headers, contigs, dictionary = _read_stream_headers(stream, bcf=bcf)
+
+    # skip lines already processed, without parsing
+    if skip_lines:
+        stream.skip_lines(skip_lines)
+
+    # setup samples, fields, types, etc.
+    (samples, loc_samples, fields, types, numbers, fills, variant_filter, drop_fields,
+     offsets_fields, allele_counts) = _normalize_params(
+        headers, fields=fields, exclude_fields=exclude_fields, types=types,
+        numbers=numbers, alt_number=alt_number, fills=fills, samples=samples,
+        filter_expression=filter_expression, subpops=subpops, bcf=bcf
+    )
+
+    # determine chunk length from the memory available
+    if max_memory is not None:
+        chunk_length = _estimate_chunk_length(max_memory, fields=fields, types=types,
+                                              numbers=numbers, n_samples=len(samples),
+                                              alt_number=alt_number)
+
+    # setup chunks iterator
+    chunks = _setup_chunk_iterator(
+        stream, headers=headers, contigs=contigs, dictionary=dictionary,
+        chunk_length=chunk_length, fields=fields, types=types, numbers=numbers,
+        fills=fills, region=region, loc_samples=loc_samples, variant_filter=variant_filter,
+        allele_counts=allele_counts, offsets_fields=offsets_fields, n_threads=n_threads,
+        bcf=bcf, stats=stats
+    )
+
+    if drop_fields:
+        fields = [f for f in fields if f not in drop_fields]
+        chunks = _chunk_iter_drop(chunks, drop_fields)
+
+    return fields, samples, headers, chunks
+
+
+def _iter_vcf_inputs(inputs, fields, exclude_fields, types, numbers, alt_number,
+                     chunk_length, fills, region, samples, tabix=None,
+                     buffer_size=DEFAULT_BUFFER_SIZE, n_threads=None,
+                     filter_expression=None, subpops=None, max_memory=None, stats=None):
+    """Iterate over chunks from each of several inputs in turn, as if from a single
+    input. Headers are read from the first input, and parameters are normalised once."""
+
+    if not inputs:
+        raise ValueError('no inputs given')
+    bcf = [_is_bcf(i) for i in inputs]
+
+    def open_input(i):
+        if bcf[i]:
+            stream = _setup_bcf_input_stream(inputs[i], buffer_size=buffer_size,
+                                             n_threads=n_threads)
+        else:
+            stream = _setup_input_stream(inputs[i], region=region, tabix=tabix,
+                                         buffer_size=buffer_size, n_threads=n_threads)
+        return (stream,) + _read_stream_headers(stream, bcf=bcf[i])
+
+    # read headers from the first input
+    opened = [open_input(0)]
+    headers = opened[0][1]
+
+    # setup samples, fields, types, etc.
+    (samples, loc_samples, fields, types, numbers, fills, variant_filter, drop_fields,
+     offsets_fields, allele_counts) = _normalize_params(
+        headers, fields=fields, exclude_fields=exclude_fields, types=types,
+        numbers=numbers, alt_number=alt_number, fills=fills, samples=samples,
+        filter_expression=filter_expression, subpops=subpops, bcf=any(bcf)
+    )
+
+    # determine chunk length from the memory available
+    if max_memory is not None:
+        chunk_length = _estimate_chunk_length(max_memory, fields=fields, types=types,
+                                              numbers=numbers, n_samples=len(samples),
+                                              alt_number=alt_number)
+
+    kwds = dict(chunk_length=chunk_length, fields=fields, types=types, numbers=numbers,
+                fills=fills, region=region, loc_samples=loc_samples,
+                variant_filter=variant_filter, allele_counts=allele_counts,
+                offsets_fields=offsets_fields, n_threads=n_threads, stats=stats)
+
+    def iter_chunks():
+        for i in range(len(inputs)):
+            stream, input_headers, contigs, dictionary = \
+                opened.pop() if opened else open_input(i)
+            if list(input_headers.samples) != list(headers.samples):
+                raise ValueError('samples in input %r differ from those in input %r'
+                                 % (inputs[i], inputs[0]))
+            for item in _setup_chunk_iterator(stream, headers=input_headers,
+                                              contigs=contigs, dictionary=dictionary,
+                                              bcf=bcf[i], **kwds):
+                yield item
+
+    chunks = iter_chunks()
+    if drop_fields:
+        fields = [f for f in fields if f not in drop_fields]
+        chunks = _chunk_iter_drop(chunks, drop_fields)
+
+    return fields, samples, headers, chunks
+
+
+def _read_stream_headers(stream, bcf=False):
+    """Read headers from a VCF or BCF stream. Returns a tuple of (headers, contigs,
+    dictionary), where `contigs` and `dictionary` are None for VCF."""
+    if bcf:
+        return _read_bcf_headers(stream)
+    return _read_vcf_headers(stream), None, None
+
+
+def _setup_chunk_iterator(stream, headers, contigs, dictionary, chunk_length, fields,
+                          types, numbers, fills, region, loc_samples, variant_filter,
+                          allele_counts, offsets_fields, n_threads=None, bcf=False,
+                          stats=None):
+    """Setup an iterator over chunks parsed from a stream positioned after the
+    headers."""
+
+    timing = stats is not None
+    if bcf:
+        chunks = BCFChunkIterator(
+            stream, chunk_length=chunk_length, headers=headers, contigs=contigs,
+            dictionary=dictionary, fields=fields, types=types, numbers=numbers,
+            fills=fills, region=region, loc_samples=loc_samples,
+            variant_filter=variant_filter, allele_counts=allele_counts
+        )
+    elif n_threads is not None and n_threads > 1 and not offsets_fields:
+        chunks = VCFParallelChunkIterator(
+            stream, chunk_length=chunk_length, n_threads=n_threads, headers=headers,
+            fields=fields, types=types, numbers=numbers, fills=fills, region=region,
+            loc_samples=loc_samples, variant_filter=variant_filter,
+            allele_counts=allele_counts, timing=timing
+        )
+    else:
+        chunks = VCFChunkIterator(
+            stream, chunk_length=chunk_length, headers=headers, fields=fields, types=types,
+            numbers=numbers, fills=fills, region=region, loc_samples=loc_samples,
+            variant_filter=variant_filter, allele_counts=allele_counts, timing=timing
+        )
+
+    if timing:
+        stream.timing = True
+        chunks = _chunk_iter_parse_stats(chunks, stream, stats)
+
+    return chunks
+
+
+def _normalize_params(headers, fields, exclude_fields, types, numbers, alt_number, fills,
+                      samples, filter_expression, subpops, bcf=False):
+    """Normalize parameters selecting samples and fields to extract, and how to parse
+    them."""
 
     # setup samples
     samples, loc_samples = _normalize_samples(samples=samples, headers=headers,
@@ -1647,6 +3153,15 @@ def _iter_vcf_stream(stream, fields, exclude_fields, types, numbers, alt_number,
                                            samples=samples)
         fields = [f for f in fields if f not in exclude_fields]
 
+    # setup variant filter, parsing any fields needed for the filter but not requested
+    variant_filter = None
+    drop_fields = list()
+    if filter_expression is not None:
+        program, filter_fields = _compile_filter_expression(filter_expression, headers)
+        drop_fields = [f for f in filter_fields if f not in fields]
+        fields = fields + drop_fields
+        variant_filter = program, filter_fields
+
     # setup data types
     types = _normalize_types(types=types, fields=fields, headers=headers)
 
@@ -1657,13 +3172,326 @@ def _iter_vcf_stream(stream, fields, exclude_fields, types, numbers, alt_number,
     # setup fills
     fills = _normalize_fills(fills=fills, fields=fields, headers=headers)
 
-    # setup chunks iterator
-    chunks = VCFChunkIterator(
-        stream, chunk_length=chunk_length, headers=headers, fields=fields, types=types,
-        numbers=numbers, fills=fills, region=region, loc_samples=loc_samples
+    # check fields with strings stored as offsets
+    offsets_fields = _check_offsets_types(types, variant_filter=variant_filter, bcf=bcf)
+
+    # setup allele counts, parsing genotype calls if needed but not requested
+    allele_counts = None
+    if subpops or any('variants/' + f in fields for f in GENOTYPE_COMPUTED_FIELDS):
+        allele_counts, pop_fields = _normalize_subpops(
+            subpops, samples=samples, numbers=numbers, alt_number=alt_number
+        )
+        fields = fields + pop_fields
+        if len(samples) > 0 and 'calldata/GT' not in fields:
+            fields.append('calldata/GT')
+            drop_fields.append('calldata/GT')
+            types['calldata/GT'] = _normalize_type(default_types['calldata/GT'])
+            numbers['calldata/GT'] = default_numbers['calldata/GT']
+        t = types.get('calldata/GT')
+        if isinstance(t, np.dtype) and t.kind not in 'iu':
+            raise ValueError('allele counts require genotype calls to be parsed as '
+                             'integers, found type %r for field %r' % (t, 'calldata/GT'))
+
+    return (samples, loc_samples, fields, types, numbers, fills, variant_filter,
+            drop_fields, offsets_fields, allele_counts)
+
+
+# approximate number of bytes per string held as a Python object, or stored as offsets
+OBJECT_ITEMSIZE = 64
+OFFSETS_ITEMSIZE = 24
+
+
+def _estimate_chunk_length(max_memory, fields, types, numbers, n_samples, alt_number):
+    """Estimate the number of variants for which arrays of parsed data fit within
+    `max_memory` bytes."""
+
+    variant_size = 0
+    for f in fields:
+        group, name = f.split('/')
+        # N.B., no number for computed fields, at most one value per allele
+        n = max(numbers.get(f, alt_number + 1), 1)
+        t = types.get(f)
+        if t is None:
+            # computed fields
+            itemsize = 4
+        elif t == OFFSETS_TYPE:
+            itemsize = OFFSETS_ITEMSIZE
+        elif isinstance(t, str) and t.startswith('genotype_packed/'):
+            # one byte per call
+            itemsize, n = 1, 1
+        elif isinstance(t, str) and t.startswith('genotype_2bit/'):
+            # four calls per byte
+            itemsize, n = .25, 1
+        elif isinstance(t, str):
+            # other genotype layouts
+            itemsize = np.dtype(t.split('/')[1]).itemsize
+        elif t.kind == 'O':
+            itemsize = OBJECT_ITEMSIZE
+        else:
+            itemsize = t.itemsize
+        if group == 'calldata':
+            n *= n_samples
+        variant_size += itemsize * n
+
+    return max(int(max_memory // max(variant_size, 1)), 1)
+
+
+def _resolve_chunk_length(input, chunk_length, max_memory, fields, exclude_fields, types,
+                          numbers, alt_number, fills, samples, filter_expression, subpops):
+    """Determine the chunk length up front from the memory available, if given, so all
+    chunks and any output datasets are alike."""
+
+    if max_memory is None:
+        return chunk_length
+
+    if isinstance(input, (list, tuple)):
+        # N.B., headers are read from the first input
+        input = input[0]
+    headers = read_vcf_headers(input)
+    samples, _, fields, types, numbers, _, _, _, _, _ = _normalize_params(
+        headers, fields=fields, exclude_fields=exclude_fields, types=types,
+        numbers=numbers, alt_number=alt_number, fills=fills, samples=samples,
+        filter_expression=filter_expression, subpops=subpops
     )
+    return _estimate_chunk_length(max_memory, fields=fields, types=types, numbers=numbers,
+                                  n_samples=len(samples), alt_number=alt_number)
 
-    return fields, samples, headers, chunks
+
+def _resolve_chunk_width(chunk_width, chunk_length, max_memory):
+    """Determine the width of chunks when storing output, if not given."""
+    if chunk_width is not None:
+        return chunk_width
+    if max_memory is None:
+        return DEFAULT_CHUNK_WIDTH
+    # same number of calls per chunk as with the defaults
+    return max(DEFAULT_CHUNK_LENGTH * DEFAULT_CHUNK_WIDTH // chunk_length, 1)
+
+
+def _check_offsets_types(types, variant_filter, bcf):
+    """Check fields given type 'offsets' are supported, returning their names."""
+    offsets_fields = sorted(f for f, t in types.items() if t == OFFSETS_TYPE)
+    for f in offsets_fields:
+        group, name = f.split('/')
+        if (group != 'variants' or name in {'CHROM', 'POS', 'QUAL'} or
+                name in COMPUTED_FIELDS or name in GENOTYPE_COMPUTED_FIELDS or
+                name.startswith('FILTER_')):
+            raise ValueError('type %r not supported for field %r' % (OFFSETS_TYPE, f))
+        if variant_filter is not None and f in variant_filter[1]:
+            raise ValueError('field %r with type %r not supported in filter expression'
+                             % (f, OFFSETS_TYPE))
+    if offsets_fields and bcf:
+        raise ValueError('type %r not supported for BCF input' % OFFSETS_TYPE)
+    return offsets_fields
+
+
+def _normalize_subpops(subpops, samples, numbers, alt_number):
+    """Setup allele counts computed from genotype calls, returning a tuple of (number of
+    alleles, list of (field, indices of samples)) for the chunk iterator, and the names
+    of the fields holding allele counts for each group of samples."""
+    n_alleles = numbers.get('variants/ac', alt_number + 1)
+    normed_subpops = list()
+    if subpops:
+        sample_index = dict((s, i) for i, s in enumerate(samples))
+        for name, members in sorted(subpops.items()):
+            indices = list()
+            for s in members:
+                if isinstance(s, (int, np.integer)):
+                    if not 0 <= s < len(samples):
+                        raise ValueError('sample index %r out of range for subpop %r'
+                                         % (s, name))
+                    indices.append(int(s))
+                elif s in sample_index:
+                    indices.append(sample_index[s])
+                else:
+                    raise ValueError('sample %r not found for subpop %r' % (s, name))
+            normed_subpops.append(('variants/ac_' + name, indices))
+    return (n_alleles, normed_subpops), [f for f, _ in normed_subpops]
+
+
+def _chunk_iter_drop(it, drop_fields):
+    for chunk, chunk_length, chrom, pos in it:
+        for f in drop_fields:
+            del chunk[f]
+        yield chunk, chunk_length, chrom, pos
+
+
+# maximum depth of the stack used to evaluate a filter expression
+FILTER_MAX_STACK = 64
+
+
+_filter_binary_ops = {
+    ast.Add: 'add', ast.Sub: 'sub', ast.Mult: 'mul', ast.Div: 'div',
+    ast.BitAnd: 'and', ast.BitOr: 'or',
+}
+_filter_unary_ops = {ast.USub: 'neg', ast.Not: 'not', ast.Invert: 'not'}
+_filter_compare_ops = {
+    ast.Lt: 'lt', ast.LtE: 'le', ast.Gt: 'gt', ast.GtE: 'ge', ast.Eq: 'eq', ast.NotEq: 'ne',
+}
+_filter_string_ops = {ast.Eq: 'str_eq', ast.NotEq: 'str_ne'}
+
+
+def _filter_constant(node):
+    """Return the value of a constant node, or raise KeyError if not a constant."""
+    if hasattr(ast, 'Constant') and isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, getattr(ast, 'Num', ())):
+        return node.n
+    if isinstance(node, getattr(ast, 'Str', ())):
+        return node.s
+    if isinstance(node, getattr(ast, 'NameConstant', ())):
+        return node.value
+    if isinstance(node, ast.Name) and node.id in {'True', 'False'}:
+        # PY2
+        return node.id == 'True'
+    raise KeyError(node)
+
+
+def _compile_filter_expression(expression, headers):
+    """Compile a filter expression into a program for a simple stack machine.
+
+    Returns
+    -------
+    program : list of tuples
+        Instructions in postfix order. Each is one of ('const', value), ('field', index,
+        column), ('str_eq', index, column, text), ('str_ne', index, column, text), or a
+        unary or binary operator, e.g., ('add',). Here, index refers to the list of
+        fields, and column is the index of the value within the field, or -1 if not
+        given.
+    fields : list of strings
+        Normalized names of the fields referenced by the program.
+
+    """
+
+    try:
+        tree = ast.parse(expression.strip(), mode='eval')
+    except SyntaxError as e:
+        raise ValueError('invalid filter expression %r: %s' % (expression, e))
+
+    program = list()
+    fields = list()
+
+    def invalid(node, reason='not supported'):
+        return ValueError('invalid filter expression %r: %s %s' %
+                          (expression, type(node).__name__, reason))
+
+    def field_ref(node):
+        # resolve a reference to a field, possibly indexed, as a tuple (index, column)
+        col = -1
+        if isinstance(node, ast.Subscript):
+            index = node.slice
+            if isinstance(index, getattr(ast, 'Index', ())):
+                # PY<3.9
+                index = index.value
+            try:
+                col = _filter_constant(index)
+            except KeyError:
+                raise invalid(node, 'index must be an integer')
+            if isinstance(col, bool) or not isinstance(col, int) or col < 0:
+                raise invalid(node, 'index must be a non-negative integer')
+            node = node.value
+        if not isinstance(node, ast.Name):
+            raise KeyError(node)
+        field = _normalize_field_prefix(node.id, headers)
+        if not field.startswith('variants/'):
+            raise ValueError('invalid filter expression %r: only variants fields are '
+                             'supported, found %r' % (expression, field))
+        if field[9:] in GENOTYPE_COMPUTED_FIELDS:
+            raise ValueError('invalid filter expression %r: fields computed from genotype '
+                             'calls are not supported, found %r' % (expression, field))
+        _check_field(field, headers)
+        if field not in fields:
+            fields.append(field)
+        return fields.index(field), col
+
+    def emit(node):
+        try:
+            value = _filter_constant(node)
+        except KeyError:
+            pass
+        else:
+            if isinstance(value, (bool, int, float)):
+                program.append(('const', float(value)))
+                return
+            raise invalid(node, 'only allowed in comparison with a string field')
+
+        try:
+            program.append(('field',) + field_ref(node))
+            return
+        except KeyError:
+            pass
+
+        if isinstance(node, ast.BoolOp):
+            op = 'and' if isinstance(node.op, ast.And) else 'or'
+            emit(node.values[0])
+            for v in node.values[1:]:
+                emit(v)
+                program.append((op,))
+
+        elif isinstance(node, ast.BinOp) and type(node.op) in _filter_binary_ops:
+            emit(node.left)
+            emit(node.right)
+            program.append((_filter_binary_ops[type(node.op)],))
+
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.UAdd):
+            emit(node.operand)
+
+        elif isinstance(node, ast.UnaryOp) and type(node.op) in _filter_unary_ops:
+            emit(node.operand)
+            program.append((_filter_unary_ops[type(node.op)],))
+
+        elif isinstance(node, ast.Compare):
+            # chained comparisons, e.g., a < b < c, are evaluated as (a < b) and (b < c)
+            left = node.left
+            for i, (op, right) in enumerate(zip(node.ops, node.comparators)):
+                emit_compare(node, op, left, right)
+                if i > 0:
+                    program.append(('and',))
+                left = right
+
+        else:
+            raise invalid(node)
+
+    def emit_compare(node, op, left, right):
+        text = None
+        for a, b in (left, right), (right, left):
+            try:
+                text = _filter_constant(b)
+            except KeyError:
+                continue
+            if isinstance(text, (str, text_type)):
+                break
+            text = None
+        if text is None:
+            if type(op) not in _filter_compare_ops:
+                raise invalid(op)
+            emit(left)
+            emit(right)
+            program.append((_filter_compare_ops[type(op)],))
+            return
+        if type(op) not in _filter_string_ops:
+            raise invalid(op, 'not supported for strings')
+        try:
+            index, col = field_ref(a)
+        except KeyError:
+            raise invalid(node, 'string may only be compared with a field')
+        if isinstance(text, bytes):
+            text = text.decode('utf8')
+        program.append((_filter_string_ops[type(op)], index, col, text))
+
+    emit(tree.body)
+
+    # check stack depth
+    depth = max_depth = 0
+    for instruction in program:
+        if instruction[0] in {'const', 'field', 'str_eq', 'str_ne'}:
+            depth += 1
+        elif instruction[0] not in {'neg', 'not'}:
+            depth -= 1
+        max_depth = max(depth, max_depth)
+    if max_depth > FILTER_MAX_STACK:
+        raise ValueError('filter expression %r is too deeply nested' % expression)
+
+    return program, fields
 
 
 # pre-compile some regular expressions
@@ -1675,6 +3503,10 @@ _re_format_header = \
     re.compile('##FORMAT=<ID=([^,]+),Number=([^,]+),Type=([^,]+),Description="([^"]*)">')
 
 
+_re_bcf_dictionary_header = re.compile('##(FILTER|INFO|FORMAT|contig)=<(?:.*,)?ID=([^,>]+)')
+_re_bcf_idx = re.compile(',IDX=([0-9]+)')
+
+
 VCFHeaders = namedtuple('VCFHeaders', ['headers', 'filters', 'infos', 'formats',
                                        'samples'])
 
@@ -1682,6 +3514,9 @@ VCFHeaders = namedtuple('VCFHeaders', ['headers', 'filters', 'infos', 'formats',
 # noinspection PyShadowingBuiltins
 def read_vcf_headers(input):
     """Read headers from a VCF file."""
+    if _is_bcf(input):
+        headers, _, _ = _read_bcf_headers(_setup_bcf_input_stream(input))
+        return headers
     stream = _setup_input_stream(input)
     return _read_vcf_headers(stream)
 
@@ -1754,6 +3589,45 @@ def _read_vcf_headers(stream):
     return VCFHeaders(headers, filters, infos, formats, samples)
 
 
+def _read_bcf_headers(stream):
+    """Read headers from a BCF stream, leaving the stream positioned at the first record.
+    Returns a tuple of (headers, contigs, dictionary), where `contigs` and `dictionary`
+    hold the names of contigs and of FILTER, INFO and FORMAT fields, which records refer
+    to by index."""
+
+    magic = stream.read(5)
+    if magic[:3] != b'BCF':
+        raise RuntimeError('not a BCF file')
+    if magic[3:] != b'\x02\x02':
+        warnings.warn('unsupported BCF version %s.%s, values may not be decoded '
+                      'correctly' % tuple(bytearray(magic[3:])))
+    l_text, = struct.unpack('<I', stream.read(4))
+    text = stream.read(l_text).rstrip(b'\x00')
+
+    # build dictionaries, in order of header lines unless given by IDX attributes
+    contigs = list()
+    dictionary = ['PASS']
+    lines = list()
+    for line in text_type(text, 'utf8').splitlines(True):
+        match = _re_bcf_dictionary_header.match(line)
+        if match is not None:
+            group, key = match.groups()
+            names = contigs if group == 'contig' else dictionary
+            idx = _re_bcf_idx.search(line)
+            if idx is not None:
+                i = int(idx.group(1))
+                names.extend([None] * (i + 1 - len(names)))
+                names[i] = key
+            elif key not in names:
+                names.append(key)
+            # N.B., IDX is only meaningful within BCF
+            line = _re_bcf_idx.sub('', line)
+        lines.append(line.encode('utf8'))
+
+    headers = _read_vcf_headers(FileInputStream(io.BytesIO(b''.join(lines))))
+    return headers, contigs, dictionary
+
+
 def _chunk_to_dataframe(fields, chunk):
     import pandas
     items = list()
@@ -1790,12 +3664,15 @@ def vcf_to_dataframe(input,
                      transformers=None,
                      buffer_size=DEFAULT_BUFFER_SIZE,
                      chunk_length=DEFAULT_CHUNK_LENGTH,
+                     max_memory=None,
+                     n_threads=None,
+                     filter_expression=None,
                      log=None):
     """Read data from a VCF file into a pandas DataFrame.
 
     Parameters
     ----------
-    input : string
+    input : string or list of strings
         {input}
     fields : list of strings, optional
         {fields}
@@ -1805,11 +3682,11 @@ def vcf_to_dataframe(input,
         {types}
     numbers : dict, optional
         {numbers}
-    alt_number : int, optional
+    alt_number : int or 'auto', optional
         {alt_number}
     fills : dict, optional
         {fills}
-    region : string, optional
+    region : string or list of strings, optional
         {region}
     tabix : string, optional
         {tabix}
@@ -1819,6 +3696,12 @@ def vcf_to_dataframe(input,
         {buffer_size}
     chunk_length : int, optional
         {chunk_length}
+    max_memory : int, optional
+        {max_memory}
+    n_threads : int, optional
+        {n_threads}
+    filter_expression : string, optional
+        {filter_expression}
     log : file-like, optional
         {log}
 
@@ -1838,9 +3721,11 @@ def vcf_to_dataframe(input,
     fields, _, _, it = iter_vcf_chunks(
         input=input, fields=fields, exclude_fields=exclude_fields, types=types,
         numbers=numbers, alt_number=alt_number, buffer_size=buffer_size,
-        chunk_length=chunk_length, fills=fills, region=region, tabix=tabix, samples=[],
-        transformers=transformers
+        chunk_length=chunk_length, max_memory=max_memory, n_threads=n_threads,
+        fills=fills, region=region, tabix=tabix, samples=[], transformers=transformers,
+        filter_expression=filter_expression
     )
+    it = _chunk_iter_decode_offsets(it)
 
     # setup progress logging
     if log is not None:
@@ -1874,6 +3759,9 @@ vcf_to_dataframe.__doc__ = vcf_to_dataframe.__doc__.format(
     transformers=_doc_param_transformers,
     buffer_size=_doc_param_buffer_size,
     chunk_length=_doc_param_chunk_length,
+    max_memory=_doc_param_max_memory,
+    n_threads=_doc_param_n_threads,
+    filter_expression=_doc_param_filter_expression,
     log=_doc_param_log,
 )
 
@@ -1891,13 +3779,16 @@ def vcf_to_csv(input, output,
                transformers=None,
                buffer_size=DEFAULT_BUFFER_SIZE,
                chunk_length=DEFAULT_CHUNK_LENGTH,
+               max_memory=None,
+               n_threads=None,
+               filter_expression=None,
                log=None,
                **kwargs):
     r"""Read data from a VCF file and write out to a comma-separated values (CSV) file.
 
     Parameters
     ----------
-    input : string
+    input : string or list of strings
         {input}
     output : string
         {output}
@@ -1909,11 +3800,11 @@ def vcf_to_csv(input, output,
         {types}
     numbers : dict, optional
         {numbers}
-    alt_number : int, optional
+    alt_number : int or 'auto', optional
         {alt_number}
     fills : dict, optional
         {fills}
-    region : string, optional
+    region : string or list of strings, optional
         {region}
     tabix : string, optional
         {tabix}
@@ -1923,6 +3814,12 @@ def vcf_to_csv(input, output,
         {buffer_size}
     chunk_length : int, optional
         {chunk_length}
+    max_memory : int, optional
+        {max_memory}
+    n_threads : int, optional
+        {n_threads}
+    filter_expression : string, optional
+        {filter_expression}
     log : file-like, optional
         {log}
     kwargs : keyword arguments
@@ -1939,9 +3836,11 @@ def vcf_to_csv(input, output,
     fields, _, _, it = iter_vcf_chunks(
         input=input, fields=fields, exclude_fields=exclude_fields, types=types,
         numbers=numbers, alt_number=alt_number, buffer_size=buffer_size,
-        chunk_length=chunk_length, fills=fills, region=region, tabix=tabix, samples=[],
-        transformers=transformers
+        chunk_length=chunk_length, max_memory=max_memory, n_threads=n_threads,
+        fills=fills, region=region, tabix=tabix, samples=[], transformers=transformers,
+        filter_expression=filter_expression
     )
+    it = _chunk_iter_decode_offsets(it)
 
     # setup progress logging
     if log is not None:
@@ -1973,6 +3872,195 @@ vcf_to_csv.__doc__ = vcf_to_csv.__doc__.format(
     transformers=_doc_param_transformers,
     buffer_size=_doc_param_buffer_size,
     chunk_length=_doc_param_chunk_length,
+    max_memory=_doc_param_max_memory,
+    n_threads=_doc_param_n_threads,
+    filter_expression=_doc_param_filter_expression,
+    log=_doc_param_log,
+)
+
+
+def _array_to_arrow(a):
+    import pyarrow as pa
+    from allel.model.ndarray import OffsetStringArray
+
+    if isinstance(a, OffsetStringArray):
+        # wrap the buffers directly, the layout is the same as an arrow string array
+        offsets = np.ascontiguousarray(a.offsets, dtype='i8')
+        # treat empty string as missing
+        valid = pa.array(offsets[1:] > offsets[:-1])
+        return pa.LargeStringArray.from_buffers(
+            len(a), pa.py_buffer(offsets), pa.py_buffer(np.ascontiguousarray(a.data)),
+            null_bitmap=valid.buffers()[1]
+        )
+
+    if a.dtype.kind == 'S':
+        a = np.char.decode(a, 'utf8')
+    if a.dtype.kind in 'UO':
+        # treat empty string as missing
+        return pa.array(a, type=pa.string(), mask=(a == ''))
+
+    # treat NaN as missing
+    return pa.array(a, from_pandas=True)
+
+
+def _chunk_to_record_batch(fields, chunk):
+    import pyarrow as pa
+
+    arrays = list()
+    names = list()
+    for f in fields:
+        a = chunk[f]
+        group, name = f.split('/')
+        if group != 'variants':
+            raise ValueError('only variants fields can be written to parquet, found %r'
+                             % f)
+        if a.ndim == 1:
+            arrays.append(_array_to_arrow(a))
+            names.append(name)
+        elif a.ndim == 2:
+            if not isinstance(a, np.ndarray):
+                a = np.asarray(a)
+            for i in range(a.shape[1]):
+                arrays.append(_array_to_arrow(a[:, i]))
+                names.append('%s_%s' % (name, i + 1))
+        else:
+            warnings.warn('cannot handle array %r with >2 dimensions, skipping' % name)
+    return pa.RecordBatch.from_arrays(arrays, names)
+
+
+# noinspection PyShadowingBuiltins
+def vcf_to_parquet(input, output,
+                   fields=None,
+                   exclude_fields=None,
+                   types=None,
+                   numbers=None,
+                   alt_number=DEFAULT_ALT_NUMBER,
+                   fills=None,
+                   region=None,
+                   tabix='tabix',
+                   transformers=None,
+                   buffer_size=DEFAULT_BUFFER_SIZE,
+                   chunk_length=DEFAULT_CHUNK_LENGTH,
+                   max_memory=None,
+                   n_threads=None,
+                   filter_expression=None,
+                   row_group_size=None,
+                   compression='snappy',
+                   log=None,
+                   **kwargs):
+    """Read data from a VCF file and write out to an Apache Parquet file. Requires
+    pyarrow.
+
+    Parameters
+    ----------
+    input : string or list of strings
+        {input}
+    output : string
+        {output}
+    fields : list of strings, optional
+        {fields}
+    exclude_fields : list of strings, optional
+        {exclude_fields}
+    types : dict, optional
+        {types}
+    numbers : dict, optional
+        {numbers}
+    alt_number : int or 'auto', optional
+        {alt_number}
+    fills : dict, optional
+        {fills}
+    region : string or list of strings, optional
+        {region}
+    tabix : string, optional
+        {tabix}
+    transformers : list of transformer objects, optional
+        {transformers}
+    buffer_size : int, optional
+        {buffer_size}
+    chunk_length : int, optional
+        {chunk_length}
+    max_memory : int, optional
+        {max_memory}
+    n_threads : int, optional
+        {n_threads}
+    filter_expression : string, optional
+        {filter_expression}
+    row_group_size : int, optional
+        Maximum number of rows in each row group. Each chunk is written out as soon as it
+        has been parsed, so row groups never span chunks, and at most `chunk_length` rows
+        are held in memory at a time. If not given, each chunk is written as a single row
+        group.
+    compression : string or dict, optional
+        Compression codec, e.g., 'snappy', 'gzip', 'zstd' or 'none', or a dictionary
+        mapping column names to codecs.
+    log : file-like, optional
+        {log}
+    kwargs : keyword arguments
+        All remaining keyword arguments are passed through to
+        pyarrow.parquet.ParquetWriter().
+
+    Notes
+    -----
+    Columns are written with the same types as returned by :func:`read_vcf`. Fields with
+    more than one value per variant are split into one column per value, named as for
+    :func:`vcf_to_dataframe`. Empty strings and NaN values are written as nulls. Fields
+    with type 'offsets' are passed to pyarrow without copying and written as
+    large_string columns. If no variants are found, no file is written, as for
+    :func:`vcf_to_zarr` and :func:`vcf_to_hdf5`.
+
+    """
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # samples requested?
+    # noinspection PyTypeChecker
+    _, fields = _prep_fields_param(fields)
+
+    # setup
+    fields, _, _, it = iter_vcf_chunks(
+        input=input, fields=fields, exclude_fields=exclude_fields, types=types,
+        numbers=numbers, alt_number=alt_number, buffer_size=buffer_size,
+        chunk_length=chunk_length, max_memory=max_memory, n_threads=n_threads,
+        fills=fills, region=region, tabix=tabix, samples=[], transformers=transformers,
+        filter_expression=filter_expression
+    )
+
+    # setup progress logging
+    if log is not None:
+        it = _chunk_iter_progress(it, log, prefix='[vcf_to_parquet]')
+
+    writer = None
+    try:
+        for chunk, _, _, _ in it:
+            batch = _chunk_to_record_batch(fields, chunk)
+            if writer is None:
+                writer = pq.ParquetWriter(output, batch.schema, compression=compression,
+                                          **kwargs)
+            writer.write_table(pa.Table.from_batches([batch]),
+                               row_group_size=row_group_size)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+vcf_to_parquet.__doc__ = vcf_to_parquet.__doc__.format(
+    input=_doc_param_input,
+    output=_doc_param_output,
+    fields=_doc_param_fields,
+    exclude_fields=_doc_param_exclude_fields,
+    types=_doc_param_types,
+    numbers=_doc_param_numbers,
+    alt_number=_doc_param_alt_number,
+    fills=_doc_param_fills,
+    region=_doc_param_region,
+    tabix=_doc_param_tabix,
+    transformers=_doc_param_transformers,
+    buffer_size=_doc_param_buffer_size,
+    chunk_length=_doc_param_chunk_length,
+    max_memory=_doc_param_max_memory,
+    n_threads=_doc_param_n_threads,
+    filter_expression=_doc_param_filter_expression,
     log=_doc_param_log,
 )
 
@@ -2009,12 +4097,15 @@ def vcf_to_recarray(input,
                     transformers=None,
                     buffer_size=DEFAULT_BUFFER_SIZE,
                     chunk_length=DEFAULT_CHUNK_LENGTH,
+                    max_memory=None,
+                    n_threads=None,
+                    filter_expression=None,
                     log=None):
     """Read data from a VCF file into a NumPy recarray.
 
     Parameters
     ----------
-    input : string
+    input : string or list of strings
         {input}
     fields : list of strings, optional
         {fields}
@@ -2024,11 +4115,11 @@ def vcf_to_recarray(input,
         {types}
     numbers : dict, optional
         {numbers}
-    alt_number : int, optional
+    alt_number : int or 'auto', optional
         {alt_number}
     fills : dict, optional
         {fills}
-    region : string, optional
+    region : string or list of strings, optional
         {region}
     tabix : string, optional
         {tabix}
@@ -2038,6 +4129,12 @@ def vcf_to_recarray(input,
         {buffer_size}
     chunk_length : int, optional
         {chunk_length}
+    max_memory : int, optional
+        {max_memory}
+    n_threads : int, optional
+        {n_threads}
+    filter_expression : string, optional
+        {filter_expression}
     log : file-like, optional
         {log}
 
@@ -2056,9 +4153,11 @@ def vcf_to_recarray(input,
     fields, _, _, it = iter_vcf_chunks(
         input=input, fields=fields, exclude_fields=exclude_fields, types=types,
         numbers=numbers, alt_number=alt_number, buffer_size=buffer_size,
-        chunk_length=chunk_length, fills=fills, region=region, tabix=tabix, samples=[],
-        transformers=transformers
+        chunk_length=chunk_length, max_memory=max_memory, n_threads=n_threads,
+        fills=fills, region=region, tabix=tabix, samples=[], transformers=transformers,
+        filter_expression=filter_expression
     )
+    it = _chunk_iter_decode_offsets(it)
 
     # setup progress logging
     if log is not None:
@@ -2091,5 +4190,8 @@ vcf_to_recarray.__doc__ = vcf_to_recarray.__doc__.format(
     transformers=_doc_param_transformers,
     buffer_size=_doc_param_buffer_size,
     chunk_length=_doc_param_chunk_length,
+    max_memory=_doc_param_max_memory,
+    n_threads=_doc_param_n_threads,
+    filter_expression=_doc_param_filter_expression,
     log=_doc_param_log,
 )
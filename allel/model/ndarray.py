@@ -11,7 +11,7 @@ import numpy as np
 # internal imports
 from allel.util import check_integer_dtype, check_shape, check_dtype, ignore_invalid, \
     check_dim0_aligned, check_ploidy, check_ndim, asarray_ndim
-from allel.compat import PY2, copy_method_doc, integer_types, memoryview_safe
+from allel.compat import PY2, copy_method_doc, integer_types, memoryview_safe, text_type
 from allel.io import write_vcf, gff3_to_recarray, recarray_from_hdf5_group, recarray_to_hdf5_group
 from allel.abc import ArrayWrapper, DisplayAs1D, DisplayAs2D, DisplayAsTable
 from allel.opt.model import genotype_array_pack_diploid, genotype_array_unpack_diploid, \
@@ -30,7 +30,8 @@ from .generic import index_genotype_vector, compress_genotypes, \
 
 __all__ = ['Genotypes', 'GenotypeArray', 'GenotypeVector', 'HaplotypeArray', 'AlleleCountsArray',
            'GenotypeAlleleCounts', 'GenotypeAlleleCountsArray', 'GenotypeAlleleCountsVector',
-           'SortedIndex', 'UniqueIndex', 'SortedMultiIndex', 'VariantTable', 'FeatureTable']
+           'SortedIndex', 'UniqueIndex', 'SortedMultiIndex', 'VariantTable', 'FeatureTable',
+           'OffsetStringArray']
 
 
 # noinspection PyTypeChecker
@@ -74,13 +75,22 @@ class NumpyArrayWrapper(ArrayWrapper):
         super(NumpyArrayWrapper, self).__init__(values)
 
 
+def recarray_from_dict(data, names=None):
+    """Construct a recarray from a dictionary of columns, which may have multiple
+    dimensions, and may be any array-like objects, e.g., a
+    :class:`OffsetStringArray`."""
+    if names is None:
+        names = sorted(data.keys())
+    arrays = [np.asarray(data[n]) for n in names]
+    dtype = [(n, a.dtype, a.shape[1:]) for n, a in zip(names, arrays)]
+    return np.rec.fromarrays(arrays, dtype=dtype)
+
+
 class NumpyRecArrayWrapper(DisplayAsTable):
 
     def __init__(self, data, copy=False, **kwargs):
         if isinstance(data, dict):
-            names = kwargs.get('names', sorted(data.keys()))
-            arrays = [data[n] for n in names]
-            values = np.rec.fromarrays(arrays, names=names)
+            values = recarray_from_dict(data, names=kwargs.get('names'))
         else:
             values = np.rec.array(data, copy=copy, **kwargs)
             check_ndim(values, 1)
@@ -100,9 +110,7 @@ class NumpyRecArrayWrapper(DisplayAsTable):
 
     @classmethod
     def fromdict(cls, data, **kwargs):
-        names = kwargs.get('names', sorted(data.keys()))
-        arrays = [data[n] for n in names]
-        a = np.rec.fromarrays(arrays, names=names)
+        a = recarray_from_dict(data, names=kwargs.get('names'))
         return cls(a, copy=False)
 
     @classmethod
@@ -4226,7 +4234,8 @@ class VariantTable(NumpyRecArrayWrapper):
     Parameters
     ----------
     data : array_like, structured, shape (n_variants,)
-        Variant records.
+        Variant records. May also be a dictionary of columns, in which case any
+        :class:`OffsetStringArray` columns are converted to fixed length strings.
     index : string or pair of strings, optional
         Names of columns to use for positional index, e.g., 'POS' if table
         contains a 'POS' column and records from a single chromosome/contig,
@@ -4572,3 +4581,210 @@ class FeatureTable(NumpyRecArrayWrapper):
             return None
         else:
             return FeatureTable(a, copy=False)
+
+
+class OffsetStringArray(object):
+    """Array of variable length byte strings, stored as a single buffer holding the
+    bytes of all items together with an array of offsets into that buffer, the same
+    layout as an Apache Arrow binary array. Compared with a fixed length string array no
+    space is wasted on padding, and compared with an object array no Python objects are
+    created until items are accessed.
+
+    Parameters
+    ----------
+    offsets : array_like, int, shape (n_items + 1,)
+        Offsets into `data`, such that item `i` is stored from `offsets[i]` up to
+        `offsets[i + 1]`.
+    data : array_like, uint8
+        Bytes of all items.
+    shape : tuple of ints, optional
+        Shape of the array, defaults to `(n_items,)`. Items are stored in C order.
+
+    Examples
+    --------
+
+    >>> import allel
+    >>> a = allel.OffsetStringArray.from_values([b'A', b'TTG', b'', b'CA'])
+    >>> a
+    <OffsetStringArray shape=(4,) nbytes=46>
+    >>> a.offsets
+    array([0, 1, 4, 4, 6])
+    >>> a[1]
+    b'TTG'
+
+    Indexing along the first dimension with a slice returns a view, without copying::
+
+        >>> b = a[1:3]
+        >>> b.offsets
+        array([1, 4, 4])
+        >>> b.data is a.data
+        True
+
+    Convert to a fixed length string array::
+
+        >>> np.asarray(a)
+        array([b'A', b'TTG', b'', b'CA'], dtype='|S3')
+
+    """
+
+    def __init__(self, offsets, data, shape=None):
+        offsets = asarray_ndim(offsets, 1)
+        check_integer_dtype(offsets)
+        if isinstance(data, bytes):
+            data = np.frombuffer(data, dtype='u1')
+        data = asarray_ndim(data, 1)
+        check_dtype(data, 'u1')
+        n_items = offsets.shape[0] - 1
+        if n_items < 0:
+            raise ValueError('offsets must have at least one element')
+        if shape is None:
+            shape = (n_items,)
+        shape = tuple(shape)
+        if int(np.prod(shape)) != n_items:
+            raise ValueError('shape %r does not match number of items %s'
+                             % (shape, n_items))
+        self._offsets = offsets
+        self._data = data
+        self._shape = shape
+
+    @classmethod
+    def from_values(cls, values):
+        """Construct an array from a sequence of byte strings. Unicode strings are
+        encoded as UTF-8."""
+        values = np.asarray(values, dtype=object)
+        items = [v.encode('utf8') if isinstance(v, text_type) else bytes(v)
+                 for v in values.flat]
+        offsets = np.zeros(len(items) + 1, dtype='i8')
+        np.cumsum([len(v) for v in items], out=offsets[1:])
+        data = np.frombuffer(b''.join(items), dtype='u1')
+        return cls(offsets, data, shape=values.shape)
+
+    @property
+    def offsets(self):
+        """Offsets of each item into the buffer of bytes, followed by the offset of the
+        end of the last item."""
+        return self._offsets
+
+    @property
+    def data(self):
+        """Buffer holding the bytes of all items. May hold further bytes before the
+        first item and after the last item."""
+        return self._data
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def ndim(self):
+        return len(self._shape)
+
+    @property
+    def nbytes(self):
+        """Number of bytes used by the offsets and the items."""
+        return self._offsets.nbytes + int(self._offsets[-1] - self._offsets[0])
+
+    @property
+    def caption(self):
+        return '<%s shape=%s nbytes=%s>' % (type(self).__name__, self.shape, self.nbytes)
+
+    def __repr__(self):
+        return self.caption
+
+    def __len__(self):
+        return self._shape[0]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def _take_items(self, items, shape):
+        # gather items into a new compact buffer
+        starts = self._offsets[items]
+        lengths = self._offsets[items + 1] - starts
+        offsets = np.zeros(len(items) + 1, dtype=self._offsets.dtype)
+        np.cumsum(lengths, out=offsets[1:])
+        index = np.arange(offsets[-1]) + np.repeat(starts - offsets[:-1], lengths)
+        return type(self)(offsets, self._data[index], shape=shape)
+
+    def __getitem__(self, item):
+        width = int(np.prod(self._shape[1:]))
+        if isinstance(item, integer_types + (np.integer,)):
+            if item < 0:
+                item += len(self)
+            if not 0 <= item < len(self):
+                raise IndexError('index %s out of range' % item)
+            if self.ndim == 1:
+                start, stop = self._offsets[item], self._offsets[item + 1]
+                return self._data[start:stop].tobytes()
+            return type(self)(self._offsets[item * width:(item + 1) * width + 1],
+                              self._data, shape=self._shape[1:])
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step == 1:
+                # N.B., a view, buffer is shared
+                stop = max(start, stop)
+                return type(self)(self._offsets[start * width:stop * width + 1],
+                                  self._data, shape=(stop - start,) + self._shape[1:])
+            item = np.arange(start, stop, step)
+        if isinstance(item, tuple):
+            # index into further dimensions via a fixed length string array
+            return np.asarray(self)[item]
+        item = np.asarray(item)
+        if item.dtype == bool:
+            check_ndim(item, 1)
+            if item.shape[0] != len(self):
+                raise IndexError('boolean index does not match length %s' % len(self))
+            item, = np.nonzero(item)
+        check_ndim(item, 1)
+        item = np.where(item < 0, item + len(self), item)
+        items = (item[:, np.newaxis] * width + np.arange(width)).reshape(-1)
+        return self._take_items(items, shape=(item.shape[0],) + self._shape[1:])
+
+    def __array__(self, dtype=None, copy=None):
+        if copy is False:
+            raise ValueError('cannot convert to an array without copying')
+        lengths = np.diff(self._offsets)
+        itemsize = max(1, int(lengths.max())) if lengths.size else 1
+        out = np.zeros(lengths.size, dtype='S%s' % itemsize)
+        # scatter bytes into padded items
+        start = self._offsets[0]
+        index = np.arange(self._offsets[-1] - start) + \
+            np.repeat(np.arange(lengths.size) * itemsize - (self._offsets[:-1] - start),
+                      lengths)
+        out.view('u1')[index] = self._data[start:self._offsets[-1]]
+        out = out.reshape(self._shape)
+        if dtype is not None:
+            out = out.astype(dtype, copy=False)
+        return out
+
+    def concatenate(self, others):
+        """Concatenate arrays along the first dimension.
+
+        Parameters
+        ----------
+        others : OffsetStringArray or sequence of OffsetStringArray
+            Arrays with the same shape, except in the first dimension.
+
+        Returns
+        -------
+        out : OffsetStringArray
+
+        """
+        if not isinstance(others, (list, tuple)):
+            others = others,
+        arrays = (self,) + tuple(others)
+        for a in arrays[1:]:
+            if a.shape[1:] != self.shape[1:]:
+                raise ValueError('arrays must have the same shape except in the first '
+                                 'dimension')
+        offsets = [np.zeros(1, dtype='i8')]
+        data = list()
+        size = 0
+        for a in arrays:
+            start, stop = a.offsets[0], a.offsets[-1]
+            offsets.append(a.offsets[1:] - start + size)
+            data.append(a.data[start:stop])
+            size += stop - start
+        shape = (sum(len(a) for a in arrays),) + self.shape[1:]
+        return type(self)(np.concatenate(offsets), np.concatenate(data), shape=shape)
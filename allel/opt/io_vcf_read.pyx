@@ -21,15 +21,39 @@ import warnings
 # noinspection PyUnresolvedReferences
 from cpython.bytes cimport PyBytes_AS_STRING, PyBytes_FromStringAndSize
 # noinspection PyUnresolvedReferences
-from libc.stdlib cimport strtol, strtof, strtod, malloc, free, realloc
+from libc.stdlib cimport strtol, strtof, strtod, malloc, calloc, free, realloc
 # noinspection PyUnresolvedReferences
-from libc.string cimport strcmp, memcpy
+from libc.string cimport strcmp, memcpy, memchr, memcmp
 import numpy as np
 cimport numpy as np
-from cpython.ref cimport PyObject
+from cpython.ref cimport PyObject, Py_XINCREF, Py_XDECREF
+# noinspection PyUnresolvedReferences
+from cpython.unicode cimport PyUnicode_DecodeUTF8
 cdef extern from "Python.h":
     char* PyByteArray_AS_STRING(object string)
-# from multiprocessing.pool import ThreadPool
+# monotonic wall clock in seconds, for timing instrumentation
+cdef extern from *:
+    """
+    #ifdef _WIN32
+    #include <windows.h>
+    static double vcf_clock(void) {
+        LARGE_INTEGER count, frequency;
+        QueryPerformanceCounter(&count);
+        QueryPerformanceFrequency(&frequency);
+        return (double) count.QuadPart / (double) frequency.QuadPart;
+    }
+    #else
+    #include <time.h>
+    static double vcf_clock(void) {
+        struct timespec ts;
+        clock_gettime(CLOCK_MONOTONIC, &ts);
+        return ts.tv_sec + ts.tv_nsec * 1e-9;
+    }
+    #endif
+    """
+    double vcf_clock() nogil
+from multiprocessing.pool import ThreadPool
+import mmap
 
 
 from allel.compat import PY2, text_type
@@ -55,6 +79,10 @@ cdef char SLASH = b'/'
 cdef char PIPE = b'|'
 cdef char EQUALS = b'='
 cdef char ASTERISK = b'*'
+cdef char ZERO = b'0'
+cdef char NINE = b'9'
+cdef char MINUS = b'-'
+cdef char PLUS = b'+'
 
 # user field specifications for fixed fields
 CHROM_FIELD = 'variants/CHROM'
@@ -62,10 +90,15 @@ POS_FIELD = 'variants/POS'
 ID_FIELD = 'variants/ID'
 REF_FIELD = 'variants/REF'
 ALT_FIELD = 'variants/ALT'
+# type of string fields stored as offsets into a buffer of bytes
+OFFSETS_TYPE = 'offsets'
 QUAL_FIELD = 'variants/QUAL'
 NUMALT_FIELD = 'variants/numalt'
 ALTLEN_FIELD = 'variants/altlen'
 IS_SNP_FIELD = 'variants/is_snp'
+AC_FIELD = 'variants/ac'
+AN_FIELD = 'variants/an'
+N_MISSING_FIELD = 'variants/n_missing'
 
 # useful to lookup max int values
 II8 = np.iinfo(np.int8)
@@ -127,6 +160,12 @@ cdef inline void CharVector_append(CharVector* self, char c) nogil:
     self.size += 1
 
 
+cdef inline void CharVector_reserve(CharVector* self, Py_ssize_t capacity) nogil:
+    if self.capacity < capacity:
+        self.capacity = max(capacity, self.capacity * 2)
+        self.data = <char*> realloc(self.data, sizeof(char) * self.capacity)
+
+
 cdef inline void CharVector_clear(CharVector* self) nogil:
     self.size = 0
 
@@ -135,6 +174,13 @@ cdef inline void CharVector_terminate(CharVector* self) nogil:
     CharVector_append(self, 0)
 
 
+cdef inline void CharVector_copy(CharVector* self, CharVector* other) nogil:
+    cdef Py_ssize_t i
+    CharVector_clear(self)
+    for i in range(other.size):
+        CharVector_append(self, other.data[i])
+
+
 cdef bytes CharVector_to_pybytes(CharVector* self):
     return PyBytes_FromStringAndSize(self.data, self.size)
 
@@ -180,6 +226,20 @@ cdef inline void IntVector_clear(IntVector* self) nogil:
     self.size = 0
 
 
+cdef inline void IntVector_copy(IntVector* self, IntVector* other) nogil:
+    cdef Py_ssize_t i
+    IntVector_clear(self)
+    for i in range(other.size):
+        IntVector_append(self, other.data[i])
+
+
+cdef struct VCFFormatCacheEntry:
+    # raw FORMAT field, e.g., b'GT:AD:DP'
+    CharVector key
+    # resolved indices of formats, as stored in VCFContext.variant_format_indices
+    IntVector indices
+
+
 ##########################################################################################
 # C string utilities.
 
@@ -202,6 +262,34 @@ cdef inline Py_ssize_t search_sorted_cstr(char* query, char** compare, Py_ssize_
 # General I/O utilities.
 
 
+cdef inline char* find_line_end(char* p, char* end) nogil:
+    """Return a pointer to the first LF or CR within [`p`, `end`), or `end` if none."""
+    cdef char* q
+    q = <char*> memchr(p, LF, end - p)
+    if q is not NULL:
+        end = q
+    q = <char*> memchr(p, CR, end - p)
+    if q is not NULL:
+        end = q
+    return end
+
+
+cdef inline char* scan_fields(char* p, char* line_end, Py_ssize_t n,
+                              Py_ssize_t* n_tabs) nogil:
+    """Scan forward from `p` over TAB-separated fields, without going beyond `line_end`,
+    until the total number of TABs passed (counted in `n_tabs`) is one less than `n`.
+    Returns a pointer to the TAB ending the last field scanned, or `line_end`."""
+    cdef char* tab
+    while True:
+        tab = <char*> memchr(p, TAB, line_end - p)
+        if tab is NULL:
+            return line_end
+        if n_tabs[0] + 1 >= n:
+            return tab
+        n_tabs[0] += 1
+        p = tab + 1
+
+
 cdef class InputStreamBase:
     """Abstract base class defining an input stream over C chars."""
 
@@ -209,10 +297,23 @@ cdef class InputStreamBase:
         # character at the current position in the stream
         char c
 
-    cdef int advance(self) except -1:  # nogil
+    cdef int advance(self) nogil except -1:
         """Read the next character from the stream and store it in the `c` attribute."""
         pass
 
+    cdef Py_ssize_t skip_fields(self, Py_ssize_t n) nogil except -1:
+        """Skip the rest of the current TAB-separated field and up to `n` - 1 further
+        fields, stopping at the TAB, LF or CR ending the last field skipped, or at the end
+        of the stream. Returns the number of TABs passed."""
+        cdef Py_ssize_t n_tabs = 0
+        while True:
+            while self.c != 0 and self.c != LF and self.c != CR and self.c != TAB:
+                self.advance()
+            if self.c != TAB or n_tabs + 1 >= n:
+                return n_tabs
+            n_tabs += 1
+            self.advance()
+
 
 cdef class FileInputStream(InputStreamBase):
 
@@ -225,6 +326,13 @@ cdef class FileInputStream(InputStreamBase):
         char* buffer_end
         char* stream
         bint close
+        # end of the current line within the buffer, found when skipping fields
+        char* line_end
+        # number of bytes of input made available to the parser
+        Py_ssize_t bytes_read
+        # if True, measure time spent reading (and decompressing) input
+        public bint timing
+        readonly double read_time
 
     def __init__(self, fileobj, buffer_size=2**14, close=False):
         self.fileobj = fileobj
@@ -241,21 +349,28 @@ cdef class FileInputStream(InputStreamBase):
         if self.close:
             self.fileobj.close()
 
-    cdef int _bufferup(self) except -1:  # nogil
+    cdef int _bufferup(self) nogil except -1:
         """Read as many bytes as possible from the underlying file object into the
-        buffer."""
+        buffer. This is the only point where the GIL needs to be acquired."""
         cdef Py_ssize_t l
-        # with gil:
-        l = self.fileobj.readinto(self.buffer)
+        cdef double before = 0
+        if self.timing:
+            before = vcf_clock()
+        with gil:
+            l = self.fileobj.readinto(self.buffer)
+        if self.timing:
+            self.read_time += vcf_clock() - before
         if l > 0:
             self.stream = self.buffer_start
             self.buffer_end = self.buffer_start + l
+            self.bytes_read += l
         else:
             self.stream = NULL
 
-    cdef int advance(self) except -1:  # nogil
+    cdef int advance(self) nogil except -1:
         """Read the next character from the stream and store it in the `c` attribute."""
         if self.stream is self.buffer_end:
+            self.line_end = NULL
             self._bufferup()
         if self.stream is NULL:
             # end of file
@@ -264,7 +379,26 @@ cdef class FileInputStream(InputStreamBase):
             self.c = self.stream[0]
             self.stream += 1
 
-    cdef int read_line_into(self, CharVector* dest) except -1:  # nogil
+    cdef Py_ssize_t skip_fields(self, Py_ssize_t n) nogil except -1:
+        """Skip the rest of the current TAB-separated field and up to `n` - 1 further
+        fields, scanning the buffer with memchr rather than advancing one character at a
+        time. Returns the number of TABs passed."""
+        cdef Py_ssize_t n_tabs = 0
+
+        while True:
+            if self.c == 0 or self.c == LF or self.c == CR:
+                return n_tabs
+            if self.c == TAB:
+                if n_tabs + 1 >= n:
+                    return n_tabs
+                n_tabs += 1
+            # find the end of the line once, so TABs can be searched for up to it
+            if self.line_end is NULL or self.line_end < self.stream:
+                self.line_end = find_line_end(self.stream, self.buffer_end)
+            self.stream = scan_fields(self.stream, self.line_end, n, &n_tabs)
+            self.advance()
+
+    cdef int read_line_into(self, CharVector* dest) nogil except -1:
         """Read up to end of line or end of file (whichever comes first) and append
         chars to the `dest` buffer."""
 
@@ -293,18 +427,57 @@ cdef class FileInputStream(InputStreamBase):
                 CharVector_append(dest, self.c)
                 self.advance()
 
-    cdef int read_lines_into(self, CharVector* dest, Py_ssize_t n) except -1:
-        """Read up to `n` lines into the `dest` buffer."""
+    cdef int read_lines_into(self, CharVector* dest, Py_ssize_t n,
+                             Py_ssize_t max_size=0) nogil except -1:
+        """Read up to `n` lines into the `dest` buffer. If `max_size` is positive, stop
+        after the line which takes the size of the `dest` buffer to at least `max_size`
+        characters."""
         cdef Py_ssize_t n_lines_read = 0
 
-        # with nogil:
-
         while n_lines_read < n and self.c != 0:
             self.read_line_into(dest)
             n_lines_read += 1
+            if 0 < max_size <= dest.size:
+                break
 
         return n_lines_read
 
+    cdef Py_ssize_t skip_lines_nogil(self, Py_ssize_t n) nogil except -1:
+        cdef Py_ssize_t n_lines_skipped = 0
+        cdef char* p
+
+        while n_lines_skipped < n and self.c != 0:
+
+            if self.c == LF:
+                n_lines_skipped += 1
+                self.advance()
+
+            else:
+                # scan the rest of the buffer for the end of the line
+                p = <char*> memchr(self.stream, LF, self.buffer_end - self.stream)
+                if p is NULL:
+                    self.stream = self.buffer_end
+                else:
+                    self.stream = p
+                self.advance()
+
+        return n_lines_skipped
+
+    @property
+    def bytes_consumed(self):
+        """Number of bytes of input consumed so far."""
+        if self.stream is NULL:
+            return self.bytes_read
+        return self.bytes_read - (self.buffer_end - self.stream)
+
+    def skip_lines(self, Py_ssize_t n):
+        """Skip up to `n` lines terminated by LF, without parsing them. Returns the
+        number of lines skipped."""
+        cdef Py_ssize_t n_lines_skipped
+        with nogil:
+            n_lines_skipped = self.skip_lines_nogil(n)
+        return n_lines_skipped
+
     def readline(self):
         """Read characters up to end of line or end of file and return as Python bytes
         object."""
@@ -315,36 +488,245 @@ cdef class FileInputStream(InputStreamBase):
         CharVector_free(&line)
         return ret
 
+    cdef Py_ssize_t read_into(self, CharVector* dest, Py_ssize_t n) nogil except -1:
+        """Read up to `n` bytes, starting with the current character, and append to the
+        `dest` buffer, or discard them if `dest` is NULL. For binary data, where a null
+        byte does not mark the end of the stream. Returns the number of bytes read, which
+        is less than `n` only at the end of the stream."""
+        cdef Py_ssize_t n_read, k
+
+        if n <= 0 or self.stream is NULL:
+            return 0
+
+        # current character
+        if dest is not NULL:
+            CharVector_append(dest, self.c)
+        n_read = 1
+
+        while n_read < n:
+            if self.stream is self.buffer_end:
+                self._bufferup()
+                if self.stream is NULL:
+                    self.c = 0
+                    return n_read
+            k = min(n - n_read, self.buffer_end - self.stream)
+            if dest is not NULL:
+                CharVector_reserve(dest, dest.size + k)
+                memcpy(dest.data + dest.size, self.stream, k)
+                dest.size += k
+            self.stream += k
+            n_read += k
+
+        self.advance()
+        return n_read
+
+    def read(self, Py_ssize_t n):
+        """Read up to `n` bytes and return as Python bytes object."""
+        cdef CharVector data
+        CharVector_init(&data, max(1, n))
+        self.read_into(&data, n)
+        ret = CharVector_to_pybytes(&data)
+        CharVector_free(&data)
+        return ret
+
+
+cdef class BlockInputStream(FileInputStream):
+    """Input stream over an iterable of bytes objects, e.g., blocks of data decompressed
+    from a BGZF file. Each block is used directly as the input buffer, avoiding any
+    copying."""
+
+    cdef:
+        object blocks
+        bytes block
+
+    def __init__(self, blocks, close=False):
+        self.blocks = iter(blocks)
+        self.fileobj = self.blocks
+        self.block = None
+        self.close = close
+        self._bufferup()
+        self.advance()
+
+    cdef int _bufferup(self) nogil except -1:
+        """Move on to the next non-empty block of data."""
+        cdef Py_ssize_t l = 0
+        cdef double before = 0
+        if self.timing:
+            before = vcf_clock()
+        with gil:
+            for block in self.blocks:
+                l = len(block)
+                if l > 0:
+                    self.block = block
+                    self.buffer_start = PyBytes_AS_STRING(self.block)
+                    break
+        if self.timing:
+            self.read_time += vcf_clock() - before
+        if l > 0:
+            self.stream = self.buffer_start
+            self.buffer_end = self.buffer_start + l
+            self.bytes_read += l
+        else:
+            self.stream = NULL
+
+
+cdef class MemoryMappedInputStream(FileInputStream):
+    """Input stream over a memory-mapped file, where the parser reads directly from the
+    mapped memory, without copying or calling back into Python.
+
+    If `start` and/or `stop` are given, the stream covers the header lines at the start
+    of the file, followed by all lines that begin within the byte range [`start`,
+    `stop`). I.e., a file can be split into line-aligned ranges that are parsed
+    independently.
+
+    """
+
+    cdef:
+        object map
+        const unsigned char[::1] view
+        char* data
+        char* header_end
+        char* range_start
+        char* range_stop
+
+    def __init__(self, fileobj, start=0, stop=None, close=False):
+        cdef Py_ssize_t size, range_start, range_stop
+        self.fileobj = fileobj
+        self.close = close
+        # N.B., raises ValueError for an empty file
+        self.map = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = self.map
+        size = self.view.shape[0]
+        self.data = <char*> &self.view[0]
+        range_start = min(max(start, 0), size)
+        range_stop = size if stop is None else min(max(stop, 0), size)
+        self.header_end = self._find_header_end()
+        self.range_start = self._align(self.data + range_start)
+        self.range_stop = self._align(self.data + range_stop)
+        if self.range_start < self.header_end:
+            self.range_start = self.header_end
+        if self.range_stop < self.range_start:
+            self.range_stop = self.range_start
+
+        # start with the header
+        self.buffer_start = self.data
+        self.stream = self.data
+        self.buffer_end = self.header_end
+        if self.range_start is self.header_end:
+            # contiguous with header, no need to jump
+            self.buffer_end = self.range_stop
+        self.bytes_read = self.buffer_end - self.buffer_start
+        self.advance()
+
+    cdef char* _eol(self, char* p) nogil:
+        """Return a pointer to the start of the line following `p`."""
+        cdef char* end = self.data + self.view.shape[0]
+        cdef char* q
+        if p >= end:
+            return end
+        q = <char*> memchr(p, LF, end - p)
+        if q is NULL:
+            return end
+        return q + 1
+
+    cdef char* _align(self, char* p) nogil:
+        """Move `p` forward to the start of a line, unless it already is."""
+        if p is self.data or (p - 1)[0] == LF:
+            return p
+        return self._eol(p)
+
+    cdef char* _find_header_end(self) nogil:
+        cdef char* end = self.data + self.view.shape[0]
+        cdef char* p = self.data
+        while p < end and p[0] == HASH:
+            p = self._eol(p)
+        return p
+
+    cdef int _bufferup(self) nogil except -1:
+        if self.buffer_end is self.header_end and self.range_start < self.range_stop:
+            # jump from the header to the requested range
+            self.buffer_start = self.range_start
+            self.stream = self.range_start
+            self.buffer_end = self.range_stop
+            self.bytes_read += self.range_stop - self.range_start
+        else:
+            self.stream = NULL
+
+    def count_lines(self):
+        """Count the number of (non-header) lines in the requested range, without
+        consuming the stream."""
+        cdef Py_ssize_t n = 0
+        cdef char* p = self.range_start
+        with nogil:
+            while p < self.range_stop:
+                p = self._eol(p)
+                n += 1
+        return n
+
+    @property
+    def span(self):
+        """Line-aligned byte range [start, stop) covered by this stream."""
+        return self.range_start - self.data, self.range_stop - self.data
+
 
 cdef class CharVectorInputStream(InputStreamBase):
 
     cdef:
         CharVector vector
         Py_ssize_t stream_index
+        # index of the end of the current line, found when skipping fields
+        Py_ssize_t line_end_index
 
     def __cinit__(self, Py_ssize_t capacity):
         CharVector_init(&self.vector, capacity)
         self.stream_index = 0
+        self.line_end_index = -1
 
     def __dealloc__(self):
         CharVector_free(&self.vector)
 
-    cdef int advance(self) except -1:  # nogil
+    cdef int advance(self) nogil except -1:
         if self.stream_index < self.vector.size:
             self.c = self.vector.data[self.stream_index]
             self.stream_index += 1
         else:
             self.c = 0
 
-    cdef void clear(self) :  # nogil
+    cdef Py_ssize_t skip_fields(self, Py_ssize_t n) nogil except -1:
+        """Skip the rest of the current TAB-separated field and up to `n` - 1 further
+        fields, scanning with memchr. Returns the number of TABs passed."""
+        cdef:
+            Py_ssize_t n_tabs = 0
+            char* data = self.vector.data
+
+        if self.c == 0 or self.c == LF or self.c == CR:
+            return 0
+        if self.c == TAB:
+            if n <= 1:
+                return 0
+            n_tabs += 1
+        if self.line_end_index < self.stream_index:
+            self.line_end_index = find_line_end(data + self.stream_index,
+                                                data + self.vector.size) - data
+        self.stream_index = scan_fields(data + self.stream_index,
+                                        data + self.line_end_index, n, &n_tabs) - data
+        self.advance()
+        return n_tabs
+
+    cdef void clear(self) nogil:
         CharVector_clear(&self.vector)
         self.stream_index = 0
+        self.line_end_index = -1
 
 
 ##########################################################################################
 # VCF Parsing.
 
 
+# maximum number of distinct FORMAT layouts to cache
+DEF FORMAT_CACHE_CAPACITY = 16
+
+
 cdef enum VCFState:
     CHROM = 0,
     POS = 1,
@@ -360,6 +742,38 @@ cdef enum VCFState:
     EOF = 11
 
 
+# slot for timing the evaluation of a filter expression, following the parser states
+DEF TIMING_FILTER = 12
+
+# number of timing slots preceding those for INFO and FORMAT fields
+DEF N_STATE_TIMINGS = 13
+
+# FORMAT fields are parsed for each sample, so timing every value would distort the
+# times, instead time one in every so many variants and scale up
+DEF CALLDATA_TIMING_INTERVAL = 32
+
+
+cdef double clock_overhead():
+    """Estimate the time taken to read the clock, which is included in each time
+    measured."""
+    cdef double before, after, overhead = 1
+    cdef int i
+    for i in range(1000):
+        before = vcf_clock()
+        after = vcf_clock()
+        overhead = min(overhead, after - before)
+    return overhead
+
+
+# N.B., subtracted from times measured for values of FORMAT fields, which take little
+# more time to parse than it takes to read the clock
+cdef double CLOCK_OVERHEAD = clock_overhead()
+
+# names of timing slots for the parser states, None for states not timed separately
+STATE_TIMING_NAMES = ('CHROM', None, 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO', 'FORMAT',
+                      'calldata', None, None, 'filter_expression')
+
+
 cdef class VCFContext:
 
     cdef:
@@ -371,12 +785,19 @@ cdef class VCFContext:
         # dynamic attributes - reflect current state during parsing
         int state  # overall parser state
         Py_ssize_t variant_index  # index of current variant
+        Py_ssize_t filtered_variant_index  # index of last variant the filter was applied to
         Py_ssize_t chunk_variant_index  # index of current variant within current chunk
         Py_ssize_t sample_index  # index of current sample within call data
         Py_ssize_t sample_output_index  # index of current sample within output calldata arrays
         Py_ssize_t sample_field_index  # index of field within call data for current sample
         IntVector variant_format_indices  # indices of formats for the current variant
 
+        # cache of FORMAT layouts seen so far, most files only have a few
+        CharVector format_raw  # raw FORMAT field for the current variant
+        VCFFormatCacheEntry* format_cache
+        Py_ssize_t format_cache_size  # number of entries in use
+        Py_ssize_t format_cache_last  # entry used for the previous variant
+
         # buffers
         CharVector temp  # used for numeric values
         CharVector info_key  # used for info key
@@ -386,9 +807,20 @@ cdef class VCFContext:
         CharVector chrom
         long pos
 
+        # chrom and pos of the last variant stored, and its index within the chunk
+        CharVector variant_chrom
+        long variant_pos
+        Py_ssize_t variant_row
+
         # track size of reference allele (needed for altlen)
         Py_ssize_t ref_len
 
+        # cumulative time spent in each parser state and INFO and FORMAT field parser,
+        # only if timing is enabled
+        bint timing
+        double* timings
+        Py_ssize_t n_timings
+
     def __cinit__(self, headers, fields):
         self.headers = headers
         self.fields = list(fields)
@@ -401,11 +833,17 @@ cdef class VCFContext:
         # initialise dynamic state
         self.state = VCFState.CHROM
         self.variant_index = -1
+        self.filtered_variant_index = -1
         self.chunk_variant_index = -1
         self.sample_index = 0
         self.sample_output_index = -1
         self.sample_field_index = 0
         IntVector_init(&self.variant_format_indices, 2**6)
+        CharVector_init(&self.format_raw, 2**6)
+        self.format_cache = <VCFFormatCacheEntry*> malloc(
+            sizeof(VCFFormatCacheEntry) * FORMAT_CACHE_CAPACITY)
+        self.format_cache_size = 0
+        self.format_cache_last = 0
 
         # initialise temporary buffers
         CharVector_init(&self.temp, 2**6)
@@ -416,13 +854,39 @@ cdef class VCFContext:
         CharVector_init(&self.chrom, 2**6)
         self.pos = -1
         self.ref_len = 0
+        CharVector_init(&self.variant_chrom, 2**6)
+        self.variant_pos = 0
+        self.variant_row = -1
+
+        self.timing = False
+        self.timings = NULL
+        self.n_timings = 0
+
+    cdef int init_timing(self, Py_ssize_t n_timings) except -1:
+        """Enable timing, with `n_timings` slots to accumulate times into."""
+        self.timings = <double*> calloc(n_timings, sizeof(double))
+        self.n_timings = n_timings
+        self.timing = True
+
+    cdef int add_timings(self, np.float64_t[:] out) except -1:
+        cdef Py_ssize_t i
+        for i in range(self.n_timings):
+            out[i] += self.timings[i]
 
     def __dealloc__(self):
         IntVector_free(&self.variant_format_indices)
+        CharVector_free(&self.format_raw)
+        for i in range(self.format_cache_size):
+            CharVector_free(&self.format_cache[i].key)
+            IntVector_free(&self.format_cache[i].indices)
+        free(self.format_cache)
         CharVector_free(&self.temp)
         CharVector_free(&self.info_key)
         CharVector_free(&self.info_val)
         CharVector_free(&self.chrom)
+        CharVector_free(&self.variant_chrom)
+        if self.timings is not NULL:
+            free(self.timings)
 
 
 def check_samples(loc_samples, headers):
@@ -452,7 +916,10 @@ cdef class VCFChunkIterator:
                  numbers,
                  fills,
                  region,
-                 loc_samples):
+                 loc_samples,
+                 variant_filter=None,
+                 allele_counts=None,
+                 timing=False):
 
         # store reference to input stream
         self.stream = stream
@@ -465,11 +932,23 @@ cdef class VCFChunkIterator:
         loc_samples = check_samples(loc_samples, headers)
         self.parser = VCFParser(fields=fields, types=types, numbers=numbers,
                                 chunk_length=chunk_length, loc_samples=loc_samples,
-                                fills=fills, region=region)
+                                fills=fills, region=region, variant_filter=variant_filter,
+                                allele_counts=allele_counts)
+
+        # setup timing
+        if timing:
+            self.context.init_timing(self.parser.n_timings)
 
     def __iter__(self):
         return self
 
+    def timings(self):
+        """Return a dict mapping parser states and fields to the cumulative time in
+        seconds spent parsing them, if timing is enabled."""
+        out = np.zeros(self.parser.n_timings, dtype='f8')
+        self.context.add_timings(out)
+        return self.parser.timings_to_dict(out)
+
     def __next__(self):
 
         if self.context.state == VCFState.EOF:
@@ -477,12 +956,14 @@ cdef class VCFChunkIterator:
 
         # reset indices
         self.context.chunk_variant_index = -1
+        self.context.variant_row = -1
 
         # allocate arrays for next chunk
         self.parser.malloc_chunk()
 
-        # parse next chunk
-        self.parser.parse(self.stream, self.context)
+        # parse next chunk, releasing the GIL
+        with nogil:
+            self.parser.parse(self.stream, self.context)
 
         # get the chunk
         chunk_length = self.context.chunk_variant_index + 1
@@ -496,6 +977,106 @@ cdef class VCFChunkIterator:
         return chunk, chunk_length, chrom, pos
 
 
+def normalize_regions(region):
+    """Parse one or more region strings into a list of (chrom, begin, end) tuples, sorted
+    by chromosome and start position, with overlapping or adjacent regions on the same
+    chromosome merged. Positions are 1-based and inclusive, where a begin or end of 0
+    means the region is unbounded on that side."""
+    if isinstance(region, (str, text_type)):
+        region = [region]
+    if len(region) == 0:
+        raise ValueError('no regions given')
+    intervals = list()
+    for r in region:
+        tokens = r.split(':')
+        begin = end = 0
+        if len(tokens) > 1:
+            range_tokens = tokens[1].split('-')
+            if len(range_tokens) != 2:
+                raise ValueError('bad region string: %r' % r)
+            begin = int(range_tokens[0])
+            end = int(range_tokens[1])
+        intervals.append((tokens[0], begin, end))
+    intervals.sort()
+    merged = list()
+    last = None
+    for chrom, begin, end in intervals:
+        if last is not None and last[0] == chrom:
+            if last[2] == 0 or begin <= last[2] + 1:
+                if last[2] != 0 and (end == 0 or end > last[2]):
+                    last[2] = end
+                continue
+        last = [chrom, begin, end]
+        merged.append(last)
+    return [tuple(interval) for interval in merged]
+
+
+cdef class VCFRegions:
+    """Set of genome regions, against which variants are matched by binary search over
+    the sorted and merged intervals."""
+
+    cdef:
+        readonly list intervals
+        tuple chroms
+        char** chroms_cstr
+        Py_ssize_t* begins
+        Py_ssize_t* ends
+        Py_ssize_t n_intervals
+
+    def __cinit__(self, *args, **kwargs):
+        self.chroms_cstr = NULL
+        self.begins = NULL
+        self.ends = NULL
+
+    def __init__(self, region):
+        cdef Py_ssize_t i
+        self.intervals = normalize_regions(region)
+        self.n_intervals = len(self.intervals)
+        # N.B., need to keep a reference to the encoded chromosome names
+        if PY2:
+            self.chroms = tuple(chrom for chrom, _, _ in self.intervals)
+        else:
+            self.chroms = tuple(chrom.encode('utf8') for chrom, _, _ in self.intervals)
+        n = max(1, self.n_intervals)
+        self.chroms_cstr = <char**> malloc(sizeof(char*) * n)
+        self.begins = <Py_ssize_t*> malloc(sizeof(Py_ssize_t) * n)
+        self.ends = <Py_ssize_t*> malloc(sizeof(Py_ssize_t) * n)
+        for i in range(self.n_intervals):
+            self.chroms_cstr[i] = <char*> self.chroms[i]
+            self.begins[i] = self.intervals[i][1]
+            self.ends[i] = self.intervals[i][2]
+
+    def __dealloc__(self):
+        free(self.chroms_cstr)
+        free(self.begins)
+        free(self.ends)
+
+    cdef bint contains(self, char* chrom, Py_ssize_t pos) nogil:
+        cdef:
+            Py_ssize_t lo = 0, hi = self.n_intervals, mid, cmp
+
+        # find the last interval starting at or before the given position
+        while lo < hi:
+            mid = (lo + hi) // 2
+            cmp = strcmp(self.chroms_cstr[mid], chrom)
+            if cmp < 0 or (cmp == 0 and self.begins[mid] <= pos):
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return False
+        lo -= 1
+        if strcmp(self.chroms_cstr[lo], chrom) != 0:
+            return False
+        return self.ends[lo] == 0 or pos <= self.ends[lo]
+
+    def __contains__(self, item):
+        chrom, pos = item
+        if not PY2:
+            chrom = chrom.encode('utf8')
+        return self.contains(chrom, pos)
+
+
 cdef class VCFParser:
 
     cdef:
@@ -510,13 +1091,26 @@ cdef class VCFParser:
         VCFFieldParserBase info_parser
         VCFFieldParserBase format_parser
         VCFFieldParserBase calldata_parser
-        bytes region_chrom
-        Py_ssize_t region_begin
-        Py_ssize_t region_end
-
-    def __init__(self, fields, types, numbers, chunk_length, loc_samples, fills, region):
+        VCFRegions regions
+        VCFVariantFilter variant_filter
+        VCFAlleleCounter allele_counter
+        list offsets_stores
+        Py_ssize_t n_offsets_stores
+        # names of fields with timing slots following those of the parser states
+        list timing_fields
+        Py_ssize_t n_timings
+
+    def __init__(self, fields, types, numbers, chunk_length, loc_samples, fills, region,
+                 variant_filter=None, allele_counts=None):
         self.chunk_length = chunk_length
         self.loc_samples = loc_samples
+        self.offsets_stores = list()
+        self.timing_fields = list()
+
+        # handle variant filter, given as a tuple of (program, fields)
+        self.variant_filter = None
+        if variant_filter is not None:
+            self.variant_filter = VCFVariantFilter(*variant_filter)
 
         # handle region
         self._init_region(region)
@@ -528,37 +1122,28 @@ cdef class VCFParser:
         self._init_alt(fields, types, numbers)
         self._init_qual(fields, types, fills)
         self._init_filter(fields)
+        self._init_allele_counts(fields, allele_counts)
         self._init_info(fields, types, numbers, fills)
         self._init_format_calldata(fields, types, numbers, fills)
 
         if fields:
             # shouldn't ever be any left over
             raise RuntimeError('unexpected fields left over: %r' % set(fields))
+        self.n_offsets_stores = len(self.offsets_stores)
+        self.n_timings = N_STATE_TIMINGS + len(self.timing_fields)
+
+        if self.variant_filter is not None:
+            self.variant_filter.bind(self.make_chunk(self.chunk_length))
 
     def _init_region(self, region):
-        self.region_chrom = b''
-        self.region_begin = 0
-        self.region_end = 0
+        self.regions = None
         if region is not None:
-            tokens = region.split(':')
-            if len(tokens) == 0:
-                raise ValueError('bad region string: %r' % region)
-            if PY2:
-                self.region_chrom = tokens[0]
-            else:
-                self.region_chrom = tokens[0].encode('utf8')
-            if len(tokens) > 1:
-                range_tokens = tokens[1].split('-')
-                if len(range_tokens) != 2:
-                    raise ValueError('bad region string: %r' % region)
-                self.region_begin = int(range_tokens[0])
-                self.region_end = int(range_tokens[1])
+            self.regions = VCFRegions(region)
 
     def _init_chrom_pos(self, fields, types):
         """Setup CHROM and POS parser."""
-        kwds = dict(dtype=None, chunk_length=self.chunk_length,
-                    region_chrom=self.region_chrom, region_begin=self.region_begin,
-                    region_end=self.region_end, store_chrom=False, store_pos=False)
+        kwds = dict(dtype=None, chunk_length=self.chunk_length, regions=self.regions,
+                    store_chrom=False, store_pos=False)
 
         if CHROM_FIELD in fields:
             kwds['dtype'] = types[CHROM_FIELD]
@@ -581,8 +1166,10 @@ cdef class VCFParser:
         """Setup ID parser."""
         if ID_FIELD in fields:
             t = types[ID_FIELD]
-            t = check_string_dtype(t)
-            if t.kind == 'S':
+            if t == OFFSETS_TYPE:
+                id_parser = VCFIDObjectParser(chunk_length=self.chunk_length,
+                                              offsets=self._new_offsets_store(1))
+            elif check_string_dtype(t).kind == 'S':
                 id_parser = VCFIDStringParser(dtype=t, chunk_length=self.chunk_length)
             else:
                 id_parser = VCFIDObjectParser(chunk_length=self.chunk_length)
@@ -592,6 +1179,14 @@ cdef class VCFParser:
         id_parser.malloc_chunk()
         self.id_parser = id_parser
 
+    def _new_offsets_store(self, number):
+        """Setup storage for a field with variable length strings stored as offsets.
+        Values stored for variants rejected by the variant filter are discarded via the
+        parser, as they cannot be reset in place."""
+        offsets = VCFOffsetsStore(number=number, chunk_length=self.chunk_length)
+        self.offsets_stores.append(offsets)
+        return offsets
+
     def _init_ref(self, fields, types):
         # setup REF parser
         t = types.get(REF_FIELD, None)
@@ -599,8 +1194,12 @@ cdef class VCFParser:
         if REF_FIELD in fields:
             store = True
             fields.remove(REF_FIELD)
-            t = check_string_dtype(t)
-        if t is not None and t.kind == 'S':
+            if t != OFFSETS_TYPE:
+                t = check_string_dtype(t)
+        if store and t == OFFSETS_TYPE:
+            ref_parser = VCFRefObjectParser(chunk_length=self.chunk_length, store=store,
+                                            offsets=self._new_offsets_store(1))
+        elif t is not None and t != OFFSETS_TYPE and t.kind == 'S':
             ref_parser = VCFRefStringParser(dtype=t, chunk_length=self.chunk_length, store=store)
         else:
             ref_parser = VCFRefObjectParser(chunk_length=self.chunk_length, store=store)
@@ -630,9 +1229,15 @@ cdef class VCFParser:
             fields.remove(IS_SNP_FIELD)
 
         if store_alt or store_numalt or store_altlen or store_is_snp:
-            if store_alt:
+            if store_alt and t != OFFSETS_TYPE:
                 t = check_string_dtype(t)
-            if t is not None and t.kind == 'S':
+            if store_alt and t == OFFSETS_TYPE:
+                alt_parser = VCFAltObjectParser(number=n, chunk_length=self.chunk_length,
+                                                store_alt=store_alt, store_numalt=store_numalt,
+                                                store_altlen=store_altlen,
+                                                store_is_snp=store_is_snp,
+                                                offsets=self._new_offsets_store(n))
+            elif t is not None and t != OFFSETS_TYPE and t.kind == 'S':
                 alt_parser = VCFAltStringParser(dtype=t, number=n, chunk_length=self.chunk_length,
                                                 store_alt=store_alt, store_numalt=store_numalt,
                                                 store_altlen=store_altlen, store_is_snp=store_is_snp)
@@ -678,6 +1283,18 @@ cdef class VCFParser:
         filter_parser.malloc_chunk()
         self.filter_parser = filter_parser
 
+    def _init_allele_counts(self, fields, allele_counts):
+        """Setup allele counts computed from genotype calls, given as a tuple of
+        (number of alleles, subpops)."""
+        self.allele_counter = None
+        if allele_counts is not None:
+            n_alleles, subpops = allele_counts
+            self.allele_counter = VCFAlleleCounter(
+                fields, n_alleles=n_alleles, subpops=subpops, chunk_length=self.chunk_length,
+                n_samples_out=np.count_nonzero(self.loc_samples)
+            )
+            self.allele_counter.malloc_chunk()
+
     def _init_info(self, fields, types, numbers, fills):
         # setup INFO parser
         info_keys = list()
@@ -703,7 +1320,12 @@ cdef class VCFParser:
                                         types=info_types,
                                         numbers=info_numbers,
                                         chunk_length=self.chunk_length,
-                                        fills=info_fills)
+                                        fills=info_fills,
+                                        offsets_stores=self.offsets_stores)
+            (<VCFInfoParser> info_parser).timing_offset = \
+                N_STATE_TIMINGS + len(self.timing_fields)
+            self.timing_fields.extend('variants/' + text_type(k, 'utf8')
+                                      for k in (<VCFInfoParser> info_parser).info_keys)
         else:
             info_parser = VCFSkipFieldParser(key=b'INFO')
         info_parser.malloc_chunk()
@@ -735,7 +1357,12 @@ cdef class VCFParser:
                                                 numbers=format_numbers,
                                                 chunk_length=self.chunk_length,
                                                 loc_samples=self.loc_samples,
-                                                fills=format_fills)
+                                                fills=format_fills,
+                                                counter=self.allele_counter)
+            (<VCFCallDataParser> calldata_parser).timing_offset = \
+                N_STATE_TIMINGS + len(self.timing_fields)
+            self.timing_fields.extend('calldata/' + text_type(k, 'utf8')
+                                      for k in (<VCFCallDataParser> calldata_parser).format_keys)
         else:
             format_parser = VCFSkipFieldParser(key=b'FORMAT')
             calldata_parser = VCFSkipAllCallDataParser()
@@ -744,18 +1371,37 @@ cdef class VCFParser:
         self.format_parser = format_parser
         self.calldata_parser = calldata_parser
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:
-        """Parse to end of current chunk or EOF."""
+    def timings_to_dict(self, timings):
+        """Map parser states and fields to times accumulated in each timing slot."""
+        names = list(STATE_TIMING_NAMES) + self.timing_fields
+        return {name: t for name, t in zip(names, timings) if name is not None}
 
-        # with nogil:
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
+        """Parse to end of current chunk or EOF."""
+        cdef:
+            Py_ssize_t timing_slot = 0
+            double before = 0, after
 
         while True:
 
+            if context.timing:
+                timing_slot = context.state
+                before = vcf_clock()
+
             if context.state == VCFState.EOF:
+                if context.filtered_variant_index != context.variant_index:
+                    self.apply_filter(stream, context)
+                if context.chunk_variant_index > context.variant_row:
+                    vcf_store_variant_chrom_pos(context)
                 break
 
             elif context.state == VCFState.EOL:
 
+                if context.filtered_variant_index != context.variant_index:
+                    self.apply_filter(stream, context)
+                if context.chunk_variant_index > context.variant_row:
+                    vcf_store_variant_chrom_pos(context)
+
                 # handle line terminators
                 if stream.c == LF:
                     stream.advance()
@@ -765,7 +1411,6 @@ cdef class VCFParser:
                         stream.advance()
                 else:
                     # shouldn't ever happen
-                    # with gil:
                     warn('unexpected EOL character', context)
                     break
 
@@ -797,6 +1442,13 @@ cdef class VCFParser:
 
             elif context.state == VCFState.INFO:
                 self.info_parser.parse(stream, context)
+                if self.variant_filter is not None:
+                    if context.timing:
+                        after = vcf_clock()
+                        context.timings[timing_slot] += after - before
+                        timing_slot = TIMING_FILTER
+                        before = after
+                    self.apply_filter(stream, context)
 
             elif context.state == VCFState.FORMAT:
                 self.format_parser.parse(stream, context)
@@ -806,10 +1458,35 @@ cdef class VCFParser:
 
             else:
                 # shouldn't ever happen
-                # with gil:
                 warn('unexpected parser state', context)
                 break
 
+            if context.timing:
+                context.timings[timing_slot] += vcf_clock() - before
+
+    cdef int apply_filter(self, InputStreamBase stream, VCFContext context) nogil except -1:
+        """Apply the variant filter to the current variant, once all variants fields
+        have been parsed. If the variant is rejected, its values are reset and the rest
+        of the line is skipped, so calldata are never parsed."""
+        context.filtered_variant_index = context.variant_index
+        if self.variant_filter is None:
+            return 0
+        if self.variant_filter.evaluate(context.chunk_variant_index):
+            return 0
+        # rejected, free the row for the next variant
+        self.variant_filter.reset(context.chunk_variant_index)
+        if self.n_offsets_stores > 0:
+            with gil:
+                self.discard_offsets(context.chunk_variant_index)
+        context.chunk_variant_index -= 1
+        if context.state != VCFState.EOL and context.state != VCFState.EOF:
+            vcf_skip_variant(stream, context)
+
+    cdef int discard_offsets(self, Py_ssize_t row) except -1:
+        cdef VCFOffsetsStore offsets
+        for offsets in self.offsets_stores:
+            offsets.discard(row)
+
     cdef int malloc_chunk(self) except -1:
         self.chrom_pos_parser.malloc_chunk()
         self.id_parser.malloc_chunk()
@@ -820,6 +1497,10 @@ cdef class VCFParser:
         self.info_parser.malloc_chunk()
         self.format_parser.malloc_chunk()
         self.calldata_parser.malloc_chunk()
+        if self.allele_counter is not None:
+            self.allele_counter.malloc_chunk()
+        if self.variant_filter is not None:
+            self.variant_filter.bind(self.make_chunk(self.chunk_length))
 
     cdef object make_chunk(self, chunk_length):
         if chunk_length > 0:
@@ -836,6 +1517,8 @@ cdef class VCFParser:
             self.filter_parser.make_chunk(chunk, limit=limit)
             self.info_parser.make_chunk(chunk, limit=limit)
             self.calldata_parser.make_chunk(chunk, limit=limit)
+            if self.allele_counter is not None:
+                self.allele_counter.make_chunk(chunk, limit=limit)
             return chunk
 
         else:
@@ -866,7 +1549,7 @@ cdef class VCFFieldParserBase:
         self.fill = fill
         self.chunk_length = chunk_length
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         pass
 
     cdef int malloc_chunk(self) except -1:
@@ -886,7 +1569,7 @@ cdef class VCFSkipFieldParser(VCFFieldParserBase):
     def __init__(self, key):
         super(VCFSkipFieldParser, self).__init__(key=key)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
 
         while True:
 
@@ -922,7 +1605,7 @@ def check_string_dtype(dtype):
 
 cdef int vcf_read_field(InputStreamBase stream,
                         VCFContext context,
-                        CharVector* dest) except -1:  # nogil
+                        CharVector* dest) nogil except -1:
 
     # setup temp vector to store value
     CharVector_clear(dest)
@@ -950,7 +1633,7 @@ cdef int vcf_read_field(InputStreamBase stream,
 
 
 cdef int vcf_parse_missing(InputStreamBase stream,
-                           VCFContext context) except -1:  # nogil
+                           VCFContext context) nogil except -1:
 
     while True:
 
@@ -972,7 +1655,16 @@ cdef int vcf_parse_missing(InputStreamBase stream,
         stream.advance()
 
 
-cdef int vcf_skip_variant(InputStreamBase stream, VCFContext context) except -1:  # nogil
+cdef inline void vcf_store_variant_chrom_pos(VCFContext context) nogil:
+    # the current variant was stored, N.B., chrom is null-terminated
+    CharVector_copy(&context.variant_chrom, &context.chrom)
+    if context.variant_chrom.size > 0:
+        context.variant_chrom.size -= 1
+    context.variant_pos = context.pos
+    context.variant_row = context.chunk_variant_index
+
+
+cdef int vcf_skip_variant(InputStreamBase stream, VCFContext context) nogil except -1:
     # skip to EOL or EOF
     while True:
         if stream.c == 0:
@@ -991,32 +1683,24 @@ cdef class VCFChromPosParser(VCFFieldParserBase):
         np.uint8_t[:] chrom_memory
         np.int32_t[:] pos_memory
         bint store_chrom
+        bint store_chrom_string
         bint store_pos
-        char* region_chrom
-        Py_ssize_t region_begin
-        Py_ssize_t region_end
+        VCFRegions regions
         np.ndarray chrom_values
         np.ndarray pos_values
 
-    def __init__(self, dtype, store_chrom, store_pos, chunk_length, region_chrom,
-                 region_begin, region_end):
+    def __init__(self, dtype, store_chrom, store_pos, chunk_length, regions):
         if store_chrom:
             dtype = check_string_dtype(dtype)
         super(VCFChromPosParser, self).__init__(key=b'CHROM', dtype=dtype, number=1, chunk_length=chunk_length)
         self.store_chrom = store_chrom
+        self.store_chrom_string = store_chrom and self.dtype.kind == 'S'
         self.store_pos = store_pos
-        if region_chrom:
-            self.region_chrom = <char*> region_chrom
-            self.region_begin = region_begin
-            self.region_end = region_end
-        else:
-            self.region_chrom = NULL
-            self.region_begin = 0
-            self.region_end = 0
+        self.regions = regions
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         cdef:
-            Py_ssize_t i, n, cmp
+            Py_ssize_t i, n
             # index into memory view
             Py_ssize_t memory_offset
 
@@ -1033,7 +1717,6 @@ cdef class VCFChromPosParser(VCFFieldParserBase):
         # read chrom
         vcf_read_field(stream, context, &context.chrom)
         if context.chrom.size == 0:
-            # with gil:
             warn('empty CHROM', context)
         CharVector_terminate(&context.chrom)
 
@@ -1043,7 +1726,6 @@ cdef class VCFChromPosParser(VCFFieldParserBase):
             # read pos
             vcf_read_field(stream, context, &context.temp)
             if context.temp.size == 0:
-                # with gil:
                 warn('empty POS', context)
             else:
                 vcf_strtol(&context.temp, context, &context.pos)
@@ -1052,24 +1734,8 @@ cdef class VCFChromPosParser(VCFFieldParserBase):
             context.state += 1
 
         # handle region
-        if self.region_chrom is not NULL:
-
-            # compare with region chrom
-            cmp = strcmp(context.chrom.data, self.region_chrom)
-
-            if cmp < 0:
-                vcf_skip_variant(stream, context)
-                return 0
-
-            if cmp > 0:
-                vcf_skip_variant(stream, context)
-                return 0
-
-            if self.region_begin > 0 and context.pos < self.region_begin:
-                vcf_skip_variant(stream, context)
-                return 0
-
-            if 0 < self.region_end < context.pos:
+        if self.regions is not None:
+            if not self.regions.contains(context.chrom.data, context.pos):
                 vcf_skip_variant(stream, context)
                 return 0
 
@@ -1083,7 +1749,7 @@ cdef class VCFChromPosParser(VCFFieldParserBase):
         # store in chunk
         if self.store_chrom:
 
-            if self.dtype.kind == 'S':
+            if self.store_chrom_string:
 
                 # initialise memory index
                 memory_offset = context.chunk_variant_index * self.itemsize
@@ -1096,14 +1762,17 @@ cdef class VCFChromPosParser(VCFFieldParserBase):
                     self.chrom_memory[memory_offset + i] = context.chrom.data[i]
 
             else:
-                # with gil:
-                # N.B., don't include terminating null byte
-                v = CharVector_to_pystr_sized(&context.chrom, context.chrom.size - 1)
-                self.chrom_values[context.chunk_variant_index] = v
+                self.store_chrom_object(context)
 
         if self.store_pos:
             self.pos_memory[context.chunk_variant_index] = context.pos
 
+    cdef int store_chrom_object(self, VCFContext context) nogil except -1:
+        with gil:
+            # N.B., don't include terminating null byte
+            v = CharVector_to_pystr_sized(&context.chrom, context.chrom.size - 1)
+            self.chrom_values[context.chunk_variant_index] = v
+
     cdef int malloc_chunk(self) except -1:
         if self.store_chrom:
             self.chrom_values = np.zeros(self.chunk_length, dtype=self.dtype)
@@ -1122,6 +1791,86 @@ cdef class VCFChromPosParser(VCFFieldParserBase):
             chunk[POS_FIELD] = self.pos_values[:limit]
 
 
+cdef class VCFOffsetsStore:
+    """Store variable length string values as a buffer of bytes and an array of offsets
+    into that buffer, see allel.OffsetStringArray. Values are copied directly from the
+    parsing context, without creating Python objects. Values must be stored in order,
+    any values not stored are empty."""
+
+    cdef:
+        Py_ssize_t number
+        Py_ssize_t chunk_length
+        np.ndarray offsets_values
+        np.ndarray data_values
+        np.int64_t[:] offsets
+        np.uint8_t[:] data
+        # number of bytes stored
+        Py_ssize_t size
+        # number of values stored, including empty values
+        Py_ssize_t n_items
+
+    def __init__(self, number, chunk_length):
+        self.number = number
+        self.chunk_length = chunk_length
+
+    cdef int malloc_chunk(self) except -1:
+        self.offsets_values = np.zeros(self.chunk_length * self.number + 1, dtype='i8')
+        self.offsets = self.offsets_values
+        # N.B., initial guess at size, grown as needed
+        self.data_values = np.empty(max(2**10, self.chunk_length * self.number * 4),
+                                    dtype='u1')
+        self.data = self.data_values
+        self.size = 0
+        self.n_items = 0
+
+    cdef int grow(self, Py_ssize_t size) except -1:
+        values = np.empty(max(size, 2 * self.data_values.shape[0]), dtype='u1')
+        values[:self.size] = self.data_values[:self.size]
+        self.data_values = values
+        self.data = self.data_values
+
+    cdef int store(self, Py_ssize_t variant_index, Py_ssize_t value_index,
+                   CharVector* value) nogil except -1:
+        cdef Py_ssize_t item = variant_index * self.number + value_index
+        # any values skipped since the last value stored are empty
+        while self.n_items < item:
+            self.n_items += 1
+            self.offsets[self.n_items] = self.size
+        if self.size + value.size > self.data.shape[0]:
+            with gil:
+                self.grow(self.size + value.size)
+        if value.size > 0:
+            memcpy(&self.data[self.size], value.data, value.size)
+        self.size += value.size
+        self.n_items += 1
+        self.offsets[self.n_items] = self.size
+
+    cdef int discard(self, Py_ssize_t variant_index) nogil except -1:
+        """Discard any values stored for the variant at `variant_index` or later, e.g.,
+        if the variant has been rejected by a filter."""
+        cdef Py_ssize_t item = variant_index * self.number
+        if item < self.n_items:
+            self.n_items = item
+            self.size = self.offsets[item]
+
+    cdef object make(self, limit=None):
+        cdef Py_ssize_t i, n
+        from allel.model.ndarray import OffsetStringArray
+        if limit is None:
+            limit = self.chunk_length
+        n = limit * self.number
+        # N.B., don't change the number of values stored, further values may follow
+        for i in range(self.n_items, n):
+            self.offsets[i + 1] = self.size
+        offsets = self.offsets_values[:n + 1]
+        data = self.data_values[:self.offsets[n]]
+        if self.number == 1:
+            shape = (limit,)
+        else:
+            shape = (limit, self.number)
+        return OffsetStringArray(offsets, data, shape=shape)
+
+
 cdef class VCFIDStringParser(VCFFieldParserBase):
 
     cdef np.uint8_t[:] memory
@@ -1129,7 +1878,7 @@ cdef class VCFIDStringParser(VCFFieldParserBase):
     def __init__(self, dtype, chunk_length):
         super(VCFIDStringParser, self).__init__(key=b'ID', dtype=dtype, number=1, chunk_length=chunk_length)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         cdef:
             # index into memory view
             Py_ssize_t memory_index = context.chunk_variant_index * self.itemsize
@@ -1171,24 +1920,41 @@ cdef class VCFIDStringParser(VCFFieldParserBase):
 
 cdef class VCFIDObjectParser(VCFFieldParserBase):
 
-    def __init__(self, chunk_length):
+    cdef VCFOffsetsStore offsets
+
+    def __init__(self, chunk_length, offsets=None):
         super(VCFIDObjectParser, self).__init__(key=b'ID', dtype=np.dtype('object'), number=1,
                                                 chunk_length=chunk_length)
+        self.offsets = offsets
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
 
         vcf_read_field(stream, context, &context.temp)
-
-        # with gil:
-        v = CharVector_to_pystr(&context.temp)
-        self.values[context.chunk_variant_index] = v
+        self.store_object(context)
 
         if context.state == VCFState.ID:
             context.state += 1
 
+    cdef int store_object(self, VCFContext context) nogil except -1:
+        if self.offsets is not None:
+            self.offsets.store(context.chunk_variant_index, 0, &context.temp)
+            return 0
+        with gil:
+            v = CharVector_to_pystr(&context.temp)
+            self.values[context.chunk_variant_index] = v
+
     cdef int malloc_chunk(self) except -1:
-        self.values = np.empty(self.chunk_length, dtype=self.dtype)
-        self.values.fill(u'')
+        if self.offsets is not None:
+            self.offsets.malloc_chunk()
+        else:
+            self.values = np.empty(self.chunk_length, dtype=self.dtype)
+            self.values.fill(u'')
+
+    cdef int make_chunk(self, chunk, limit=None) except -1:
+        if self.offsets is not None:
+            chunk[ID_FIELD] = self.offsets.make(limit)
+        else:
+            chunk[ID_FIELD] = self.values[:limit]
 
 
 cdef class VCFRefStringParser(VCFFieldParserBase):
@@ -1203,7 +1969,7 @@ cdef class VCFRefStringParser(VCFFieldParserBase):
         super(VCFRefStringParser, self).__init__(key=b'REF', dtype=dtype, number=1, chunk_length=chunk_length)
         self.store = store
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         cdef:
             # index into memory view
             Py_ssize_t memory_index = context.chunk_variant_index * self.itemsize
@@ -1255,32 +2021,50 @@ cdef class VCFRefObjectParser(VCFFieldParserBase):
 
     cdef:
         bint store
+        VCFOffsetsStore offsets
 
-    def __init__(self, chunk_length, store):
+    def __init__(self, chunk_length, store, offsets=None):
         super(VCFRefObjectParser, self).__init__(key=b'REF', dtype=np.dtype('object'), number=1, chunk_length=chunk_length)
         self.store = store
+        self.offsets = offsets
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
+
+        cdef Py_ssize_t i
 
         vcf_read_field(stream, context, &context.temp)
 
-        # with gil:
-        v = CharVector_to_pystr(&context.temp)
-        if v != '.':
-            context.ref_len = len(v)
+        if not (context.temp.size == 1 and context.temp.data[0] == PERIOD):
+            # count characters, not including UTF-8 continuation bytes
+            context.ref_len = 0
+            for i in range(context.temp.size):
+                if (context.temp.data[i] & 0xC0) != 0x80:
+                    context.ref_len += 1
         if self.store:
-            self.values[context.chunk_variant_index] = v
+            self.store_object(context)
 
         if context.state == VCFState.REF:
             context.state += 1
 
+    cdef int store_object(self, VCFContext context) nogil except -1:
+        if self.offsets is not None:
+            self.offsets.store(context.chunk_variant_index, 0, &context.temp)
+            return 0
+        with gil:
+            v = CharVector_to_pystr(&context.temp)
+            self.values[context.chunk_variant_index] = v
+
     cdef int malloc_chunk(self) except -1:
-        if self.store:
+        if self.store and self.offsets is not None:
+            self.offsets.malloc_chunk()
+        elif self.store:
             self.values = np.empty(self.chunk_length, dtype=self.dtype)
             self.values.fill(u'')
 
     cdef int make_chunk(self, chunk, limit=None) except -1:
-        if self.store:
+        if self.store and self.offsets is not None:
+            chunk[REF_FIELD] = self.offsets.make(limit)
+        elif self.store:
             chunk[REF_FIELD] = self.values[:limit]
 
 
@@ -1310,7 +2094,7 @@ cdef class VCFAltStringParser(VCFFieldParserBase):
         self.store_altlen = store_altlen
         self.store_is_snp = store_is_snp
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         cdef:
             # index of alt values
             Py_ssize_t alt_index = 0
@@ -1450,16 +2234,19 @@ cdef class VCFAltObjectParser(VCFFieldParserBase):
         bint store_numalt
         bint store_altlen
         bint store_is_snp
+        VCFOffsetsStore offsets
 
-    def __init__(self, number, chunk_length, store_alt, store_numalt, store_altlen, store_is_snp):
+    def __init__(self, number, chunk_length, store_alt, store_numalt, store_altlen, store_is_snp,
+                 offsets=None):
         super(VCFAltObjectParser, self).__init__(key=b'ALT', dtype=np.dtype('object'), number=number,
                                                  chunk_length=chunk_length)
+        self.offsets = offsets
         self.store_alt = store_alt
         self.store_numalt = store_numalt
         self.store_altlen = store_altlen
         self.store_is_snp = store_is_snp
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         cdef:
             # index of alt values
             Py_ssize_t alt_index = 0
@@ -1491,9 +2278,7 @@ cdef class VCFAltObjectParser(VCFFieldParserBase):
                     self.altlen_memory[context.chunk_variant_index, alt_index] = \
                         alt_len - context.ref_len
                 if self.store_alt and alt_index < self.number and context.temp.size > 0:
-                    # with gil:
-                    v = CharVector_to_pystr(&context.temp)
-                    self.values[context.chunk_variant_index, alt_index] = v
+                    self.store_object(context, alt_index)
                 context.state = VCFState.EOF
                 break
 
@@ -1503,9 +2288,7 @@ cdef class VCFAltObjectParser(VCFFieldParserBase):
                     self.altlen_memory[context.chunk_variant_index, alt_index] = \
                         alt_len - context.ref_len
                 if self.store_alt and alt_index < self.number and context.temp.size > 0:
-                    # with gil:
-                    v = CharVector_to_pystr(&context.temp)
-                    self.values[context.chunk_variant_index, alt_index] = v
+                    self.store_object(context, alt_index)
                 context.state = VCFState.EOL
                 break
 
@@ -1515,9 +2298,7 @@ cdef class VCFAltObjectParser(VCFFieldParserBase):
                     self.altlen_memory[context.chunk_variant_index, alt_index] = \
                         alt_len - context.ref_len
                 if self.store_alt and alt_index < self.number and context.temp.size > 0:
-                    # with gil:
-                    v = CharVector_to_pystr(&context.temp)
-                    self.values[context.chunk_variant_index, alt_index] = v
+                    self.store_object(context, alt_index)
                 stream.advance()
                 context.state += 1
                 break
@@ -1528,9 +2309,7 @@ cdef class VCFAltObjectParser(VCFFieldParserBase):
                     self.altlen_memory[context.chunk_variant_index, alt_index] = \
                         alt_len - context.ref_len
                 if self.store_alt and alt_index < self.number:
-                    # with gil:
-                    v = CharVector_to_pystr(&context.temp)
-                    self.values[context.chunk_variant_index, alt_index] = v
+                    self.store_object(context, alt_index)
                 # advance value index
                 alt_index += 1
                 # reset
@@ -1551,9 +2330,19 @@ cdef class VCFAltObjectParser(VCFFieldParserBase):
         if self.store_is_snp:
             self.is_snp_memory[context.chunk_variant_index] = is_snp
 
+    cdef int store_object(self, VCFContext context, Py_ssize_t alt_index) nogil except -1:
+        if self.offsets is not None:
+            self.offsets.store(context.chunk_variant_index, alt_index, &context.temp)
+            return 0
+        with gil:
+            v = CharVector_to_pystr(&context.temp)
+            self.values[context.chunk_variant_index, alt_index] = v
+
     cdef int malloc_chunk(self) except -1:
         shape = (self.chunk_length, self.number)
-        if self.store_alt:
+        if self.store_alt and self.offsets is not None:
+            self.offsets.malloc_chunk()
+        elif self.store_alt:
             self.values = np.empty(shape, dtype=self.dtype, order='C')
             self.values.fill(u'')
         if self.store_numalt:
@@ -1567,7 +2356,9 @@ cdef class VCFAltObjectParser(VCFFieldParserBase):
             self.is_snp_memory = self.is_snp_values.view('u1')
 
     cdef int make_chunk(self, chunk, limit=None) except -1:
-        if self.store_alt:
+        if self.store_alt and self.offsets is not None:
+            chunk[ALT_FIELD] = self.offsets.make(limit)
+        elif self.store_alt:
             field = 'variants/' + text_type(self.key, 'utf8')
             values = self.values
             if self.values.ndim > 1 and self.number == 1:
@@ -1580,7 +2371,7 @@ cdef class VCFAltObjectParser(VCFFieldParserBase):
         if self.store_altlen:
             field = ALTLEN_FIELD
             values = self.altlen_values
-            if self.values.ndim > 1 and self.number == 1:
+            if self.number == 1:
                 values = values.squeeze(axis=1)
             chunk[field] = values[:limit]
         if self.store_is_snp:
@@ -1597,7 +2388,7 @@ cdef class VCFQualParser(VCFFieldParserBase):
         super(VCFQualParser, self).__init__(key=b'QUAL', dtype='float32', number=1,
                                             fill=fill, chunk_length=chunk_length)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         cdef:
             double value
             Py_ssize_t parsed
@@ -1647,7 +2438,7 @@ cdef class VCFFilterParser(VCFFieldParserBase):
         if self.filter_keys_cstr is not NULL:
             free(self.filter_keys_cstr)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         cdef:
             Py_ssize_t filter_index
 
@@ -1692,7 +2483,7 @@ cdef class VCFFilterParser(VCFFieldParserBase):
 
         return 1
 
-    cdef int parse_filter(self, VCFContext context) except -1:  # nogil
+    cdef int parse_filter(self, VCFContext context) nogil except -1:
         cdef:
             Py_ssize_t filter_index
             Py_ssize_t i
@@ -1736,8 +2527,10 @@ cdef class VCFInfoParser(VCFFieldParserBase):
         PyObject** info_parsers_cptr
         VCFInfoParserBase skip_parser
         object fills
+        # index of the timing slot for the first INFO key
+        Py_ssize_t timing_offset
 
-    def __cinit__(self, info_keys, types, numbers, chunk_length, fills):
+    def __cinit__(self, info_keys, types, numbers, chunk_length, fills, offsets_stores=None):
 
         # setup INFO keys
         # N.B., need to keep a reference to these, otherwise C strings will not behave
@@ -1801,6 +2594,12 @@ cdef class VCFInfoParser(VCFFieldParserBase):
                                               fill=fill)
             elif t == np.dtype(bool):
                 parser = VCFInfoFlagParser(key, chunk_length=chunk_length)
+            elif t == OFFSETS_TYPE:
+                offsets = VCFOffsetsStore(number=n, chunk_length=chunk_length)
+                if offsets_stores is not None:
+                    offsets_stores.append(offsets)
+                parser = VCFInfoObjectParser(key, number=n, chunk_length=chunk_length,
+                                             offsets=offsets)
             elif t.kind == 'S':
                 parser = VCFInfoStringParser(key, dtype=t, number=n, chunk_length=chunk_length)
             elif t.kind == 'O':
@@ -1816,7 +2615,7 @@ cdef class VCFInfoParser(VCFFieldParserBase):
         for i in range(self.n_infos):
             self.info_parsers_cptr[i] = <PyObject*> self.info_parsers[i]
 
-    def __init__(self, info_keys, types, numbers, chunk_length, fills):
+    def __init__(self, info_keys, types, numbers, chunk_length, fills, offsets_stores=None):
         super(VCFInfoParser, self).__init__(key=b'INFO', chunk_length=chunk_length)
         self.fills = fills
 
@@ -1826,7 +2625,7 @@ cdef class VCFInfoParser(VCFFieldParserBase):
         if self.info_parsers_cptr is not NULL:
             free(self.info_parsers_cptr)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
 
         # reset buffers
         CharVector_clear(&context.info_key)
@@ -1882,7 +2681,6 @@ cdef class VCFInfoParser(VCFFieldParserBase):
                 if context.info_key.size > 0:
                     self.parse_info(stream, context)
                 else:
-                    # with gil:
                     warn('missing INFO key', context)
                     self.skip_parser.parse(stream, context)
 
@@ -1893,11 +2691,12 @@ cdef class VCFInfoParser(VCFFieldParserBase):
 
     cdef int parse_info(self,
                         InputStreamBase stream,
-                        VCFContext context) except -1:  # nogil
+                        VCFContext context) nogil except -1:
 
         cdef:
             Py_ssize_t parser_index
             PyObject* parser
+            double before
 
         # terminate key
         CharVector_terminate(&context.info_key)
@@ -1911,7 +2710,12 @@ cdef class VCFInfoParser(VCFFieldParserBase):
         if parser_index >= 0:
             # obtain parser, use trickery for nogil
             parser = self.info_parsers_cptr[parser_index]
-            (<VCFInfoParserBase> parser).parse(stream, context)
+            if context.timing:
+                before = vcf_clock()
+                (<VCFInfoParserBase> parser).parse(stream, context)
+                context.timings[self.timing_offset + parser_index] += vcf_clock() - before
+            else:
+                (<VCFInfoParserBase> parser).parse(stream, context)
         else:
             self.skip_parser.parse(stream, context)
 
@@ -1950,7 +2754,7 @@ cdef class VCFInfoParserBase:
         self.fill = fill
         self.chunk_length = chunk_length
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         pass
 
     cdef int make_chunk(self, chunk, limit=None) except -1:
@@ -1973,7 +2777,7 @@ cdef class VCFInfoInt8Parser(VCFInfoParserBase):
         kwargs.setdefault('fill', -1)
         super(VCFInfoInt8Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         vcf_info_parse_integer(stream, context, self.memory)
 
     cdef int malloc_chunk(self) except -1:
@@ -1992,7 +2796,7 @@ cdef class VCFInfoInt16Parser(VCFInfoParserBase):
         kwargs.setdefault('fill', -1)
         super(VCFInfoInt16Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         vcf_info_parse_integer(stream, context, self.memory)
 
     cdef int malloc_chunk(self) except -1:
@@ -2011,7 +2815,7 @@ cdef class VCFInfoInt32Parser(VCFInfoParserBase):
         kwargs.setdefault('fill', -1)
         super(VCFInfoInt32Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         vcf_info_parse_integer(stream, context, self.memory)
 
     cdef int malloc_chunk(self) except -1:
@@ -2030,7 +2834,7 @@ cdef class VCFInfoInt64Parser(VCFInfoParserBase):
         kwargs.setdefault('fill', -1)
         super(VCFInfoInt64Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         vcf_info_parse_integer(stream, context, self.memory)
 
     cdef int malloc_chunk(self) except -1:
@@ -2049,7 +2853,7 @@ cdef class VCFInfoUInt8Parser(VCFInfoParserBase):
         kwargs.setdefault('fill', IU8.max)
         super(VCFInfoUInt8Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         vcf_info_parse_integer(stream, context, self.memory)
 
     cdef int malloc_chunk(self) except -1:
@@ -2068,7 +2872,7 @@ cdef class VCFInfoUInt16Parser(VCFInfoParserBase):
         kwargs.setdefault('fill', IU16.max)
         super(VCFInfoUInt16Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         vcf_info_parse_integer(stream, context, self.memory)
 
     cdef int malloc_chunk(self) except -1:
@@ -2087,7 +2891,7 @@ cdef class VCFInfoUInt32Parser(VCFInfoParserBase):
         kwargs.setdefault('fill', IU32.max)
         super(VCFInfoUInt32Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         vcf_info_parse_integer(stream, context, self.memory)
 
     cdef int malloc_chunk(self) except -1:
@@ -2106,7 +2910,7 @@ cdef class VCFInfoUInt64Parser(VCFInfoParserBase):
         kwargs.setdefault('fill', IU64.max)
         super(VCFInfoUInt64Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         vcf_info_parse_integer(stream, context, self.memory)
 
     cdef int malloc_chunk(self) except -1:
@@ -2125,7 +2929,7 @@ cdef class VCFInfoFloat32Parser(VCFInfoParserBase):
         kwargs.setdefault('fill', NAN)
         super(VCFInfoFloat32Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         vcf_info_parse_floating(stream, context, self.memory)
 
     cdef int malloc_chunk(self) except -1:
@@ -2144,7 +2948,7 @@ cdef class VCFInfoFloat64Parser(VCFInfoParserBase):
         kwargs.setdefault('fill', NAN)
         super(VCFInfoFloat64Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         vcf_info_parse_floating(stream, context, self.memory)
 
     cdef int malloc_chunk(self) except -1:
@@ -2162,7 +2966,7 @@ cdef class VCFInfoFlagParser(VCFInfoParserBase):
         kwargs['dtype'] = 'uint8'
         super(VCFInfoFlagParser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         # nothing to parse
         self.memory[context.chunk_variant_index] = 1
         # ensure we advance the end of the field
@@ -2192,7 +2996,7 @@ cdef class VCFInfoStringParser(VCFInfoParserBase):
         kwargs['dtype'] = check_string_dtype(kwargs.get('dtype'))
         super(VCFInfoStringParser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         cdef:
             Py_ssize_t value_index = 0
             # index into memory view
@@ -2240,11 +3044,14 @@ cdef class VCFInfoStringParser(VCFInfoParserBase):
 
 cdef class VCFInfoObjectParser(VCFInfoParserBase):
 
+    cdef VCFOffsetsStore offsets
+
     def __init__(self, *args, **kwargs):
+        self.offsets = kwargs.pop('offsets', None)
         kwargs['dtype'] = np.dtype('object')
         super(VCFInfoObjectParser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         cdef:
             Py_ssize_t value_index = 0
 
@@ -2258,16 +3065,12 @@ cdef class VCFInfoObjectParser(VCFInfoParserBase):
                     stream.c == TAB or \
                     stream.c == SEMICOLON:
                 if value_index < self.number and context.info_val.size > 0:
-                    # with gil:
-                    v = CharVector_to_pystr(&context.info_val)
-                    self.values[context.chunk_variant_index, value_index] = v
+                    self.store_object(context, value_index)
                 break
 
             elif stream.c == COMMA:
                 if value_index < self.number and context.info_val.size > 0:
-                    # with gil:
-                    v = CharVector_to_pystr(&context.info_val)
-                    self.values[context.chunk_variant_index, value_index] = v
+                    self.store_object(context, value_index)
                     CharVector_clear(&context.info_val)
                 # advance value index
                 value_index += 1
@@ -2278,10 +3081,27 @@ cdef class VCFInfoObjectParser(VCFInfoParserBase):
             # advance input stream
             stream.advance()
 
+    cdef int store_object(self, VCFContext context, Py_ssize_t value_index) nogil except -1:
+        if self.offsets is not None:
+            self.offsets.store(context.chunk_variant_index, value_index, &context.info_val)
+            return 0
+        with gil:
+            v = CharVector_to_pystr(&context.info_val)
+            self.values[context.chunk_variant_index, value_index] = v
+
     cdef int malloc_chunk(self) except -1:
-        shape = (self.chunk_length, self.number)
-        self.values = np.empty(shape, dtype=self.dtype)
-        self.values.fill(u'')
+        if self.offsets is not None:
+            self.offsets.malloc_chunk()
+        else:
+            shape = (self.chunk_length, self.number)
+            self.values = np.empty(shape, dtype=self.dtype)
+            self.values.fill(u'')
+
+    cdef int make_chunk(self, chunk, limit=None) except -1:
+        if self.offsets is not None:
+            chunk['variants/' + text_type(self.key, 'utf8')] = self.offsets.make(limit)
+        else:
+            VCFInfoParserBase.make_chunk(self, chunk, limit=limit)
 
 
 cdef class VCFInfoSkipParser(VCFInfoParserBase):
@@ -2289,7 +3109,7 @@ cdef class VCFInfoSkipParser(VCFInfoParserBase):
     def __init__(self, *args, **kwargs):
         super(VCFInfoSkipParser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         # ensure we advance the end of the field
         while stream.c != SEMICOLON and \
                 stream.c != TAB and \
@@ -2307,100 +3127,44 @@ cdef class VCFInfoSkipParser(VCFInfoParserBase):
 
 cdef int vcf_info_parse_integer(InputStreamBase stream,
                                 VCFContext context,
-                                integer[:, :] memory) except -1:  # nogil
+                                integer[:, :] memory) nogil except -1:
     cdef:
         Py_ssize_t value_index = 0
-
-    # reset temporary buffer
-    CharVector_clear(&context.info_val)
+        long value
 
     while True:
 
-        if stream.c == 0 or \
-                stream.c == LF or \
-                stream.c == CR or \
-                stream.c == TAB or \
-                stream.c == SEMICOLON:
-            vcf_info_store_integer(context, value_index, memory)
-            break
+        if vcf_read_integer(stream, context, &context.info_val, SEMICOLON, &value) > 0 \
+                and value_index < memory.shape[1]:
+            memory[context.chunk_variant_index, value_index] = value
 
-        elif stream.c == COMMA:
-            vcf_info_store_integer(context, value_index, memory)
-            CharVector_clear(&context.info_val)
+        if stream.c == COMMA:
             value_index += 1
+            stream.advance()
 
         else:
-            CharVector_append(&context.info_val, stream.c)
-
-        stream.advance()
-
-
-cdef int vcf_info_store_integer(VCFContext context,
-                                Py_ssize_t value_index,
-                                integer[:, :] memory) except -1:  # nogil
-    cdef:
-        Py_ssize_t parsed
-        long value
-
-    if value_index >= memory.shape[1]:
-        # more values than we have room for, ignore
-        return 0
-
-    # parse string as integer
-    parsed = vcf_strtol(&context.info_val, context, &value)
-
-    if parsed > 0:
-        # store value
-        memory[context.chunk_variant_index, value_index] = value
+            break
 
 
 cdef int vcf_info_parse_floating(InputStreamBase stream,
                                  VCFContext context,
-                                 floating[:, :] memory) except -1:  # nogil
+                                 floating[:, :] memory) nogil except -1:
     cdef:
         Py_ssize_t value_index = 0
-
-    # reset temporary buffer
-    CharVector_clear(&context.info_val)
+        double value
 
     while True:
 
-        if stream.c == 0 or \
-                stream.c == LF or \
-                stream.c == CR or \
-                stream.c == TAB or \
-                stream.c == SEMICOLON:
-            vcf_info_store_floating(context, value_index, memory)
-            break
+        if vcf_read_floating(stream, context, &context.info_val, SEMICOLON, &value) > 0 \
+                and value_index < memory.shape[1]:
+            memory[context.chunk_variant_index, value_index] = value
 
-        elif stream.c == COMMA:
-            vcf_info_store_floating(context, value_index, memory)
-            CharVector_clear(&context.info_val)
+        if stream.c == COMMA:
             value_index += 1
+            stream.advance()
 
         else:
-            CharVector_append(&context.info_val, stream.c)
-
-        stream.advance()
-
-
-cdef int vcf_info_store_floating(VCFContext context,
-                                 Py_ssize_t value_index,
-                                 floating[:, :] memory) except -1:  # nogil
-    cdef:
-        Py_ssize_t parsed
-        double value
-
-    if value_index >= memory.shape[1]:
-        # more values than we have room for, ignore
-        return 0
-
-    # parse string as floating
-    parsed = vcf_strtod(&context.info_val, context, &value)
-
-    if parsed > 0:
-        # store value
-        memory[context.chunk_variant_index, value_index] = value
+            break
 
 
 ##########################################################################################
@@ -2433,11 +3197,10 @@ cdef class VCFFormatParser(VCFFieldParserBase):
         if self.format_keys_cstr is not NULL:
             free(self.format_keys_cstr)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
 
-        # reset temporary buffer
-        CharVector_clear(&context.temp)
-        IntVector_clear(&context.variant_format_indices)
+        # reset buffer for the raw FORMAT field
+        CharVector_clear(&context.format_raw)
 
         while True:
 
@@ -2452,22 +3215,62 @@ cdef class VCFFormatParser(VCFFieldParserBase):
                 break
 
             elif stream.c == TAB:
-                self.store_format(context)
+                self.resolve_format(context)
                 # we're done here, advance to next field
                 context.state += 1
                 stream.advance()
                 break
 
-            elif stream.c == COLON:
-                self.store_format(context)
-
             else:
-                CharVector_append(&context.temp, stream.c)
+                CharVector_append(&context.format_raw, stream.c)
 
             # advance to next character
             stream.advance()
 
-    cdef int store_format(self, VCFContext context) except -1:  # nogil
+    cdef int resolve_format(self, VCFContext context) nogil except -1:
+        """Set the indices of formats for the current variant, looking up the layout in
+        the cache before searching for each key."""
+        cdef:
+            Py_ssize_t i
+            VCFFormatCacheEntry* entry
+
+        # check the layout used for the previous variant first, as most likely to match
+        for i in range(context.format_cache_size):
+            entry = &context.format_cache[(context.format_cache_last + i) %
+                                          context.format_cache_size]
+            if entry.key.size == context.format_raw.size and \
+                    memcmp(entry.key.data, context.format_raw.data,
+                           context.format_raw.size) == 0:
+                context.format_cache_last = (context.format_cache_last + i) % \
+                    context.format_cache_size
+                IntVector_copy(&context.variant_format_indices, &entry.indices)
+                return 0
+
+        # not seen before, search for each key
+        CharVector_clear(&context.temp)
+        IntVector_clear(&context.variant_format_indices)
+        for i in range(context.format_raw.size):
+            if context.format_raw.data[i] == COLON:
+                self.store_format(context)
+            else:
+                CharVector_append(&context.temp, context.format_raw.data[i])
+        self.store_format(context)
+
+        # add to the cache, replacing the entry after the last used if full
+        if context.format_cache_size < FORMAT_CACHE_CAPACITY:
+            i = context.format_cache_size
+            entry = &context.format_cache[i]
+            CharVector_init(&entry.key, context.format_raw.size + 1)
+            IntVector_init(&entry.indices, context.variant_format_indices.size + 1)
+            context.format_cache_size += 1
+        else:
+            i = (context.format_cache_last + 1) % FORMAT_CACHE_CAPACITY
+            entry = &context.format_cache[i]
+        CharVector_copy(&entry.key, &context.format_raw)
+        IntVector_copy(&entry.indices, &context.variant_format_indices)
+        context.format_cache_last = i
+
+    cdef int store_format(self, VCFContext context) nogil except -1:
         cdef Py_ssize_t format_index
 
         # deal with empty or missing data
@@ -2495,31 +3298,138 @@ cdef class VCFFormatParser(VCFFieldParserBase):
 cdef class VCFSkipAllCallDataParser(VCFFieldParserBase):
     """Skip a field."""
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         vcf_skip_variant(stream, context)
 
     cdef int make_chunk(self, chunk, limit=None) except -1:
         pass
 
 
-cdef class VCFCallDataParser(VCFFieldParserBase):
+cdef class VCFAlleleCounter:
+    """Accumulate allele counts for each variant from genotype calls as they are parsed,
+    for all samples and optionally for groups of samples, so no second pass over the
+    genotype calls is needed."""
 
     cdef:
-        tuple format_keys
-        Py_ssize_t n_formats
-        tuple parsers
-        PyObject** parsers_cptr
+        Py_ssize_t chunk_length
+        Py_ssize_t n_alleles
+        Py_ssize_t n_samples_out
+        bint store_ac
+        bint store_an
+        bint store_n_missing
+        list pop_fields
+        # groups each sample belongs to, as pop_indices[pop_offsets[i]:pop_offsets[i + 1]]
+        np.ndarray pop_offsets_values
+        np.ndarray pop_indices_values
+        np.int32_t[:] pop_offsets
+        np.int32_t[:] pop_indices
+        np.ndarray ac_values
+        np.ndarray an_values
+        np.ndarray n_called_values
+        np.ndarray n_missing_values
+        np.ndarray pop_ac_values
+        np.int32_t[:, :] ac
+        np.int32_t[:] an
+        np.int32_t[:] n_called
+        np.int32_t[:, :, :] pop_ac
+
+    def __init__(self, fields, n_alleles, subpops, chunk_length, n_samples_out):
+        self.chunk_length = chunk_length
+        self.n_alleles = n_alleles
+        self.n_samples_out = n_samples_out
+        self.store_ac = AC_FIELD in fields
+        self.store_an = AN_FIELD in fields
+        self.store_n_missing = N_MISSING_FIELD in fields
+        for f in AC_FIELD, AN_FIELD, N_MISSING_FIELD:
+            if f in fields:
+                fields.remove(f)
+
+        # subpops given as a list of (field, indices of samples within output)
+        self.pop_fields = list()
+        membership = [list() for _ in range(n_samples_out)]
+        for i, (field, indices) in enumerate(subpops):
+            self.pop_fields.append(field)
+            if field in fields:
+                fields.remove(field)
+            for j in indices:
+                membership[j].append(i)
+        self.pop_offsets_values = np.zeros(n_samples_out + 1, dtype='i4')
+        self.pop_offsets_values[1:] = np.cumsum([len(m) for m in membership])
+        self.pop_indices_values = np.array([i for m in membership for i in m], dtype='i4')
+        self.pop_offsets = self.pop_offsets_values
+        self.pop_indices = self.pop_indices_values
+
+    cdef int malloc_chunk(self) except -1:
+        self.ac_values = np.zeros((self.chunk_length, self.n_alleles), dtype='i4')
+        self.ac = self.ac_values
+        self.an_values = np.zeros(self.chunk_length, dtype='i4')
+        self.an = self.an_values
+        self.n_called_values = np.zeros(self.chunk_length, dtype='i4')
+        self.n_called = self.n_called_values
+        self.n_missing_values = np.zeros(self.chunk_length, dtype='i4')
+        self.pop_ac_values = np.zeros((len(self.pop_fields), self.chunk_length,
+                                       self.n_alleles), dtype='i4')
+        self.pop_ac = self.pop_ac_values
+
+    cdef int make_chunk(self, chunk, limit=None) except -1:
+        if self.store_ac:
+            chunk[AC_FIELD] = self.ac_values[:limit]
+        if self.store_an:
+            chunk[AN_FIELD] = self.an_values[:limit]
+        if self.store_n_missing:
+            # N.B., computed in place, as arrays may be bound by a variant filter
+            values = self.n_missing_values[:limit]
+            np.subtract(self.n_samples_out, self.n_called_values[:limit], out=values)
+            chunk[N_MISSING_FIELD] = values
+        for i, field in enumerate(self.pop_fields):
+            chunk[field] = self.pop_ac_values[i, :limit]
+
+    cdef inline void add_allele(self, Py_ssize_t variant_index, Py_ssize_t sample_index,
+                                long allele) nogil:
+        """Count a called allele, N.B., `allele` must not be negative."""
+        cdef Py_ssize_t k
+        self.an[variant_index] += 1
+        if allele < self.n_alleles:
+            self.ac[variant_index, allele] += 1
+            for k in range(self.pop_offsets[sample_index], self.pop_offsets[sample_index + 1]):
+                self.pop_ac[self.pop_indices[k], variant_index, allele] += 1
+
+    cdef inline void add_called(self, Py_ssize_t variant_index) nogil:
+        """Count a genotype call with no missing alleles."""
+        self.n_called[variant_index] += 1
+
+
+cdef class VCFCallDataParser(VCFFieldParserBase):
+
+    cdef:
+        tuple format_keys
+        Py_ssize_t n_formats
+        tuple parsers
+        PyObject** parsers_cptr
         VCFCallDataParserBase skip_parser
         np.uint8_t[:] loc_samples
+        # number of consecutive samples not selected, starting from each sample
+        np.intp_t[:] skip_runs
         Py_ssize_t n_samples
         Py_ssize_t n_samples_out
+        # index of the timing slot for the first FORMAT key
+        Py_ssize_t timing_offset
 
-    def __cinit__(self, format_keys, types, numbers, chunk_length, loc_samples, fills):
+    def __cinit__(self, format_keys, types, numbers, chunk_length, loc_samples, fills,
+                  counter=None):
         self.chunk_length = chunk_length
         self.loc_samples = loc_samples
         self.n_samples = loc_samples.shape[0]
         self.n_samples_out = np.count_nonzero(loc_samples)
 
+        # setup skipping of samples not selected, N.B., one extra in case there are more
+        # samples than given in the header
+        skip_runs = np.ones(self.n_samples + 1, dtype=np.intp)
+        for i in range(self.n_samples - 2, -1, -1):
+            if not loc_samples[i] and not loc_samples[i + 1]:
+                skip_runs[i] = skip_runs[i + 1] + 1
+        self.skip_runs = skip_runs
+
         # setup formats
         self.format_keys = tuple(sorted(format_keys))
         self.n_formats = len(self.format_keys)
@@ -2531,6 +3441,10 @@ cdef class VCFCallDataParser(VCFFieldParserBase):
         for key in self.format_keys:
             t = types[key]
             n = numbers[key]
+            if key == b'GT':
+                kwds['counter'] = counter
+            else:
+                kwds.pop('counter', None)
 
             # special handling of "genotype" dtypes for any field
             if isinstance(t, str) and t.startswith('genotype/'):
@@ -2556,6 +3470,18 @@ cdef class VCFCallDataParser(VCFFieldParserBase):
                     warnings.warn('type %r not supported for genotype field %r, field will be skipped' % (t, key))
                     parser = self.skip_parser
 
+            # special handling of packed genotype dtypes for any field
+            elif isinstance(t, str) and (t.startswith('genotype_packed/') or
+                                         t.startswith('genotype_2bit/')):
+                two_bit = t.startswith('genotype_2bit/')
+                t = np.dtype(t.split('/')[1])
+                if t == np.dtype('uint8'):
+                    parser = VCFGenotypePackedParser(key, number=n, two_bit=two_bit, **kwds)
+                else:
+                    warnings.warn('type %r not supported for packed genotype field %r, field '
+                                  'will be skipped' % (t, key))
+                    parser = self.skip_parser
+
             # special handling of "genotype_ac" dtypes for any field
             elif isinstance(t, str) and t.startswith('genotype_ac/'):
                 t = np.dtype(t.split('/')[1])
@@ -2635,16 +3561,21 @@ cdef class VCFCallDataParser(VCFFieldParserBase):
         for i in range(self.n_formats):
             self.parsers_cptr[i] = <PyObject*> self.parsers[i]
 
-    def __init__(self, format_keys, types, numbers, chunk_length, loc_samples, fills):
+    def __init__(self, format_keys, types, numbers, chunk_length, loc_samples, fills,
+                 counter=None):
         super(VCFCallDataParser, self).__init__(chunk_length=chunk_length)
 
     def __dealloc__(self):
         if self.parsers_cptr is not NULL:
             free(self.parsers_cptr)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         cdef:
             PyObject* parser
+            Py_ssize_t format_index
+            double before
+            bint timing = (context.timing and
+                           context.variant_index % CALLDATA_TIMING_INTERVAL == 0)
 
         # initialise context
         context.sample_index = 0
@@ -2655,14 +3586,12 @@ cdef class VCFCallDataParser(VCFFieldParserBase):
         if self.loc_samples[0]:
             context.sample_output_index += 1
         else:
-            # skip to next sample
-            while stream.c != 0 and stream.c != LF and stream.c != CR and stream.c != TAB:
-                stream.advance()
+            # skip to next sample selected
+            context.sample_index += stream.skip_fields(self.skip_runs[0])
 
         while True:
 
             if context.sample_index >= self.n_samples:
-                # with gil:
                 warn('more samples than given in header', context)
                 while stream.c != 0 and stream.c != LF and stream.c != CR:
                     stream.advance()
@@ -2682,9 +3611,9 @@ cdef class VCFCallDataParser(VCFFieldParserBase):
                 if self.loc_samples[context.sample_index]:
                     context.sample_output_index += 1
                 else:
-                    # skip to next sample
-                    while stream.c != 0 and stream.c != LF and stream.c != CR and stream.c != TAB:
-                        stream.advance()
+                    # skip to next sample selected
+                    context.sample_index += stream.skip_fields(
+                        self.skip_runs[context.sample_index])
 
             elif stream.c == COLON:
                 context.sample_field_index += 1
@@ -2703,7 +3632,13 @@ cdef class VCFCallDataParser(VCFFieldParserBase):
                 if format_index >= 0:
                     parser = self.parsers_cptr[format_index]
                     # jump through some hoops to avoid references (which need the GIL)
-                    (<VCFCallDataParserBase>parser).parse(stream, context)
+                    if timing:
+                        before = vcf_clock()
+                        (<VCFCallDataParserBase>parser).parse(stream, context)
+                        context.timings[self.timing_offset + format_index] += \
+                            (vcf_clock() - before - CLOCK_OVERHEAD) * CALLDATA_TIMING_INTERVAL
+                    else:
+                        (<VCFCallDataParserBase>parser).parse(stream, context)
 
                 else:
                     self.skip_parser.parse(stream, context)
@@ -2730,10 +3665,13 @@ cdef class VCFCallDataParserBase:
         np.ndarray values
         Py_ssize_t chunk_length
         Py_ssize_t n_samples_out
+        # only set for genotype parsers, if allele counts are computed
+        VCFAlleleCounter counter
 
     def __init__(self, key=None, dtype=None, number=1, fill=0, chunk_length=0,
-                 n_samples_out=0):
+                 n_samples_out=0, counter=None):
         self.key = key
+        self.counter = counter
         if dtype is not None:
             self.dtype = np.dtype(dtype)
             self.itemsize = self.dtype.itemsize
@@ -2755,7 +3693,7 @@ cdef class VCFCallDataParserBase:
             values = values.squeeze(axis=2)
         chunk[field] = values
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         pass
 
 
@@ -2764,7 +3702,7 @@ cdef class VCFCallDataSkipParser(VCFCallDataParserBase):
     def __init__(self, key, *args, **kwargs):
         super(VCFCallDataSkipParser, self).__init__(key=key)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         while stream.c != COLON and \
                 stream.c != TAB and \
                 stream.c != CR and \
@@ -2786,8 +3724,8 @@ cdef class VCFGenotypeInt8Parser(VCFCallDataParserBase):
         kwargs.setdefault('fill', -1)
         super(VCFGenotypeInt8Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
-        vcf_genotype_parse(stream, context, self.memory)
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
+        vcf_genotype_parse(stream, context, self.memory, self.counter)
 
     cdef int malloc_chunk(self) except -1:
         shape = (self.chunk_length, self.n_samples_out, self.number)
@@ -2806,8 +3744,8 @@ cdef class VCFGenotypeInt16Parser(VCFCallDataParserBase):
         kwargs.setdefault('fill', -1)
         super(VCFGenotypeInt16Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
-        vcf_genotype_parse(stream, context, self.memory)
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
+        vcf_genotype_parse(stream, context, self.memory, self.counter)
 
     cdef int malloc_chunk(self) except -1:
         shape = (self.chunk_length, self.n_samples_out, self.number)
@@ -2826,8 +3764,8 @@ cdef class VCFGenotypeInt32Parser(VCFCallDataParserBase):
         kwargs.setdefault('fill', -1)
         super(VCFGenotypeInt32Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
-        vcf_genotype_parse(stream, context, self.memory)
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
+        vcf_genotype_parse(stream, context, self.memory, self.counter)
 
     cdef int malloc_chunk(self) except -1:
         shape = (self.chunk_length, self.n_samples_out, self.number)
@@ -2846,8 +3784,8 @@ cdef class VCFGenotypeInt64Parser(VCFCallDataParserBase):
         kwargs.setdefault('fill', -1)
         super(VCFGenotypeInt64Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
-        vcf_genotype_parse(stream, context, self.memory)
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
+        vcf_genotype_parse(stream, context, self.memory, self.counter)
 
     cdef int malloc_chunk(self) except -1:
         shape = (self.chunk_length, self.n_samples_out, self.number)
@@ -2866,8 +3804,8 @@ cdef class VCFGenotypeUInt8Parser(VCFCallDataParserBase):
         kwargs.setdefault('fill', IU8.max)
         super(VCFGenotypeUInt8Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
-        vcf_genotype_parse(stream, context, self.memory)
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
+        vcf_genotype_parse(stream, context, self.memory, self.counter)
 
     cdef int malloc_chunk(self) except -1:
         shape = (self.chunk_length, self.n_samples_out, self.number)
@@ -2886,8 +3824,8 @@ cdef class VCFGenotypeUInt16Parser(VCFCallDataParserBase):
         kwargs.setdefault('fill', IU16.max)
         super(VCFGenotypeUInt16Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
-        vcf_genotype_parse(stream, context, self.memory)
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
+        vcf_genotype_parse(stream, context, self.memory, self.counter)
 
     cdef int malloc_chunk(self) except -1:
         shape = (self.chunk_length, self.n_samples_out, self.number)
@@ -2906,8 +3844,8 @@ cdef class VCFGenotypeUInt32Parser(VCFCallDataParserBase):
         kwargs.setdefault('fill', IU32.max)
         super(VCFGenotypeUInt32Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
-        vcf_genotype_parse(stream, context, self.memory)
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
+        vcf_genotype_parse(stream, context, self.memory, self.counter)
 
     cdef int malloc_chunk(self) except -1:
         shape = (self.chunk_length, self.n_samples_out, self.number)
@@ -2926,8 +3864,8 @@ cdef class VCFGenotypeUInt64Parser(VCFCallDataParserBase):
         kwargs.setdefault('fill', IU64.max)
         super(VCFGenotypeUInt64Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
-        vcf_genotype_parse(stream, context, self.memory)
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
+        vcf_genotype_parse(stream, context, self.memory, self.counter)
 
     cdef int malloc_chunk(self) except -1:
         shape = (self.chunk_length, self.n_samples_out, self.number)
@@ -2936,19 +3874,65 @@ cdef class VCFGenotypeUInt64Parser(VCFCallDataParserBase):
         self.memory[:] = self.fill
 
 
+cdef inline bint is_genotype_allele_char(char c) nogil:
+    return (ZERO <= c <= NINE) or c == PERIOD
+
+
+cdef inline bint is_genotype_end_char(char c) nogil:
+    return c == COLON or c == TAB or c == LF or c == CR or c == 0
+
+
 cdef int vcf_genotype_parse(InputStreamBase stream,
                             VCFContext context,
-                            integer[:, :, :] memory) except -1:  # nogil
+                            integer[:, :, :] memory,
+                            VCFAlleleCounter counter) nogil except -1:
     cdef:
         Py_ssize_t value_index = 0
+        Py_ssize_t n_stored = 0
+        char a, b
 
     # reset temporary buffer
     CharVector_clear(&context.temp)
 
+    # fast path for diploid calls with single digit alleles, e.g., '0/1' or './.', which
+    # are by far the most common, storing alleles directly from the characters read
+    # rather than accumulating and converting each allele; as soon as a call departs
+    # from this pattern, carry on with the general path from wherever we got to
+    a = stream.c
+    if memory.shape[2] > 1 and is_genotype_allele_char(a):
+        stream.advance()
+        if stream.c == SLASH or stream.c == PIPE:
+            stream.advance()
+            b = stream.c
+            if is_genotype_allele_char(b):
+                stream.advance()
+                if is_genotype_end_char(stream.c):
+                    if a != PERIOD:
+                        memory[context.chunk_variant_index, context.sample_output_index,
+                               0] = a - ZERO
+                    if b != PERIOD:
+                        memory[context.chunk_variant_index, context.sample_output_index,
+                               1] = b - ZERO
+                    if counter is not None:
+                        vcf_genotype_count_diploid(context, counter, a, b, memory.shape[2])
+                    return 0
+                # second allele has more than one character
+                CharVector_append(&context.temp, b)
+            if a != PERIOD:
+                memory[context.chunk_variant_index, context.sample_output_index, 0] = a - ZERO
+                if counter is not None:
+                    counter.add_allele(context.chunk_variant_index,
+                                       context.sample_output_index, a - ZERO)
+                n_stored = 1
+            value_index = 1
+        else:
+            # haploid call or first allele has more than one character
+            CharVector_append(&context.temp, a)
+
     while True:
 
         if stream.c == SLASH or stream.c == PIPE:
-            vcf_genotype_store(context, memory, value_index)
+            n_stored += vcf_genotype_store(context, memory, value_index, counter)
             value_index += 1
             CharVector_clear(&context.temp)
 
@@ -2957,7 +3941,7 @@ cdef int vcf_genotype_parse(InputStreamBase stream,
                 stream.c == LF or \
                 stream.c == CR or \
                 stream.c == 0:
-            vcf_genotype_store(context, memory, value_index)
+            n_stored += vcf_genotype_store(context, memory, value_index, counter)
             break
 
         else:
@@ -2965,10 +3949,15 @@ cdef int vcf_genotype_parse(InputStreamBase stream,
 
         stream.advance()
 
+    if counter is not None and n_stored == memory.shape[2]:
+        counter.add_called(context.chunk_variant_index)
+
 
 cdef int vcf_genotype_store(VCFContext context,
                             integer[:, :, :] memory,
-                            Py_ssize_t value_index) except -1:  # nogil
+                            Py_ssize_t value_index,
+                            VCFAlleleCounter counter) nogil except -1:
+    """Store an allele, returning 1 if a value was stored, otherwise 0."""
     cdef:
         Py_ssize_t parsed
         long allele
@@ -2983,6 +3972,166 @@ cdef int vcf_genotype_store(VCFContext context,
     # store value
     if parsed > 0:
         memory[context.chunk_variant_index, context.sample_output_index, value_index] = allele
+        if counter is not None and allele >= 0:
+            counter.add_allele(context.chunk_variant_index, context.sample_output_index,
+                               allele)
+            return 1
+
+    return 0
+
+
+cdef int vcf_genotype_count_diploid(VCFContext context,
+                                    VCFAlleleCounter counter,
+                                    char a,
+                                    char b,
+                                    Py_ssize_t number) nogil except -1:
+    """Count the alleles of a diploid call with single digit alleles."""
+    if a != PERIOD:
+        counter.add_allele(context.chunk_variant_index, context.sample_output_index, a - ZERO)
+    if b != PERIOD:
+        counter.add_allele(context.chunk_variant_index, context.sample_output_index, b - ZERO)
+    if a != PERIOD and b != PERIOD and number == 2:
+        counter.add_called(context.chunk_variant_index)
+
+
+cdef class VCFGenotypePackedParser(VCFCallDataParserBase):
+    """Parse diploid genotype calls directly into a packed layout, either one byte per
+    call as for GenotypeArray.to_packed(), or with `two_bit`, four biallelic calls per
+    byte."""
+
+    cdef:
+        bint two_bit
+        np.uint8_t[:, :] memory
+
+    def __init__(self, *args, two_bit=False, **kwargs):
+        kwargs['dtype'] = 'uint8'
+        kwargs['fill'] = 255 if two_bit else 239
+        super(VCFGenotypePackedParser, self).__init__(*args, **kwargs)
+        self.two_bit = two_bit
+
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
+        cdef long alleles[2]
+        vcf_genotype_parse_diploid(stream, context, alleles)
+        if self.counter is not None:
+            vcf_genotype_count_alleles(self.counter, context.chunk_variant_index,
+                                       context.sample_output_index, alleles, 2, 2)
+        if vcf_genotype_packed_store(context.chunk_variant_index, context.sample_output_index,
+                                     alleles[0], alleles[1], self.memory, self.two_bit):
+            warn('allele too large to pack, genotype call stored as missing', context)
+
+    cdef int malloc_chunk(self) except -1:
+        if self.two_bit:
+            shape = (self.chunk_length, (self.n_samples_out + 3) // 4)
+        else:
+            shape = (self.chunk_length, self.n_samples_out)
+        self.values = np.empty(shape, dtype=self.dtype)
+        self.memory = self.values
+        self.memory[:] = self.fill
+
+    cdef int make_chunk(self, chunk, limit=None) except -1:
+        field = 'calldata/' + text_type(self.key, 'utf8')
+        chunk[field] = self.values[:limit]
+
+
+cdef int vcf_genotype_parse_diploid(InputStreamBase stream,
+                                    VCFContext context,
+                                    long* alleles) nogil except -1:
+    cdef:
+        Py_ssize_t value_index = 0
+        char a, b
+        long allele
+
+    alleles[0] = -1
+    alleles[1] = -1
+    CharVector_clear(&context.temp)
+
+    # fast path for single digit alleles, as for vcf_genotype_parse()
+    a = stream.c
+    if is_genotype_allele_char(a):
+        stream.advance()
+        if stream.c == SLASH or stream.c == PIPE:
+            stream.advance()
+            b = stream.c
+            if is_genotype_allele_char(b):
+                stream.advance()
+                if is_genotype_end_char(stream.c):
+                    if a != PERIOD:
+                        alleles[0] = a - ZERO
+                    if b != PERIOD:
+                        alleles[1] = b - ZERO
+                    return 0
+                CharVector_append(&context.temp, b)
+            if a != PERIOD:
+                alleles[0] = a - ZERO
+            value_index = 1
+        else:
+            CharVector_append(&context.temp, a)
+
+    while True:
+
+        if stream.c == SLASH or stream.c == PIPE or is_genotype_end_char(stream.c):
+            # N.B., alleles beyond the second are ignored
+            if value_index < 2 and vcf_strtol(&context.temp, context, &allele) > 0:
+                alleles[value_index] = allele
+            if is_genotype_end_char(stream.c):
+                break
+            value_index += 1
+            CharVector_clear(&context.temp)
+
+        else:
+            CharVector_append(&context.temp, stream.c)
+
+        stream.advance()
+
+
+cdef int vcf_genotype_count_alleles(VCFAlleleCounter counter,
+                                    Py_ssize_t variant_index,
+                                    Py_ssize_t sample_index,
+                                    long* alleles,
+                                    Py_ssize_t n,
+                                    Py_ssize_t number) nogil except -1:
+    """Count `n` alleles of a call, where missing alleles are negative, and the call is
+    only called if `number` alleles are present."""
+    cdef:
+        Py_ssize_t i, n_called = 0
+    for i in range(n):
+        if alleles[i] >= 0:
+            counter.add_allele(variant_index, sample_index, alleles[i])
+            n_called += 1
+    if n_called == number:
+        counter.add_called(variant_index)
+
+
+cdef int vcf_genotype_packed_store(Py_ssize_t variant_index,
+                                   Py_ssize_t sample_index,
+                                   long a1,
+                                   long a2,
+                                   np.uint8_t[:, :] memory,
+                                   bint two_bit) nogil except -1:
+    """Store a packed genotype call, returning 1 if an allele was too large to pack."""
+    cdef:
+        np.uint8_t code
+        int shift
+
+    if two_bit:
+        # number of alternate alleles, or 3 if either allele is missing or not 0 or 1
+        if a1 < 0 or a2 < 0 or a1 > 1 or a2 > 1:
+            code = 3
+        else:
+            code = a1 + a2
+        shift = (sample_index & 3) * 2
+        memory[variant_index, sample_index >> 2] = \
+            (memory[variant_index, sample_index >> 2] & ~(3 << shift)) | (code << shift)
+
+    else:
+        if a1 > 14 or a2 > 14:
+            memory[variant_index, sample_index] = 239
+            return 1
+        # as for genotype_array_pack_diploid(), hom ref calls are encoded as 0
+        memory[variant_index, sample_index] = \
+            <np.uint8_t> ((((a1 + 1) << 4) | ((a2 + 1) & 15)) - 17)
+
+    return 0
 
 
 cdef class VCFGenotypeACInt8Parser(VCFCallDataParserBase):
@@ -2995,8 +4144,8 @@ cdef class VCFGenotypeACInt8Parser(VCFCallDataParserBase):
         kwargs['fill'] = 0
         super(VCFGenotypeACInt8Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
-        vcf_genotype_ac_parse(stream, context, self.memory)
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
+        vcf_genotype_ac_parse(stream, context, self.memory, self.counter)
 
     cdef int malloc_chunk(self) except -1:
         shape = (self.chunk_length, self.n_samples_out, self.number)
@@ -3015,8 +4164,8 @@ cdef class VCFGenotypeACInt16Parser(VCFCallDataParserBase):
         kwargs['fill'] = 0
         super(VCFGenotypeACInt16Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
-        vcf_genotype_ac_parse(stream, context, self.memory)
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
+        vcf_genotype_ac_parse(stream, context, self.memory, self.counter)
 
     cdef int malloc_chunk(self) except -1:
         shape = (self.chunk_length, self.n_samples_out, self.number)
@@ -3035,8 +4184,8 @@ cdef class VCFGenotypeACInt32Parser(VCFCallDataParserBase):
         kwargs['fill'] = 0
         super(VCFGenotypeACInt32Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
-        vcf_genotype_ac_parse(stream, context, self.memory)
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
+        vcf_genotype_ac_parse(stream, context, self.memory, self.counter)
 
     cdef int malloc_chunk(self) except -1:
         shape = (self.chunk_length, self.n_samples_out, self.number)
@@ -3055,8 +4204,8 @@ cdef class VCFGenotypeACInt64Parser(VCFCallDataParserBase):
         kwargs['fill'] = 0
         super(VCFGenotypeACInt64Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
-        vcf_genotype_ac_parse(stream, context, self.memory)
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
+        vcf_genotype_ac_parse(stream, context, self.memory, self.counter)
 
     cdef int malloc_chunk(self) except -1:
         shape = (self.chunk_length, self.n_samples_out, self.number)
@@ -3075,8 +4224,8 @@ cdef class VCFGenotypeACUInt8Parser(VCFCallDataParserBase):
         kwargs['fill'] = 0
         super(VCFGenotypeACUInt8Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
-        vcf_genotype_ac_parse(stream, context, self.memory)
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
+        vcf_genotype_ac_parse(stream, context, self.memory, self.counter)
 
     cdef int malloc_chunk(self) except -1:
         shape = (self.chunk_length, self.n_samples_out, self.number)
@@ -3095,8 +4244,8 @@ cdef class VCFGenotypeACUInt16Parser(VCFCallDataParserBase):
         kwargs['fill'] = 0
         super(VCFGenotypeACUInt16Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
-        vcf_genotype_ac_parse(stream, context, self.memory)
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
+        vcf_genotype_ac_parse(stream, context, self.memory, self.counter)
 
     cdef int malloc_chunk(self) except -1:
         shape = (self.chunk_length, self.n_samples_out, self.number)
@@ -3115,8 +4264,8 @@ cdef class VCFGenotypeACUInt32Parser(VCFCallDataParserBase):
         kwargs['fill'] = 0
         super(VCFGenotypeACUInt32Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
-        vcf_genotype_ac_parse(stream, context, self.memory)
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
+        vcf_genotype_ac_parse(stream, context, self.memory, self.counter)
 
     cdef int malloc_chunk(self) except -1:
         shape = (self.chunk_length, self.n_samples_out, self.number)
@@ -3135,8 +4284,8 @@ cdef class VCFGenotypeACUInt64Parser(VCFCallDataParserBase):
         kwargs['fill'] = 0
         super(VCFGenotypeACUInt64Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
-        vcf_genotype_ac_parse(stream, context, self.memory)
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
+        vcf_genotype_ac_parse(stream, context, self.memory, self.counter)
 
     cdef int malloc_chunk(self) except -1:
         shape = (self.chunk_length, self.n_samples_out, self.number)
@@ -3147,14 +4296,18 @@ cdef class VCFGenotypeACUInt64Parser(VCFCallDataParserBase):
 
 cdef int vcf_genotype_ac_parse(InputStreamBase stream,
                                VCFContext context,
-                               integer[:, :, :] memory) except -1:  # nogil
+                               integer[:, :, :] memory,
+                               VCFAlleleCounter counter) nogil except -1:
+    cdef:
+        bint called = True
+
     # reset temporary buffer
     CharVector_clear(&context.temp)
 
     while True:
 
         if stream.c == SLASH or stream.c == PIPE:
-            vcf_genotype_ac_store(context, memory)
+            called &= vcf_genotype_ac_store(context, memory, counter)
             CharVector_clear(&context.temp)
 
         elif stream.c == COLON or \
@@ -3162,7 +4315,7 @@ cdef int vcf_genotype_ac_parse(InputStreamBase stream,
                 stream.c == LF or \
                 stream.c == CR or \
                 stream.c == 0:
-            vcf_genotype_ac_store(context, memory)
+            called &= vcf_genotype_ac_store(context, memory, counter)
             break
 
         else:
@@ -3170,19 +4323,29 @@ cdef int vcf_genotype_ac_parse(InputStreamBase stream,
 
         stream.advance()
 
+    if counter is not None and called:
+        counter.add_called(context.chunk_variant_index)
+
 
 cdef int vcf_genotype_ac_store(VCFContext context,
-                               integer[:, :, :] memory) except -1:  # nogil
+                               integer[:, :, :] memory,
+                               VCFAlleleCounter counter) nogil except -1:
+    """Count an allele, returning 1 if the allele was called, otherwise 0."""
     cdef:
         Py_ssize_t parsed
         long allele
 
     # attempt to parse allele
     parsed = vcf_strtol(&context.temp, context, &allele)
+    if parsed <= 0 or allele < 0:
+        return 0
 
     # store value
-    if parsed > 0 and allele < memory.shape[2]:
+    if allele < memory.shape[2]:
         memory[context.chunk_variant_index, context.sample_output_index, allele] += 1
+    if counter is not None:
+        counter.add_allele(context.chunk_variant_index, context.sample_output_index, allele)
+    return 1
 
 
 cdef class VCFCallDataInt8Parser(VCFCallDataParserBase):
@@ -3194,7 +4357,7 @@ cdef class VCFCallDataInt8Parser(VCFCallDataParserBase):
         kwargs.setdefault('fill', -1)
         super(VCFCallDataInt8Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         vcf_calldata_parse_integer(stream, context, self.memory)
 
     cdef int malloc_chunk(self) except -1:
@@ -3213,7 +4376,7 @@ cdef class VCFCallDataInt16Parser(VCFCallDataParserBase):
         kwargs.setdefault('fill', -1)
         super(VCFCallDataInt16Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         vcf_calldata_parse_integer(stream, context, self.memory)
 
     cdef int malloc_chunk(self) except -1:
@@ -3232,7 +4395,7 @@ cdef class VCFCallDataInt32Parser(VCFCallDataParserBase):
         kwargs.setdefault('fill', -1)
         super(VCFCallDataInt32Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         vcf_calldata_parse_integer(stream, context, self.memory)
 
     cdef int malloc_chunk(self) except -1:
@@ -3251,7 +4414,7 @@ cdef class VCFCallDataInt64Parser(VCFCallDataParserBase):
         kwargs.setdefault('fill', -1)
         super(VCFCallDataInt64Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         vcf_calldata_parse_integer(stream, context, self.memory)
 
     cdef int malloc_chunk(self) except -1:
@@ -3270,7 +4433,7 @@ cdef class VCFCallDataUInt8Parser(VCFCallDataParserBase):
         kwargs.setdefault('fill', IU8.max)
         super(VCFCallDataUInt8Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         vcf_calldata_parse_integer(stream, context, self.memory)
 
     cdef int malloc_chunk(self) except -1:
@@ -3289,7 +4452,7 @@ cdef class VCFCallDataUInt16Parser(VCFCallDataParserBase):
         kwargs.setdefault('fill', IU16.max)
         super(VCFCallDataUInt16Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         vcf_calldata_parse_integer(stream, context, self.memory)
 
     cdef int malloc_chunk(self) except -1:
@@ -3308,7 +4471,7 @@ cdef class VCFCallDataUInt32Parser(VCFCallDataParserBase):
         kwargs.setdefault('fill', IU32.max)
         super(VCFCallDataUInt32Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         vcf_calldata_parse_integer(stream, context, self.memory)
 
     cdef int malloc_chunk(self) except -1:
@@ -3327,7 +4490,7 @@ cdef class VCFCallDataUInt64Parser(VCFCallDataParserBase):
         kwargs.setdefault('fill', IU64.max)
         super(VCFCallDataUInt64Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         vcf_calldata_parse_integer(stream, context, self.memory)
 
     cdef int malloc_chunk(self) except -1:
@@ -3346,7 +4509,7 @@ cdef class VCFCallDataFloat32Parser(VCFCallDataParserBase):
         kwargs.setdefault('fill', NAN)
         super(VCFCallDataFloat32Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         vcf_calldata_parse_floating(stream, context, self.memory)
 
     cdef int malloc_chunk(self) except -1:
@@ -3365,7 +4528,7 @@ cdef class VCFCallDataFloat64Parser(VCFCallDataParserBase):
         kwargs.setdefault('fill', NAN)
         super(VCFCallDataFloat64Parser, self).__init__(*args, **kwargs)
 
-    cdef int parse(self, InputStreamBase stream, VCFContext context) except -1:  # nogil
+    cdef int parse(self, InputStreamBase stream, VCFContext context) nogil except -1:
         vcf_calldata_parse_floating(stream, context, self.memory)
 
     cdef int malloc_chunk(self) except -1:
@@ -3377,100 +4540,46 @@ cdef class VCFCallDataFloat64Parser(VCFCallDataParserBase):
 
 cdef int vcf_calldata_parse_integer(InputStreamBase stream,
                                     VCFContext context,
-                                    integer[:, :, :] memory) except -1:  # nogil
+                                    integer[:, :, :] memory) nogil except -1:
 
     cdef:
         Py_ssize_t value_index = 0
-
-    # reset temporary buffer
-    CharVector_clear(&context.temp)
+        long value
 
     while True:
 
+        if vcf_read_integer(stream, context, &context.temp, COLON, &value) > 0 \
+                and value_index < memory.shape[2]:
+            memory[context.chunk_variant_index, context.sample_output_index, value_index] = value
+
         if stream.c == COMMA:
-            vcf_calldata_store_integer(context, value_index, memory)
-            CharVector_clear(&context.temp)
             value_index += 1
-
-        elif stream.c == COLON or \
-                stream.c == TAB or \
-                stream.c == LF or \
-                stream.c == CR or \
-                stream.c == 0:
-            vcf_calldata_store_integer(context, value_index, memory)
-            break
+            stream.advance()
 
         else:
-            CharVector_append(&context.temp, stream.c)
-
-        stream.advance()
-
-
-cdef int vcf_calldata_store_integer(VCFContext context,
-                                    Py_ssize_t value_index,
-                                    integer[:, :, :] memory) except -1:  # nogil
-    cdef:
-        Py_ssize_t parsed
-        long value
-
-    if value_index >= memory.shape[2]:
-        # more values than we have room for, ignore
-        return 0
-
-    parsed = vcf_strtol(&context.temp, context, &value)
-
-    # store value
-    if parsed > 0:
-        memory[context.chunk_variant_index, context.sample_output_index, value_index] = value
+            break
 
 
 cdef int vcf_calldata_parse_floating(InputStreamBase stream,
                                      VCFContext context,
-                                     floating[:, :, :] memory) except -1:  # nogil
+                                     floating[:, :, :] memory) nogil except -1:
 
     cdef:
         Py_ssize_t value_index = 0
-
-    # reset temporary buffer
-    CharVector_clear(&context.temp)
+        double value
 
     while True:
 
+        if vcf_read_floating(stream, context, &context.temp, COLON, &value) > 0 \
+                and value_index < memory.shape[2]:
+            memory[context.chunk_variant_index, context.sample_output_index, value_index] = value
+
         if stream.c == COMMA:
-            vcf_calldata_store_floating(context, value_index, memory)
-            CharVector_clear(&context.temp)
             value_index += 1
-
-        elif stream.c == COLON or \
-                stream.c == TAB or \
-                stream.c == LF or \
-                stream.c == CR or \
-                stream.c == 0:
-            vcf_calldata_store_floating(context, value_index, memory)
-            break
+            stream.advance()
 
         else:
-            CharVector_append(&context.temp, stream.c)
-
-        stream.advance()
-
-
-cdef int vcf_calldata_store_floating(VCFContext context,
-                                     Py_ssize_t value_index,
-                                     floating[:, :, :] memory) except -1:  # nogil
-    cdef:
-        Py_ssize_t parsed
-        double value
-
-    if value_index >= memory.shape[2]:
-        # more values than we have room for, ignore
-        return 0
-
-    parsed = vcf_strtod(&context.temp, context, &value)
-
-    # store value
-    if parsed > 0:
-        memory[context.chunk_variant_index, context.sample_output_index, value_index] = value
+            break
 
 
 cdef class VCFCallDataStringParser(VCFCallDataParserBase):
@@ -3483,7 +4592,7 @@ cdef class VCFCallDataStringParser(VCFCallDataParserBase):
 
     cdef int parse(self,
                    InputStreamBase stream,
-                   VCFContext context) except -1:  # nogil
+                   VCFContext context) nogil except -1:
         cdef:
             Py_ssize_t value_index = 0
             # index into memory view
@@ -3553,7 +4662,7 @@ cdef class VCFCallDataObjectParser(VCFCallDataParserBase):
 
     cdef int parse(self,
                    InputStreamBase stream,
-                   VCFContext context) except -1:  # nogil
+                   VCFContext context) nogil except -1:
         cdef:
             Py_ssize_t value_index = 0
 
@@ -3568,16 +4677,12 @@ cdef class VCFCallDataObjectParser(VCFCallDataParserBase):
                     stream.c == LF or \
                     stream.c == 0:
                 if value_index < self.number and context.temp.size > 0:
-                    # with gil:
-                    v = CharVector_to_pystr(&context.temp)
-                    self.values[context.chunk_variant_index, context.sample_output_index, value_index] = v
+                    self.store_object(context, value_index)
                 break
 
             elif stream.c == COMMA:
                 if value_index < self.number and context.temp.size > 0:
-                    # with gil:
-                    v = CharVector_to_pystr(&context.temp)
-                    self.values[context.chunk_variant_index, context.sample_output_index, value_index] = v
+                    self.store_object(context, value_index)
                 CharVector_clear(&context.temp)
                 # advance value index
                 value_index += 1
@@ -3588,6 +4693,12 @@ cdef class VCFCallDataObjectParser(VCFCallDataParserBase):
             # advance input stream
             stream.advance()
 
+    cdef int store_object(self, VCFContext context, Py_ssize_t value_index) nogil except -1:
+        with gil:
+            v = CharVector_to_pystr(&context.temp)
+            self.values[context.chunk_variant_index, context.sample_output_index,
+                        value_index] = v
+
     cdef int malloc_chunk(self) except -1:
         shape = (self.chunk_length, self.n_samples_out, self.number)
         self.values = np.empty(shape, dtype=self.dtype)
@@ -3605,7 +4716,149 @@ cdef class VCFCallDataObjectParser(VCFCallDataParserBase):
 # Low-level VCF value parsing functions
 
 
-cdef Py_ssize_t vcf_strtol(CharVector* value, VCFContext context, long* l) except -1:  # nogil
+# maximum number of digits accumulated when reading numbers directly from the stream,
+# N.B., beyond this the value may not be exact, so defer to the C library
+DEF MAX_INTEGER_DIGITS = 18
+DEF MAX_FLOATING_DIGITS = 15
+
+
+# exact powers of ten
+cdef double POW10[MAX_FLOATING_DIGITS + 1]
+for _i in range(MAX_FLOATING_DIGITS + 1):
+    POW10[_i] = 10.0 ** _i
+
+
+cdef inline bint is_value_end(char c, char delim) nogil:
+    return c == COMMA or c == delim or c == TAB or c == LF or c == CR or c == 0
+
+
+cdef inline void vcf_append_digits(CharVector* dest, unsigned long long v,
+                                   Py_ssize_t n_digits) nogil:
+    # append exactly n_digits digits, zero padded
+    cdef Py_ssize_t i
+    for i in range(n_digits):
+        CharVector_append(dest, ZERO)
+    i = dest.size - 1
+    while v > 0:
+        dest.data[i] = ZERO + <char> (v % 10)
+        v = v // 10
+        i -= 1
+
+
+cdef inline void vcf_read_value_into(InputStreamBase stream, CharVector* dest,
+                                     char delim) nogil:
+    while not is_value_end(stream.c, delim):
+        CharVector_append(dest, stream.c)
+        stream.advance()
+
+
+cdef Py_ssize_t vcf_read_integer(InputStreamBase stream,
+                                 VCFContext context,
+                                 CharVector* temp,
+                                 char delim,
+                                 long* value) nogil except -1:
+    """Read an integer value directly from the stream, up to the next comma or `delim`.
+    Returns a positive number if a value was read, else 0 if the value was missing. Values
+    which are not plain decimal integers are copied to `temp` and parsed via strtol, so
+    results (and warnings) are the same as parsing every value via strtol."""
+    cdef:
+        unsigned long long v = 0
+        Py_ssize_t n_digits = 0
+        char sign = 0
+
+    if stream.c == MINUS or stream.c == PLUS:
+        sign = stream.c
+        stream.advance()
+
+    while ZERO <= stream.c <= NINE and n_digits < MAX_INTEGER_DIGITS:
+        v = v * 10 + (stream.c - ZERO)
+        n_digits += 1
+        stream.advance()
+
+    if is_value_end(stream.c, delim):
+        if n_digits > 0:
+            value[0] = -<long> v if sign == MINUS else <long> v
+            return n_digits
+        if sign == 0:
+            # not strictly kosher, treat as missing value
+            return 0
+
+    elif stream.c == PERIOD and n_digits == 0 and sign == 0:
+        stream.advance()
+        if is_value_end(stream.c, delim):
+            # explicit missing value
+            return 0
+        CharVector_clear(temp)
+        CharVector_append(temp, PERIOD)
+        vcf_read_value_into(stream, temp, delim)
+        return vcf_strtol(temp, context, value)
+
+    # anything else, copy what has been read so far and the rest of the value
+    CharVector_clear(temp)
+    if sign:
+        CharVector_append(temp, sign)
+    vcf_append_digits(temp, v, n_digits)
+    vcf_read_value_into(stream, temp, delim)
+    return vcf_strtol(temp, context, value)
+
+
+cdef Py_ssize_t vcf_read_floating(InputStreamBase stream,
+                                  VCFContext context,
+                                  CharVector* temp,
+                                  char delim,
+                                  double* value) nogil except -1:
+    """Read a floating point value directly from the stream, up to the next comma or
+    `delim`. Returns a positive number if a value was read, else 0 if the value was
+    missing. Only plain decimal values with few enough digits to be represented exactly
+    are converted here, as the quotient of two exact doubles is correctly rounded, the
+    same as strtod; anything else is copied to `temp` and parsed via strtod."""
+    cdef:
+        unsigned long long v = 0
+        Py_ssize_t n_int = 0
+        Py_ssize_t n_frac = 0
+        bint point = False
+        char sign = 0
+
+    if stream.c == MINUS or stream.c == PLUS:
+        sign = stream.c
+        stream.advance()
+
+    while ZERO <= stream.c <= NINE and n_int < MAX_FLOATING_DIGITS:
+        v = v * 10 + (stream.c - ZERO)
+        n_int += 1
+        stream.advance()
+
+    if stream.c == PERIOD:
+        point = True
+        stream.advance()
+        while ZERO <= stream.c <= NINE and n_int + n_frac < MAX_FLOATING_DIGITS:
+            v = v * 10 + (stream.c - ZERO)
+            n_frac += 1
+            stream.advance()
+
+    if is_value_end(stream.c, delim):
+        if n_int + n_frac > 0:
+            value[0] = <double> v / POW10[n_frac]
+            if sign == MINUS:
+                value[0] = -value[0]
+            return n_int + n_frac
+        if sign == 0:
+            # empty (not strictly kosher) or explicit missing value
+            return 0
+
+    # anything else, copy what has been read so far and the rest of the value
+    CharVector_clear(temp)
+    if sign:
+        CharVector_append(temp, sign)
+    vcf_append_digits(temp, v // <unsigned long long> POW10[n_frac], n_int)
+    if point:
+        CharVector_append(temp, PERIOD)
+        vcf_append_digits(temp, v % <unsigned long long> POW10[n_frac], n_frac)
+    vcf_read_value_into(stream, temp, delim)
+    return vcf_strtod(temp, context, value)
+
+
+cdef Py_ssize_t vcf_strtol(CharVector* value, VCFContext context, long* l) nogil except -1:
     cdef:
         char* str_end
         Py_ssize_t parsed
@@ -3632,17 +4885,15 @@ cdef Py_ssize_t vcf_strtol(CharVector* value, VCFContext context, long* l) excep
         return parsed
 
     elif parsed > 0:
-        # with gil:
         warn('not all characters parsed for integer value', context)
         return parsed
 
     else:
-        # with gil:
         warn('error parsing integer value', context)
         return 0
 
 
-cdef Py_ssize_t vcf_strtod(CharVector* value, VCFContext context, double* d) except -1:  # nogil
+cdef Py_ssize_t vcf_strtod(CharVector* value, VCFContext context, double* d) nogil except -1:
     cdef:
         char* str_end
         Py_ssize_t parsed
@@ -3669,239 +4920,1791 @@ cdef Py_ssize_t vcf_strtod(CharVector* value, VCFContext context, double* d) exc
         return parsed
 
     elif parsed > 0:
-        # with gil:
         warn('not all characters parsed for floating point value', context)
         return parsed
 
     else:
-        # with gil:
         warn('error parsing floating point value', context)
         return 0
 
 
 ##########################################################################################
-# LOGGING
+# Variant filtering
+
+
+cdef enum VCFFilterOp:
+    FILTER_CONST = 0,
+    FILTER_FIELD = 1,
+    FILTER_STR_EQ = 2,
+    FILTER_STR_NE = 3,
+    FILTER_ADD = 4,
+    FILTER_SUB = 5,
+    FILTER_MUL = 6,
+    FILTER_DIV = 7,
+    FILTER_LT = 8,
+    FILTER_LE = 9,
+    FILTER_GT = 10,
+    FILTER_GE = 11,
+    FILTER_EQ = 12,
+    FILTER_NE = 13,
+    FILTER_AND = 14,
+    FILTER_OR = 15,
+    FILTER_NEG = 16,
+    FILTER_NOT = 17
+
+
+# maximum depth of the stack used to evaluate a filter program
+DEF FILTER_MAX_STACK = 64
+
+
+vcf_filter_ops = {
+    'const': FILTER_CONST,
+    'field': FILTER_FIELD,
+    'str_eq': FILTER_STR_EQ,
+    'str_ne': FILTER_STR_NE,
+    'add': FILTER_ADD,
+    'sub': FILTER_SUB,
+    'mul': FILTER_MUL,
+    'div': FILTER_DIV,
+    'lt': FILTER_LT,
+    'le': FILTER_LE,
+    'gt': FILTER_GT,
+    'ge': FILTER_GE,
+    'eq': FILTER_EQ,
+    'ne': FILTER_NE,
+    'and': FILTER_AND,
+    'or': FILTER_OR,
+    'neg': FILTER_NEG,
+    'not': FILTER_NOT,
+}
+
+
+vcf_filter_types = {'b1': 0, 'i1': 1, 'i2': 2, 'i4': 3, 'i8': 4, 'u1': 5, 'u2': 6,
+                    'u4': 7, 'u8': 8, 'f4': 9, 'f8': 10}
+
+
+cdef struct VCFFilterInstruction:
+    int op
+    double value
+    # index into the list of fields and column within the field array
+    Py_ssize_t field
+    Py_ssize_t col
+    # bound to the arrays for the current chunk
+    char* data
+    Py_ssize_t stride
+    Py_ssize_t itemsize
+    int type
+    bint is_object
+    # string constant
+    char* text
+    Py_ssize_t text_len
 
 
-vcf_state_labels = [
-    'CHROM',
-    'POS',
-    'ID',
-    'REF',
-    'ALT',
-    'QUAL',
-    'FILTER',
-    'INFO',
-    'FORMAT',
-    'CALLDATA',
-    'EOL',
-    'EOF'
-]
+cdef struct VCFFilterResetTarget:
+    char* data
+    Py_ssize_t stride
+    Py_ssize_t size
+    char* fill
+    Py_ssize_t n_objects
 
 
-cdef int warn(message, VCFContext context) except -1:
-    cdef Py_ssize_t format_index
-    message += '; field: %s' % vcf_state_labels[context.state]
-    message += '; variant: %s' % context.variant_index
-    if context.state > VCFState.POS:
-        chrom = CharVector_to_pybytes(&context.chrom)
-        if not PY2:
-            chrom = str(chrom, 'utf8')
-        message += ' (%s:%s)' % (chrom, context.pos)
-    if context.state == VCFState.CALLDATA:
-        if context.sample_index >= len(context.headers.samples):
-            sample = 'unknown'
-        else:
-            sample = context.headers.samples[context.sample_index]
-        if context.sample_field_index >= context.variant_format_indices.size:
-            format = 'unknown'
-        else:
-            format_index = context.variant_format_indices.data[context.sample_field_index]
-            format = context.formats[format_index]
-        message += '; sample: %s:%s (%s:%s)' % (context.sample_index,
-                                                context.sample_field_index,
-                                                sample,
-                                                format)
-    warnings.warn(message)
+cdef class VCFVariantFilter:
+    """Evaluate a filter program against the variant-level values stored for each
+    variant, and reset values for rejected variants. The program is a list of tuples
+    describing instructions for a stack machine, see `_compile_filter_expression` in
+    allel.io.vcf_read."""
 
+    cdef:
+        VCFFilterInstruction* program
+        Py_ssize_t n_instructions
+        VCFFilterResetTarget* targets
+        Py_ssize_t n_targets
+        list fields
+        dict constants
+        list fills
+
+    def __cinit__(self, program, fields):
+        cdef VCFFilterInstruction* ins
+        self.n_instructions = len(program)
+        self.program = <VCFFilterInstruction*> malloc(
+            max(1, self.n_instructions) * sizeof(VCFFilterInstruction))
+        self.targets = NULL
+        self.n_targets = 0
+        self.fields = list(fields)
+        self.constants = dict()
+        self.fills = list()
+        for i, instruction in enumerate(program):
+            ins = &self.program[i]
+            ins.op = vcf_filter_ops[instruction[0]]
+            ins.value = 0
+            ins.field = -1
+            ins.col = 0
+            ins.data = NULL
+            ins.text = NULL
+            ins.text_len = 0
+            if ins.op == FILTER_CONST:
+                ins.value = instruction[1]
+            elif ins.op == FILTER_FIELD:
+                ins.field, ins.col = instruction[1:]
+            elif ins.op == FILTER_STR_EQ or ins.op == FILTER_STR_NE:
+                ins.field, ins.col, text = instruction[1:]
+                # N.B., keep the text as stored in object arrays, as well as encoded
+                text = text.encode('utf8')
+                self.constants[i] = (text if PY2 else str(text, 'utf8'), text)
+                ins.text = PyBytes_AS_STRING(text)
+                ins.text_len = len(text)
 
-# import sys
-#
-#
-# cdef int debug(message, vars=None) except -1:
-#     message = '[DEBUG] ' + str(message)
-#     if vars:
-#         message = message % vars
-#     print(message, file=sys.stderr)
-#     sys.stderr.flush()
+    def __dealloc__(self):
+        free(self.program)
+        free(self.targets)
 
+    cdef int bind(self, dict chunk) except -1:
+        """Bind the program to the arrays for the current chunk."""
+        cdef:
+            VCFFilterInstruction* ins
+            VCFFilterResetTarget* target
+            Py_ssize_t i
 
-##########################################################################################
-# EXPERIMENTAL support for multi-threaded parsing
-# N.B., this is not used for the moment, because use of object dtype for strings
-# requires GIL acquisition, and this may hurt performance in a single-threaded
-# context. I'm not completely certain that is the case, but I am out of time to
-# explore further.
+        for i in range(self.n_instructions):
+            ins = &self.program[i]
+            if ins.field < 0:
+                continue
+            field = self.fields[ins.field]
+            a = chunk[field]
+            if a.ndim > 2:
+                raise ValueError('field %r not supported in filter expression' % field)
+            elif a.ndim == 2:
+                if ins.col < 0:
+                    raise ValueError('field %r has multiple values, must be indexed in '
+                                     'filter expression, e.g., %s[0]'
+                                     % (field, field[9:]))
+                if ins.col >= a.shape[1]:
+                    raise ValueError('index %s out of range for field %r in filter '
+                                     'expression' % (ins.col, field))
+                offset = ins.col * a.strides[1]
+            elif ins.col > 0:
+                raise ValueError('index %s out of range for field %r in filter '
+                                 'expression' % (ins.col, field))
+            else:
+                offset = 0
+            ins.data = (<char*> <size_t> a.ctypes.data) + <Py_ssize_t> offset
+            ins.stride = a.strides[0]
+            ins.itemsize = a.dtype.itemsize
+            ins.is_object = a.dtype.kind == 'O'
+            if ins.op == FILTER_FIELD:
+                if a.dtype.kind in 'SO':
+                    raise ValueError('string field %r can only be compared for equality '
+                                     'with a string in filter expression' % field)
+                ins.type = vcf_filter_types[a.dtype.str[1:]]
+            elif a.dtype.kind not in 'SO':
+                raise ValueError('numeric field %r cannot be compared with a string in '
+                                 'filter expression' % field)
+
+        # all variants fields are reset if a variant is rejected, N.B., strings stored as
+        # offsets are discarded by the parser instead
+        keys = sorted(k for k in chunk
+                      if k.startswith('variants/') and isinstance(chunk[k], np.ndarray))
+        if self.targets is NULL:
+            self.n_targets = len(keys)
+            self.targets = <VCFFilterResetTarget*> malloc(
+                max(1, self.n_targets) * sizeof(VCFFilterResetTarget))
+        self.fills = list()
+        for i, k in enumerate(keys):
+            target = &self.targets[i]
+            a = chunk[k]
+            # N.B., arrays have only just been allocated, so first row holds fill values
+            fill = np.array(a[:1], copy=True, order='C')
+            if not a[:1].flags.c_contiguous:
+                raise RuntimeError('unexpected memory layout for field %r' % k)
+            self.fills.append(fill)
+            target.data = <char*> <size_t> a.ctypes.data
+            target.stride = a.strides[0]
+            target.size = fill.nbytes
+            target.fill = <char*> <size_t> fill.ctypes.data
+            target.n_objects = fill.size if a.dtype.kind == 'O' else 0
+
+    cdef int evaluate(self, Py_ssize_t row) nogil except -1:
+        """Evaluate the program for the variant stored at `row`, returning 1 if the
+        variant is accepted, else 0."""
+        cdef:
+            double stack[FILTER_MAX_STACK]
+            Py_ssize_t top = -1
+            Py_ssize_t i
+            VCFFilterInstruction* ins
+            double a, b
+            int eq
 
+        for i in range(self.n_instructions):
+            ins = &self.program[i]
 
-# import itertools
-# import time
-#
-#
-# cdef class VCFParallelParser:
-#
-#     cdef:
-#         FileInputStream stream
-#         CharVectorInputStream buffer
-#         VCFContext context
-#         VCFParser parser
-#         Py_ssize_t chunk_length
-#         Py_ssize_t block_length
-#         object pool
-#         object result
-#
-#     def __cinit__(self, stream, parser, chunk_length, block_length, pool, headers, fields):
-#         self.buffer = CharVectorInputStream(2**14)
-#         self.context = VCFContext(headers, fields)
-#         self.stream = stream
-#         self.parser = parser
-#         self.chunk_length = chunk_length
-#         self.block_length = block_length
-#         self.pool = pool
-#         self.result = None
-#
-#     def read(self, n_lines):
-#         self.buffer.clear()
-#         n_lines_read = self.stream.read_lines_into(&(self.buffer.vector), n_lines)
-#         self.buffer.advance()
-#         return n_lines_read
-#
-#     def parse_async(self, block_index, chunk_index):
-#         self.result = self.pool.apply_async(self.parse, args=(block_index, chunk_index))
-#
-#     def join(self):
-#         if self.result is not None:
-#             self.result.get()
-#
-#     def parse(self, block_index, chunk_index):
-#         before = time.time()
-#         # set initial state
-#         self.context.state = VCFState.CHROM
-#         self.context.chunk_variant_index = block_index * self.block_length - 1
-#         self.context.variant_index = (chunk_index * self.chunk_length +
-#                                       self.context.chunk_variant_index)
-#         # parse the block of data stored in the buffer
-#         self.parser.parse(self.buffer, self.context)
-#         after = time.time()
-#
-#
-# cdef class VCFParallelChunkIterator:
-#
-#     cdef:
-#         FileInputStream stream
-#         VCFParser parser
-#         object pool
-#         Py_ssize_t chunk_length
-#         Py_ssize_t block_length
-#         int n_threads
-#         int n_workers
-#         Py_ssize_t chunk_index
-#         list workers
-#
-#     def __cinit__(self,
-#                   FileInputStream stream,
-#                   Py_ssize_t chunk_length, Py_ssize_t block_length, int n_threads,
-#                   headers, fields, types, numbers, fills, region, loc_samples):
-#
-#         fields = sorted(fields)
-#         self.stream = stream
-#         self.chunk_length = chunk_length
-#         self.n_threads = n_threads
-#         self.pool = ThreadPool(n_threads)
-#         # allow one more worker than number of threads in pool to allow for sync
-#         # reading of data in the main thread
-#         self.n_workers = n_threads + 1
-#         # only makes sense to have block length at most fraction chunk length if we want
-#         # some parallelism
-#         self.block_length = min(block_length, chunk_length//self.n_workers)
-#         if self.block_length < 1:
-#             self.block_length = 1
-#         loc_samples = check_samples(loc_samples, headers)
-#         self.parser = VCFParser(
-#             fields=fields, types=types, numbers=numbers, chunk_length=chunk_length, loc_samples=loc_samples, fills=fills,
-#             region=region
-#         )
-#         self.chunk_index = -1
-#         self.workers = [VCFParallelParser(stream=stream, parser=self.parser, chunk_length=self.chunk_length,
-#                                           block_length=self.block_length, pool=self.pool, headers=headers,
-#                                           fields=fields)
-#                         for _ in range(self.n_workers)]
-#
-#     def __iter__(self):
-#         return self
-#
-#     def __next__(self):
-#         cdef:
-#             Py_ssize_t block_index = 0
-#             Py_ssize_t i = 0
-#             Py_ssize_t n_lines
-#             Py_ssize_t n_lines_read = 0
-#             VCFParallelParser worker
-#
-#         # increment the current chunk index
-#         self.chunk_index += 1
-#
-#         # allocate arrays for next chunk
-#         self.parser.malloc_chunk()
-#
-#         # cycle around the workers
-#         for i in itertools.cycle(list(range(self.n_workers))):
-#             worker = self.workers[i]
-#
-#             # wait for the result to finish - this ensures we don't overwrite a
-#             # worker's buffer while it's still parsing
-#             worker.join()
-#
-#             # read lines into the worker's buffer - this part has to be synchronous
-#             n_lines = min(self.block_length, self.chunk_length - n_lines_read)
-#             n_lines_read += worker.read(n_lines)
-#
-#             # launch parsing of the block in parallel
-#             worker.parse_async(block_index, self.chunk_index)
-#
-#             # increment the current block index
-#             block_index += 1
-#
-#             # is the chunk done?
-#             if n_lines_read >= self.chunk_length:
-#                 break
-#
-#             # is the input stream exhausted?
-#             if self.stream.c == 0:
-#                 break
-#
-#         # wait for all parallel tasks to complete
-#         for worker in self.workers:
-#             worker.join()
-#
-#         # obtain the final chunk length via the last worker
-#         worker = self.workers[i]
-#         chunk_length = worker.context.chunk_variant_index + 1
-#
-#         # obtain the chunk
-#         chunk = self.parser.make_chunk(chunk_length)
+            if ins.op == FILTER_CONST:
+                top += 1
+                stack[top] = ins.value
+
+            elif ins.op == FILTER_FIELD:
+                top += 1
+                stack[top] = vcf_filter_load(ins, row)
+
+            elif ins.op == FILTER_STR_EQ or ins.op == FILTER_STR_NE:
+                if ins.is_object:
+                    eq = self.object_equals(i, row)
+                else:
+                    eq = vcf_filter_string_equals(ins, row)
+                if ins.op == FILTER_STR_NE:
+                    eq = not eq
+                top += 1
+                stack[top] = eq
+
+            elif ins.op == FILTER_NEG:
+                stack[top] = -stack[top]
+
+            elif ins.op == FILTER_NOT:
+                stack[top] = stack[top] == 0
+
+            else:
+                b = stack[top]
+                top -= 1
+                a = stack[top]
+                if ins.op == FILTER_ADD:
+                    stack[top] = a + b
+                elif ins.op == FILTER_SUB:
+                    stack[top] = a - b
+                elif ins.op == FILTER_MUL:
+                    stack[top] = a * b
+                elif ins.op == FILTER_DIV:
+                    stack[top] = a / b if b != 0 else NAN
+                elif ins.op == FILTER_LT:
+                    stack[top] = a < b
+                elif ins.op == FILTER_LE:
+                    stack[top] = a <= b
+                elif ins.op == FILTER_GT:
+                    stack[top] = a > b
+                elif ins.op == FILTER_GE:
+                    stack[top] = a >= b
+                elif ins.op == FILTER_EQ:
+                    stack[top] = a == b
+                elif ins.op == FILTER_NE:
+                    stack[top] = a != b
+                elif ins.op == FILTER_AND:
+                    stack[top] = a != 0 and b != 0
+                elif ins.op == FILTER_OR:
+                    stack[top] = a != 0 or b != 0
+
+        return top >= 0 and stack[top] != 0
+
+    cdef int object_equals(self, Py_ssize_t i, Py_ssize_t row) nogil except -1:
+        cdef VCFFilterInstruction* ins = &self.program[i]
+        with gil:
+            value = <object> (<PyObject**> (ins.data + row * ins.stride))[0]
+            return value == self.constants[i][0]
+
+    cdef int reset(self, Py_ssize_t row) nogil except -1:
+        """Reset all variants fields for the variant stored at `row` to fill values."""
+        cdef:
+            Py_ssize_t i
+            VCFFilterResetTarget* target
+        for i in range(self.n_targets):
+            target = &self.targets[i]
+            if target.n_objects > 0:
+                self.reset_objects(target, row)
+            else:
+                memcpy(target.data + row * target.stride, target.fill, target.size)
+
+    cdef int reset_objects(self, VCFFilterResetTarget* target,
+                           Py_ssize_t row) nogil except -1:
+        cdef:
+            Py_ssize_t j
+            PyObject** dest = <PyObject**> (target.data + row * target.stride)
+            PyObject** fill = <PyObject**> target.fill
+        with gil:
+            for j in range(target.n_objects):
+                Py_XINCREF(fill[j])
+                Py_XDECREF(dest[j])
+                dest[j] = fill[j]
+
+
+cdef inline double vcf_filter_load(VCFFilterInstruction* ins, Py_ssize_t row) nogil:
+    cdef char* p = ins.data + row * ins.stride
+    if ins.type == 0:
+        return (<np.uint8_t*> p)[0] != 0
+    elif ins.type == 1:
+        return (<np.int8_t*> p)[0]
+    elif ins.type == 2:
+        return (<np.int16_t*> p)[0]
+    elif ins.type == 3:
+        return (<np.int32_t*> p)[0]
+    elif ins.type == 4:
+        return (<np.int64_t*> p)[0]
+    elif ins.type == 5:
+        return (<np.uint8_t*> p)[0]
+    elif ins.type == 6:
+        return (<np.uint16_t*> p)[0]
+    elif ins.type == 7:
+        return (<np.uint32_t*> p)[0]
+    elif ins.type == 8:
+        return (<np.uint64_t*> p)[0]
+    elif ins.type == 9:
+        return (<np.float32_t*> p)[0]
+    else:
+        return (<np.float64_t*> p)[0]
+
+
+cdef inline int vcf_filter_string_equals(VCFFilterInstruction* ins, Py_ssize_t row) nogil:
+    # N.B., fixed length strings are padded with null bytes
+    cdef char* p = ins.data + row * ins.stride
+    if ins.text_len > ins.itemsize:
+        return 0
+    if memcmp(p, ins.text, ins.text_len) != 0:
+        return 0
+    return ins.text_len == ins.itemsize or p[ins.text_len] == 0
+
+
+##########################################################################################
+# Scanning
+
+
+cdef class VCFSizeScanner:
+    """Scan VCF data without storing any values, measuring the maximum number of
+    alternate alleles and the maximum length of any single value within the CHROM, ID,
+    REF and ALT fields and within selected INFO and FORMAT fields. Header lines are
+    skipped. Used to size output arrays before parsing."""
+
+    cdef:
+        tuple info_keys
+        char** info_keys_cstr
+        Py_ssize_t n_infos
+        Py_ssize_t* info_lengths
+        tuple format_keys
+        char** format_keys_cstr
+        Py_ssize_t n_formats
+        Py_ssize_t* format_lengths
+        IntVector format_indices
+        CharVector key
+        public Py_ssize_t n_variants
+        public Py_ssize_t max_n_alt
+        public Py_ssize_t chrom_length
+        public Py_ssize_t id_length
+        public Py_ssize_t ref_length
+        public Py_ssize_t alt_length
+
+    def __cinit__(self, info_keys=(), format_keys=()):
+        # N.B., need to keep a reference to keys, otherwise C strings will not behave
+        self.info_keys = tuple(sorted(info_keys))
+        self.n_infos = len(self.info_keys)
+        self.info_keys_cstr = <char**> malloc(sizeof(char*) * max(1, self.n_infos))
+        self.info_lengths = <Py_ssize_t*> malloc(sizeof(Py_ssize_t) * max(1, self.n_infos))
+        for i in range(self.n_infos):
+            self.info_keys_cstr[i] = <char*> self.info_keys[i]
+            self.info_lengths[i] = 0
+        self.format_keys = tuple(sorted(format_keys))
+        self.n_formats = len(self.format_keys)
+        self.format_keys_cstr = <char**> malloc(sizeof(char*) * max(1, self.n_formats))
+        self.format_lengths = <Py_ssize_t*> malloc(sizeof(Py_ssize_t) *
+                                                   max(1, self.n_formats))
+        for i in range(self.n_formats):
+            self.format_keys_cstr[i] = <char*> self.format_keys[i]
+            self.format_lengths[i] = 0
+        IntVector_init(&self.format_indices, 2**6)
+        CharVector_init(&self.key, 2**6)
+        self.n_variants = 0
+        self.max_n_alt = 0
+        self.chrom_length = 0
+        self.id_length = 0
+        self.ref_length = 0
+        self.alt_length = 0
+
+    def __dealloc__(self):
+        free(self.info_keys_cstr)
+        free(self.info_lengths)
+        free(self.format_keys_cstr)
+        free(self.format_lengths)
+        IntVector_free(&self.format_indices)
+        CharVector_free(&self.key)
+
+    def scan(self, InputStreamBase stream):
+        """Scan all remaining lines in `stream`, releasing the GIL."""
+        with nogil:
+            self._scan(stream)
+
+    def update(self, VCFSizeScanner other):
+        """Combine results from another scanner with the same keys."""
+        self.n_variants += other.n_variants
+        self.max_n_alt = max(self.max_n_alt, other.max_n_alt)
+        self.chrom_length = max(self.chrom_length, other.chrom_length)
+        self.id_length = max(self.id_length, other.id_length)
+        self.ref_length = max(self.ref_length, other.ref_length)
+        self.alt_length = max(self.alt_length, other.alt_length)
+        for i in range(self.n_infos):
+            self.info_lengths[i] = max(self.info_lengths[i], other.info_lengths[i])
+        for i in range(self.n_formats):
+            self.format_lengths[i] = max(self.format_lengths[i], other.format_lengths[i])
+
+    @property
+    def lengths(self):
+        """Dictionary mapping field names to the maximum length of any single value."""
+        lengths = {
+            'variants/CHROM': self.chrom_length,
+            'variants/ID': self.id_length,
+            'variants/REF': self.ref_length,
+            'variants/ALT': self.alt_length,
+        }
+        for i, k in enumerate(self.info_keys):
+            lengths['variants/' + text_type(k, 'utf8')] = self.info_lengths[i]
+        for i, k in enumerate(self.format_keys):
+            lengths['calldata/' + text_type(k, 'utf8')] = self.format_lengths[i]
+        return lengths
+
+    cdef int _scan(self, InputStreamBase stream) nogil except -1:
+        cdef:
+            # index of current column
+            Py_ssize_t col = 0
+            # length of current value
+            Py_ssize_t n = 0
+            # number of values within the current ALT field
+            Py_ssize_t n_alt = 0
+            # index of the current INFO key, or -1 if not scanned
+            Py_ssize_t info_index = -1
+            # whether within the value part of an INFO key/value pair
+            bint info_value = False
+            # index of the current field within the current sample
+            Py_ssize_t sample_field_index = 0
+            char c
+            char prev = 0
+
+        while True:
+            c = stream.c
+
+            if col == 0 and n == 0 and c == HASH:
+                # skip header line
+                while stream.c != 0 and stream.c != LF:
+                    stream.advance()
+                if stream.c == 0:
+                    break
+                stream.advance()
+                continue
+
+            if c == 0 or c == LF or c == CR or c == TAB:
+
+                # end of field
+                if col == 0:
+                    self.chrom_length = max(self.chrom_length, n)
+                elif col == 2:
+                    self.id_length = max(self.id_length, n)
+                elif col == 3:
+                    self.ref_length = max(self.ref_length, n)
+                elif col == 4:
+                    self.alt_length = max(self.alt_length, n)
+                    if n_alt > 0 or not (n == 1 and prev == PERIOD):
+                        # N.B., a single missing value means no alternate alleles
+                        n_alt += 1
+                    self.max_n_alt = max(self.max_n_alt, n_alt)
+                elif col == 7:
+                    if info_index >= 0 and info_value:
+                        self.info_lengths[info_index] = max(self.info_lengths[info_index], n)
+                elif col == 8:
+                    self._add_format_key()
+                elif col > 8:
+                    self._end_sample_value(sample_field_index, n)
+
+                if c == TAB:
+                    col += 1
+                    n = 0
+                    info_index = -1
+                    info_value = False
+                    sample_field_index = 0
+                    CharVector_clear(&self.key)
+                    stream.advance()
+                    continue
+
+                # end of line
+                if col > 0 or n > 0:
+                    self.n_variants += 1
+                if c == 0:
+                    break
+                col = 0
+                n = 0
+                n_alt = 0
+                info_index = -1
+                info_value = False
+                IntVector_clear(&self.format_indices)
+                CharVector_clear(&self.key)
+                stream.advance()
+                continue
+
+            if col == 4 and c == COMMA:
+                self.alt_length = max(self.alt_length, n)
+                n_alt += 1
+                n = 0
+
+            elif col == 7:
+                if c == SEMICOLON:
+                    if info_index >= 0 and info_value:
+                        self.info_lengths[info_index] = max(self.info_lengths[info_index], n)
+                    CharVector_clear(&self.key)
+                    info_index = -1
+                    info_value = False
+                    n = 0
+                elif info_value:
+                    if c == COMMA:
+                        if info_index >= 0:
+                            self.info_lengths[info_index] = max(self.info_lengths[info_index],
+                                                                n)
+                        n = 0
+                    else:
+                        n += 1
+                elif c == EQUALS:
+                    CharVector_terminate(&self.key)
+                    info_index = search_sorted_cstr(self.key.data, self.info_keys_cstr,
+                                                    self.n_infos)
+                    info_value = True
+                    n = 0
+                else:
+                    CharVector_append(&self.key, c)
+
+            elif col == 8:
+                if c == COLON:
+                    self._add_format_key()
+                else:
+                    CharVector_append(&self.key, c)
+
+            elif col > 8 and (c == COLON or c == COMMA):
+                self._end_sample_value(sample_field_index, n)
+                if c == COLON:
+                    sample_field_index += 1
+                n = 0
+
+            else:
+                n += 1
+
+            prev = c
+            stream.advance()
+
+    cdef int _add_format_key(self) nogil except -1:
+        cdef Py_ssize_t format_index
+        CharVector_terminate(&self.key)
+        format_index = search_sorted_cstr(self.key.data, self.format_keys_cstr,
+                                          self.n_formats)
+        IntVector_append(&self.format_indices, format_index)
+        CharVector_clear(&self.key)
+
+    cdef int _end_sample_value(self, Py_ssize_t sample_field_index,
+                               Py_ssize_t n) nogil except -1:
+        cdef Py_ssize_t format_index
+        if sample_field_index < self.format_indices.size:
+            format_index = self.format_indices.data[sample_field_index]
+            if format_index >= 0:
+                self.format_lengths[format_index] = max(self.format_lengths[format_index], n)
+
+
+##########################################################################################
+# LOGGING
+
+
+vcf_state_labels = [
+    'CHROM',
+    'POS',
+    'ID',
+    'REF',
+    'ALT',
+    'QUAL',
+    'FILTER',
+    'INFO',
+    'FORMAT',
+    'CALLDATA',
+    'EOL',
+    'EOF'
+]
+
+
+cdef int warn(char* message, VCFContext context) nogil except -1:
+    with gil:
+        _warn(text_type(message, 'utf8'), context)
+
+
+cdef int _warn(message, VCFContext context) except -1:
+    cdef Py_ssize_t format_index
+    message += '; field: %s' % vcf_state_labels[context.state]
+    message += '; variant: %s' % context.variant_index
+    if context.state > VCFState.POS:
+        chrom = CharVector_to_pybytes(&context.chrom)
+        if not PY2:
+            chrom = str(chrom, 'utf8')
+        message += ' (%s:%s)' % (chrom, context.pos)
+    if context.state == VCFState.CALLDATA:
+        if context.sample_index >= len(context.headers.samples):
+            sample = 'unknown'
+        else:
+            sample = context.headers.samples[context.sample_index]
+        if context.sample_field_index >= context.variant_format_indices.size:
+            format = 'unknown'
+        else:
+            format_index = context.variant_format_indices.data[context.sample_field_index]
+            format = context.formats[format_index]
+        message += '; sample: %s:%s (%s:%s)' % (context.sample_index,
+                                                context.sample_field_index,
+                                                sample,
+                                                format)
+    warnings.warn(message)
+
+
+# import sys
 #
-#         if chunk is None:
-#             # clean up thread pool
-#             self.pool.close()
-#             self.pool.join()
-#             self.pool.terminate()
-#             raise StopIteration
 #
-#         else:
-#             chrom = CharVector_to_pybytes(&worker.context.chrom)
-#             pos = worker.context.pos
-#             return chunk, chunk_length, chrom, pos
+# cdef int debug(message, vars=None) except -1:
+#     message = '[DEBUG] ' + str(message)
+#     if vars:
+#         message = message % vars
+#     print(message, file=sys.stderr)
+#     sys.stderr.flush()
+
+
+##########################################################################################
+# Multi-threaded parsing
+
+
+cdef class VCFParallelParser:
+    """Worker which parses a block of lines read from the input stream. Each worker
+    has its own buffer and parsing context, so blocks can be parsed concurrently, with
+    results written into disjoint rows of the arrays for the current chunk."""
+
+    cdef:
+        FileInputStream stream
+        CharVectorInputStream buffer
+        VCFContext context
+        VCFParser parser
+        object pool
+        object result
+        Py_ssize_t block_start
+        Py_ssize_t n_lines
+
+    def __cinit__(self, stream, parser, pool, headers, fields):
+        self.buffer = CharVectorInputStream(2**14)
+        self.context = VCFContext(headers, fields)
+        self.stream = stream
+        self.parser = parser
+        self.pool = pool
+        self.result = None
+        self.block_start = 0
+        self.n_lines = 0
+
+    cdef Py_ssize_t read(self, Py_ssize_t block_start, Py_ssize_t n_lines,
+                         Py_ssize_t block_size) except -1:
+        """Read a block of lines from the input stream into the worker's buffer. This
+        has to be done synchronously, in the main thread."""
+        self.buffer.clear()
+        self.block_start = block_start
+        with nogil:
+            self.n_lines = self.stream.read_lines_into(&(self.buffer.vector), n_lines,
+                                                       block_size)
+        self.buffer.advance()
+        return self.n_lines
+
+    def parse_async(self, variant_index):
+        self.result = self.pool.apply_async(self.parse, args=(variant_index,))
+
+    def join(self):
+        """Wait for the current block to be parsed, returning a tuple of (block start,
+        number of lines, number of variants, chrom, pos), where chrom and pos are those of
+        the last variant stored, or None if no block was being parsed."""
+        result = self.result
+        self.result = None
+        if result is not None:
+            return result.get()
+
+    def parse(self, variant_index):
+        # set initial state, N.B., variants are stored from the row corresponding to the
+        # first line of the block
+        self.context.state = VCFState.CHROM
+        self.context.chunk_variant_index = self.block_start - 1
+        self.context.variant_row = self.block_start - 1
+        self.context.variant_index = variant_index + self.block_start - 1
+        self.context.filtered_variant_index = self.context.variant_index
+        # parse the block of data stored in the buffer, releasing the GIL so blocks are
+        # parsed in parallel
+        with nogil:
+            self.parser.parse(self.buffer, self.context)
+        n_variants = self.context.chunk_variant_index + 1 - self.block_start
+        # N.B., report the last variant stored, as later lines may have been skipped
+        chrom = CharVector_to_pybytes(&self.context.variant_chrom)
+        return self.block_start, self.n_lines, n_variants, chrom, self.context.variant_pos
+
+
+cdef class VCFParallelChunkIterator:
+    """Iterate over chunks of a VCF, parsing blocks of lines within each chunk
+    concurrently using a pool of threads. Produces the same chunks as VCFChunkIterator,
+    except that when variants are skipped (e.g., outside a region) a chunk may contain
+    fewer than `chunk_length` variants."""
+
+    cdef:
+        FileInputStream stream
+        VCFParser parser
+        object pool
+        Py_ssize_t chunk_length
+        Py_ssize_t block_length
+        Py_ssize_t block_size
+        int n_threads
+        int n_workers
+        Py_ssize_t variant_index
+        list workers
+
+    def __init__(self,
+                 FileInputStream stream,
+                 chunk_length,
+                 n_threads,
+                 headers,
+                 fields,
+                 types,
+                 numbers,
+                 fills,
+                 region,
+                 loc_samples,
+                 block_size=2**20,
+                 variant_filter=None,
+                 allele_counts=None,
+                 timing=False):
+
+        fields = sorted(fields)
+        self.stream = stream
+        self.chunk_length = chunk_length
+        self.n_threads = n_threads
+        self.pool = ThreadPool(n_threads)
+        # allow one more worker than number of threads in pool to allow for sync
+        # reading of data in the main thread
+        self.n_workers = n_threads + 1
+        # only makes sense to have block length at most fraction chunk length if we want
+        # some parallelism, also limit the size of each block to bound memory usage
+        self.block_length = max(1, chunk_length // self.n_workers)
+        self.block_size = block_size
+        loc_samples = check_samples(loc_samples, headers)
+        self.parser = VCFParser(fields=fields, types=types, numbers=numbers,
+                                chunk_length=chunk_length, loc_samples=loc_samples,
+                                fills=fills, region=region, variant_filter=variant_filter,
+                                allele_counts=allele_counts)
+        self.variant_index = 0
+        self.workers = [VCFParallelParser(stream=stream, parser=self.parser, pool=self.pool,
+                                          headers=headers, fields=fields)
+                        for _ in range(self.n_workers)]
+        if timing:
+            # N.B., each worker has its own context, so times are accumulated without
+            # contention
+            for worker in self.workers:
+                (<VCFParallelParser> worker).context.init_timing(self.parser.n_timings)
+
+    def __dealloc__(self):
+        if self.pool is not None:
+            self.pool.terminate()
+
+    def __iter__(self):
+        return self
+
+    def timings(self):
+        """Return a dict mapping parser states and fields to the cumulative time in
+        seconds spent parsing them by all threads, if timing is enabled."""
+        cdef VCFParallelParser worker
+        out = np.zeros(self.parser.n_timings, dtype='f8')
+        for worker in self.workers:
+            if worker.context.timing:
+                worker.context.add_timings(out)
+        return self.parser.timings_to_dict(out)
+
+    def __next__(self):
+        cdef:
+            Py_ssize_t i
+            Py_ssize_t n_lines
+            Py_ssize_t n_lines_read
+            Py_ssize_t chunk_length
+            VCFParallelParser worker
+
+        while True:
+
+            # allocate arrays for next chunk
+            self.parser.malloc_chunk()
+
+            blocks = list()
+            n_lines_read = 0
+            i = 0
+
+            # cycle around the workers
+            while n_lines_read < self.chunk_length and self.stream.c != 0:
+                worker = self.workers[i % self.n_workers]
+                i += 1
+
+                # wait for the worker to finish parsing its previous block - this ensures
+                # we don't overwrite a worker's buffer while it's still parsing
+                block = worker.join()
+                if block is not None:
+                    blocks.append(block)
+
+                # read lines into the worker's buffer - this part has to be synchronous
+                n_lines = min(self.block_length, self.chunk_length - n_lines_read)
+                n_lines_read += worker.read(n_lines_read, n_lines, self.block_size)
+
+                # launch parsing of the block in parallel
+                worker.parse_async(self.variant_index)
+
+            # wait for all parallel tasks to complete
+            for worker in self.workers:
+                block = worker.join()
+                if block is not None:
+                    blocks.append(block)
+
+            if n_lines_read == 0:
+                # input stream is exhausted, clean up thread pool
+                self.pool.close()
+                self.pool.join()
+                raise StopIteration
+
+            blocks.sort()
+            chunk_length = sum(b[2] for b in blocks)
+            if chunk_length == 0:
+                # all variants in this chunk were skipped, move on to the next
+                continue
+
+            chunk = self.parser.make_chunk(n_lines_read)
+            if chunk_length < n_lines_read:
+                # some lines were skipped, compact the chunk so variants are contiguous
+                index = np.concatenate([np.arange(b[0], b[0] + b[2]) for b in blocks])
+                chunk = {k: v[index] for k, v in chunk.items()}
+
+            self.variant_index += chunk_length
+            # N.B., report the end of the last block holding any variants, as variants at
+            # the end of later blocks were skipped
+            for block in blocks:
+                if block[2] > 0:
+                    _, _, _, chrom, pos = block
+            return chunk, chunk_length, chrom, pos
+
+
+##########################################################################################
+# BCF parsing
+
+
+# types of typed values within BCF records
+cdef enum BCFType:
+    BCF_NULL = 0,
+    BCF_INT8 = 1,
+    BCF_INT16 = 2,
+    BCF_INT32 = 3,
+    BCF_FLOAT = 5,
+    BCF_CHAR = 7
+
+
+# kinds of output array, N.B., numeric kinds have the same codes as vcf_filter_types
+cdef enum BCFOutputKind:
+    BCF_OUT_BOOL = 0,
+    BCF_OUT_INT8 = 1,
+    BCF_OUT_INT16 = 2,
+    BCF_OUT_INT32 = 3,
+    BCF_OUT_INT64 = 4,
+    BCF_OUT_UINT8 = 5,
+    BCF_OUT_UINT16 = 6,
+    BCF_OUT_UINT32 = 7,
+    BCF_OUT_UINT64 = 8,
+    BCF_OUT_FLOAT32 = 9,
+    BCF_OUT_FLOAT64 = 10,
+    BCF_OUT_STRING = 11,
+    BCF_OUT_OBJECT = 12
+
+
+# how values are decoded into the output array
+cdef enum BCFDecodeMode:
+    BCF_DECODE_VALUES = 0,
+    BCF_DECODE_FLAG = 1,
+    BCF_DECODE_GENOTYPE = 2,
+    BCF_DECODE_GENOTYPE_AC = 3,
+    BCF_DECODE_GENOTYPE_PACKED = 4,
+    BCF_DECODE_GENOTYPE_2BIT = 5
+
+
+# integer values are loaded as int32, with the missing and end-of-vector values of the
+# smaller integer types mapped to the int32 values
+DEF BCF_INT_MISSING = -2147483648
+DEF BCF_INT_EOV = -2147483647
+DEF BCF_FLOAT_MISSING = 0x7F800001
+DEF BCF_FLOAT_EOV = 0x7F800002
+
+
+cdef inline Py_ssize_t bcf_type_size(int type) nogil:
+    if type == BCF_INT8 or type == BCF_CHAR:
+        return 1
+    elif type == BCF_INT16:
+        return 2
+    elif type == BCF_INT32 or type == BCF_FLOAT:
+        return 4
+    elif type == BCF_NULL:
+        return 0
+    return -1
+
+
+cdef inline np.int32_t bcf_load_int(const char* p, int type) nogil:
+    cdef:
+        np.int8_t v8
+        np.int16_t v16
+        np.int32_t v32
+    if type == BCF_INT8:
+        v8 = (<np.int8_t*> p)[0]
+        if v8 == -128:
+            return BCF_INT_MISSING
+        elif v8 == -127:
+            return BCF_INT_EOV
+        return v8
+    elif type == BCF_INT16:
+        memcpy(&v16, p, 2)
+        if v16 == -32768:
+            return BCF_INT_MISSING
+        elif v16 == -32767:
+            return BCF_INT_EOV
+        return v16
+    memcpy(&v32, p, 4)
+    return v32
+
+
+cdef int bcf_error(char* message) nogil except -1:
+    with gil:
+        raise RuntimeError(text_type(message, 'utf8'))
+
+
+cdef inline const char* bcf_read_typed(const char* data, Py_ssize_t size, Py_ssize_t* offset,
+                                       int* type, Py_ssize_t* count,
+                                       Py_ssize_t n_items=1) nogil except NULL:
+    """Read the descriptor of a typed value at `offset` within `data`, returning a
+    pointer to the values and advancing `offset` beyond the values, assuming `n_items`
+    vectors of values follow the descriptor, e.g., one per sample."""
+    cdef:
+        const char* values
+        int count_type
+        Py_ssize_t type_size
+
+    if offset[0] >= size:
+        bcf_error('BCF record is truncated')
+    type[0] = data[offset[0]] & 0x0F
+    count[0] = (<unsigned char> data[offset[0]]) >> 4
+    offset[0] += 1
+
+    if count[0] == 15:
+        # count too large for the descriptor, held in a following typed integer
+        if offset[0] >= size:
+            bcf_error('BCF record is truncated')
+        count_type = data[offset[0]] & 0x0F
+        type_size = bcf_type_size(count_type)
+        if count_type == BCF_FLOAT or count_type == BCF_CHAR or type_size <= 0 or \
+                offset[0] + 1 + type_size > size:
+            bcf_error('bad typed value count in BCF record')
+        count[0] = bcf_load_int(data + offset[0] + 1, count_type)
+        offset[0] += 1 + type_size
+
+    type_size = bcf_type_size(type[0])
+    if type_size < 0:
+        bcf_error('unsupported type in BCF record')
+    values = data + offset[0]
+    offset[0] += type_size * count[0] * n_items
+    if offset[0] > size:
+        bcf_error('BCF record is truncated')
+    return values
+
+
+cdef inline np.int32_t bcf_read_typed_int(const char* data, Py_ssize_t size,
+                                          Py_ssize_t* offset) nogil except? -1:
+    """Read a single typed integer, e.g., a dictionary key."""
+    cdef:
+        int type
+        Py_ssize_t count
+        const char* values
+    values = bcf_read_typed(data, size, offset, &type, &count)
+    if count < 1 or type == BCF_FLOAT or type == BCF_CHAR or type == BCF_NULL:
+        bcf_error('expected integer in BCF record')
+    return bcf_load_int(values, type)
+
+
+cdef inline Py_ssize_t bcf_text_length(const char* s, Py_ssize_t n) nogil:
+    """Length of a string value, which may be padded with null bytes."""
+    cdef const char* end = <const char*> memchr(s, 0, n)
+    if end is NULL:
+        return n
+    return end - s
+
+
+cdef class BCFFieldDecoder:
+    """Store values decoded from BCF records into the output array for one field."""
+
+    cdef:
+        object field
+        object dtype
+        object fill
+        int kind
+        int mode
+        Py_ssize_t number
+        Py_ssize_t chunk_length
+        Py_ssize_t n_samples_out
+        Py_ssize_t itemsize
+        Py_ssize_t sample_size
+        Py_ssize_t row_size
+        np.ndarray values
+        char* data
+        np.uint8_t[:, :] packed
+        # only set for genotype calls, if allele counts are computed
+        VCFAlleleCounter counter
+
+    def __init__(self, field, dtype, number=1, fill=0, chunk_length=0, n_samples_out=0,
+                 mode=BCF_DECODE_VALUES, counter=None):
+        self.field = field
+        self.counter = counter if mode != BCF_DECODE_VALUES else None
+        self.dtype = np.dtype(dtype)
+        if self.dtype.kind == 'S':
+            self.kind = BCF_OUT_STRING
+        elif self.dtype.kind == 'O':
+            self.kind = BCF_OUT_OBJECT
+        else:
+            self.kind = vcf_filter_types[self.dtype.str[1:]]
+        self.fill = fill
+        self.mode = mode
+        # N.B., flags have number 0, but store one value per variant
+        self.number = 1 if mode == BCF_DECODE_FLAG else number
+        self.chunk_length = chunk_length
+        self.n_samples_out = n_samples_out
+        self.itemsize = self.dtype.itemsize
+        self.sample_size = self.itemsize * self.number
+        self.row_size = self.sample_size * max(1, self.n_samples_out)
+
+    cdef int malloc_chunk(self) except -1:
+        if self.mode == BCF_DECODE_FLAG:
+            shape = (self.chunk_length,)
+        elif self.mode == BCF_DECODE_GENOTYPE_PACKED:
+            shape = (self.chunk_length, self.n_samples_out)
+        elif self.mode == BCF_DECODE_GENOTYPE_2BIT:
+            shape = (self.chunk_length, (self.n_samples_out + 3) // 4)
+        elif self.n_samples_out > 0:
+            shape = (self.chunk_length, self.n_samples_out, self.number)
+        else:
+            shape = (self.chunk_length, self.number)
+        self.values = np.empty(shape, dtype=self.dtype)
+        if self.kind == BCF_OUT_OBJECT:
+            self.values.fill(u'')
+        elif self.kind == BCF_OUT_STRING:
+            self.values.fill(b'')
+        else:
+            self.values.fill(self.fill)
+        self.data = <char*> <size_t> self.values.ctypes.data
+        if self.mode == BCF_DECODE_GENOTYPE_PACKED or self.mode == BCF_DECODE_GENOTYPE_2BIT:
+            self.packed = self.values
+
+    cdef int make_chunk(self, chunk, limit=None) except -1:
+        values = self.values[:limit]
+        if self.mode == BCF_DECODE_GENOTYPE_PACKED or self.mode == BCF_DECODE_GENOTYPE_2BIT:
+            pass
+        elif self.mode != BCF_DECODE_FLAG and self.number == 1:
+            values = values.squeeze(axis=values.ndim - 1)
+        chunk[self.field] = values
+
+    cdef inline char* item(self, Py_ssize_t row, Py_ssize_t sample, Py_ssize_t i) nogil:
+        return self.data + row * self.row_size + sample * self.sample_size + i * self.itemsize
+
+    cdef int store_int(self, char* p, np.int64_t v) nogil except -1:
+        if self.kind == BCF_OUT_INT8:
+            (<np.int8_t*> p)[0] = v
+        elif self.kind == BCF_OUT_INT16:
+            (<np.int16_t*> p)[0] = v
+        elif self.kind == BCF_OUT_INT32:
+            (<np.int32_t*> p)[0] = v
+        elif self.kind == BCF_OUT_INT64:
+            (<np.int64_t*> p)[0] = v
+        elif self.kind == BCF_OUT_UINT8 or self.kind == BCF_OUT_BOOL:
+            (<np.uint8_t*> p)[0] = v
+        elif self.kind == BCF_OUT_UINT16:
+            (<np.uint16_t*> p)[0] = v
+        elif self.kind == BCF_OUT_UINT32:
+            (<np.uint32_t*> p)[0] = v
+        elif self.kind == BCF_OUT_UINT64:
+            (<np.uint64_t*> p)[0] = v
+        elif self.kind == BCF_OUT_FLOAT32:
+            (<np.float32_t*> p)[0] = v
+        elif self.kind == BCF_OUT_FLOAT64:
+            (<np.float64_t*> p)[0] = v
+
+    cdef int store_float(self, char* p, double v) nogil except -1:
+        if self.kind == BCF_OUT_FLOAT32:
+            (<np.float32_t*> p)[0] = v
+        elif self.kind == BCF_OUT_FLOAT64:
+            (<np.float64_t*> p)[0] = v
+        else:
+            self.store_int(p, <np.int64_t> v)
+
+    cdef np.int64_t load_int(self, char* p) nogil:
+        if self.kind == BCF_OUT_INT8:
+            return (<np.int8_t*> p)[0]
+        elif self.kind == BCF_OUT_INT16:
+            return (<np.int16_t*> p)[0]
+        elif self.kind == BCF_OUT_INT32:
+            return (<np.int32_t*> p)[0]
+        elif self.kind == BCF_OUT_UINT8:
+            return (<np.uint8_t*> p)[0]
+        elif self.kind == BCF_OUT_UINT16:
+            return (<np.uint16_t*> p)[0]
+        elif self.kind == BCF_OUT_UINT32:
+            return (<np.uint32_t*> p)[0]
+        return (<np.int64_t*> p)[0]
+
+    cdef int store_text(self, char* p, const char* s, Py_ssize_t n) nogil except -1:
+        if self.kind == BCF_OUT_STRING:
+            memcpy(p, s, min(n, self.itemsize))
+        elif self.kind == BCF_OUT_OBJECT:
+            self.store_object(p, s, n)
+
+    cdef int store_object(self, char* p, const char* s, Py_ssize_t n) nogil except -1:
+        cdef PyObject** dest = <PyObject**> p
+        with gil:
+            v = text_type(PyBytes_FromStringAndSize(s, n), 'utf8')
+            Py_XINCREF(<PyObject*> v)
+            Py_XDECREF(dest[0])
+            dest[0] = <PyObject*> v
+
+    cdef int decode(self, Py_ssize_t row, Py_ssize_t sample, int type, Py_ssize_t count,
+                    const char* values) nogil except -1:
+        """Decode `count` values of the given `type` into the output array."""
+        cdef:
+            Py_ssize_t i, n, type_size, start, value_index
+            np.int32_t v
+            long alleles[2]
+            np.uint32_t bits
+            float f
+            char* p
+
+        if self.mode == BCF_DECODE_FLAG:
+            self.store_int(self.item(row, 0, 0), 1)
+            return 0
+
+        if type == BCF_CHAR:
+            # string, split multiple values on commas as for VCF
+            if self.kind != BCF_OUT_STRING and self.kind != BCF_OUT_OBJECT:
+                return 0
+            n = bcf_text_length(values, count)
+            start = 0
+            value_index = 0
+            for i in range(n + 1):
+                if i == n or values[i] == COMMA:
+                    if i > start:
+                        self.store_text(self.item(row, sample, value_index), values + start,
+                                        i - start)
+                    value_index += 1
+                    if value_index >= self.number:
+                        break
+                    start = i + 1
+            return 0
+
+        if self.kind == BCF_OUT_STRING or self.kind == BCF_OUT_OBJECT:
+            # numeric values, can't be stored
+            return 0
+
+        if type == BCF_FLOAT:
+            n = min(count, self.number)
+            for i in range(n):
+                memcpy(&bits, values + i * 4, 4)
+                if bits == BCF_FLOAT_EOV:
+                    break
+                if bits != BCF_FLOAT_MISSING:
+                    memcpy(&f, values + i * 4, 4)
+                    self.store_float(self.item(row, sample, i), f)
+            return 0
+
+        type_size = bcf_type_size(type)
+
+        if self.mode == BCF_DECODE_GENOTYPE_PACKED or self.mode == BCF_DECODE_GENOTYPE_2BIT:
+            alleles[0] = -1
+            alleles[1] = -1
+            for i in range(min(count, 2)):
+                v = bcf_load_int(values + i * type_size, type)
+                if v == BCF_INT_EOV:
+                    break
+                if v != BCF_INT_MISSING:
+                    alleles[i] = max(-1, (v >> 1) - 1)
+            if self.counter is not None:
+                vcf_genotype_count_alleles(self.counter, row, sample, alleles, 2, 2)
+            if vcf_genotype_packed_store(row, sample, alleles[0], alleles[1], self.packed,
+                                         self.mode == BCF_DECODE_GENOTYPE_2BIT):
+                with gil:
+                    warnings.warn('allele too large to pack, genotype call stored as missing; '
+                                  'field: %s' % self.field)
+            return 0
+
+        if self.mode == BCF_DECODE_GENOTYPE_AC:
+            value_index = 0
+            for i in range(count):
+                v = bcf_load_int(values + i * type_size, type)
+                if v == BCF_INT_EOV:
+                    break
+                v = (v >> 1) - 1
+                if v < 0:
+                    # missing allele, so the call is not counted as called
+                    value_index = -1
+                    continue
+                if v < self.number:
+                    p = self.item(row, sample, v)
+                    self.store_int(p, self.load_int(p) + 1)
+                if self.counter is not None:
+                    self.counter.add_allele(row, sample, v)
+            if self.counter is not None and value_index == 0:
+                self.counter.add_called(row)
+            return 0
+
+        n = min(count, self.number)
+        value_index = 0
+        for i in range(n):
+            v = bcf_load_int(values + i * type_size, type)
+            if v == BCF_INT_EOV:
+                break
+            if v == BCF_INT_MISSING:
+                continue
+            if self.mode == BCF_DECODE_GENOTYPE:
+                # alleles are encoded as (allele + 1) << 1 | phased, zero if missing
+                v = (v >> 1) - 1
+                if v < 0:
+                    continue
+                if self.counter is not None:
+                    self.counter.add_allele(row, sample, v)
+                value_index += 1
+            self.store_int(self.item(row, sample, i), v)
+        if self.counter is not None and value_index == self.number:
+            self.counter.add_called(row)
+
+
+def bcf_default_fill(dtype):
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'f':
+        return NAN
+    elif dtype.kind == 'u':
+        return np.iinfo(dtype).max
+    elif dtype.kind == 'i':
+        return -1
+    return 0
+
+
+cdef class BCFChunkIterator:
+    """Iterate over chunks of data decoded from the records of a BCF file, yielding the
+    same (chunk, chunk_length, chrom, pos) tuples as VCFChunkIterator. The stream must be
+    positioned at the first record, after the header. Records hold values as binary
+    typed vectors, so no text is tokenised, and values within INFO and FORMAT fields or
+    samples which are not needed are skipped over without being decoded."""
+
+    cdef:
+        FileInputStream stream
+        CharVector shared
+        CharVector indiv
+        Py_ssize_t chunk_length
+        Py_ssize_t chunk_variant_index
+        bint eof
+        # names referred to by index within records
+        tuple contigs
+        tuple contig_objects
+        char** contigs_cstr
+        Py_ssize_t* contig_lengths
+        Py_ssize_t n_contigs
+        Py_ssize_t n_keys
+        # decoders for fixed fields
+        BCFFieldDecoder chrom_decoder
+        BCFFieldDecoder pos_decoder
+        BCFFieldDecoder id_decoder
+        BCFFieldDecoder ref_decoder
+        BCFFieldDecoder alt_decoder
+        BCFFieldDecoder qual_decoder
+        BCFFieldDecoder numalt_decoder
+        BCFFieldDecoder altlen_decoder
+        BCFFieldDecoder is_snp_decoder
+        bint store_alleles
+        # decoders for FILTER, INFO and FORMAT fields, indexed by dictionary key
+        list decoders
+        PyObject** filter_decoders
+        PyObject** info_decoders
+        PyObject** format_decoders
+        bint store_calldata
+        # samples
+        Py_ssize_t n_samples
+        Py_ssize_t n_samples_out
+        np.ndarray sample_indices
+        np.intp_t* sample_indices_ptr
+        # region
+        VCFRegions regions
+        # last record read
+        Py_ssize_t contig
+        long pos
+        VCFVariantFilter variant_filter
+        VCFAlleleCounter allele_counter
+
+    def __cinit__(self, *args, **kwargs):
+        CharVector_init(&self.shared, 2**10)
+        CharVector_init(&self.indiv, 2**10)
+        self.contigs_cstr = NULL
+        self.contig_lengths = NULL
+        self.filter_decoders = NULL
+        self.info_decoders = NULL
+        self.format_decoders = NULL
+
+    def __init__(self,
+                 FileInputStream stream,
+                 chunk_length,
+                 headers,
+                 contigs,
+                 dictionary,
+                 fields,
+                 types,
+                 numbers,
+                 fills,
+                 region,
+                 loc_samples,
+                 variant_filter=None,
+                 allele_counts=None):
+
+        self.stream = stream
+        self.chunk_length = chunk_length
+        self.chunk_variant_index = -1
+        self.eof = False
+        self.contig = -1
+        self.pos = 0
+
+        # setup contigs as C strings, N.B., need to keep a reference to these
+        self.contigs = tuple((c or u'').encode('utf8') for c in contigs)
+        self.contig_objects = tuple(c or u'' for c in contigs)
+        self.n_contigs = len(self.contigs)
+        self.contigs_cstr = <char**> malloc(sizeof(char*) * max(1, self.n_contigs))
+        self.contig_lengths = <Py_ssize_t*> malloc(sizeof(Py_ssize_t) *
+                                                   max(1, self.n_contigs))
+        for i in range(self.n_contigs):
+            self.contigs_cstr[i] = <char*> self.contigs[i]
+            self.contig_lengths[i] = len(self.contigs[i])
+
+        # setup samples
+        loc_samples = check_samples(loc_samples, headers)
+        self.n_samples = loc_samples.shape[0]
+        self.sample_indices = np.nonzero(loc_samples)[0].astype(np.intp)
+        self.n_samples_out = self.sample_indices.shape[0]
+        self.sample_indices_ptr = <np.intp_t*> <size_t> self.sample_indices.ctypes.data
+
+        # setup region
+        self._init_region(region)
+
+        # setup decoders
+        fields = list(fields)
+        self.store_calldata = any(f.startswith('calldata/') for f in fields)
+        self.decoders = list()
+        self.n_keys = len(dictionary)
+        self.filter_decoders = <PyObject**> calloc(max(1, self.n_keys), sizeof(PyObject*))
+        self.info_decoders = <PyObject**> calloc(max(1, self.n_keys), sizeof(PyObject*))
+        self.format_decoders = <PyObject**> calloc(max(1, self.n_keys), sizeof(PyObject*))
+        self._init_fixed(fields, types, numbers)
+        self.allele_counter = None
+        if allele_counts is not None:
+            n_alleles, subpops = allele_counts
+            self.allele_counter = VCFAlleleCounter(
+                fields, n_alleles=n_alleles, subpops=subpops, chunk_length=self.chunk_length,
+                n_samples_out=self.n_samples_out
+            )
+        self._init_keyed(fields, headers, dictionary, types, numbers, fills)
+        if fields:
+            # shouldn't ever be any left over
+            raise RuntimeError('unexpected fields left over: %r' % set(fields))
+        self.malloc_chunk()
+
+        # handle variant filter, given as a tuple of (program, fields)
+        self.variant_filter = None
+        if variant_filter is not None:
+            self.variant_filter = VCFVariantFilter(*variant_filter)
+            self.variant_filter.bind(self.make_chunk(self.chunk_length))
+
+    def __dealloc__(self):
+        CharVector_free(&self.shared)
+        CharVector_free(&self.indiv)
+        free(self.contigs_cstr)
+        free(self.contig_lengths)
+        free(self.filter_decoders)
+        free(self.info_decoders)
+        free(self.format_decoders)
+
+    def _init_region(self, region):
+        self.regions = None
+        if region is not None:
+            self.regions = VCFRegions(region)
+
+    def _add_decoder(self, field, dtype, fields, **kwargs):
+        decoder = BCFFieldDecoder(field, dtype, chunk_length=self.chunk_length, **kwargs)
+        self.decoders.append(decoder)
+        fields.remove(field)
+        return decoder
+
+    def _init_fixed(self, fields, types, numbers):
+        if CHROM_FIELD in fields:
+            t = check_string_dtype(types[CHROM_FIELD])
+            self.chrom_decoder = self._add_decoder(CHROM_FIELD, t, fields)
+        if POS_FIELD in fields:
+            if POS_FIELD in types:
+                t = types[POS_FIELD]
+                if t != np.dtype('int32'):
+                    warnings.warn('only int32 supported for POS field, ignoring requested type: %r' % t)
+            self.pos_decoder = self._add_decoder(POS_FIELD, 'int32', fields)
+        if ID_FIELD in fields:
+            t = check_string_dtype(types[ID_FIELD])
+            self.id_decoder = self._add_decoder(ID_FIELD, t, fields)
+        if REF_FIELD in fields:
+            t = check_string_dtype(types[REF_FIELD])
+            self.ref_decoder = self._add_decoder(REF_FIELD, t, fields)
+        n = numbers.get(ALT_FIELD, 1)
+        if ALT_FIELD in fields:
+            t = check_string_dtype(types[ALT_FIELD])
+            self.alt_decoder = self._add_decoder(ALT_FIELD, t, fields, number=n)
+        if NUMALT_FIELD in fields:
+            self.numalt_decoder = self._add_decoder(NUMALT_FIELD, 'int32', fields)
+        if ALTLEN_FIELD in fields:
+            self.altlen_decoder = self._add_decoder(ALTLEN_FIELD, 'int32', fields, number=n)
+        if IS_SNP_FIELD in fields:
+            self.is_snp_decoder = self._add_decoder(IS_SNP_FIELD, bool, fields)
+        self.store_alleles = (self.ref_decoder is not None or self.alt_decoder is not None or
+                              self.numalt_decoder is not None or
+                              self.altlen_decoder is not None or
+                              self.is_snp_decoder is not None)
+        if QUAL_FIELD in fields:
+            if QUAL_FIELD in types:
+                t = types[QUAL_FIELD]
+                if t != np.dtype('float32'):
+                    warnings.warn('only float32 supported for QUAL field, ignoring requested type: %r' % t)
+            self.qual_decoder = self._add_decoder(QUAL_FIELD, 'float32', fields, fill=NAN)
+
+    def _init_keyed(self, fields, headers, dictionary, types, numbers, fills):
+        cdef PyObject** decoders
+        keys = dict((k, i) for i, k in enumerate(dictionary) if k is not None)
+
+        for field in sorted(fields):
+            group, name = field.split('/')
+            t = types.get(field)
+            n = numbers.get(field, 1)
+            kwds = dict()
+
+            if group == 'variants' and name.startswith('FILTER_'):
+                key = name[7:]
+                decoder = self._add_decoder(field, bool, fields)
+                if key in keys:
+                    self.filter_decoders[keys[key]] = <PyObject*> decoder
+                continue
+
+            elif group == 'variants':
+                key = name
+                decoders = self.info_decoders
+                header_type = headers.infos.get(key, dict()).get('Type')
+                if t == np.dtype(bool) or n == 0:
+                    if t != np.dtype(bool):
+                        warnings.warn('cannot have non-bool dtype for field with number 0, ignoring type %r' % t)
+                    kwds['mode'] = BCF_DECODE_FLAG
+                    t = np.dtype(bool)
+                elif t.kind not in 'iufSO':
+                    warnings.warn('type %s not supported for INFO field %r, field will be skipped' % (t, key))
+                    fields.remove(field)
+                    continue
+
+            else:
+                key = name
+                decoders = self.format_decoders
+                header_type = headers.formats.get(key, dict()).get('Type')
+                kwds['n_samples_out'] = self.n_samples_out
+                if isinstance(t, str) and t.startswith('genotype/'):
+                    kwds['mode'] = BCF_DECODE_GENOTYPE
+                    t = np.dtype(t.split('/')[1])
+                elif isinstance(t, str) and t.startswith('genotype_ac/'):
+                    kwds['mode'] = BCF_DECODE_GENOTYPE_AC
+                    t = np.dtype(t.split('/')[1])
+                    kwds['fill'] = 0
+                elif isinstance(t, str) and (t.startswith('genotype_packed/') or
+                                             t.startswith('genotype_2bit/')):
+                    if t.startswith('genotype_2bit/'):
+                        kwds['mode'] = BCF_DECODE_GENOTYPE_2BIT
+                        kwds['fill'] = 255
+                    else:
+                        kwds['mode'] = BCF_DECODE_GENOTYPE_PACKED
+                        kwds['fill'] = 239
+                    t = np.dtype(t.split('/')[1])
+                    if t != np.dtype('uint8'):
+                        warnings.warn('type %r not supported for packed genotype field %r, '
+                                      'field will be skipped' % (t, key))
+                        fields.remove(field)
+                        continue
+                elif key == 'GT' and t.kind in 'iu':
+                    kwds['mode'] = BCF_DECODE_GENOTYPE
+                if kwds.get('mode') is not None and t.kind not in 'iu':
+                    warnings.warn('type %r not supported for genotype field %r, field will be skipped' % (t, key))
+                    fields.remove(field)
+                    continue
+                if t.kind not in 'iufSO':
+                    warnings.warn('type %r not supported for FORMAT field %r, field will be skipped' % (t, key))
+                    fields.remove(field)
+                    continue
+                if key == 'GT' and t.kind in 'SO':
+                    raise ValueError('genotype calls cannot be decoded from BCF as strings, '
+                                     'found type %r for field %r' % (t, field))
+
+            if t.kind in 'SO' and header_type in ('Integer', 'Float'):
+                raise ValueError('numeric values cannot be decoded from BCF as strings, '
+                                 'found type %r for field %r' % (t, field))
+            kwds.setdefault('fill', fills.get(field, bcf_default_fill(t)))
+            if group == 'calldata' and key == 'GT':
+                kwds['counter'] = self.allele_counter
+            decoder = self._add_decoder(field, t, fields, number=n, **kwds)
+            if key not in keys:
+                # not in the header, so not in any record
+                continue
+            decoders[keys[key]] = <PyObject*> decoder
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+
+        if self.eof:
+            raise StopIteration
+
+        # reset indices
+        self.chunk_variant_index = -1
+
+        # allocate arrays for next chunk
+        self.malloc_chunk()
+
+        # decode next chunk, releasing the GIL
+        with nogil:
+            self.parse()
+
+        # get the chunk
+        chunk_length = self.chunk_variant_index + 1
+        chunk = self.make_chunk(chunk_length)
+
+        if chunk is None:
+            raise StopIteration
+
+        if 0 <= self.contig < self.n_contigs:
+            chrom = self.contigs[self.contig]
+        else:
+            chrom = b''
+        return chunk, chunk_length, chrom, self.pos
+
+    cdef int malloc_chunk(self) except -1:
+        cdef BCFFieldDecoder decoder
+        for decoder in self.decoders:
+            decoder.malloc_chunk()
+        if self.allele_counter is not None:
+            self.allele_counter.malloc_chunk()
+        if self.variant_filter is not None:
+            self.variant_filter.bind(self.make_chunk(self.chunk_length))
+
+    cdef object make_chunk(self, chunk_length):
+        cdef BCFFieldDecoder decoder
+        if chunk_length > 0:
+            if chunk_length < self.chunk_length:
+                limit = chunk_length
+            else:
+                limit = None
+            chunk = dict()
+            for decoder in self.decoders:
+                decoder.make_chunk(chunk, limit=limit)
+            if self.allele_counter is not None:
+                self.allele_counter.make_chunk(chunk, limit=limit)
+            return chunk
+        else:
+            return None
+
+    cdef int parse(self) nogil except -1:
+        """Decode records to end of current chunk or EOF."""
+        cdef:
+            np.uint32_t l_shared, l_indiv
+            Py_ssize_t n, row
+
+        while self.chunk_variant_index + 1 < self.chunk_length:
+
+            # read lengths of the shared and per-sample parts of the record
+            CharVector_clear(&self.shared)
+            n = self.stream.read_into(&self.shared, 8)
+            if n == 0:
+                self.eof = True
+                break
+            elif n < 8:
+                bcf_error('BCF file is truncated')
+            memcpy(&l_shared, self.shared.data, 4)
+            memcpy(&l_indiv, self.shared.data + 4, 4)
+
+            # read the shared part
+            CharVector_clear(&self.shared)
+            if self.stream.read_into(&self.shared, l_shared) < l_shared:
+                bcf_error('BCF file is truncated')
+
+            row = self.chunk_variant_index + 1
+            if not self.decode_shared(row):
+                # skip the per-sample part, without copying
+                if self.stream.read_into(NULL, l_indiv) < l_indiv:
+                    bcf_error('BCF file is truncated')
+                continue
+
+            if self.store_calldata:
+                CharVector_clear(&self.indiv)
+                if self.stream.read_into(&self.indiv, l_indiv) < l_indiv:
+                    bcf_error('BCF file is truncated')
+                self.decode_indiv(row)
+            elif self.stream.read_into(NULL, l_indiv) < l_indiv:
+                bcf_error('BCF file is truncated')
+
+            self.chunk_variant_index = row
+
+    cdef bint decode_shared(self, Py_ssize_t row) nogil except -1:
+        """Decode the shared part of the current record into the given `row` of the
+        output arrays. Returns False if the record is outside the region or rejected by
+        the variant filter."""
+        cdef:
+            const char* data = self.shared.data
+            Py_ssize_t size = self.shared.size
+            Py_ssize_t offset = 24
+            Py_ssize_t n_allele, n_info, n_sample, n_fmt
+            Py_ssize_t i, j, count, ref_len = 0, alt_len
+            np.int32_t contig, pos, key
+            np.uint32_t bits, n_allele_info, n_fmt_sample
+            float qual
+            const char* values
+            int type
+            bint is_snp
+            PyObject* decoder
+
+        if size < 24:
+            bcf_error('BCF record is truncated')
+        memcpy(&contig, data, 4)
+        memcpy(&pos, data + 4, 4)
+        memcpy(&bits, data + 12, 4)
+        memcpy(&n_allele_info, data + 16, 4)
+        memcpy(&n_fmt_sample, data + 20, 4)
+        n_allele = n_allele_info >> 16
+        n_info = n_allele_info & 0xFFFF
+        n_sample = n_fmt_sample & 0xFFFFFF
+        n_fmt = n_fmt_sample >> 24
+        # N.B., positions are zero-based within BCF records
+        pos += 1
+        self.contig = contig
+        self.pos = pos
+
+        # handle region
+        if self.regions is not None:
+            if not 0 <= contig < self.n_contigs:
+                return False
+            if not self.regions.contains(self.contigs_cstr[contig], pos):
+                return False
+
+        if self.chrom_decoder is not None and 0 <= contig < self.n_contigs:
+            if self.chrom_decoder.kind == BCF_OUT_OBJECT:
+                self.store_contig_object(row, contig)
+            else:
+                self.chrom_decoder.store_text(self.chrom_decoder.item(row, 0, 0),
+                                              self.contigs_cstr[contig],
+                                              self.contig_lengths[contig])
+        if self.pos_decoder is not None:
+            self.pos_decoder.store_int(self.pos_decoder.item(row, 0, 0), pos)
+        if self.qual_decoder is not None and bits != BCF_FLOAT_MISSING:
+            memcpy(&qual, data + 12, 4)
+            self.qual_decoder.store_float(self.qual_decoder.item(row, 0, 0), qual)
+
+        # ID
+        values = bcf_read_typed(data, size, &offset, &type, &count)
+        if self.id_decoder is not None:
+            count = bcf_text_length(values, count) if type == BCF_CHAR else 0
+            if count == 0:
+                self.id_decoder.store_text(self.id_decoder.item(row, 0, 0), &PERIOD, 1)
+            else:
+                self.id_decoder.store_text(self.id_decoder.item(row, 0, 0), values, count)
+
+        # REF and ALT
+        is_snp = n_allele > 1
+        for i in range(n_allele):
+            values = bcf_read_typed(data, size, &offset, &type, &count)
+            if not self.store_alleles:
+                continue
+            count = bcf_text_length(values, count) if type == BCF_CHAR else 0
+            if i == 0:
+                for j in range(count):
+                    # N.B., don't count UTF-8 continuation bytes
+                    if values[j] != PERIOD and (values[j] & 0xC0) != 0x80:
+                        ref_len += 1
+                is_snp = is_snp and ref_len == 1
+                if self.ref_decoder is not None and count > 0:
+                    self.ref_decoder.store_text(self.ref_decoder.item(row, 0, 0), values,
+                                                count)
+                continue
+            alt_len = 0
+            for j in range(count):
+                if values[j] != PERIOD and values[j] != ASTERISK:
+                    alt_len += 1
+            is_snp = is_snp and alt_len == 1
+            if self.alt_decoder is not None and i - 1 < self.alt_decoder.number and \
+                    count > 0:
+                self.alt_decoder.store_text(self.alt_decoder.item(row, 0, i - 1), values,
+                                            count)
+            if self.altlen_decoder is not None and i - 1 < self.altlen_decoder.number:
+                self.altlen_decoder.store_int(self.altlen_decoder.item(row, 0, i - 1),
+                                              alt_len - ref_len)
+        if self.numalt_decoder is not None:
+            self.numalt_decoder.store_int(self.numalt_decoder.item(row, 0, 0),
+                                          max(0, n_allele - 1))
+        if self.is_snp_decoder is not None:
+            self.is_snp_decoder.store_int(self.is_snp_decoder.item(row, 0, 0), is_snp)
+
+        # FILTER
+        values = bcf_read_typed(data, size, &offset, &type, &count)
+        if type != BCF_NULL and type != BCF_FLOAT and type != BCF_CHAR:
+            for i in range(count):
+                key = bcf_load_int(values + i * bcf_type_size(type), type)
+                if 0 <= key < self.n_keys and self.filter_decoders[key] is not NULL:
+                    decoder = self.filter_decoders[key]
+                    (<BCFFieldDecoder> decoder).store_int(
+                        (<BCFFieldDecoder> decoder).item(row, 0, 0), 1)
+
+        # INFO
+        for i in range(n_info):
+            key = bcf_read_typed_int(data, size, &offset)
+            values = bcf_read_typed(data, size, &offset, &type, &count)
+            if 0 <= key < self.n_keys and self.info_decoders[key] is not NULL:
+                decoder = self.info_decoders[key]
+                (<BCFFieldDecoder> decoder).decode(row, 0, type, count, values)
+
+        if n_sample != self.n_samples and n_fmt > 0 and self.store_calldata:
+            bcf_error('number of samples in BCF record does not match header')
+
+        # apply variant filter
+        if self.variant_filter is not None and not self.variant_filter.evaluate(row):
+            self.variant_filter.reset(row)
+            return False
+
+        return True
+
+    cdef int store_contig_object(self, Py_ssize_t row, Py_ssize_t contig) nogil except -1:
+        cdef PyObject** dest = <PyObject**> self.chrom_decoder.item(row, 0, 0)
+        with gil:
+            v = self.contig_objects[contig]
+            Py_XINCREF(<PyObject*> v)
+            Py_XDECREF(dest[0])
+            dest[0] = <PyObject*> v
+
+    cdef int decode_indiv(self, Py_ssize_t row) nogil except -1:
+        """Decode the per-sample part of the current record into the given `row` of the
+        output arrays, for the selected samples only."""
+        cdef:
+            const char* data = self.indiv.data
+            Py_ssize_t size = self.indiv.size
+            Py_ssize_t offset = 0
+            Py_ssize_t i, j, count, stride
+            np.int32_t key
+            np.intp_t* sample_indices = self.sample_indices_ptr
+            const char* values
+            int type
+            PyObject* decoder
+
+        while offset < size:
+            key = bcf_read_typed_int(data, size, &offset)
+            values = bcf_read_typed(data, size, &offset, &type, &count, self.n_samples)
+            if key < 0 or key >= self.n_keys or self.format_decoders[key] is NULL:
+                # skip over values for all samples
+                continue
+            decoder = self.format_decoders[key]
+            stride = count * bcf_type_size(type)
+            for j in range(self.n_samples_out):
+                i = sample_indices[j]
+                (<BCFFieldDecoder> decoder).decode(row, j, type, count, values + i * stride)
 
 
 ###################################################################
@@ -4041,30 +6844,290 @@ def _normalize_ann_types(fields, types):
 
     if types is None:
         types = dict()
-    types = {_normalize_ann_field_prefix(f): np.dtype(t)
+    types = {_normalize_ann_field_prefix(f): t if t == OFFSETS_TYPE else np.dtype(t)
              for f, t in types.items()}
 
     normed_types = dict()
     for f in fields:
         if f in types:
-            normed_types[f] = types[f]
+            t = types[f]
         else:
-            normed_types[f] = default_ann_types[f]
+            t = default_ann_types[f]
+        if default_ann_types[f].kind == 'i':
+            if t == OFFSETS_TYPE or t.kind != 'i':
+                raise ValueError('only signed integer dtype supported for field %r' % f)
+        elif t != OFFSETS_TYPE and t.kind != 'U':
+            check_string_dtype(t)
+        normed_types[f] = t
 
     return normed_types
 
 
+# number of values extracted from each annotation
+DEF ANN_N_VALUES = 15
+
+
+# part of a value to extract
+cdef enum ANNPart:
+    WHOLE = 0,
+    # e.g., position from 'pos/length'
+    BEFORE_SLASH = 1,
+    # e.g., length from 'pos/length'
+    AFTER_SLASH = 2,
+    # strip leading 'n.' or 'p.' as redundant information
+    STRIP_PREFIX = 3
+
+
+# fields extracted from each annotation, with the index and part of the value extracted
+ANN_EXTRACTS = (
+    (ANN_ALLELE_FIELD, ANNFidx.ALLELE, ANNPart.WHOLE),
+    (ANN_ANNOTATION_FIELD, ANNFidx.ANNOTATION, ANNPart.WHOLE),
+    (ANN_ANNOTATION_IMPACT_FIELD, ANNFidx.ANNOTATION_IMPACT, ANNPart.WHOLE),
+    (ANN_GENE_NAME_FIELD, ANNFidx.GENE_NAME, ANNPart.WHOLE),
+    (ANN_GENE_ID_FIELD, ANNFidx.GENE_ID, ANNPart.WHOLE),
+    (ANN_FEATURE_TYPE_FIELD, ANNFidx.FEATURE_TYPE, ANNPart.WHOLE),
+    (ANN_FEATURE_ID_FIELD, ANNFidx.FEATURE_ID, ANNPart.WHOLE),
+    (ANN_TRANSCRIPT_BIOTYPE_FIELD, ANNFidx.TRANSCRIPT_BIOTYPE, ANNPart.WHOLE),
+    # ignore second part of rank
+    (ANN_RANK_FIELD, ANNFidx.RANK, ANNPart.BEFORE_SLASH),
+    (ANN_HGVS_C_FIELD, ANNFidx.HGVS_C, ANNPart.STRIP_PREFIX),
+    (ANN_HGVS_P_FIELD, ANNFidx.HGVS_P, ANNPart.STRIP_PREFIX),
+    (ANN_CDNA_POS_FIELD, ANNFidx.CDNA, ANNPart.BEFORE_SLASH),
+    (ANN_CDNA_LENGTH_FIELD, ANNFidx.CDNA, ANNPart.AFTER_SLASH),
+    (ANN_CDS_POS_FIELD, ANNFidx.CDS, ANNPart.BEFORE_SLASH),
+    (ANN_CDS_LENGTH_FIELD, ANNFidx.CDS, ANNPart.AFTER_SLASH),
+    (ANN_AA_POS_FIELD, ANNFidx.AA, ANNPart.BEFORE_SLASH),
+    (ANN_AA_LENGTH_FIELD, ANNFidx.AA, ANNPart.AFTER_SLASH),
+    (ANN_DISTANCE_FIELD, ANNFidx.DISTANCE, ANNPart.WHOLE),
+)
+
+
+ANN_ANNOTATIONS = ('all', 'most_severe')
+
+
+cdef int ann_find_values(const np.uint8_t[::1] data,
+                         const np.int64_t[::1] starts,
+                         const np.int64_t[::1] stops,
+                         np.int64_t[:, :, ::1] spans) nogil except -1:
+    """Find the start and stop of each value within each annotation, leaving -1 for
+    values not present."""
+    cdef Py_ssize_t k, p, start, stop, value_start, value_index
+
+    for k in range(starts.shape[0]):
+        start = starts[k]
+        stop = stops[k]
+
+        # bail early if no content
+        if stop <= start or (stop - start == 1 and data[start] == PERIOD):
+            continue
+
+        value_index = 0
+        value_start = start
+        for p in range(start, stop + 1):
+            if p == stop or data[p] == PIPE or data[p] == COMMA:
+                if value_index < ANN_N_VALUES:
+                    spans[k, value_index, 0] = value_start
+                    spans[k, value_index, 1] = p
+                value_index += 1
+                value_start = p + 1
+                if p == stop or data[p] == COMMA:
+                    # end of annotation
+                    break
+
+
+cdef int ann_extract(const np.uint8_t[::1] data,
+                     const np.int64_t[:, :, ::1] spans,
+                     Py_ssize_t value_index,
+                     ANNPart part,
+                     np.int64_t[:, ::1] out) nogil except -1:
+    """Find the start and stop of the requested part of a value within each
+    annotation, or -1 if not present."""
+    cdef Py_ssize_t k, p, start, stop, slash
+
+    for k in range(spans.shape[0]):
+        start = spans[k, value_index, 0]
+        stop = spans[k, value_index, 1]
+
+        if start >= 0 and part == ANNPart.STRIP_PREFIX:
+            start = min(start + 2, stop)
+
+        elif start >= 0 and part != ANNPart.WHOLE:
+            slash = -1
+            for p in range(start, stop):
+                if data[p] == SLASH:
+                    slash = p
+                    break
+            if part == ANNPart.BEFORE_SLASH and slash >= 0:
+                stop = slash
+            elif part == ANNPart.AFTER_SLASH and slash >= 0:
+                start = slash + 1
+            elif part == ANNPart.AFTER_SLASH:
+                start = stop = -1
+
+        out[k, 0] = start
+        out[k, 1] = stop
+
+
+cdef int ann_parse_integers(const np.uint8_t[::1] data,
+                            const np.int64_t[:, ::1] extracts,
+                            np.int64_t[::1] out) nogil except -1:
+    """Parse plain decimal integers, leaving -1 for values missing or not parsed."""
+    cdef:
+        Py_ssize_t k, p, start, stop
+        np.int64_t v
+        bint negative
+
+    for k in range(extracts.shape[0]):
+        out[k] = -1
+        start = extracts[k, 0]
+        stop = extracts[k, 1]
+        if start >= stop:
+            continue
+        negative = data[start] == MINUS
+        if negative or data[start] == PLUS:
+            start += 1
+        if start == stop or stop - start > MAX_INTEGER_DIGITS:
+            continue
+        v = 0
+        for p in range(start, stop):
+            if not ZERO <= data[p] <= NINE:
+                break
+            v = v * 10 + (data[p] - ZERO)
+        else:
+            out[k] = -v if negative else v
+
+
+cdef int ann_copy_fixed(const np.uint8_t[::1] data,
+                        const np.int64_t[:, ::1] extracts,
+                        np.uint8_t[:, ::1] out) nogil except -1:
+    """Copy values into a fixed length string array, truncating if necessary."""
+    cdef Py_ssize_t k, n
+
+    for k in range(extracts.shape[0]):
+        n = min(extracts[k, 1] - extracts[k, 0], out.shape[1])
+        if n > 0:
+            memcpy(&out[k, 0], &data[extracts[k, 0]], n)
+
+
+cdef int ann_copy_offsets(const np.uint8_t[::1] data,
+                          const np.int64_t[:, ::1] extracts,
+                          const np.int64_t[::1] offsets,
+                          np.uint8_t[::1] out) nogil except -1:
+    """Copy values into a buffer of bytes with precomputed offsets."""
+    cdef Py_ssize_t k, n
+
+    for k in range(extracts.shape[0]):
+        n = offsets[k + 1] - offsets[k]
+        if n > 0:
+            memcpy(&out[offsets[k]], &data[extracts[k, 0]], n)
+
+
+cdef inline bint ann_value_equals(const np.uint8_t[::1] data, Py_ssize_t start,
+                                  Py_ssize_t stop, const char* s, Py_ssize_t n) nogil:
+    return stop - start == n and memcmp(&data[start], s, n) == 0
+
+
+cdef int ann_impact_rank(const np.uint8_t[::1] data, Py_ssize_t start,
+                         Py_ssize_t stop) nogil:
+    if start < 0:
+        # no annotation
+        return 0
+    elif ann_value_equals(data, start, stop, b'HIGH', 4):
+        return 5
+    elif ann_value_equals(data, start, stop, b'MODERATE', 8):
+        return 4
+    elif ann_value_equals(data, start, stop, b'LOW', 3):
+        return 3
+    elif ann_value_equals(data, start, stop, b'MODIFIER', 8):
+        return 2
+    return 1
+
+
+cdef int ann_select_most_severe(const np.uint8_t[::1] data,
+                                const np.int64_t[:, :, ::1] spans,
+                                Py_ssize_t number,
+                                np.int64_t[::1] selected) nogil except -1:
+    """Select the annotation with the highest impact for each variant, or the first if
+    impacts are equal."""
+    cdef Py_ssize_t i, j, k
+    cdef int rank, best_rank
+
+    for i in range(selected.shape[0]):
+        best_rank = -1
+        for j in range(number):
+            k = i * number + j
+            rank = ann_impact_rank(data, spans[k, <Py_ssize_t> ANNFidx.ANNOTATION_IMPACT, 0],
+                                   spans[k, <Py_ssize_t> ANNFidx.ANNOTATION_IMPACT, 1])
+            if rank > best_rank:
+                selected[i] = k
+                best_rank = rank
+
+
+def _ann_buffers(ann):
+    """Obtain a buffer of bytes holding all annotations, and the start and stop of each
+    annotation within the buffer."""
+    from allel.model.ndarray import OffsetStringArray
+
+    if not isinstance(ann, OffsetStringArray):
+        ann = np.asarray(ann)
+        if ann.dtype.kind == 'S':
+            # N.B., use fixed length values in place
+            n_items, itemsize = ann.size, ann.dtype.itemsize
+            data = np.ascontiguousarray(ann).reshape(-1).view('u1')
+            starts = np.arange(n_items, dtype='i8') * itemsize
+            stops = starts + np.char.str_len(ann).reshape(-1)
+            return data, starts, stops
+        ann = OffsetStringArray.from_values(ann)
+
+    offsets = np.ascontiguousarray(ann.offsets, dtype='i8')
+    data = np.ascontiguousarray(ann.data)
+    n_items = offsets.shape[0] - 1
+    return data, offsets[:n_items], offsets[1:]
+
+
 cdef class ANNTransformer:
+    """Transformer which splits the values of the SnpEff ANN field into separate fields
+    for each part of an annotation.
+
+    Values are split and integer values are parsed by a C loop over the bytes of all
+    annotations in a chunk, without creating any Python objects unless object arrays are
+    requested, and without holding the GIL, so chunks can be transformed in a background
+    thread while the next chunk is being parsed. The ANN field may be parsed with any
+    string type, including 'offsets'. Types of string fields may be given as
+    'offsets', to obtain an :class:`allel.OffsetStringArray`.
+
+    Parameters
+    ----------
+    fields : list of strings, optional
+        ANN fields to extract, defaults to all.
+    types : dict, optional
+        Types of ANN fields to extract.
+    keep_original : bool, optional
+        If True, keep the original ANN field.
+    annotations : {'all', 'most_severe'}, optional
+        If 'all', extract all annotations parsed for each variant, i.e., as many as the
+        number of values of the ANN field, which is 1 by default, so only the first. If
+        'most_severe', extract only the annotation with the highest impact (HIGH,
+        MODERATE, LOW, MODIFIER) out of those parsed for each variant. E.g., provide
+        ``numbers={'ANN': 50}`` to parse up to 50 annotations per variant, and use type
+        'offsets' for the ANN field so that annotations not present take no space.
+
+    """
 
     cdef:
         list fields
         object types
         bint keep_original
+        object annotations
 
-    def __init__(self, fields=None, types=None, keep_original=False):
+    def __init__(self, fields=None, types=None, keep_original=False, annotations='all'):
         self.fields = _normalize_ann_fields(fields)
         self.types = _normalize_ann_types(self.fields, types)
         self.keep_original = keep_original
+        if annotations not in ANN_ANNOTATIONS:
+            raise ValueError('annotations must be one of %r, found %r'
+                             % (ANN_ANNOTATIONS, annotations))
+        self.annotations = annotations
 
     def transform_fields(self, fields):
         fields_transformed = list()
@@ -4077,34 +7140,20 @@ cdef class ANNTransformer:
                 fields_transformed.append(f)
         return fields_transformed
 
-    def _malloc_string_array(self, field, shape):
-        if field in self.fields:
-            t = check_string_dtype(self.types[field])
-            a = np.empty(shape, dtype=t)
-            if t.kind == 'S':
-                a.fill(b'')
-            else:
-                a.fill(u'')
-        else:
-            a = None
-        return a
-
-    def _malloc_integer_array(self, field, shape):
-        if field in self.fields:
-            t = self.types[field]
-            if t.kind != 'i':
-                raise ValueError('only signed integer dtype supported for field %r' % field)
-            a = np.empty(shape, dtype=t)
-            a.fill(-1)
-        else:
-            a = None
-        return a
-
     def transform_chunk(self, chunk):
         cdef:
-            Py_ssize_t i, j, chunk_length, number, n_vals
-            list vals
-            list vv
+            Py_ssize_t k, chunk_length, number, n_items
+            const np.uint8_t[::1] data
+            np.int64_t[::1] starts, stops, selected, offsets
+            np.int64_t[:, :, ::1] spans
+            np.int64_t[:, ::1] extracts
+            np.int64_t[::1] integers
+            np.uint8_t[:, ::1] fixed
+            np.uint8_t[::1] buffer
+            ANNPart part
+            Py_ssize_t value_index
+
+        from allel.model.ndarray import OffsetStringArray
 
         # obtain array to be transformed
         ann = chunk[ANN_FIELD]
@@ -4113,146 +7162,77 @@ cdef class ANNTransformer:
 
         # determine chunk length and number of items
         chunk_length = ann.shape[0]
-        if ann.ndim == 1:
-            ann = ann[:, np.newaxis]
-        number = ann.shape[1]
-        shape = chunk_length, number
-
-        # allocate output arrays
-        allele = self._malloc_string_array(ANN_ALLELE_FIELD, shape)
-        annotation = self._malloc_string_array(ANN_ANNOTATION_FIELD, shape)
-        annotation_impact = self._malloc_string_array(ANN_ANNOTATION_IMPACT_FIELD, shape)
-        gene_name = self._malloc_string_array(ANN_GENE_NAME_FIELD, shape)
-        gene_id = self._malloc_string_array(ANN_GENE_ID_FIELD, shape)
-        feature_type = self._malloc_string_array(ANN_FEATURE_TYPE_FIELD, shape)
-        feature_id = self._malloc_string_array(ANN_FEATURE_ID_FIELD, shape)
-        transcript_biotype = self._malloc_string_array(ANN_TRANSCRIPT_BIOTYPE_FIELD, shape)
-        rank = self._malloc_integer_array(ANN_RANK_FIELD, shape)
-        hgvs_c = self._malloc_string_array(ANN_HGVS_C_FIELD, shape)
-        hgvs_p = self._malloc_string_array(ANN_HGVS_P_FIELD, shape)
-        cdna_pos = self._malloc_integer_array(ANN_CDNA_POS_FIELD, shape)
-        cdna_length = self._malloc_integer_array(ANN_CDNA_LENGTH_FIELD, shape)
-        cds_pos = self._malloc_integer_array(ANN_CDS_POS_FIELD, shape)
-        cds_length = self._malloc_integer_array(ANN_CDS_LENGTH_FIELD, shape)
-        aa_pos = self._malloc_integer_array(ANN_AA_POS_FIELD, shape)
-        aa_length = self._malloc_integer_array(ANN_AA_LENGTH_FIELD, shape)
-        distance = self._malloc_integer_array(ANN_DISTANCE_FIELD, shape)
-
-        # start working
-        for i in range(chunk_length):
-            for j in range(number):
-
-                # obtain raw string value
-                raw = ann[i, j]
-                if not PY2 and isinstance(raw, bytes):
-                    raw = str(raw, 'utf8')
-
-                # bail early if no content
-                if raw == '' or raw == '.':
-                    continue
-
-                # split fields
-                vals = raw.split('|')
-                n_vals = len(vals)
-
-                # convert and store values
-                if allele is not None and n_vals > ANNFidx.ALLELE:
-                    allele[i, j] = vals[ANNFidx.ALLELE]
-                if annotation is not None and n_vals > ANNFidx.ANNOTATION:
-                    annotation[i, j] = vals[ANNFidx.ANNOTATION]
-                if annotation_impact is not None and n_vals > ANNFidx.ANNOTATION_IMPACT:
-                    annotation_impact[i, j] = vals[ANNFidx.ANNOTATION_IMPACT]
-                if gene_name is not None and n_vals > ANNFidx.GENE_NAME:
-                    gene_name[i, j] = vals[ANNFidx.GENE_NAME]
-                if gene_id is not None and n_vals > ANNFidx.GENE_ID:
-                    gene_id[i, j] = vals[ANNFidx.GENE_ID]
-                if feature_type is not None and n_vals > ANNFidx.FEATURE_TYPE:
-                    feature_type[i, j] = vals[ANNFidx.FEATURE_TYPE]
-                if feature_id is not None and n_vals > ANNFidx.FEATURE_ID:
-                    feature_id[i, j] = vals[ANNFidx.FEATURE_ID]
-                if transcript_biotype is not None and n_vals > ANNFidx.TRANSCRIPT_BIOTYPE:
-                    transcript_biotype[i, j] = vals[ANNFidx.TRANSCRIPT_BIOTYPE]
-                if rank is not None and n_vals > ANNFidx.RANK:
-                    v = vals[ANNFidx.RANK]
-                    if v:
-                        vv = v.split('/')
-                        # ignore second part of rank
-                        rank[i, j] = int(vv[0])
-                if hgvs_c is not None and n_vals > ANNFidx.HGVS_C:
-                    # strip of leading 'n.' as redundant information
-                    hgvs_c[i, j] = vals[ANNFidx.HGVS_C][2:]
-                if hgvs_p is not None and n_vals > ANNFidx.HGVS_P:
-                    # strip of leading 'p.' as redundant information
-                    hgvs_p[i, j] = vals[ANNFidx.HGVS_P][2:]
-                if cdna_pos is not None or cdna_length is not None and n_vals > ANNFidx.CDNA:
-                    v = vals[ANNFidx.CDNA]
-                    if v:
-                        vv = v.split('/')
-                        if cdna_pos is not None:
-                            cdna_pos[i, j] = int(vv[0])
-                        if cdna_length is not None and len(vv) > 1:
-                            cdna_length[i, j] = int(vv[1])
-                if cds_pos is not None or cds_length is not None and n_vals > ANNFidx.CDS:
-                    v = vals[ANNFidx.CDS]
-                    if v:
-                        vv = v.split('/')
-                        if cds_pos is not None:
-                            cds_pos[i, j] = int(vv[0])
-                        if cds_length is not None and len(vv) > 1:
-                            cds_length[i, j] = int(vv[1])
-                if aa_pos is not None or aa_length is not None and n_vals > ANNFidx.AA:
-                    v = vals[ANNFidx.AA]
-                    if v:
-                        vv = v.split('/')
-                        if aa_pos is not None:
-                            aa_pos[i, j] = int(vv[0])
-                        if aa_length is not None and len(vv) > 1:
-                            aa_length[i, j] = int(vv[1])
-                if distance is not None and n_vals > ANNFidx.DISTANCE:
-                    v = vals[ANNFidx.DISTANCE]
-                    if v:
-                        distance[i, j] = int(v)
-
-        ann_chunk = dict()
-        if allele is not None:
-            ann_chunk[ANN_ALLELE_FIELD] = allele
-        if annotation is not None:
-            ann_chunk[ANN_ANNOTATION_FIELD] = annotation
-        if annotation_impact is not None:
-            ann_chunk[ANN_ANNOTATION_IMPACT_FIELD] = annotation_impact
-        if gene_name is not None:
-            ann_chunk[ANN_GENE_NAME_FIELD] = gene_name
-        if gene_id is not None:
-            ann_chunk[ANN_GENE_ID_FIELD] = gene_id
-        if feature_type is not None:
-            ann_chunk[ANN_FEATURE_TYPE_FIELD] = feature_type
-        if feature_id is not None:
-            ann_chunk[ANN_FEATURE_ID_FIELD] = feature_id
-        if transcript_biotype is not None:
-            ann_chunk[ANN_TRANSCRIPT_BIOTYPE_FIELD] = transcript_biotype
-        if rank is not None:
-            ann_chunk[ANN_RANK_FIELD] = rank
-        if hgvs_c is not None:
-            ann_chunk[ANN_HGVS_C_FIELD] = hgvs_c
-        if hgvs_p is not None:
-            ann_chunk[ANN_HGVS_P_FIELD] = hgvs_p
-        if cdna_pos is not None:
-            ann_chunk[ANN_CDNA_POS_FIELD] = cdna_pos
-        if cdna_length is not None:
-            ann_chunk[ANN_CDNA_LENGTH_FIELD] = cdna_length
-        if cds_pos is not None:
-            ann_chunk[ANN_CDS_POS_FIELD] = cds_pos
-        if cds_length is not None:
-            ann_chunk[ANN_CDS_LENGTH_FIELD] = cds_length
-        if aa_pos is not None:
-            ann_chunk[ANN_AA_POS_FIELD] = aa_pos
-        if aa_length is not None:
-            ann_chunk[ANN_AA_LENGTH_FIELD] = aa_length
-        if distance is not None:
-            ann_chunk[ANN_DISTANCE_FIELD] = distance
+        number = 1 if len(ann.shape) == 1 else ann.shape[1]
+        n_items = chunk_length * number
+
+        # find values within all annotations
+        data_values, starts_values, stops_values = _ann_buffers(ann)
+        data, starts, stops = data_values, starts_values, stops_values
+        spans_values = np.full((n_items, ANN_N_VALUES, 2), -1, dtype='i8')
+        spans = spans_values
+        with nogil:
+            ann_find_values(data, starts, stops, spans)
+
+        if self.annotations == 'most_severe' and number > 1:
+            selected_values = np.zeros(chunk_length, dtype='i8')
+            selected = selected_values
+            with nogil:
+                ann_select_most_severe(data, spans, number, selected)
+            spans_values = spans_values[selected_values]
+            spans = spans_values
+            number = 1
+            n_items = chunk_length
 
         if number == 1:
-            for k in list(ann_chunk.keys()):
-                ann_chunk[k] = ann_chunk[k].squeeze(axis=1)
+            shape = (chunk_length,)
+        else:
+            shape = (chunk_length, number)
+
+        extracts_values = np.empty((n_items, 2), dtype='i8')
+        extracts = extracts_values
+        for field, value_index, part in ANN_EXTRACTS:
+            if field not in self.fields:
+                continue
+            t = self.types[field]
+            with nogil:
+                ann_extract(data, spans, value_index, part, extracts)
+
+            if default_ann_types[field].kind == 'i':
+                values = np.empty(n_items, dtype='i8')
+                integers = values
+                with nogil:
+                    ann_parse_integers(data, extracts, integers)
+                values = values.astype(t)
+
+            elif t == OFFSETS_TYPE:
+                lengths = extracts_values[:, 1] - extracts_values[:, 0]
+                offsets_values = np.zeros(n_items + 1, dtype='i8')
+                np.cumsum(np.maximum(lengths, 0), out=offsets_values[1:])
+                offsets = offsets_values
+                buffer_values = np.empty(offsets_values[n_items], dtype='u1')
+                buffer = buffer_values
+                with nogil:
+                    ann_copy_offsets(data, extracts, offsets, buffer)
+                chunk[field] = OffsetStringArray(offsets_values, buffer_values, shape=shape)
+                continue
 
-        chunk.update(ann_chunk)
+            elif t.kind == 'S':
+                values = np.zeros(n_items, dtype=t)
+                if t.itemsize > 0:
+                    fixed = values.view('u1').reshape(n_items, t.itemsize)
+                    with nogil:
+                        ann_copy_fixed(data, extracts, fixed)
+
+            else:
+                values = np.empty(n_items, dtype=object)
+                for k in range(n_items):
+                    if extracts[k, 1] > extracts[k, 0]:
+                        values[k] = PyUnicode_DecodeUTF8(
+                            <const char*> &data[extracts[k, 0]],
+                            extracts[k, 1] - extracts[k, 0], NULL)
+                    else:
+                        values[k] = u''
+                if t.kind == 'U':
+                    values = values.astype(t)
+
+            chunk[field] = values.reshape(shape)
@@ -11,7 +11,7 @@ from allel.test.tools import assert_array_equal as aeq
 
 # internal imports
 from allel import GenotypeArray, HaplotypeArray, AlleleCountsArray, GenotypeVector, \
-    GenotypeAlleleCountsArray, GenotypeAlleleCountsVector
+    GenotypeAlleleCountsArray, GenotypeAlleleCountsVector, OffsetStringArray
 from allel.test.model.test_api import GenotypeArrayInterface, HaplotypeArrayInterface, \
     diploid_genotype_data, triploid_genotype_data, haplotype_data, \
     AlleleCountsArrayInterface, allele_counts_data, GenotypeAlleleCountsArrayInterface, \
@@ -478,3 +478,62 @@ class GenotypeAlleleCountsArrayTests(GenotypeAlleleCountsArrayInterface, unittes
         s = g[0, 0, 0]
         assert_is_instance(s, np.int8)
         assert_not_is_instance(s, GenotypeAlleleCountsArray)
+
+
+# noinspection PyMethodMayBeStatic
+class OffsetStringArrayTests(unittest.TestCase):
+
+    def test_constructor(self):
+
+        # missing data arg
+        with assert_raises(TypeError):
+            # noinspection PyArgumentList
+            OffsetStringArray()
+
+        # offsets have wrong dtype
+        with assert_raises(TypeError):
+            OffsetStringArray([0., 1.], b'A')
+
+        # shape does not match number of items
+        with assert_raises(ValueError):
+            OffsetStringArray([0, 1, 2], b'AC', shape=(3,))
+
+        a = OffsetStringArray([0, 1, 4, 4], b'ATTG')
+        eq((3,), a.shape)
+        eq(3, len(a))
+        eq([b'A', b'TTG', b''], list(a))
+
+    def test_get_item(self):
+        values = [[b'A', b'CC'], [b'', b'GGG'], [b'T', b'']]
+        a = OffsetStringArray.from_values(values)
+        eq((3, 2), a.shape)
+        aeq(np.array(values), np.asarray(a))
+
+        # row index
+        s = a[1]
+        assert_is_instance(s, OffsetStringArray)
+        eq([b'', b'GGG'], list(s))
+        eq(b'T', a[-1][0])
+
+        # row slice, shares buffer
+        s = a[1:]
+        assert_is_instance(s, OffsetStringArray)
+        assert s.data is a.data
+        aeq(np.array(values[1:]), np.asarray(s))
+
+        # take and compress
+        aeq(np.array(values)[[2, 0]], np.asarray(a[[2, 0]]))
+        aeq(np.array(values)[::2], np.asarray(a[::2]))
+        aeq(np.array(values)[::2], np.asarray(a[np.array([True, False, True])]))
+
+        # item
+        eq(b'GGG', a[1, 1])
+
+    def test_concatenate(self):
+        a = OffsetStringArray.from_values([b'A', b'TTG', b'', b'CA'])
+        b = OffsetStringArray.from_values([u'GATTACA', u''])
+        c = a[1:3].concatenate([b, a[:1]])
+        eq([b'TTG', b'', b'GATTACA', b'', b'A'], list(c))
+        aeq([0, 3, 3, 10, 10, 11], c.offsets)
+        with assert_raises(ValueError):
+            a.concatenate(OffsetStringArray.from_values([[b'A', b'C']]))
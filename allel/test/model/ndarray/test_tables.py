@@ -11,7 +11,7 @@ from allel.test.tools import assert_array_equal as aeq
 
 
 # internal imports
-from allel import VariantTable, FeatureTable
+from allel import VariantTable, FeatureTable, OffsetStringArray
 from allel.test.model.test_api import VariantTableInterface, variant_table_data, \
     variant_table_dtype, FeatureTableInterface, feature_table_data, feature_table_dtype
 
@@ -61,6 +61,20 @@ class VariantTableTests(VariantTableInterface, unittest.TestCase):
         expect = a.take(indices)
         aeq(expect, t)
 
+    def test_constructor_dict(self):
+        data = {
+            'POS': np.array([2, 7, 3]),
+            'REF': OffsetStringArray.from_values([b'A', b'TTG', b'C']),
+            'ALT': OffsetStringArray.from_values([[b'C', b''], [b'T', b'TT'], [b'', b'']]),
+        }
+        vt = VariantTable(data, names=['POS', 'REF', 'ALT'])
+        eq(('POS', 'REF', 'ALT'), vt.names)
+        eq(3, vt.n_variants)
+        aeq([b'A', b'TTG', b'C'], vt['REF'])
+        aeq([[b'C', b''], [b'T', b'TT'], [b'', b'']], vt['ALT'])
+        vt = VariantTable.fromdict(data)
+        eq(('ALT', 'POS', 'REF'), vt.names)
+
 
 # noinspection PyMethodMayBeStatic
 class FeatureTableTests(FeatureTableInterface, unittest.TestCase):
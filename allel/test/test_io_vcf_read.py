@@ -2,12 +2,17 @@
 from __future__ import absolute_import, print_function, division
 import io
 import os
+import re
 import shutil
 import itertools
 import gzip
+import struct
 import warnings
 import tempfile
 import atexit
+import zlib
+import json
+from multiprocessing.pool import ThreadPool
 
 
 import zarr
@@ -18,9 +23,15 @@ from nose.tools import (assert_almost_equal, eq_, assert_in, assert_list_equal,
                         assert_raises)
 from allel.io.vcf_read import (iter_vcf_chunks, read_vcf, vcf_to_zarr, vcf_to_hdf5,
                                vcf_to_npz, ANNTransformer, vcf_to_dataframe, vcf_to_csv,
-                               vcf_to_recarray, read_vcf_headers)
+                               vcf_to_parquet, vcf_to_recarray, read_vcf_headers,
+                               VCFIngestStats, _chunk_iter_collect, _chunk_iter_store)
+from allel.opt.io_vcf_read import MemoryMappedInputStream
+from allel.io.bgzf import is_bgzf, iter_bgzf_blocks
+from allel.io.tabix import read_index, parse_region, load_index
+from allel.io.vcf_index import index_vcf, read_vcf_index
 from allel.compat import PY2
 from allel.test.tools import compare_arrays
+from allel.model.ndarray import GenotypeArray, OffsetStringArray
 
 
 # needed for PY2/PY3 consistent behaviour
@@ -541,6 +552,75 @@ def test_chunk_lengths():
         _test_read_vcf_content(vcf_path, chunk_length, buffer_size)
 
 
+def test_max_memory():
+    vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'sample.vcf')
+    fields = ['POS', 'DP', 'GT']
+    # 4 bytes for POS and DP, 2 x 3 bytes for GT
+    for max_memory, chunk_length in (1, 1), (14, 1), (30, 2), (50, 3), (10**6, 9):
+        _, _, _, it = iter_vcf_chunks(vcf_path, fields=fields, max_memory=max_memory)
+        chunk_lengths = [n for _, n, _, _ in it]
+        eq_(chunk_length, chunk_lengths[0])
+        eq_(9, sum(chunk_lengths))
+    expect = read_vcf(vcf_path, fields='*')
+    actual = read_vcf(vcf_path, fields='*', max_memory=1000)
+    for key in expect.keys():
+        compare_arrays(expect[key], actual[key])
+    # storage chunks match
+    zarr_path = os.path.join(tempdir, 'sample.zarr')
+    if os.path.exists(zarr_path):
+        shutil.rmtree(zarr_path)
+    vcf_to_zarr(vcf_path, zarr_path, fields=fields, max_memory=30)
+    actual = zarr.open_group(zarr_path, mode='r')
+    eq_((2,), actual['variants/POS'].chunks)
+    eq_((2, 3, 2), actual['calldata/GT'].chunks)
+    compare_arrays(expect['calldata/GT'], actual['calldata/GT'][:])
+
+
+def test_ingest_stats():
+    vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'sample.vcf')
+    bcf_path = os.path.join(tempdir, 'sample.stats.bcf')
+    _vcf_to_bcf(vcf_path, bcf_path)
+    fields = ['variants/*', 'calldata/GT', 'calldata/DP']
+
+    for input, n_threads in (vcf_path, None), (vcf_path, 2), (bcf_path, None):
+        log = io.StringIO()
+        stats = VCFIngestStats(log=log)
+        _, _, _, it = iter_vcf_chunks(input, fields=fields, chunk_length=4,
+                                      n_threads=n_threads, filter_expression='DP > 10',
+                                      stats=stats)
+        chunks = [chunk for chunk, _, _, _ in it]
+        eq_(len(chunks), stats.n_chunks)
+        eq_(sum(len(c['variants/POS']) for c in chunks), stats.n_variants)
+        eq_(sum(a.nbytes for c in chunks for a in c.values()), stats.bytes_out)
+        assert stats.elapsed > 0
+        assert stats.variants_per_second > 0
+        assert_list_equal(['parse', 'read'], sorted(stats.stages.keys()))
+        if input == vcf_path:
+            eq_(os.path.getsize(vcf_path), stats.bytes_in)
+            for f in 'CHROM', 'INFO', 'calldata', 'filter_expression', 'variants/DP', \
+                    'calldata/GT', 'calldata/DP':
+                assert_in(f, stats.fields)
+        else:
+            eq_(dict(), stats.fields)
+        lines = [json.loads(line) for line in log.getvalue().splitlines()]
+        eq_(stats.n_chunks + 1, len(lines))
+        eq_(['chunk'] * stats.n_chunks + ['done'], [line['event'] for line in lines])
+        eq_(stats.to_dict()['n_variants'], lines[-1]['n_variants'])
+
+    # storing
+    stats = VCFIngestStats()
+    zarr_path = os.path.join(tempdir, 'sample.stats.zarr')
+    vcf_to_zarr(vcf_path, zarr_path, fields=fields, chunk_length=2, overwrite=True,
+                transformers=[], stats=stats)
+    eq_(9, stats.n_variants)
+    assert_list_equal(['parse', 'read', 'store', 'transform'], sorted(stats.stages.keys()))
+    h5_path = os.path.join(tempdir, 'sample.stats.h5')
+    vcf_to_hdf5(vcf_path, h5_path, fields=fields, chunk_length=2, overwrite=True,
+                stats=stats)
+    eq_(18, stats.n_variants)
+    eq_(10, stats.n_chunks)
+
+
 def test_buffer_sizes():
     vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'sample.vcf')
     chunk_length = 3
@@ -550,6 +630,411 @@ def test_buffer_sizes():
         _test_read_vcf_content(vcf_path, chunk_length, buffer_size)
 
 
+def test_n_threads():
+    vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'sample.vcf')
+    chunk_lengths = 1, 2, 3, 5, 10, 20
+    regions = None, '20', '20:1000000-1233000', 'Y'
+
+    for chunk_length, region in itertools.product(chunk_lengths, regions):
+        expect = read_vcf(vcf_path, fields='*', chunk_length=chunk_length,
+                          region=region)
+        for n_threads in 2, 3:
+            actual = read_vcf(vcf_path, fields='*', chunk_length=chunk_length,
+                              region=region, n_threads=n_threads)
+            if expect is None:
+                assert actual is None
+                continue
+            assert_list_equal(sorted(expect.keys()), sorted(actual.keys()))
+            for k in expect.keys():
+                compare_arrays(expect[k], actual[k])
+
+    # chunks end at the last variant returned, not the last line parsed
+    for kwargs in dict(region='20:1-1110696'), dict(region=['19', 'X']), \
+            dict(filter_expression='POS < 1110696'):
+        for chunk_length in 2, 4:
+            _, _, _, it = iter_vcf_chunks(vcf_path, fields=['CHROM', 'POS'],
+                                          chunk_length=chunk_length, n_threads=2,
+                                          **kwargs)
+            for chunk, n, chrom, pos in it:
+                eq_(chunk['variants/CHROM'][n - 1], chrom.decode('ascii'))
+                eq_(chunk['variants/POS'][n - 1], pos)
+
+
+def test_concurrent_reads():
+    # parsing releases the GIL, check reading from multiple threads is safe
+    vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'sample.vcf')
+    regions = ['19', '20', 'X'] * 4
+
+    def read_region(region):
+        return read_vcf(vcf_path, fields='*', region=region, chunk_length=2)
+
+    expect = [read_region(region) for region in regions]
+    pool = ThreadPool(4)
+    actual = pool.map(read_region, regions)
+    pool.close()
+    pool.join()
+    for e, a in zip(expect, actual):
+        assert_list_equal(sorted(e.keys()), sorted(a.keys()))
+        for k in e.keys():
+            compare_arrays(e[k], a[k])
+
+
+def test_bgzf():
+    vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'sample.vcf.gz')
+    assert is_bgzf(vcf_path)
+    assert not is_bgzf(vcf_path[:-3])
+
+    # decompressed blocks
+    with gzip.open(vcf_path, mode='rb') as f:
+        expect = f.read()
+    for n_threads in None, 1, 2:
+        with open(vcf_path, mode='rb') as f:
+            actual = b''.join(iter_bgzf_blocks(f, n_threads=n_threads, batch_size=1))
+        eq_(expect, actual)
+
+    # parsing
+    for chunk_length in 1, 2, 3, 20:
+        expect = read_vcf(vcf_path, fields='*', chunk_length=chunk_length)
+        for n_threads in 1, 2:
+            actual = read_vcf(vcf_path, fields='*', chunk_length=chunk_length,
+                              n_threads=n_threads)
+            assert_list_equal(sorted(expect.keys()), sorted(actual.keys()))
+            for k in expect.keys():
+                compare_arrays(expect[k], actual[k])
+
+
+def _tbi_to_csi(index, path):
+    # write a CSI index with the same bins as a tabix index
+    aux = struct.pack('<6i', 2, 1, 2, 0, ord('#'), 0)
+    names = b''.join(n.encode('ascii') + b'\x00' for n in index.names)
+    aux += struct.pack('<i', len(names)) + names
+    data = b'CSI\x01' + struct.pack('<3i', 14, 5, len(aux)) + aux
+    data += struct.pack('<i', len(index.bins))
+    for bins in index.bins:
+        data += struct.pack('<i', len(bins))
+        for b, chunks in sorted(bins.items()):
+            data += struct.pack('<IQi', b, int(chunks[0, 0]), len(chunks))
+            data += chunks.astype('<u8').tobytes()
+    with gzip.open(path, mode='wb') as f:
+        f.write(data)
+
+
+def _read_region_by_filtering(path, region):
+    # read the whole file, then select variants within the region
+    callset = read_vcf(path, fields='*', tabix=None)
+    chrom, begin, end = parse_region(region)
+    loc = callset['variants/CHROM'] == chrom
+    if begin:
+        loc &= callset['variants/POS'] >= begin
+    if end:
+        loc &= callset['variants/POS'] <= end
+    if not np.any(loc):
+        return None
+    return dict((k, a if k == 'samples' else a[loc]) for k, a in callset.items())
+
+
+def test_tabix_index():
+    vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'sample.vcf.gz')
+    regions = '19', '20', 'X', 'Y', '20:1000000-1233000', '20:1-5', '19:111-112'
+
+    index = read_index(vcf_path + '.tbi')
+    eq_(['19', '20', 'X'], index.names)
+    eq_(2, index.n_records('19'))
+    eq_(6, index.n_records('20'))
+    eq_(0, index.n_records('Y'))
+
+    # compare with scanning
+    for region in regions:
+        expect = _read_region_by_filtering(vcf_path, region)
+        eq_(expect is None,
+            read_vcf(vcf_path, fields='*', region=region, tabix=None) is None)
+        actual = read_vcf(vcf_path, fields='*', region=region, tabix='nonexistent')
+        if expect is None:
+            assert actual is None
+            continue
+        for k in expect.keys():
+            compare_arrays(expect[k], actual[k])
+
+    # CSI index
+    csi_path = os.path.join(tempdir, 'sample.vcf.gz')
+    shutil.copy(vcf_path, csi_path)
+    _tbi_to_csi(index, csi_path + '.csi')
+    csi_index = read_index(csi_path + '.csi')
+    eq_(index.names, csi_index.names)
+    for region in regions:
+        chrom, begin, end = parse_region(region)
+        eq_(index.query(chrom, begin, end), csi_index.query(chrom, begin, end))
+        expect = _read_region_by_filtering(vcf_path, region)
+        actual = read_vcf(csi_path, fields='*', region=region, tabix='nonexistent')
+        if expect is None:
+            assert actual is None
+            continue
+        for k in expect.keys():
+            compare_arrays(expect[k], actual[k])
+
+
+def _bgzf_compress(data, block_size=2**16 - 1024):
+    # compress data as a series of BGZF blocks, followed by an empty block
+    out = b''
+    blocks = [data[i:i + block_size] for i in range(0, len(data), block_size)]
+    for block in blocks + [b'']:
+        c = zlib.compressobj(6, zlib.DEFLATED, -15)
+        cdata = c.compress(block) + c.flush()
+        out += struct.pack('<4BI2BH2BHH', 31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2,
+                           len(cdata) + 25)
+        out += cdata + struct.pack('<2I', zlib.crc32(block) & 0xffffffff, len(block))
+    return out
+
+
+def test_tabix_index_no_records():
+    data_path = os.path.join(os.path.dirname(__file__), 'data')
+    with open(os.path.join(data_path, 'sample.vcf'), mode='rb') as f:
+        data = f.read()
+    header = data[:data.index(b'\n19\t') + 1]
+
+    # small blocks, so the header spans several
+    vcf_path = os.path.join(tempdir, 'no_records.vcf.gz')
+    with open(vcf_path, mode='wb') as f:
+        f.write(_bgzf_compress(data, block_size=100))
+    assert is_bgzf(vcf_path)
+
+    # tabix index naming sequences but holding no bins
+    names = b'19\x0020\x00X\x00'
+    index_data = b'TBI\x01' + struct.pack('<8i', 3, 2, 1, 2, 0, ord('#'), 0, len(names))
+    index_data += names + struct.pack('<2i', 0, 0) * 3
+    with gzip.open(vcf_path + '.tbi', mode='wb') as f:
+        f.write(index_data)
+
+    index = load_index(vcf_path)
+    assert index.data_offset is None
+    eq_(header, index.header)
+    assert read_vcf(vcf_path, region='20') is None
+    eq_(9, len(read_vcf(vcf_path)['variants/POS']))
+
+
+def test_vcf_index():
+    data_path = os.path.join(os.path.dirname(__file__), 'data')
+    regions = ['19', '20', 'X', 'Y', '20:1000000-1233000', '20:1-5', '20:17330-17330',
+               ['19:111-111', '20:1-20000', 'X']]
+
+    # uncompressed, gzip and bgzip compressed, and unsorted
+    vcf_paths = list()
+    for fn in 'sample.vcf', 'unsorted.vcf':
+        shutil.copy(os.path.join(data_path, fn), os.path.join(tempdir, fn))
+        vcf_paths.append(os.path.join(tempdir, fn))
+    shutil.copy(os.path.join(data_path, 'sample.vcf.gz'),
+                os.path.join(tempdir, 'sample.bgzf.vcf.gz'))
+    vcf_paths.append(os.path.join(tempdir, 'sample.bgzf.vcf.gz'))
+    with open(os.path.join(data_path, 'sample.vcf'), mode='rb') as src:
+        with gzip.open(os.path.join(tempdir, 'sample.gzip.vcf.gz'), mode='wb') as dst:
+            dst.write(src.read())
+    vcf_paths.append(os.path.join(tempdir, 'sample.gzip.vcf.gz'))
+
+    for vcf_path, compression in zip(vcf_paths, ['none', 'none', 'bgzf', 'gzip']):
+        if os.path.exists(vcf_path + '.vidx'):
+            os.remove(vcf_path + '.vidx')
+        expect = [read_vcf(vcf_path, fields='*', region=region, tabix=None)
+                  for region in regions]
+        index = index_vcf(vcf_path, interval=2)
+        eq_(compression, index.compression)
+        eq_(9, index.n_records())
+        eq_(6, index.n_records('20'))
+        eq_(0, index.n_records('Y'))
+        eq_(index.to_dict(), read_vcf_index(vcf_path + '.vidx').to_dict())
+
+        # compare with scanning
+        for region, e in zip(regions, expect):
+            actual = read_vcf(vcf_path, fields='*', region=region)
+            if e is None:
+                assert actual is None
+                continue
+            for k in e.keys():
+                compare_arrays(e[k], actual[k])
+
+        # ranges hold all records between them
+        ranges = index.split(3)
+        eq_(3, len(ranges))
+        eq_(9, sum(n for _, _, n in ranges))
+        eq_(index.data_end, ranges[-1][1])
+
+    # regions are only read in part
+    vcf_path = vcf_paths[0]
+    index = read_vcf_index(vcf_path + '.vidx')
+    eq_(1, len(index.query('20', 1200000, 1230237)))
+    start, stop = index.query('20', 1200000, 1230237)[0]
+    assert index.query('20')[0][0] < start < stop < index.query('20')[0][1]
+
+    # split parsing between processes via the index
+    zarr_path = os.path.join(tempdir, 'sample.zarr')
+    for vcf_path, compression in zip(vcf_paths, ['none', 'none', 'bgzf', 'gzip']):
+        expect = read_vcf(vcf_path, fields='*', alt_number=2)
+        if os.path.exists(zarr_path):
+            shutil.rmtree(zarr_path)
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            vcf_to_zarr(vcf_path, zarr_path, fields='*', alt_number=2, chunk_length=2,
+                        n_processes=3)
+        # N.B., gzip input cannot be read from an offset, so is processed serially
+        eq_(compression == 'gzip', any('gzip' in str(x.message) for x in w))
+        actual = zarr.open_group(zarr_path, mode='r')
+        for k in expect.keys():
+            compare_arrays(expect[k], actual[k][:])
+
+    # ignore index if the data are modified, whether or not the index is older
+    vcf_path = vcf_paths[0]
+    stat = os.stat(vcf_path)
+    os.utime(vcf_path + '.vidx', (stat.st_atime, stat.st_mtime + 10))
+    os.utime(vcf_path, (stat.st_atime, stat.st_mtime + 5))
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter('always')
+        callset = read_vcf(vcf_path, region='20')
+    eq_(6, len(callset['variants/POS']))
+    assert any('modified' in str(x.message) for x in w)
+    with open(vcf_path, mode='ab') as f:
+        f.write(b'20\t1300000\t.\tA\tT\t.\t.\t.\tGT\t0|0\t0|0\t0|0\n')
+    os.utime(vcf_path, (stat.st_atime, stat.st_mtime))
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter('always')
+        callset = read_vcf(vcf_path, region='20')
+    eq_(7, len(callset['variants/POS']))
+    assert any('modified' in str(x.message) for x in w)
+
+    # BCF not supported
+    bcf_path = os.path.join(tempdir, 'sample.bcf')
+    _vcf_to_bcf(os.path.join(data_path, 'sample.vcf'), bcf_path)
+    with assert_raises(ValueError):
+        index_vcf(bcf_path)
+
+
+def test_memory_mapped_input_stream():
+    vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'sample.vcf')
+    with open(vcf_path, mode='rb') as f:
+        data = f.read()
+    header_end = data.index(b'\n19\t') + 1
+    n_lines = data[header_end:].count(b'\n')
+
+    # whole file
+    with open(vcf_path, mode='rb') as f:
+        stream = MemoryMappedInputStream(f)
+        eq_((header_end, len(data)), stream.span)
+        eq_(n_lines, stream.count_lines())
+        lines = list(iter(stream.readline, b''))
+    eq_(data, b''.join(lines))
+
+    # line-aligned splits cover all data lines exactly once
+    for n in 1, 2, 3, 7, 100:
+        spans = list()
+        with open(vcf_path, mode='rb') as f:
+            for i in range(n):
+                stream = MemoryMappedInputStream(f, start=len(data) * i // n,
+                                                 stop=len(data) * (i + 1) // n)
+                spans.append(stream.span)
+                lines = list(iter(stream.readline, b''))
+                eq_(data[:header_end], b''.join(lines[:len(lines) - stream.count_lines()]))
+                eq_(data[slice(*stream.span)],
+                    b''.join(lines[len(lines) - stream.count_lines():]))
+        eq_(header_end, spans[0][0])
+        eq_(len(data), spans[-1][1])
+        for (_, stop), (start, _) in zip(spans[:-1], spans[1:]):
+            eq_(stop, start)
+
+    # parse a split
+    expect = read_vcf(vcf_path, fields='*')
+    with open(vcf_path, mode='rb') as f:
+        stream = MemoryMappedInputStream(f, start=len(data) // 2)
+        start = stream.span[0]
+        actual = read_vcf(io.BytesIO(data[:header_end] + data[start:]), fields='*')
+        offset = len(expect['variants/POS']) - len(actual['variants/POS'])
+    for k in expect.keys():
+        if k != 'samples':
+            compare_arrays(expect[k][offset:], actual[k])
+
+
+def test_chunk_iter_collect():
+    chunks = [
+        {'a': np.arange(3), 'b': np.array([b'x', b'y', b'z']),
+         'c': np.array(['x', 'y', 'z'], dtype=object)},
+        {'a': np.arange(3, 5), 'b': np.array([b'xx', b'yy']),
+         'c': np.array(['xx', 'yy'], dtype=object)},
+        {'a': np.arange(5, 10), 'b': np.array([b'q'] * 5),
+         'c': np.array(['q'] * 5, dtype=object)},
+    ]
+    expect = dict((k, np.concatenate([c[k] for c in chunks])) for k in 'abc')
+    for capacity in None, 1, 4, 10, 100:
+        it = ((c, len(c['a']), b'', 0) for c in chunks)
+        actual = _chunk_iter_collect(it, capacity=capacity)
+        for k in 'abc':
+            compare_arrays(expect[k], actual[k])
+    eq_(None, _chunk_iter_collect(iter([])))
+
+
+def test_filter_expression():
+    vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'sample.vcf')
+    expected = read_vcf(vcf_path, fields='*', types={'REF': 'S3'})
+    v = dict((k[9:], a) for k, a in expected.items() if k.startswith('variants/'))
+    expressions = {
+        'DP > 10': v['DP'] > 10,
+        'FILTER_PASS': v['FILTER_PASS'],
+        'not DB': ~v['DB'],
+        'is_snp and QUAL > 20': v['is_snp'] & (v['QUAL'] > 20),
+        '(AF[0] > 0.1) | (10 < DP <= 14)':
+            (v['AF'][:, 0] > 0.1) | ((v['DP'] > 10) & (v['DP'] <= 14)),
+        '-DP * 2 < -24': -v['DP'] * 2 < -24,
+        "REF == 'G'": v['REF'] == b'G',
+        "ALT[0] != 'A'": v['ALT'][:, 0] != 'A',
+    }
+    for expression, loc in expressions.items():
+        for chunk_length, n_threads in itertools.product([1, 2, 100], [None, 2]):
+            # all fields
+            actual = read_vcf(vcf_path, fields='*', types={'REF': 'S3'},
+                              chunk_length=chunk_length, n_threads=n_threads,
+                              filter_expression=expression)
+            for key in expected:
+                if key == 'samples':
+                    continue
+                compare_arrays(expected[key][loc], actual[key])
+            # fields referenced in the expression are not returned unless requested
+            actual = read_vcf(vcf_path, fields=['POS', 'GT'], types={'REF': 'S3'},
+                              chunk_length=chunk_length, n_threads=n_threads,
+                              filter_expression=expression)
+            assert_list_equal(['calldata/GT', 'variants/POS'], sorted(actual))
+            compare_arrays(expected['variants/POS'][loc], actual['variants/POS'])
+            compare_arrays(expected['calldata/GT'][loc], actual['calldata/GT'])
+
+    # no variants selected
+    eq_(None, read_vcf(vcf_path, filter_expression='DP > 1000'))
+
+    # bad expressions
+    for expression in ['DP >', 'GT > 0', 'AF > 0.1', 'DP[1] > 0', "DP == 'x'",
+                       "REF < 'A'", 'len(REF) > 1', 'DP ** 2 > 4', "'A' == 'A'"]:
+        assert_raises(ValueError, read_vcf, vcf_path, filter_expression=expression)
+
+
+def test_auto_sizes():
+    vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'sample.vcf')
+    expected = read_vcf(vcf_path, fields='*', alt_number=3,
+                        types={'REF': 'S2', 'ALT': 'S3', 'ID': 'S9', 'AA': 'S1',
+                               'calldata/GT': 'S3'})
+    for path, n_threads in itertools.product([vcf_path, vcf_path + '.gz'], [None, 2]):
+        actual = read_vcf(path, fields='*', alt_number='auto', n_threads=n_threads,
+                          types={'REF': 'S', 'ALT': 'S', 'ID': 'S', 'AA': 'S',
+                                 'calldata/GT': 'S'})
+        for key in expected:
+            eq_(expected[key].dtype, actual[key].dtype)
+            compare_arrays(expected[key], actual[key])
+
+    # sizes are found within the region only, where possible
+    callset = read_vcf(vcf_path + '.gz', region='19', alt_number='auto',
+                       types={'REF': 'S'})
+    eq_((2,), callset['variants/ALT'].shape)
+    eq_(np.dtype('S1'), callset['variants/REF'].dtype)
+
+    # errors
+    assert_raises(ValueError, read_vcf, vcf_path, types={'POS': 'S'})
+    with open(vcf_path, mode='rb') as f:
+        assert_raises(ValueError, read_vcf, f, alt_number='auto')
+
+
 def test_utf8():
     vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'sample.utf8.vcf')
     callset = read_vcf(vcf_path, fields='*')
@@ -1032,6 +1517,327 @@ def test_genotype_ploidy():
     eq_((0, 2, -1), tuple(gt[8, 2]))
 
 
+def test_genotype_diploid():
+    # mix of calls handled by the diploid fast path and calls which are not
+    input_data = (
+        b"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\tS2\tS3\tS4\n"
+        b"2L\t12\t.\tA\tT\t.\t.\t.\tGT:GQ\t0/0:11\t0|1:12\t./.:13\t1/.:14\n"
+        b"2L\t34\t.\tC\tT\t.\t.\t.\tGT:GQ\t10/2:21\t0|12:22\t123|45:23\t1:24\n"
+        b"2L\t56\t.\tG\tA\t.\t.\t.\tGT:GQ\t0/1/2:31\t0/:32\t/1:33\t.:34\n"
+        b"2L\t78\t.\tT\tA\t.\t.\t.\tGT\t0/0\t1|1\t.|0\t9/9\n"
+    )
+    expect_gt = np.array([[[0, 0, -1], [0, 1, -1], [-1, -1, -1], [1, -1, -1]],
+                          [[10, 2, -1], [0, 12, -1], [123, 45, -1], [1, -1, -1]],
+                          [[0, 1, 2], [0, -1, -1], [-1, 1, -1], [-1, -1, -1]],
+                          [[0, 0, -1], [1, 1, -1], [-1, 0, -1], [9, 9, -1]]])
+    expect_gq = np.array([[11, 12, 13, 14],
+                          [21, 22, 23, 24],
+                          [31, 32, 33, 34],
+                          [-1, -1, -1, -1]])
+    for ploidy in 1, 2, 3:
+        for dtype in 'i2', 'i4', 'u2':
+            callset = read_vcf(io.BytesIO(input_data),
+                               fields=['calldata/GT', 'calldata/GQ'],
+                               numbers={'calldata/GT': ploidy, 'calldata/GQ': 1},
+                               types={'calldata/GT': 'genotype/' + dtype,
+                                      'calldata/GQ': 'i2'})
+            gt = callset['calldata/GT']
+            e = expect_gt[:, :, :ploidy].astype(dtype)
+            if ploidy == 1:
+                e = e[:, :, 0]
+            assert_array_equal(e, gt)
+            assert_array_equal(expect_gq, callset['calldata/GQ'])
+
+
+def test_format_layouts():
+    # many distinct FORMAT layouts, revisited in turn, more than are cached
+    keys = [b'GT', b'GQ', b'DP', b'XX', b'YY']
+    layouts = list(itertools.permutations(keys, 3)) * 3
+    values = {b'GT': b'0/1', b'GQ': b'12', b'DP': b'34', b'XX': b'x', b'YY': b'y'}
+    input_data = b"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\tS2\n"
+    for i, layout in enumerate(layouts):
+        sample = b':'.join(values[k] for k in layout)
+        input_data += b"2L\t%d\t.\tA\tT\t.\t.\t.\t%s\t%s\t%s\n" % (
+            i + 1, b':'.join(layout), sample, sample)
+    callset = read_vcf(io.BytesIO(input_data),
+                       fields=['calldata/GT', 'calldata/GQ', 'calldata/DP'],
+                       numbers={'calldata/GT': 2, 'calldata/GQ': 1, 'calldata/DP': 1},
+                       types={'calldata/GT': 'genotype/i1', 'calldata/GQ': 'i1',
+                              'calldata/DP': 'i2'})
+    eq_(len(layouts), len(callset['calldata/GT']))
+    for i, layout in enumerate(layouts):
+        if b'GT' in layout:
+            assert_array_equal([[0, 1], [0, 1]], callset['calldata/GT'][i])
+        else:
+            assert_array_equal([[-1, -1], [-1, -1]], callset['calldata/GT'][i])
+        assert_array_equal([12 if b'GQ' in layout else -1] * 2, callset['calldata/GQ'][i])
+        assert_array_equal([34 if b'DP' in layout else -1] * 2, callset['calldata/DP'][i])
+
+
+def test_numeric_values():
+    # values read directly from the input, and values deferred to strtol/strtod
+    values = [b'.', b'', b'0', b'-0', b'+5', b'007', b'-12', b'1.5', b'1e3', b'nan', b'-.',
+              b'.5', b'x', b'1234567890123456789', b'0.1', b'-3.75', b'123456.7890123',
+              b'0.12345678901234567', b'2.', b'-', b'inf']
+    expect_i = [-1, -1, 0, 0, 5, 7, -12, 1, 1, -1, -1, -1, -1, 1234567890123456789, 0, -3,
+                123456, 0, 2, -1, -1]
+    expect_f = [np.nan, np.nan, 0, 0, 5, 7, -12, 1.5, 1000, np.nan, np.nan, .5, np.nan,
+                1234567890123456789, .1, -3.75, 123456.7890123, 0.12345678901234567, 2,
+                np.nan, np.inf]
+    input_data = (b"##INFO=<ID=I,Number=2,Type=Integer,Description=\"\">\n"
+                  b"##INFO=<ID=F,Number=2,Type=Float,Description=\"\">\n"
+                  b"##FORMAT=<ID=I,Number=2,Type=Integer,Description=\"\">\n"
+                  b"##FORMAT=<ID=F,Number=2,Type=Float,Description=\"\">\n"
+                  b"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\n")
+    for i, v in enumerate(values):
+        input_data += b"2L\t%d\t.\tA\tT\t.\t.\tI=%s,%s;F=%s,%s\tI:F\t%s,%s:%s,%s\n" % (
+            (i + 1,) + (v,) * 8)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        callset = read_vcf(io.BytesIO(input_data),
+                           fields=['I', 'F', 'calldata/I', 'calldata/F'],
+                           types={'I': 'i8', 'F': 'f8', 'calldata/I': 'i8',
+                                  'calldata/F': 'f8'})
+    expect_i = np.array(expect_i)
+    expect_f = np.array(expect_f)
+    assert_array_equal(np.column_stack([expect_i] * 2), callset['variants/I'])
+    assert_array_equal(np.column_stack([expect_f] * 2), callset['variants/F'])
+    assert_array_equal(np.column_stack([expect_i] * 2), callset['calldata/I'][:, 0])
+    assert_array_equal(np.column_stack([expect_f] * 2), callset['calldata/F'][:, 0])
+    # sign of negative zero is preserved
+    assert np.signbit(callset['variants/F'][3, 0])
+
+
+# integer types used within BCF records, with the range of values each can hold
+_bcf_int_types = ((1, 'b', -120, 127), (2, 'h', -32760, 32767),
+                  (3, 'i', -2147483640, 2147483647))
+
+
+def _bcf_descriptor(t, n):
+    if n < 15:
+        return struct.pack('<B', n << 4 | t)
+    return struct.pack('<B', 15 << 4 | t) + _bcf_ints([n])
+
+
+def _bcf_ints(values, t=None):
+    # None is missing, Ellipsis is end of vector
+    if t is None:
+        present = [v for v in values if v is not None and v is not Ellipsis]
+        t, code, _, _ = [x for x in _bcf_int_types
+                         if all(x[2] <= v <= x[3] for v in present)][0]
+        data = _bcf_descriptor(t, len(values))
+    else:
+        code = dict((x[0], x[1]) for x in _bcf_int_types)[t]
+        data = b''
+    missing = {'b': -128, 'h': -32768, 'i': -2147483648}[code]
+    values = [missing if v is None else missing + 1 if v is Ellipsis else v
+              for v in values]
+    return data + struct.pack('<%s%s' % (len(values), code), *values)
+
+
+def _bcf_floats(values):
+    return b''.join(struct.pack('<I', 0x7F800001) if v is None else
+                    struct.pack('<I', 0x7F800002) if v is Ellipsis else
+                    struct.pack('<f', v) for v in values)
+
+
+def _bcf_encode_format(t, values):
+    # values for all samples, padded to the same length
+    if t == 'String':
+        values = [v or b'' for v in values]
+        n = max(len(v) for v in values)
+        return (_bcf_descriptor(7, n) +
+                b''.join(v + b'\x00' * (n - len(v)) for v in values))
+    values = [v or [None] for v in values]
+    n = max(len(v) for v in values)
+    values = [v + [Ellipsis] * (n - len(v)) for v in values]
+    if t == 'Float':
+        return _bcf_descriptor(5, n) + b''.join(_bcf_floats(v) for v in values)
+    flat = [x for v in values for x in v]
+    present = [x for x in flat if x is not None and x is not Ellipsis]
+    it = [x[0] for x in _bcf_int_types if all(x[2] <= v <= x[3] for v in present)][0]
+    return _bcf_descriptor(it, n) + b''.join(_bcf_ints(v, it) for v in values)
+
+
+def _bcf_parse_values(t, text):
+    if t == 'Integer':
+        return [None if v == b'.' else int(v) for v in text.split(b',')]
+    elif t == 'Float':
+        return [None if v == b'.' else float(v) for v in text.split(b',')]
+    return text
+
+
+def _bcf_parse_genotype(text):
+    values = list()
+    phased = False
+    for allele in re.split(b'([/|])', text):
+        if allele in (b'/', b'|'):
+            phased = allele == b'|'
+        else:
+            values.append((0 if allele == b'.' else (int(allele) + 1) << 1) | phased)
+    return values
+
+
+def _vcf_to_bcf(vcf_path, bcf_path, block_size=None):
+    """Convert a VCF file to BCF, as htslib would, compressed with BGZF unless
+    `block_size` is 0."""
+    headers = read_vcf_headers(vcf_path)
+    with open(vcf_path, mode='rb') as f:
+        lines = [line for line in f.read().split(b'\n') if line]
+    meta = [line for line in lines if line.startswith(b'##')]
+    records = [line.split(b'\t') for line in lines if not line.startswith(b'#')]
+
+    # dictionaries, with IDX attributes added to the header as by htslib
+    contigs = list()
+    for r in records:
+        if r[0] not in contigs:
+            contigs.append(r[0])
+    if not any(line.startswith(b'##FILTER=<ID=PASS,') for line in meta):
+        meta = [b'##FILTER=<ID=PASS,Description="All filters passed">'] + meta
+    meta += [b'##contig=<ID=%s>' % c for c in contigs]
+    dictionary = [b'PASS']
+    for i, line in enumerate(meta):
+        match = re.match(b'##(FILTER|INFO|FORMAT|contig)=<ID=([^,>]+)', line)
+        if match is not None:
+            names = contigs if match.group(1) == b'contig' else dictionary
+            if match.group(2) not in names:
+                names.append(match.group(2))
+            meta[i] = line[:-1] + b',IDX=%d>' % names.index(match.group(2))
+    header = [line for line in lines if line.startswith(b'#CHROM')]
+    text = b'\n'.join(meta + header) + b'\n\x00'
+    data = b'BCF\x02\x02' + struct.pack('<I', len(text)) + text
+
+    def header_type(group, key):
+        return group[key.decode()]['Type'] if key.decode() in group else 'String'
+
+    for r in records:
+        alleles = [r[3]] + ([] if r[4] == b'.' else r[4].split(b','))
+        shared = struct.pack('<iii', contigs.index(r[0]), int(r[1]) - 1, len(r[3]))
+        shared += _bcf_floats([None if r[5] == b'.' else float(r[5])])
+        info = [] if r[7] == b'.' else [kv.split(b'=', 1) for kv in r[7].split(b';') if kv]
+        formats = r[8].split(b':') if len(r) > 8 else []
+        samples = [s.split(b':') for s in r[9:]]
+        shared += struct.pack('<II', len(alleles) << 16 | len(info),
+                              len(formats) << 24 | len(samples))
+        shared += _bcf_descriptor(7, 0) if r[2] == b'.' else \
+            _bcf_descriptor(7, len(r[2])) + r[2]
+        for a in alleles:
+            shared += _bcf_descriptor(7, len(a)) + a
+        shared += b'\x00' if r[6] == b'.' else \
+            _bcf_ints([dictionary.index(f) for f in r[6].split(b';')])
+        for kv in info:
+            shared += _bcf_ints([dictionary.index(kv[0])])
+            t = header_type(headers.infos, kv[0])
+            if len(kv) == 1:
+                shared += b'\x00'
+            elif t == 'String':
+                shared += _bcf_descriptor(7, len(kv[1])) + kv[1]
+            else:
+                shared += _bcf_encode_format(t, [_bcf_parse_values(t, kv[1])])
+        indiv = b''
+        for i, k in enumerate(formats):
+            indiv += _bcf_ints([dictionary.index(k)])
+            t = header_type(headers.formats, k)
+            values = [s[i] if i < len(s) else None for s in samples]
+            if k == b'GT':
+                values = [_bcf_parse_genotype(v) if v else None for v in values]
+                t = 'Integer'
+            elif t != 'String':
+                values = [_bcf_parse_values(t, v) if v else None for v in values]
+            indiv += _bcf_encode_format(t, values)
+        data += struct.pack('<II', len(shared), len(indiv)) + shared + indiv
+
+    with open(bcf_path, mode='wb') as f:
+        if block_size == 0:
+            f.write(data)
+            return
+        for i in range(0, len(data), block_size or 2**16 - 256):
+            block = data[i:i + (block_size or 2**16 - 256)]
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+            cdata = compressor.compress(block) + compressor.flush()
+            f.write(struct.pack('<BBBBIBBHBBHH', 31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2,
+                                len(cdata) + 25))
+            f.write(cdata + struct.pack('<II', zlib.crc32(block) & 0xffffffff, len(block)))
+        # end of file marker
+        f.write(b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00\x1b\x00\x03'
+                b'\x00\x00\x00\x00\x00\x00\x00\x00\x00')
+
+
+def test_read_bcf():
+    data_path = os.path.join(os.path.dirname(__file__), 'data')
+    for fn in 'sample.vcf', 'ann.vcf', 'test16.vcf':
+        vcf_path = os.path.join(data_path, fn)
+        bcf_paths = list()
+        for block_size in None, 50, 0:
+            bcf_path = os.path.join(tempdir, '%s.%s.bcf' % (fn, block_size))
+            _vcf_to_bcf(vcf_path, bcf_path, block_size=block_size)
+            bcf_paths.append(bcf_path)
+        eq_(read_vcf_headers(vcf_path).samples, read_vcf_headers(bcf_paths[0]).samples)
+        for kwargs in (dict(fields='*'),
+                       dict(fields='*', chunk_length=2, buffer_size=10),
+                       dict(fields='*', types={'REF': 'S1', 'ALT': 'S2', 'CHROM': 'S1',
+                                               'ID': 'S3'}),
+                       dict(fields=['variants/*', 'calldata/GT'], numbers={'ALT': 1},
+                            types={'GT': 'genotype_ac/i1'}),
+                       dict(fields=['calldata/GT'], types={'GT': 'genotype_packed/u1'}),
+                       dict(fields=['calldata/GT'], types={'GT': 'genotype_2bit/u1'}),
+                       dict(fields=['ac', 'an', 'n_missing']),
+                       dict(fields='*', samples=[1], region='20:14370-1230237'),
+                       dict(fields='*', region='19'),
+                       dict(fields='*', filter_expression='QUAL > 20', n_threads=2)):
+            expect = read_vcf(vcf_path, **kwargs)
+            for bcf_path in bcf_paths:
+                actual = read_vcf(bcf_path, **kwargs)
+                if expect is None:
+                    assert actual is None
+                    continue
+                assert_list_equal(sorted(expect.keys()), sorted(actual.keys()))
+                for k in expect.keys():
+                    compare_arrays(expect[k], actual[k])
+
+    # other outputs work unchanged
+    vcf_path = os.path.join(data_path, 'sample.vcf')
+    bcf_path = os.path.join(tempdir, 'sample.vcf.None.bcf')
+    expect = read_vcf(vcf_path, fields='*')
+    zarr_path = os.path.join(tempdir, 'sample.bcf.zarr')
+    vcf_to_zarr(bcf_path, zarr_path, fields='*', overwrite=True)
+    actual = zarr.open_group(zarr_path, mode='r')
+    for k in expect.keys():
+        compare_arrays(expect[k], actual[k][:])
+
+    # allele counts for groups of samples
+    kwargs = dict(fields=['ac', 'n_missing'], subpops={'A': [0, 1], 'B': ['NA00003']},
+                  types={'GT': 'genotype_ac/i1'})
+    expect = read_vcf(vcf_path, **kwargs)
+    actual = read_vcf(bcf_path, **kwargs)
+    for k in expect.keys():
+        compare_arrays(expect[k], actual[k])
+
+    # numeric values can't be decoded as strings
+    with assert_raises(ValueError):
+        read_vcf(bcf_path, fields=['DP'], types={'DP': 'S3'})
+
+
+def test_read_bcf_htslib():
+    # sample.bcf was written by htslib from sample.vcf, with contig headers added
+    data_path = os.path.join(os.path.dirname(__file__), 'data')
+    vcf_path = os.path.join(data_path, 'sample.vcf')
+    bcf_path = os.path.join(data_path, 'sample.bcf')
+    eq_(read_vcf_headers(vcf_path).samples, read_vcf_headers(bcf_path).samples)
+    for kwargs in (dict(fields='*'),
+                   dict(fields='*', alt_number=2, chunk_length=2, buffer_size=10),
+                   dict(fields=['variants/*', 'calldata/GT'], numbers={'ALT': 1},
+                        types={'GT': 'genotype_ac/i1'}),
+                   dict(fields=['ac', 'an', 'n_missing']),
+                   dict(fields='*', samples=[1], region='20:14370-1230237'),
+                   dict(fields='*', filter_expression='QUAL > 20')):
+        expect = read_vcf(vcf_path, **kwargs)
+        actual = read_vcf(bcf_path, **kwargs)
+        assert_list_equal(sorted(expect.keys()), sorted(actual.keys()))
+        for k in expect.keys():
+            compare_arrays(expect[k], actual[k])
+
+
 def test_fills_info():
     vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'sample.vcf')
 
@@ -1360,6 +2166,92 @@ def test_read_region_unsorted():
     assert_array_equal([1234567, 1235237], pos)
 
 
+def test_read_regions():
+    # overlapping regions, given out of order
+    regions = ['20:1000000-1233000', 'X', '20:1-100000', '19', '20:17000-1200000']
+    expect_pos = [111, 112, 14370, 17330, 1110696, 1230237, 10]
+
+    for vcf_path in (os.path.join(os.path.dirname(__file__), 'data', 'sample.vcf.gz'),
+                     os.path.join(os.path.dirname(__file__), 'data', 'sample.vcf'),
+                     os.path.join(os.path.dirname(__file__), 'data', 'unsorted.vcf')):
+        for tabix in 'tabix', None:
+            callset = read_vcf(vcf_path, fields='*', region=regions, tabix=tabix)
+            if 'unsorted' in vcf_path:
+                # variants are read in order of the file
+                eq_(sorted(expect_pos), sorted(callset['variants/POS']))
+                continue
+            assert_array_equal(expect_pos, callset['variants/POS'])
+            assert_array_equal(['19', '19', '20', '20', '20', '20', 'X'],
+                               callset['variants/CHROM'])
+            # variants are read only once, as if from a single region
+            callset_all = read_vcf(vcf_path, fields='*', tabix=tabix)
+            loc = np.in1d(callset_all['variants/POS'], expect_pos)
+            for k, a in callset.items():
+                if k != 'samples':
+                    compare_arrays(callset_all[k][loc], a)
+
+            # data split by region
+            split = read_vcf(vcf_path, fields='*', region=regions + ['Y'], tabix=tabix,
+                             by_region=True)
+            eq_(set(regions + ['Y']), set(split))
+            assert split['Y'] is None
+            for region in regions:
+                expect = read_vcf(vcf_path, fields='*', region=region, tabix=tabix)
+                for k, a in expect.items():
+                    compare_arrays(a, split[region][k])
+
+            # chunks of data from multiple regions
+            _, _, _, it = iter_vcf_chunks(vcf_path, fields=['POS'], region=regions,
+                                          tabix=tabix, chunk_length=2)
+            assert_array_equal(expect_pos, np.concatenate(
+                [chunk['variants/POS'] for chunk, _, _, _ in it]))
+
+    # positions are needed to split by region
+    vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'sample.vcf')
+    with assert_raises(ValueError):
+        read_vcf(vcf_path, fields=['REF'], region=regions, by_region=True)
+    with assert_raises(ValueError):
+        read_vcf(vcf_path, by_region=True)
+
+    # an empty list of regions is an error, rather than selecting nothing
+    for path in vcf_path, vcf_path + '.gz':
+        with assert_raises(ValueError):
+            read_vcf(path, region=[])
+        with assert_raises(ValueError):
+            iter_vcf_chunks(path, region=[])
+
+
+def test_read_multiple_inputs():
+    data_path = os.path.join(os.path.dirname(__file__), 'data')
+    vcf_paths = [os.path.join(data_path, 'sample.vcf'),
+                 os.path.join(data_path, 'sample.vcf.gz')]
+    bcf_path = os.path.join(tempdir, 'sample.bcf')
+    _vcf_to_bcf(vcf_paths[0], bcf_path)
+
+    for inputs in vcf_paths, (vcf_paths[1], bcf_path):
+        for kwargs in dict(alt_number=2), dict(alt_number=2, n_threads=2), \
+                dict(alt_number='auto'), dict(region='20'):
+            if kwargs.get('alt_number') == 'auto' and bcf_path in inputs:
+                # not supported for BCF
+                continue
+            expect = read_vcf(vcf_paths[0], fields='*', **kwargs)
+            n_variants = len(expect['variants/POS'])
+            actual = read_vcf(inputs, fields='*', **kwargs)
+            for k, a in expect.items():
+                if k == 'samples':
+                    assert_array_equal(a, actual[k])
+                else:
+                    eq_(2 * n_variants, len(actual[k]))
+                    compare_arrays(a, actual[k][:n_variants])
+                    compare_arrays(a, actual[k][n_variants:])
+
+    # samples must match
+    with assert_raises(ValueError):
+        read_vcf([vcf_paths[0], os.path.join(data_path, 'test1.vcf')])
+    with assert_raises(ValueError):
+        read_vcf([])
+
+
 def test_read_samples():
     vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'sample.vcf')
 
@@ -1382,6 +2274,42 @@ def test_read_samples():
         eq_((2, 1), tuple(gt[4, 0]))
 
 
+def test_read_samples_subset():
+    # wide data with fields of varying length, to exercise skipping samples not selected
+    n_samples = 30
+    header = (b'##fileformat=VCFv4.2\n'
+              b'##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n'
+              b'##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Depth">\n'
+              b'#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t' +
+              b'\t'.join(b'S%d' % i for i in range(n_samples)) + b'\n')
+    lines = list()
+    for v in range(50):
+        calls = [b'%d/%d:%d' % (v % 2, (v + i) % 3, v * i) + b'0' * ((v * i) % 7)
+                 for i in range(n_samples)]
+        lines.append(b'2L\t%d\t.\tA\tC,T\t.\t.\t.\tGT:DP\t' % (v + 1) +
+                     b'\t'.join(calls))
+    vcf_path = os.path.join(tempdir, 'wide.vcf')
+    fields = ['calldata/GT', 'calldata/DP']
+
+    for eol in b'\n', b'\r\n':
+        data = header + eol.join(lines) + eol
+        with open(vcf_path, mode='wb') as f:
+            f.write(data)
+        expect = read_vcf(vcf_path, fields=fields)
+        for samples in [0], [n_samples - 1], list(range(0, n_samples, 2)), \
+                [1, 2, 3, 20], [5, 25]:
+            inputs = [(vcf_path, dict()), (vcf_path, dict(n_threads=2)),
+                      (io.BytesIO(data), dict(buffer_size=100))]
+            for input, kwargs in inputs:
+                callset = read_vcf(input, fields=fields, samples=samples, **kwargs)
+                for k in fields:
+                    assert_array_equal(expect[k][:, samples], callset[k])
+        # no samples selected
+        callset = read_vcf(io.BytesIO(data), fields=fields + ['POS'], samples=[],
+                           buffer_size=100)
+        assert_array_equal(np.arange(1, 51), callset['variants/POS'])
+
+
 def test_read_empty():
     vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'empty.vcf')
     callset = read_vcf(vcf_path)
@@ -1534,6 +2462,70 @@ def test_ann():
     assert_array_equal([-1, -1, 17], a)
 
 
+def test_ann_most_severe():
+    vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'ann.vcf')
+
+    # most severe out of two annotations
+    transformers = [ANNTransformer(fields=['Allele', 'Annotation_Impact', 'cDNA_pos'],
+                                   annotations='most_severe')]
+    callset = read_vcf(vcf_path, fields=['ANN'], numbers={'ANN': 2},
+                       transformers=transformers)
+    a = callset['variants/ANN_Allele']
+    eq_((3,), a.shape)
+    assert_array_equal(['T', '', 'T'], a)
+    a = callset['variants/ANN_Annotation_Impact']
+    assert_array_equal(['MODIFIER', '', 'MODERATE'], a)
+    a = callset['variants/ANN_cDNA_pos']
+    eq_((3,), a.shape)
+    assert_array_equal([-1, -1, 17], a)
+
+    # most severe annotation is not first
+    data = (b'##fileformat=VCFv4.2\n'
+            b'#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n'
+            b'2L\t1\t.\tA\tC,G,T\t.\t.\tANN=C|a|LOW|||||,G|b|HIGH|||||,T|c|HIGH|||||\n'
+            b'2L\t2\t.\tA\tC,G\t.\t.\tANN=C|a|MODIFIER|||||,G|b|foo|||||\n')
+    callset = read_vcf(io.BytesIO(data), fields=['ANN'], numbers={'ANN': 3},
+                       transformers=[ANNTransformer(annotations='most_severe')])
+    assert_array_equal(['G', 'C'], callset['variants/ANN_Allele'])
+    assert_array_equal(['b', 'a'], callset['variants/ANN_Annotation'])
+
+    with assert_raises(ValueError):
+        ANNTransformer(annotations='foo')
+
+
+def test_ann_types():
+    vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'ann.vcf')
+    expect = read_vcf(vcf_path, fields=['ANN'], numbers={'ANN': 2},
+                      transformers=[ANNTransformer()])
+
+    # ANN parsed with any string type, fields stored with any string type
+    for ann_type in 'object', 'S400', 'offsets':
+        for ann_field_type in 'object', 'S20', 'U20', 'offsets':
+            fields = ['Allele', 'HGVS_c', 'HGVS_p', 'Distance', 'AA_length']
+            types = {'Allele': ann_field_type, 'HGVS_c': ann_field_type,
+                     'HGVS_p': ann_field_type}
+            transformers = [ANNTransformer(fields=fields, types=types)]
+            for n_threads in None, 2:
+                callset = read_vcf(vcf_path, fields=['ANN'], types={'ANN': ann_type},
+                                   numbers={'ANN': 2}, transformers=transformers,
+                                   chunk_length=1, n_threads=n_threads)
+                for f in 'ANN_Allele', 'ANN_HGVS_c', 'ANN_HGVS_p':
+                    k = 'variants/' + f
+                    a = callset[k]
+                    eq_((3, 2), a.shape)
+                    if ann_field_type == 'offsets':
+                        a = np.char.decode(np.asarray(a), 'utf8')
+                    elif ann_field_type.startswith('S'):
+                        a = np.char.decode(a, 'utf8')
+                    assert_array_equal(expect[k], a)
+                for f in 'ANN_Distance', 'ANN_AA_length':
+                    k = 'variants/' + f
+                    assert_array_equal(expect[k], callset[k])
+
+    with assert_raises(ValueError):
+        ANNTransformer(fields=['Rank'], types={'Rank': 'offsets'})
+
+
 def test_format_inconsistencies():
 
     input_data = (
@@ -1910,6 +2902,131 @@ def test_genotype_ac():
     assert_array_equal(e, a)
 
 
+def test_genotype_packed():
+
+    input_data = (
+        b"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\tS2\tS3\tS4\tS5\n"
+        b"2L\t12\t.\tA\tT\t.\t.\t.\tGT:GQ\t0/0:11\t0|1:12\t1/0\t1/1\t./.\n"
+        b"2L\t34\t.\tC\tT,G\t.\t.\t.\tGT:GQ\t1/2:22\t2/2\t0/.\t.\t0/1/1\n"
+        b"3R\t45\t.\tG\tA\t.\t.\t.\tGQ:GT\t12:1\t.:10/14\t:0/15\t\t.:0/0\n"
+    )
+    callset = read_vcf(io.BytesIO(input_data), fields=['calldata/GT'])
+    g = GenotypeArray(callset['calldata/GT'])
+
+    # same layout as GenotypeArray.to_packed()
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter('always')
+        callset = read_vcf(io.BytesIO(input_data), fields=['calldata/GT'],
+                           types={'calldata/GT': 'genotype_packed/u1'})
+    eq_(1, len([x for x in w if 'too large to pack' in str(x.message)]))
+    a = callset['calldata/GT']
+    eq_(np.dtype('u1'), a.dtype)
+    g[2, 2] = -1
+    assert_array_equal(g.to_packed(), a)
+
+    # four calls per byte, coded as the number of alternate alleles
+    callset = read_vcf(io.BytesIO(input_data), fields=['calldata/GT'],
+                       types={'calldata/GT': 'genotype_2bit/u1'})
+    a = callset['calldata/GT']
+    eq_((3, 2), a.shape)
+    e = np.array([[0, 1, 1, 2, 3, 3, 3, 3],
+                  [3, 3, 3, 3, 1, 3, 3, 3],
+                  [3, 3, 3, 3, 0, 3, 3, 3]])
+    assert_array_equal(e, ((a[:, :, None] >> [0, 2, 4, 6]) & 3).reshape(3, 8))
+
+
+def test_allele_counts():
+    vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'sample.vcf')
+    g = GenotypeArray(read_vcf(vcf_path, fields='GT')['calldata/GT'])
+    subpops = {'A': [0, 1], 'B': ['NA00003', 0]}
+
+    for kwargs in (dict(),
+                   dict(n_threads=2, chunk_length=2),
+                   dict(filter_expression='QUAL > 20'),
+                   dict(types={'GT': 'genotype_packed/u1'})):
+        callset = read_vcf(vcf_path, fields=['ac', 'an', 'n_missing', 'POS'],
+                           subpops=subpops, **kwargs)
+        assert_list_equal(sorted(['variants/ac', 'variants/an', 'variants/n_missing',
+                                  'variants/POS', 'variants/ac_A', 'variants/ac_B']),
+                          sorted(callset.keys()))
+        loc = slice(None)
+        if 'filter_expression' in kwargs:
+            loc = read_vcf(vcf_path, fields='QUAL')['variants/QUAL'] > 20
+        ac = g[loc].count_alleles(max_allele=3)
+        assert_array_equal(ac, callset['variants/ac'])
+        eq_(np.dtype('i4'), callset['variants/ac'].dtype)
+        assert_array_equal(ac.sum(axis=1), callset['variants/an'])
+        assert_array_equal(g[loc].count_missing(axis=1), callset['variants/n_missing'])
+        assert_array_equal(g[loc].count_alleles(max_allele=3, subpop=[0, 1]),
+                           callset['variants/ac_A'])
+        assert_array_equal(g[loc].count_alleles(max_allele=3, subpop=[2, 0]),
+                           callset['variants/ac_B'])
+
+    # selected samples only
+    callset = read_vcf(vcf_path, fields=['ac', 'n_missing'], samples=['NA00002'],
+                       numbers={'ac': 2})
+    assert_array_equal(g.count_alleles(max_allele=1, subpop=[1]), callset['variants/ac'])
+    assert_array_equal(g[:, [1]].count_missing(axis=1), callset['variants/n_missing'])
+
+    # not allowed in filter expression
+    with assert_raises(ValueError):
+        read_vcf(vcf_path, fields='ac', filter_expression='an > 2')
+    with assert_raises(ValueError):
+        read_vcf(vcf_path, subpops={'A': ['foo']})
+
+
+def test_string_offsets():
+    vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'sample.vcf')
+    fields = ['variants/ID', 'variants/REF', 'variants/ALT', 'variants/AA']
+    offsets_types = dict((f, 'offsets') for f in fields)
+    string_types = dict((f, 'S') for f in fields)
+
+    for kwargs in (dict(),
+                   dict(chunk_length=2),
+                   dict(n_threads=2, chunk_length=2),
+                   dict(filter_expression='DP > 10', chunk_length=3)):
+        expect = read_vcf(vcf_path, fields=fields + ['numalt'], types=string_types,
+                          **kwargs)
+        callset = read_vcf(vcf_path, fields=fields + ['numalt'], types=offsets_types,
+                           **kwargs)
+        assert_array_equal(expect['variants/numalt'], callset['variants/numalt'])
+        for f in fields:
+            a = callset[f]
+            assert isinstance(a, OffsetStringArray)
+            eq_(expect[f].shape, a.shape)
+            assert_array_equal(expect[f], np.asarray(a))
+
+    # zarr stores the end offset of each value, and the bytes of all values
+    zarr_path = os.path.join(tempdir, 'sample.offsets.zarr')
+    vcf_to_zarr(vcf_path, zarr_path, fields=fields, types=offsets_types, chunk_length=2,
+                overwrite=True)
+    expect = read_vcf(vcf_path, fields=fields, types=string_types)
+    callset = zarr.open_group(zarr_path, mode='r')
+    for f in fields:
+        ends = callset[f][:]
+        a = OffsetStringArray(np.concatenate([[0], ends.ravel()]),
+                              callset[f + '_bytes'][:], shape=ends.shape)
+        assert_array_equal(expect[f], np.asarray(a))
+        # keyword arguments passed by numpy >= 2
+        assert_array_equal(expect[f], a.__array__(dtype=None, copy=True))
+        eq_(np.dtype(object), a.__array__(dtype=object, copy=None).dtype)
+        with assert_raises(ValueError):
+            a.__array__(copy=False)
+
+    # other outputs store strings as objects
+    a = vcf_to_recarray(vcf_path, fields=fields, types=offsets_types)
+    eq_(np.dtype(object), a['ID'].dtype)
+    eq_('rs6054257', a['ID'][2])
+    eq_('G', a['REF'][2])
+
+    # not supported
+    with assert_raises(ValueError):
+        read_vcf(vcf_path, fields='GT', types={'GT': 'offsets'})
+    with assert_raises(ValueError):
+        read_vcf(vcf_path, fields='REF', types={'REF': 'offsets'},
+                 filter_expression='REF == "A"')
+
+
 def test_region_truncate():
     vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'test54.vcf.gz')
     for tabix in 'tabix', None:
@@ -2180,6 +3297,74 @@ def test_vcf_to_zarr():
                 assert 'calldata/' + key in expected
 
 
+def test_vcf_to_zarr_n_processes():
+    vcf_paths = [os.path.join(os.path.dirname(__file__), 'data', x)
+                 for x in ['sample.vcf', 'sample.vcf.gz']]
+    zarr_path = os.path.join(tempdir, 'sample.zarr')
+    samples_values = None, ['NA00001', 'NA00003']
+    string_type_values = 'S10', 'object'
+    n_processes_values = 2, 3
+    param_matrix = itertools.product(vcf_paths, samples_values, string_type_values,
+                                     n_processes_values)
+    for vcf_path, samples, string_type, n_processes in param_matrix:
+        types = {'CHROM': string_type, 'ALT': string_type, 'samples': string_type}
+        expected = read_vcf(vcf_path, fields='*', alt_number=2, samples=samples,
+                            types=types)
+        if os.path.exists(zarr_path):
+            shutil.rmtree(zarr_path)
+        vcf_to_zarr(vcf_path, zarr_path, fields='*', alt_number=2, chunk_length=2,
+                    samples=samples, types=types, n_processes=n_processes)
+        actual = zarr.open_group(zarr_path, mode='r')
+        for key in expected.keys():
+            compare_arrays(expected[key], actual[key][:])
+        eq_(actual['variants/NS'].attrs['Description'], 'Number of Samples With Data')
+
+    # no index, falls back to serial
+    vcf_path = os.path.join(tempdir, 'noindex.vcf.gz')
+    shutil.copy(vcf_paths[1], vcf_path)
+    expected = read_vcf(vcf_path, fields='*')
+    if os.path.exists(zarr_path):
+        shutil.rmtree(zarr_path)
+    with warnings.catch_warnings(record=True) as w:
+        vcf_to_zarr(vcf_path, zarr_path, fields='*', n_processes=2)
+    assert any('processing serially' in str(x.message) for x in w)
+    actual = zarr.open_group(zarr_path, mode='r')
+    for key in expected.keys():
+        compare_arrays(expected[key], actual[key][:])
+
+
+def test_vcf_to_zarr_queue_depth():
+    vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'sample.vcf')
+    zarr_path = os.path.join(tempdir, 'sample.zarr')
+    h5_path = os.path.join(tempdir, 'sample.h5')
+    expected = read_vcf(vcf_path, fields='*')
+    for queue_depth, n_threads in itertools.product([0, 1, 3], [None, 2]):
+        if os.path.exists(zarr_path):
+            shutil.rmtree(zarr_path)
+        if os.path.exists(h5_path):
+            os.remove(h5_path)
+        vcf_to_zarr(vcf_path, zarr_path, fields='*', chunk_length=2,
+                    queue_depth=queue_depth, n_threads=n_threads)
+        vcf_to_hdf5(vcf_path, h5_path, fields='*', chunk_length=2,
+                    queue_depth=queue_depth, n_threads=n_threads)
+        actual = zarr.open_group(zarr_path, mode='r')
+        with h5py.File(h5_path, mode='r') as h5f:
+            for key in expected.keys():
+                compare_arrays(expected[key], actual[key][:])
+                if expected[key].dtype.kind != 'O':
+                    compare_arrays(expected[key], h5f[key][:])
+                else:
+                    eq_(len(expected[key]), len(h5f[key]))
+
+    # errors raised when storing are propagated
+    def store(chunk):
+        if chunk > 2:
+            raise ValueError('foo')
+    for queue_depth in 0, 1, 2:
+        it = ((i, 1, b'', 0) for i in range(10))
+        assert_raises(ValueError, _chunk_iter_store, it, store, queue_depth)
+
+
 def test_vcf_to_zarr_exclude():
     vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'sample.vcf')
     zarr_path = os.path.join(tempdir, 'sample.zarr')
@@ -2259,6 +3444,123 @@ def test_vcf_to_zarr_group():
                 'Genotype Quality')
 
 
+def test_vcf_to_zarr_append():
+    vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'sample.vcf.gz')
+    zarr_path = os.path.join(tempdir, 'sample.zarr')
+    if os.path.exists(zarr_path):
+        shutil.rmtree(zarr_path)
+    chroms = ['19', '20', 'X']
+    for chrom in chroms:
+        vcf_to_zarr(vcf_path, zarr_path, fields='*', alt_number=2, chunk_length=2,
+                    region=chrom, append=True)
+    expect = read_vcf(vcf_path, fields='*', alt_number=2)
+    actual = zarr.open_group(zarr_path, mode='r')
+    for key in expect.keys():
+        compare_arrays(expect[key], actual[key][:])
+    checkpoint = actual.attrs['vcf_to_zarr']
+    eq_(9, checkpoint['n_variants'])
+    eq_(chroms, [e['region'] for e in checkpoint['inputs']])
+    eq_([2, 6, 1], [e['n_variants'] for e in checkpoint['inputs']])
+    assert all(e['complete'] for e in checkpoint['inputs'])
+    # fields must match
+    with assert_raises(ValueError):
+        vcf_to_zarr(vcf_path, zarr_path, fields=['POS'], append=True)
+    with assert_raises(ValueError):
+        vcf_to_zarr(vcf_path, zarr_path, fields='*', alt_number=2, append=True,
+                    overwrite=True)
+
+
+def test_vcf_to_zarr_multiple_inputs():
+    data_path = os.path.join(os.path.dirname(__file__), 'data')
+    vcf_paths = [os.path.join(data_path, 'sample.vcf'),
+                 os.path.join(data_path, 'sample.vcf.gz')]
+    zarr_path = os.path.join(tempdir, 'sample.zarr')
+    expect = read_vcf(vcf_paths, fields='*', alt_number=2)
+    for kwargs in dict(), dict(n_processes=2):
+        if os.path.exists(zarr_path):
+            shutil.rmtree(zarr_path)
+        vcf_to_zarr(vcf_paths, zarr_path, fields='*', alt_number=2, chunk_length=2,
+                    **kwargs)
+        actual = zarr.open_group(zarr_path, mode='r')
+        for key in expect.keys():
+            compare_arrays(expect[key], actual[key][:])
+        checkpoint = actual.attrs['vcf_to_zarr']
+        eq_(vcf_paths, checkpoint['inputs'][0]['input'])
+        eq_(len(expect['variants/POS']), checkpoint['n_variants'])
+    # nothing left to do
+    vcf_to_zarr(tuple(vcf_paths), zarr_path, fields='*', alt_number=2, chunk_length=2,
+                resume=True)
+    actual = zarr.open_group(zarr_path, mode='r')
+    eq_(len(expect['variants/POS']), actual['variants/POS'].shape[0])
+
+
+def test_vcf_to_zarr_resume():
+    vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'sample.vcf')
+    zarr_path = os.path.join(tempdir, 'sample.zarr')
+    for kwargs in dict(), dict(filter_expression='QUAL > 5'), dict(n_threads=2):
+        if os.path.exists(zarr_path):
+            shutil.rmtree(zarr_path)
+        vcf_to_zarr(vcf_path, zarr_path, fields='*', alt_number=2, chunk_length=2,
+                    **kwargs)
+        expect = read_vcf(vcf_path, fields='*', alt_number=2, **kwargs)
+        # simulate an interruption while storing the third chunk
+        root = zarr.open_group(zarr_path, mode='a')
+        checkpoint = root.attrs['vcf_to_zarr']
+        checkpoint['n_variants'] = 4
+        checkpoint['inputs'][0]['n_variants'] = 4
+        checkpoint['inputs'][0]['complete'] = False
+        root.attrs['vcf_to_zarr'] = checkpoint
+        for key in expect.keys():
+            if key != 'samples':
+                a = root[key]
+                a.resize((5,) + a.shape[1:])
+        root['variants/POS'][4] = -1
+        # requires resume
+        with assert_raises(ValueError):
+            vcf_to_zarr(vcf_path, zarr_path, fields='*', alt_number=2, chunk_length=2,
+                        append=True, **kwargs)
+        vcf_to_zarr(vcf_path, zarr_path, fields='*', alt_number=2, chunk_length=2,
+                    resume=True, **kwargs)
+        actual = zarr.open_group(zarr_path, mode='r')
+        for key in expect.keys():
+            compare_arrays(expect[key], actual[key][:])
+        checkpoint = actual.attrs['vcf_to_zarr']
+        eq_(len(expect['variants/POS']), checkpoint['n_variants'])
+        assert checkpoint['inputs'][0]['complete']
+        # nothing left to do
+        vcf_to_zarr(vcf_path, zarr_path, fields='*', alt_number=2, chunk_length=2,
+                    resume=True, **kwargs)
+        actual = zarr.open_group(zarr_path, mode='r')
+        eq_(len(expect['variants/POS']), actual['variants/POS'].shape[0])
+
+    # an interrupted sharded call records no progress, so is done again from the start
+    if os.path.exists(zarr_path):
+        shutil.rmtree(zarr_path)
+    vcf_to_zarr(vcf_path, zarr_path, fields='*', alt_number=2, chunk_length=2,
+                n_processes=2)
+    expect = read_vcf(vcf_path, fields='*', alt_number=2)
+    root = zarr.open_group(zarr_path, mode='a')
+    checkpoint = root.attrs['vcf_to_zarr']
+    checkpoint['n_variants'] = 0
+    checkpoint['inputs'][0]['n_variants'] = 0
+    checkpoint['inputs'][0]['complete'] = False
+    root.attrs['vcf_to_zarr'] = checkpoint
+    root['variants/POS'][0] = -1
+    vcf_to_zarr(vcf_path, zarr_path, fields='*', alt_number=2, chunk_length=2,
+                n_processes=2, resume=True)
+    actual = zarr.open_group(zarr_path, mode='r')
+    for key in expect.keys():
+        compare_arrays(expect[key], actual[key][:])
+    assert actual.attrs['vcf_to_zarr']['inputs'][0]['complete']
+
+    # file-like input cannot be matched against the input recorded
+    for kwargs in dict(resume=True), dict(append=True):
+        with open(vcf_path, mode='rb') as f:
+            with assert_raises(ValueError):
+                vcf_to_zarr(f, zarr_path, fields='*', alt_number=2, chunk_length=2,
+                            **kwargs)
+
+
 def test_vcf_to_zarr_string_codec():
     vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'sample.vcf')
     zarr_path = os.path.join(tempdir, 'sample.zarr')
@@ -2614,6 +3916,62 @@ def test_vcf_to_csv_ann():
             compare_arrays(df[k].values, adf[k].values)
 
 
+def test_vcf_to_parquet():
+    import pyarrow.parquet as pq
+    vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'sample.vcf')
+    fields = ['CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'DP', 'AC', 'DB', 'GT']
+    numbers = {'AC': 2}
+    for string_type in 'S20', 'object', 'offsets':
+        types = {'ID': string_type, 'REF': string_type, 'ALT': string_type}
+        parquet_path = os.path.join(tempdir, 'test.parquet')
+        if os.path.exists(parquet_path):
+            os.remove(parquet_path)
+        vcf_to_parquet(vcf_path, parquet_path, fields=fields, alt_number=2,
+                       numbers=numbers, types=types, chunk_length=2, row_group_size=1,
+                       compression='gzip')
+        callset = read_vcf(vcf_path, fields=fields, alt_number=2, numbers=numbers)
+        n_variants = len(callset['variants/POS'])
+        f = pq.ParquetFile(parquet_path)
+        eq_(n_variants, f.metadata.num_rows)
+        eq_(n_variants, f.metadata.num_row_groups)
+        table = f.read()
+        assert_list_equal(['CHROM', 'POS', 'ID', 'REF', 'ALT_1', 'ALT_2', 'QUAL', 'DP',
+                           'AC_1', 'AC_2', 'DB'], table.column_names)
+        eq_('int32', str(table.schema.field('POS').type))
+        eq_('float', str(table.schema.field('QUAL').type))
+        eq_('bool', str(table.schema.field('DB').type))
+        for name, expect in [('CHROM', callset['variants/CHROM']),
+                             ('ID', callset['variants/ID']),
+                             ('REF', callset['variants/REF']),
+                             ('ALT_1', callset['variants/ALT'][:, 0]),
+                             ('ALT_2', callset['variants/ALT'][:, 1])]:
+            # empty strings are written as nulls
+            expect = [(v.decode() if isinstance(v, bytes) else v) if v else None
+                      for v in expect]
+            eq_(expect, table.column(name).to_pylist())
+        for name, expect in [('POS', callset['variants/POS']),
+                             ('DP', callset['variants/DP']),
+                             ('AC_1', callset['variants/AC'][:, 0]),
+                             ('DB', callset['variants/DB'])]:
+            assert_array_equal(expect, np.asarray(table.column(name).to_pylist()))
+        # NaN is written as null
+        qual = table.column('QUAL').to_pylist()
+        for expect, actual in zip(callset['variants/QUAL'], qual):
+            if np.isnan(expect):
+                assert actual is None
+            else:
+                assert_almost_equal(expect, actual, places=6)
+
+
+def test_vcf_to_parquet_empty():
+    vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'empty.vcf')
+    parquet_path = os.path.join(tempdir, 'empty.parquet')
+    if os.path.exists(parquet_path):
+        os.remove(parquet_path)
+    vcf_to_parquet(vcf_path, parquet_path)
+    assert not os.path.exists(parquet_path)
+
+
 def test_vcf_to_recarray():
     vcf_path = os.path.join(os.path.dirname(__file__), 'data', 'sample.vcf')
     fields = ['CHROM', 'POS', 'REF', 'ALT', 'DP', 'AC', 'GT']
@@ -0,0 +1,61 @@
+"""Benchmark reading a BGZF-compressed VCF via the gzip module versus decompressing
+BGZF blocks natively, optionally in parallel.
+
+Usage: python profiling/bgzf.py VCF [N_THREADS ...]
+
+If VCF is not compressed, a BGZF-compressed copy is written alongside it first.
+
+"""
+import sys
+import struct
+import time
+import zlib
+sys.path.insert(0, '.')
+from allel.io.vcf_read import read_vcf
+
+
+def bgzip(src, dst, block_size=2**16 - 2**10):
+    eof = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+    with open(src, mode='rb') as fi, open(dst, mode='wb') as fo:
+        while True:
+            data = fi.read(block_size)
+            if not data:
+                break
+            c = zlib.compressobj(6, zlib.DEFLATED, -15)
+            cdata = c.compress(data) + c.flush()
+            bsize = len(cdata) + 25
+            fo.write(struct.pack('<BBBBIBBHBBHH', 31, 139, 8, 4, 0, 0, 255, 6, 66, 67,
+                                 2, bsize))
+            fo.write(cdata)
+            fo.write(struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data)))
+        fo.write(eof)
+
+
+def time_it(label, f, n=3):
+    best = None
+    for _ in range(n):
+        before = time.time()
+        f()
+        elapsed = time.time() - before
+        best = elapsed if best is None else min(best, elapsed)
+    print('%-40s %.3fs' % (label, best))
+
+
+def drain(fn, n_threads):
+    # parse as little as possible, so decompression dominates
+    read_vcf(fn, fields=['variants/POS'], n_threads=n_threads)
+
+
+fn = sys.argv[1]
+if not fn.endswith('.gz'):
+    bgzip(fn, fn + '.gz')
+    fn += '.gz'
+threads = [int(n) for n in sys.argv[2:]] or [1, 2, 4]
+
+time_it('decompress (gzip module)', lambda: drain(fn, n_threads=None))
+for n in threads:
+    time_it('decompress (bgzf, %s threads)' % n, lambda: drain(fn, n_threads=n))
+time_it('read_vcf (gzip module)', lambda: read_vcf(fn, fields='*'))
+for n in threads:
+    time_it('read_vcf (bgzf, %s threads)' % n,
+            lambda: read_vcf(fn, fields='*', n_threads=n))
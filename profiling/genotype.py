@@ -0,0 +1,52 @@
+"""Benchmark GT-only parsing throughput on a wide VCF, for each genotype layout.
+
+Usage: python profiling/genotype.py [N_VARIANTS [N_SAMPLES]]
+
+A synthetic VCF with diploid genotype calls is written to a temporary directory first.
+Defaults are 1000 variants and 10000 samples.
+
+"""
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+sys.path.insert(0, '.')
+from allel.io.vcf_read import read_vcf
+
+
+def write_vcf(path, n_variants, n_samples, seed=42):
+    rng = np.random.RandomState(seed)
+    calls = np.array([b'0/0', b'0/1', b'1/1', b'0|1', b'1|0', b'./.'])
+    p = [.6, .15, .1, .05, .05, .05]
+    with open(path, mode='wb') as f:
+        f.write(b'##fileformat=VCFv4.1\n')
+        f.write(b'##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n')
+        f.write(b'#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t')
+        f.write(b'\t'.join(b'S%d' % i for i in range(n_samples)) + b'\n')
+        for i in range(n_variants):
+            gt = calls[rng.choice(len(calls), size=n_samples, p=p)]
+            f.write(b'1\t%d\t.\tA\tT\t.\tPASS\t.\tGT\t' % (i + 1))
+            f.write(b'\t'.join(gt) + b'\n')
+
+
+n_variants = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+n_samples = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+fn = os.path.join(tempfile.mkdtemp(), 'wide.vcf')
+write_vcf(fn, n_variants, n_samples)
+size = os.path.getsize(fn)
+
+n_calls = n_variants * n_samples
+for t in 'genotype/i1', 'genotype_packed/u1', 'genotype_2bit/u1':
+    best = None
+    for _ in range(5):
+        before = time.time()
+        # N.B., keep chunks small, a wide file makes for large chunks
+        callset = read_vcf(fn, fields=['calldata/GT'], types={'calldata/GT': t},
+                           chunk_length=2**10)
+        elapsed = time.time() - before
+        best = elapsed if best is None else min(best, elapsed)
+    print('%s variants x %s samples, %s: %.3fs, %.1f M calls/s, %.1f MB/s, %.1f MB output'
+          % (n_variants, n_samples, t, best, n_calls / best / 1e6, size / best / 1e6,
+             callset['calldata/GT'].nbytes / 1e6))
+os.remove(fn)
@@ -0,0 +1,57 @@
+"""Benchmark parsing of numeric calldata and INFO fields on PL-heavy input.
+
+Usage: python profiling/numeric.py [N_VARIANTS [N_SAMPLES]]
+
+A synthetic VCF with GT:AD:DP:GQ:PL calls and float INFO values is written to a
+temporary directory first. Defaults are 2000 variants and 1000 samples.
+
+"""
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+sys.path.insert(0, '.')
+from allel.io.vcf_read import read_vcf
+
+
+def write_vcf(path, n_variants, n_samples, seed=42):
+    rng = np.random.RandomState(seed)
+    with open(path, mode='wb') as f:
+        f.write(b'##fileformat=VCFv4.1\n')
+        f.write(b'##INFO=<ID=AF,Number=A,Type=Float,Description="">\n')
+        f.write(b'##INFO=<ID=MQ,Number=1,Type=Float,Description="">\n')
+        f.write(b'##FORMAT=<ID=GT,Number=1,Type=String,Description="">\n')
+        f.write(b'##FORMAT=<ID=AD,Number=R,Type=Integer,Description="">\n')
+        f.write(b'##FORMAT=<ID=DP,Number=1,Type=Integer,Description="">\n')
+        f.write(b'##FORMAT=<ID=GQ,Number=1,Type=Integer,Description="">\n')
+        f.write(b'##FORMAT=<ID=PL,Number=G,Type=Integer,Description="">\n')
+        f.write(b'#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t')
+        f.write(b'\t'.join(b'S%d' % i for i in range(n_samples)) + b'\n')
+        for i in range(n_variants):
+            ad = rng.randint(0, 50, size=(n_samples, 2))
+            pl = rng.randint(0, 2000, size=(n_samples, 3))
+            gq = rng.randint(0, 99, size=n_samples)
+            f.write(b'1\t%d\t.\tA\tT\t.\tPASS\tAF=%.4f;MQ=%.2f\tGT:AD:DP:GQ:PL\t'
+                    % (i + 1, rng.uniform(), rng.uniform(0, 60)))
+            f.write(b'\t'.join(b'0/1:%d,%d:%d:%d:%d,%d,%d'
+                               % (a[0], a[1], a.sum(), q, p[0], p[1], p[2])
+                               for a, q, p in zip(ad, gq, pl)))
+            f.write(b'\n')
+
+
+n_variants = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+n_samples = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+fn = os.path.join(tempfile.mkdtemp(), 'numeric.vcf')
+write_vcf(fn, n_variants, n_samples)
+
+for fields in ['calldata/PL'], ['calldata/AD', 'calldata/DP', 'calldata/GQ',
+                                'calldata/PL'], ['variants/AF', 'variants/MQ']:
+    best = None
+    for _ in range(5):
+        before = time.time()
+        read_vcf(fn, fields=fields, chunk_length=2**10)
+        elapsed = time.time() - before
+        best = elapsed if best is None else min(best, elapsed)
+    print('%-60s %.3fs' % (', '.join(fields), best))
+os.remove(fn)
@@ -1,9 +1,31 @@
+"""Benchmark reading a VCF, serially and with chunks parsed by increasing numbers of
+threads, reporting the speedup over serial parsing for each.
+
+Usage: python profiling/read_vcf.py VCF [N_THREADS ...]
+
+"""
 import sys
+import time
 sys.path.insert(0, '.')
-from allel.io_vcf_read import read_vcf
+from allel.io.vcf_read import read_vcf
+
+
+def time_it(f, n=3):
+    best = None
+    for _ in range(n):
+        before = time.time()
+        f()
+        elapsed = time.time() - before
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
 fn = sys.argv[1]
-if len(sys.argv) > 2:
-    n_threads = int(sys.argv[2])
-else:
-    n_threads = None
-read_vcf(fn, fields='*', n_threads=n_threads, log=sys.stderr)
+threads = [int(n) for n in sys.argv[2:]] or [1, 2, 4, 8]
+
+serial = time_it(lambda: read_vcf(fn, fields='*'))
+print('%-30s %.3fs' % ('read_vcf (serial)', serial))
+for n in threads:
+    elapsed = time_it(lambda: read_vcf(fn, fields='*', n_threads=n))
+    print('%-30s %.3fs %5.2fx' % ('read_vcf (%s threads)' % n, elapsed,
+                                  serial / elapsed))